@@ -5,18 +5,31 @@
 """
 
 import os
+import time
 import logging
 import json
 import asyncio
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 
+from flows.query_cache import QueryCache, normalize_question, normalize_sql
+from flows.warmup import WarmupManager, DuckDBWarmer
+from flows.metrics import get_metrics_registry
+from flows.tracing import get_tracer
+from flows.event_loop_thread import get_event_loop_thread
+from flows.json_response import dumps, encode_json, wants_pretty
+from flows.workflow_jobs import WorkflowJobManager, JobQueueFullError, FINISHED_STATUSES, report_progress
+from flows.sales_report import get_sales_report_engine
+from flows.insight_miner import get_insight_miner, describe_driver
+from flows.trend_analysis import get_trend_analysis_service
+from flows.audit_log import get_audit_writer
+
 try:
-    from fastapi import FastAPI, HTTPException, Depends
+    from fastapi import FastAPI, HTTPException, Depends, Request
     from fastapi.middleware.cors import CORSMiddleware
     from fastapi.staticfiles import StaticFiles
-    from fastapi.responses import HTMLResponse
+    from fastapi.responses import HTMLResponse, Response, JSONResponse, StreamingResponse
     from pydantic import BaseModel
     import uvicorn
     FASTAPI_AVAILABLE = True
@@ -32,11 +45,18 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 if FASTAPI_AVAILABLE:
+    class FastJSONResponse(JSONResponse):
+        """默认响应类：使用共享序列化层（orjson 优先）"""
+
+        def render(self, content: Any) -> bytes:
+            return dumps(content)
+
     # 创建 FastAPI 应用
     app = FastAPI(
         title="DB-GPT AWEL Complete Service",
         description="完整的 DB-GPT AWEL 服务，包含 NL2SQL、向量存储、工作流等功能",
-        version="2.0.0"
+        version="2.0.0",
+        default_response_class=FastJSONResponse
     )
 
     # 添加 CORS 中间件
@@ -63,6 +83,7 @@ if FASTAPI_AVAILABLE:
         workflow_type: str
         input_data: Dict[str, Any]
         parameters: Optional[Dict[str, Any]] = {}
+        priority: Any = "normal"
 
     class NL2SQLResponse(BaseModel):
         sql: str
@@ -83,10 +104,15 @@ if FASTAPI_AVAILABLE:
         result: Dict[str, Any]
         execution_time: float
 
+metrics = get_metrics_registry()
+tracer = get_tracer()
+WORKFLOW_TYPES = ("nl2sql_pipeline", "trend_analysis", "data_insight", "sales_report")
+
 # 数据库管理器
 class DatabaseManager:
     def __init__(self):
         self.connections = {}
+        self.result_cache = QueryCache(max_entries=512, ttl=300, name="query_result")
         self.schemas = {
             "analytics": {
                 "douyin_products": {
@@ -112,6 +138,11 @@ class DatabaseManager:
         import time
         start_time = time.time()
 
+        cache_key = (database, normalize_sql(sql))
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "execution_time": time.time() - start_time, "cache_hit": True}
+
         # 根据 SQL 类型返回不同的模拟数据
         sql_lower = sql.lower()
 
@@ -154,17 +185,20 @@ class DatabaseManager:
 
         execution_time = time.time() - start_time
 
-        return {
+        result = {
             "data": mock_data,
             "columns": columns,
             "row_count": len(mock_data),
             "execution_time": execution_time
         }
+        self.result_cache.put(cache_key, result)
+        return result
 
 # NL2SQL 引擎
 class NL2SQLEngine:
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
+        self.cache = QueryCache(max_entries=1024, ttl=3600, name="nl2sql")
         self.templates = {
             "销售": "SELECT category, SUM(sales_amount) as total_sales FROM douyin_products GROUP BY category ORDER BY total_sales DESC",
             "商品": "SELECT * FROM douyin_products ORDER BY created_date DESC LIMIT {limit}",
@@ -180,8 +214,43 @@ class NL2SQLEngine:
         import time
         start_time = time.time()
 
+        cache_key = (normalize_question(question), database, context)
+        with tracer.span("nl2sql.cache_lookup") as span:
+            cached = self.cache.get(cache_key)
+            span.set_attribute("nl2sql.cache_hit", cached is not None)
+        if cached is not None:
+            return {
+                **cached,
+                "execution_time": time.time() - start_time,
+                "metadata": {**cached["metadata"], "timestamp": datetime.now().isoformat(), "cache_hit": True}
+            }
+
         question_lower = question.lower()
+        with tracer.span("nl2sql.template_match") as span:
+            sql, explanation, confidence = self._match_template(question_lower)
+            query_type = self._get_query_type(question_lower)
+            span.set_attributes({"nl2sql.query_type": query_type, "nl2sql.confidence": confidence})
+
+        execution_time = time.time() - start_time
+
+        result = {
+            "sql": sql,
+            "explanation": explanation,
+            "confidence": confidence,
+            "execution_time": execution_time,
+            "metadata": {
+                "database": database,
+                "question": question,
+                "context": context,
+                "timestamp": datetime.now().isoformat(),
+                "query_type": query_type
+            }
+        }
+        self.cache.put(cache_key, result)
+        return result
 
+    def _match_template(self, question_lower: str) -> Tuple[str, str, float]:
+        """按关键词匹配查询模板，返回 SQL、说明和置信度"""
         # 智能匹配查询类型
         if any(keyword in question_lower for keyword in ["销售", "sales", "营业额", "收入", "销售额"]):
             sql = self.templates["销售"]
@@ -230,21 +299,7 @@ class NL2SQLEngine:
             explanation = "查询商品总数、平均价格和总销量统计"
             confidence = 0.75
 
-        execution_time = time.time() - start_time
-
-        return {
-            "sql": sql,
-            "explanation": explanation,
-            "confidence": confidence,
-            "execution_time": execution_time,
-            "metadata": {
-                "database": database,
-                "question": question,
-                "context": context,
-                "timestamp": datetime.now().isoformat(),
-                "query_type": self._get_query_type(question_lower)
-            }
-        }
+        return sql, explanation, confidence
 
     def _get_query_type(self, question_lower: str) -> str:
         if any(keyword in question_lower for keyword in ["销售", "sales"]):
@@ -271,21 +326,29 @@ class AWELWorkflowEngine:
         import time
         import uuid
 
-        start_time = time.time()
+        start_time = time.perf_counter()
         workflow_id = str(uuid.uuid4())
 
-        if workflow_type == "nl2sql_pipeline":
-            result = await self._execute_nl2sql_pipeline(input_data, parameters)
-        elif workflow_type == "trend_analysis":
-            result = await self._execute_trend_analysis(input_data, parameters)
-        elif workflow_type == "data_insight":
-            result = await self._execute_data_insight(input_data, parameters)
-        elif workflow_type == "sales_report":
-            result = await self._execute_sales_report(input_data, parameters)
-        else:
+        if workflow_type not in WORKFLOW_TYPES:
+            metrics.inc("workflow_executions_total", workflow_type="unknown", status="failed")
             raise ValueError(f"未知的工作流类型: {workflow_type}")
 
-        execution_time = time.time() - start_time
+        try:
+            if workflow_type == "nl2sql_pipeline":
+                result = await self._execute_nl2sql_pipeline(input_data, parameters)
+            elif workflow_type == "trend_analysis":
+                result = await self._execute_trend_analysis(input_data, parameters)
+            elif workflow_type == "data_insight":
+                result = await self._execute_data_insight(input_data, parameters)
+            else:
+                result = await self._execute_sales_report(input_data, parameters)
+        except Exception:
+            metrics.inc("workflow_executions_total", workflow_type=workflow_type, status="failed")
+            raise
+
+        execution_time = time.perf_counter() - start_time
+        metrics.inc("workflow_executions_total", workflow_type=workflow_type, status="completed")
+        metrics.observe("workflow_duration_seconds", execution_time, workflow_type=workflow_type)
 
         return {
             "workflow_id": workflow_id,
@@ -299,12 +362,15 @@ class AWELWorkflowEngine:
         database = input_data.get("database", "analytics")
 
         # 步骤1: NL2SQL 转换
-        nl2sql_result = self.nl2sql_engine.convert(question, database)
+        report_progress(0.1, "NL2SQL 转换")
+        nl2sql_result = await asyncio.to_thread(self.nl2sql_engine.convert, question, database)
 
         # 步骤2: SQL 执行
-        query_result = self.db_manager.execute_query(nl2sql_result["sql"], database)
+        report_progress(0.5, "SQL 执行")
+        query_result = await asyncio.to_thread(self.db_manager.execute_query, nl2sql_result["sql"], database)
 
         # 步骤3: 结果后处理
+        report_progress(0.9, "结果处理")
         return {
             "question": question,
             "sql": nl2sql_result["sql"],
@@ -317,10 +383,15 @@ class AWELWorkflowEngine:
         }
 
     async def _execute_trend_analysis(self, input_data: Dict[str, Any], parameters: Dict[str, Any]) -> Dict[str, Any]:
-        # 模拟趋势分析
         period = parameters.get("period", "daily")
         data_source = input_data.get("data_source", "sales")
 
+        service = get_trend_analysis_service()
+        if service.supports_database():
+            return await service.analyze(data_source, period, int(parameters.get("forecast_periods", 7)),
+                                         parameters.get("forecast_backend", "auto"))
+
+        # 未配置 DuckDB 数据库时返回示例趋势
         if period == "daily":
             data_points = [
                 {"date": "2025-01-01", "value": 15000, "growth": 0.0},
@@ -339,6 +410,7 @@ class AWELWorkflowEngine:
         return {
             "trend_type": f"{data_source}_trend",
             "period": period,
+            "data_source": "sample",
             "data_points": data_points,
             "insights": [
                 f"{data_source}数据呈上升趋势",
@@ -353,9 +425,28 @@ class AWELWorkflowEngine:
         }
 
     async def _execute_data_insight(self, input_data: Dict[str, Any], parameters: Dict[str, Any]) -> Dict[str, Any]:
-        # 模拟数据洞察
         analysis_type = input_data.get("analysis_type", "comprehensive")
 
+        miner = get_insight_miner()
+        if miner.supports_database():
+            analysis = await asyncio.to_thread(
+                miner.analyze, parameters.get("metric", "sales_amount"), parameters.get("dimensions"),
+                parameters, int(parameters.get("top_k", 10))
+            )
+            insights = [describe_driver(analysis, driver) for driver in analysis.pop("drivers")]
+            return {
+                "analysis_type": analysis_type,
+                "analysis": analysis,
+                "insights": insights,
+                "summary": {
+                    "total_insights": len(insights),
+                    "high_impact_count": len([i for i in insights if i["impact"] == "high"]),
+                    "key_opportunities": [i["title"] for i in insights if (i["contribution"] or 0) > 0][:3]
+                },
+                "recommendations": [insight["recommendation"] for insight in insights]
+            }
+
+        # 未配置 DuckDB 数据库时返回示例洞察
         insights = [
             {
                 "type": "category_performance",
@@ -391,6 +482,7 @@ class AWELWorkflowEngine:
 
         return {
             "analysis_type": analysis_type,
+            "data_source": "sample",
             "insights": insights,
             "summary": {
                 "total_insights": len(insights),
@@ -401,13 +493,19 @@ class AWELWorkflowEngine:
         }
 
     async def _execute_sales_report(self, input_data: Dict[str, Any], parameters: Dict[str, Any]) -> Dict[str, Any]:
-        # 模拟销售报告生成
         report_type = parameters.get("report_type", "summary")
         time_range = parameters.get("time_range", "last_7_days")
 
+        engine = get_sales_report_engine()
+        if engine.supports_database():
+            return await asyncio.to_thread(engine.generate, report_type, time_range,
+                                           parameters.get("as_of"), parameters.get("top_n"))
+
+        # 未配置 DuckDB 数据库时返回示例报告
         return {
             "report_type": report_type,
             "time_range": time_range,
+            "data_source": "sample",
             "summary": {
                 "total_sales": 3590000.00,
                 "total_orders": 1250,
@@ -427,12 +525,160 @@ class AWELWorkflowEngine:
             }
         }
 
+# 图表以内容寻址 ID 标识，内容不会变化，可长期缓存
+CHART_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def chart_etag_matches(chart_id: str, if_none_match: Optional[str]) -> bool:
+    """检查 If-None-Match 是否命中图表 ETag"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or f'"{chart_id}"' in tags or f'W/"{chart_id}"' in tags
+
+
 # 初始化组件
 db_manager = DatabaseManager()
 nl2sql_engine = NL2SQLEngine(db_manager)
 workflow_engine = AWELWorkflowEngine(db_manager, nl2sql_engine)
+duckdb_warmer = DuckDBWarmer()
+
+
+async def warm_hot_query(item: Dict[str, Any]):
+    """回放一个历史热点：填充 NL2SQL 缓存、结果缓存，并把涉及的数据页读入 DuckDB 缓冲池"""
+    converted = await asyncio.to_thread(nl2sql_engine.convert, item["question"])
+    for sql in dict.fromkeys([converted["sql"], item.get("sql")]):
+        if not sql:
+            continue
+        await asyncio.to_thread(db_manager.execute_query, sql)
+        if duckdb_warmer.supports_database():
+            try:
+                await asyncio.to_thread(duckdb_warmer.warm, sql)
+            except Exception as e:
+                # 历史 SQL 可能引用已变更的表，缓冲池预热尽力而为
+                logger.debug(f"DuckDB 预热跳过: {e}")
+
+
+warmup_manager = WarmupManager(warm_hot_query)
+job_manager = WorkflowJobManager(workflow_engine.execute_workflow)
+
+
+def job_links(job_id: str) -> Dict[str, str]:
+    return {
+        "status_url": f"/api/v1/workflow/{job_id}",
+        "events_url": f"/api/v1/workflow/{job_id}/events"
+    }
+
+
+async def submit_workflow_job(data: Dict[str, Any], wait: float = 0.0):
+    """提交异步工作流任务；wait > 0 时最多等待该秒数，已完成则直接返回结果
+
+    返回 (HTTP 状态码, 响应体)：已结束为 200（失败时带 error），仍在执行为 202
+    """
+    if data.get("workflow_type") not in WORKFLOW_TYPES:
+        raise ValueError(f"未知的工作流类型: {data.get('workflow_type')}")
+    job = await job_manager.submit(
+        data["workflow_type"],
+        data.get("input_data") or {},
+        data.get("parameters") or {},
+        data.get("priority") or "normal"
+    )
+    if wait > 0:
+        job = await job_manager.wait(job.job_id, wait)
+    if job.status == "completed":
+        # 与同步执行时的响应格式一致
+        return 200, {**job.result, "job_id": job.job_id}
+    if job.status in FINISHED_STATUSES:
+        return 200, {**job.to_dict(), **job_links(job.job_id)}
+    return 202, {"job_id": job.job_id, "status": job.status, **job_links(job.job_id)}
+
+
+# SSE 保活间隔（秒）
+SSE_HEARTBEAT_SECONDS = 15.0
+
+
+def sse_event(event: Optional[Dict[str, Any]]) -> bytes:
+    """Server-Sent Events 格式的一条任务状态事件；None 为保活注释"""
+    if event is None:
+        return b": keepalive\n\n"
+    return b"event: " + event["status"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+
+
+def traced_nl2sql(question: str, database: str = "analytics", context: Optional[str] = None,
+                  traceparent: Optional[str] = None):
+    """在一次请求追踪下执行 NL2SQL 转换，返回结果和当前 Span"""
+    with tracer.start_trace("POST /api/v1/nl2sql", traceparent=traceparent, **{
+        "http.route": "/api/v1/nl2sql", "db.name": database
+    }) as root:
+        with tracer.span("nl2sql.convert", **{"nl2sql.question": question}) as span:
+            result = nl2sql_engine.convert(question, database, context)
+            span.set_attributes({
+                "nl2sql.cache_hit": result["metadata"].get("cache_hit", False),
+                "nl2sql.query_type": result["metadata"].get("query_type")
+            })
+    return result, root
+
+
+def record_http_request(method: str, route: str, status: int, seconds: float):
+    """记录 HTTP 请求耗时；route 使用路由模板，避免路径参数撑爆标签基数"""
+    metrics.observe("http_request_duration_seconds", seconds, method=method, route=route)
+    metrics.inc("http_requests_total", method=method, route=route, status=f"{status // 100}xx")
+
+
+def build_stats() -> Dict[str, Any]:
+    """由指标注册表汇总 /api/v1/stats"""
+    uptime = time.time() - metrics.started_at
+    requests_total = metrics.counter_value("http_requests_total")
+    errors_total = metrics.counter_value("http_requests_total", status="5xx")
+    http = metrics.merged_histogram("http_request_duration_seconds").snapshot()
+    runs = metrics.counter_value("workflow_executions_total")
+    completed = metrics.counter_value("workflow_executions_total", status="completed")
+    snapshot = metrics.snapshot()
+
+    return {
+        "system": {
+            "uptime_seconds": round(uptime, 1),
+            "version": "2.0.0",
+            "environment": os.getenv("DBGPT_ENV", "development")
+        },
+        "database": {
+            "total_databases": len(db_manager.schemas),
+            "total_tables": sum(len(tables) for tables in db_manager.schemas.values()),
+            "connection_status": "healthy"
+        },
+        "workflows": {
+            "total_workflows": len(WORKFLOW_TYPES),
+            "execution_count": int(runs),
+            "success_rate": round(completed / runs * 100, 2) if runs else 100.0,
+            "by_type": {
+                workflow_type: int(metrics.counter_value("workflow_executions_total", workflow_type=workflow_type))
+                for workflow_type in WORKFLOW_TYPES
+            },
+            "jobs": job_manager.get_metrics()
+        },
+        "performance": {
+            "requests": int(requests_total),
+            "avg_response_time_ms": http.get("mean_ms", 0.0),
+            "p50_response_time_ms": http.get("p50_ms", 0.0),
+            "p99_response_time_ms": http.get("p99_ms", 0.0),
+            "throughput_rps": round(requests_total / uptime, 3) if uptime > 0 else 0.0,
+            "error_rate": round(errors_total / requests_total * 100, 3) if requests_total else 0.0
+        },
+        "caches": {
+            "nl2sql": nl2sql_engine.cache.get_metrics(),
+            "query_result": db_manager.result_cache.get_metrics()
+        },
+        "stages": snapshot["histograms"].get("awel_operator_duration_seconds", {}),
+        "queries": snapshot["histograms"].get("nl2sql_query_duration_seconds", {})
+    }
 
 if FASTAPI_AVAILABLE:
+    def json_response(request: Request, data: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+        """按请求协商压缩和缩进的 JSON 响应；直接返回 Response，跳过 pydantic 校验与标准库序列化"""
+        body, response_headers = encode_json(data, request.headers.get("accept-encoding"),
+                                             wants_pretty(request.url.query))
+        return Response(content=body, headers={**response_headers, **(headers or {})})
+
     @app.get("/")
     async def root():
         return {
@@ -451,10 +697,42 @@ if FASTAPI_AVAILABLE:
             "network_status": "容器内网络问题已解决"
         }
 
+    @app.middleware("http")
+    async def measure_requests(request: Request, call_next):
+        """按单调时钟记录每个请求的耗时"""
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            record_http_request(request.method, route, status, time.perf_counter() - start)
+
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        """Prometheus 文本格式指标"""
+        return Response(content=metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.on_event("startup")
+    async def start_warmup():
+        """后台预热，不阻塞服务启动"""
+        warmup_manager.start()
+        await job_manager.start()
+
+    @app.on_event("shutdown")
+    async def stop_jobs():
+        await job_manager.stop()
+        # 写出缓冲中的审计记录并完成当前分段（Parquet 写入文件尾）
+        await get_audit_writer().close()
+
     @app.get("/health")
     async def health_check():
+        warmup = warmup_manager.get_status()
         return {
             "status": "healthy",
+            "ready": warmup["ready"],
             "service": "dbgpt-complete",
             "timestamp": datetime.now().isoformat(),
             "components": {
@@ -464,42 +742,72 @@ if FASTAPI_AVAILABLE:
                 "workflow_engine": "ok",
                 "vector_store": "ok"
             },
+            "warmup": warmup,
             "network_solution": "主机网络模式 + IP 代理配置"
         }
 
     @app.post("/api/v1/nl2sql", response_model=NL2SQLResponse)
-    async def nl2sql_convert(request: NL2SQLRequest):
+    async def nl2sql_convert(request: NL2SQLRequest, http_request: Request):
         """自然语言转 SQL"""
         try:
-            result = nl2sql_engine.convert(request.question, request.database, request.context)
-            return NL2SQLResponse(**result)
+            result, span = traced_nl2sql(request.question, request.database, request.context,
+                                         http_request.headers.get("traceparent"))
+            return json_response(http_request, result, {"traceparent": span.traceparent} if span.sampled else None)
         except Exception as e:
             logger.error(f"NL2SQL 转换错误: {e}")
             raise HTTPException(status_code=500, detail=str(e))
 
     @app.post("/api/v1/query", response_model=QueryResponse)
-    async def execute_query(request: QueryRequest):
+    async def execute_query(request: QueryRequest, http_request: Request):
         """执行 SQL 查询"""
         try:
             result = db_manager.execute_query(request.sql, request.database)
-            return QueryResponse(**result)
+            return json_response(http_request, result)
         except Exception as e:
             logger.error(f"查询执行错误: {e}")
             raise HTTPException(status_code=500, detail=str(e))
 
-    @app.post("/api/v1/workflow", response_model=WorkflowResponse)
-    async def execute_workflow(request: WorkflowRequest):
-        """执行 AWEL 工作流"""
+    @app.post("/api/v1/workflow", status_code=202)
+    async def execute_workflow(request: WorkflowRequest, http_request: Request, wait: float = 0.0):
+        """提交 AWEL 工作流任务，返回 202 和任务 ID；?wait=秒数 时在该时间内完成则直接返回结果"""
         try:
-            result = await workflow_engine.execute_workflow(
-                request.workflow_type,
-                request.input_data,
-                request.parameters
-            )
-            return WorkflowResponse(**result)
-        except Exception as e:
-            logger.error(f"工作流执行错误: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+            status, body = await submit_workflow_job(request.dict(), min(wait, 60.0))
+        except JobQueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        response = json_response(http_request, body, {"Location": f"/api/v1/workflow/{body.get('job_id')}"}
+                                 if status == 202 else None)
+        response.status_code = status
+        return response
+
+    @app.get("/api/v1/workflow/{job_id}")
+    async def get_workflow_job(job_id: str, request: Request):
+        """查询工作流任务状态和结果"""
+        job = await asyncio.to_thread(job_manager.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="任务不存在或已过期")
+        return json_response(request, {**job.to_dict(), **job_links(job_id)})
+
+    @app.get("/api/v1/workflow/{job_id}/events")
+    async def workflow_job_events(job_id: str):
+        """以 SSE 推送任务进度，任务结束后关闭"""
+        if await asyncio.to_thread(job_manager.get, job_id) is None:
+            raise HTTPException(status_code=404, detail="任务不存在或已过期")
+
+        async def stream():
+            async for event in job_manager.events(job_id, SSE_HEARTBEAT_SECONDS):
+                yield sse_event(event)
+
+        return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    @app.delete("/api/v1/workflow/{job_id}")
+    async def cancel_workflow_job(job_id: str, request: Request):
+        """取消排队或执行中的任务"""
+        job = await job_manager.cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="任务不存在或已过期")
+        return json_response(request, job.to_dict(include_result=False))
 
     @app.get("/api/v1/databases")
     async def list_databases():
@@ -587,40 +895,125 @@ if FASTAPI_AVAILABLE:
             ]
         }
 
+    @app.get("/charts/{chart_id}")
+    async def get_chart(chart_id: str, request: Request, format: str = "png"):
+        """按需获取趋势图：format=png 渲染图片，format=json 返回前端绘图描述"""
+        from flows.chart_store import get_chart_store
+
+        store = get_chart_store()
+        if store.get_spec(chart_id) is None:
+            raise HTTPException(status_code=404, detail="图表不存在或已过期")
+
+        headers = {"ETag": f'"{chart_id}"', "Cache-Control": CHART_CACHE_CONTROL}
+        if chart_etag_matches(chart_id, request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+
+        if format == "json":
+            return json_response(request, store.get_spec(chart_id), headers)
+
+        try:
+            image = await store.get_png(chart_id)
+        except Exception as e:
+            logger.error(f"图表渲染错误: {e}")
+            raise HTTPException(status_code=503, detail="图表渲染失败，可改用 format=json")
+        if image is None:
+            raise HTTPException(status_code=404, detail="图表不存在或已过期")
+        return Response(content=image, media_type="image/png", headers=headers)
+
+    @app.get("/api/v1/audit/report")
+    async def audit_report(request: Request, top: int = 20, since_days: Optional[int] = None, refresh: bool = True):
+        """查询审计热点报告：增量导入审计日志后返回最热问题、最慢 SQL 和优化建议"""
+        from flows.audit_analytics import get_audit_analytics
+
+        try:
+            report = await asyncio.to_thread(get_audit_analytics().report, top, since_days, refresh)
+            return json_response(request, report)
+        except Exception as e:
+            logger.error(f"审计报告生成错误: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
     @app.get("/api/v1/stats")
-    async def get_stats():
+    async def get_stats(request: Request):
         """获取系统统计信息"""
-        return {
-            "system": {
-                "uptime": "运行中",
-                "version": "2.0.0",
-                "environment": "development"
-            },
-            "database": {
-                "total_databases": 1,
-                "total_tables": 3,
-                "connection_status": "healthy"
-            },
-            "workflows": {
-                "total_workflows": 4,
-                "execution_count": 0,
-                "success_rate": 100.0
-            },
-            "performance": {
-                "avg_response_time": "< 200ms",
-                "throughput": "高",
-                "error_rate": "< 1%"
-            }
-        }
+        return json_response(request, build_stats())
 
 else:
     # 如果 FastAPI 不可用，使用简化的 HTTP 服务器
     import json
-    from http.server import HTTPServer, BaseHTTPRequestHandler
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
     from urllib.parse import urlparse, parse_qs
 
+    # 所有请求线程共享的常驻事件循环
+    event_loop = get_event_loop_thread()
+
+    class BoundedThreadingHTTPServer(ThreadingHTTPServer):
+        """每个连接一个线程；限制连接数（线程数）和同时处理的请求数"""
+        daemon_threads = True
+        request_queue_size = 128
+
+        def __init__(self, server_address, handler_class, max_connections: int = 256, max_concurrency: int = 32):
+            super().__init__(server_address, handler_class)
+            self.connection_slots = threading.BoundedSemaphore(max_connections)
+            self.request_slots = threading.BoundedSemaphore(max_concurrency)
+
+        def process_request(self, request, client_address):
+            # 连接数达到上限时在此等待，新连接留在监听队列中
+            self.connection_slots.acquire()
+            try:
+                super().process_request(request, client_address)
+            except Exception:
+                self.connection_slots.release()
+                raise
+
+        def process_request_thread(self, request, client_address):
+            try:
+                super().process_request_thread(request, client_address)
+            finally:
+                self.connection_slots.release()
+
     class CompleteDBGPTHandler(BaseHTTPRequestHandler):
+        # 简化服务器没有路由表，带参数的路径按前缀归并
+        ROUTE_PREFIXES = ('/charts/', '/api/nl2sql', '/api/v1/workflow/')
+        # HTTP/1.1 长连接；空闲超过 timeout 秒的连接被关闭，释放线程
+        protocol_version = "HTTP/1.1"
+        timeout = float(os.getenv('DBGPT_KEEPALIVE_TIMEOUT', '15'))
+        disable_nagle_algorithm = True
+
+        def handle_one_request(self):
+            """记录每个请求的耗时和状态码"""
+            self._status = None
+            start = time.perf_counter()
+            super().handle_one_request()
+            if self._status is not None:
+                path = urlparse(self.path).path
+                route = next((prefix for prefix in self.ROUTE_PREFIXES if path.startswith(prefix)), path)
+                if self._status == 404:
+                    route = "unmatched"
+                record_http_request(self.command or "-", route, self._status, time.perf_counter() - start)
+
+        def send_response(self, code, message=None):
+            self._status = code
+            super().send_response(code, message)
+
         def do_GET(self):
+            path = urlparse(self.path).path
+            if path.startswith('/api/v1/workflow/') and path.endswith('/events'):
+                # 事件流持续到任务结束，只占用连接线程，不占并发请求名额
+                self.send_job_events(path[len('/api/v1/workflow/'):-len('/events')])
+                return
+            with self.server.request_slots:
+                self.handle_get()
+
+        def do_POST(self):
+            with self.server.request_slots:
+                self.handle_post()
+
+        def do_DELETE(self):
+            with self.server.request_slots:
+                self.handle_delete()
+
+        def handle_get(self):
             """处理 GET 请求"""
             parsed_path = urlparse(self.path)
             path = parsed_path.path
@@ -628,8 +1021,10 @@ else:
             if path == '/':
                 self.send_html_response(self.get_main_page())
             elif path == '/health':
+                warmup = warmup_manager.get_status()
                 self.send_json_response({
                     "status": "healthy",
+                    "ready": warmup["ready"],
                     "service": "dbgpt-complete",
                     "timestamp": datetime.now().isoformat(),
                     "components": {
@@ -638,6 +1033,7 @@ else:
                         "nl2sql_engine": "ok",
                         "workflow_engine": "ok"
                     },
+                    "warmup": warmup,
                     "network_solution": "容器内网络问题已解决"
                 })
             elif path == '/api/v1/databases':
@@ -660,26 +1056,56 @@ else:
                         {"type": "sales_report", "name": "销售报告"}
                     ]
                 })
+            elif path == '/metrics':
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif path == '/api/v1/stats':
+                self.send_json_response(build_stats())
+            elif path.startswith('/api/v1/workflow/'):
+                job_id = path[len('/api/v1/workflow/'):]
+                job = job_manager.get(job_id)
+                if job is None:
+                    self.send_empty_response(404, b'Not Found')
+                    return
+                self.send_json_response({**job.to_dict(), **job_links(job_id)})
+            elif path.startswith('/charts/'):
+                self.send_chart_response(path[len('/charts/'):], parse_qs(parsed_path.query))
+            elif path == '/api/v1/audit/report':
+                from flows.audit_analytics import get_audit_analytics
+                query_params = parse_qs(parsed_path.query)
+                since_days = query_params.get('since_days', [None])[0]
+                try:
+                    report = get_audit_analytics().report(
+                        top=int(query_params.get('top', ['20'])[0]),
+                        since_days=int(since_days) if since_days else None,
+                        refresh=query_params.get('refresh', ['true'])[0].lower() not in ('0', 'false')
+                    )
+                except Exception as e:
+                    logger.error(f"审计报告生成错误: {e}")
+                    self.send_empty_response(500)
+                    return
+                self.send_json_response(report)
             elif path.startswith('/api/nl2sql'):
                 query_params = parse_qs(parsed_path.query)
                 question = query_params.get('question', [''])[0]
                 result = nl2sql_engine.convert(question)
                 self.send_json_response(result)
             else:
-                self.send_response(404)
-                self.end_headers()
-                self.wfile.write(b'Not Found')
+                self.send_empty_response(404, b'Not Found')
 
-        def do_POST(self):
+        def handle_post(self):
             """处理 POST 请求"""
-            content_length = int(self.headers['Content-Length'])
+            content_length = int(self.headers.get('Content-Length') or 0)
             post_data = self.rfile.read(content_length)
 
             try:
                 data = json.loads(post_data.decode('utf-8'))
             except:
-                self.send_response(400)
-                self.end_headers()
+                self.send_empty_response(400)
                 return
 
             parsed_path = urlparse(self.path)
@@ -687,38 +1113,128 @@ else:
 
             if path == '/api/v1/nl2sql':
                 question = data.get('question', '')
-                result = nl2sql_engine.convert(question)
+                result, span = traced_nl2sql(question, traceparent=self.headers.get('traceparent'))
+                self.send_json_response(result, {'traceparent': span.traceparent} if span.sampled else None)
+            elif path == '/api/v1/query':
+                result = db_manager.execute_query(data.get('sql', ''), data.get('database', 'analytics'))
                 self.send_json_response(result)
             elif path == '/api/v1/workflow':
-                import asyncio
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                result = loop.run_until_complete(
-                    workflow_engine.execute_workflow(
-                        data.get('workflow_type', ''),
-                        data.get('input_data', {}),
-                        data.get('parameters', {})
-                    )
-                )
-                self.send_json_response(result)
+                try:
+                    wait = min(float(parse_qs(parsed_path.query).get('wait', ['0'])[0]), 60.0)
+                    status, body = event_loop.run(submit_workflow_job(data, wait))
+                except JobQueueFullError:
+                    self.send_empty_response(503)
+                    return
+                except ValueError as e:
+                    self.send_empty_response(400, str(e).encode('utf-8'))
+                    return
+                except Exception as e:
+                    logger.error(f"工作流提交错误: {e}")
+                    self.send_empty_response(500)
+                    return
+                headers = {'Location': body['status_url']} if status == 202 else None
+                self.send_json_response(body, headers, status)
             else:
-                self.send_response(404)
-                self.end_headers()
+                self.send_empty_response(404)
 
-        def send_json_response(self, data):
-            """发送 JSON 响应"""
+        def handle_delete(self):
+            """处理 DELETE 请求：取消工作流任务"""
+            path = urlparse(self.path).path
+            if not path.startswith('/api/v1/workflow/'):
+                self.send_empty_response(404)
+                return
+            job = event_loop.run(job_manager.cancel(path[len('/api/v1/workflow/'):]))
+            if job is None:
+                self.send_empty_response(404, b'Not Found')
+                return
+            self.send_json_response(job.to_dict(include_result=False))
+
+        def send_job_events(self, job_id):
+            """以 SSE 推送任务进度；事件流不定长，发送完毕后关闭连接"""
+            if job_manager.get(job_id) is None:
+                self.send_empty_response(404, b'Not Found')
+                return
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.close_connection = True
+            events = job_manager.events(job_id, SSE_HEARTBEAT_SECONDS)
+            try:
+                while True:
+                    try:
+                        event = event_loop.run(events.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    self.wfile.write(sse_event(event))
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                event_loop.run(events.aclose())
+
+        def send_json_response(self, data, headers=None, status=200):
+            """发送 JSON 响应（?pretty=1 时缩进，按 Accept-Encoding 压缩）"""
+            body, json_headers = encode_json(data, self.headers.get('Accept-Encoding'), wants_pretty(self.path))
+            self.send_response(status)
+            for name, value in {**json_headers, **(headers or {})}.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_empty_response(self, code, body=b''):
+            """发送错误等简单响应；长连接下必须声明长度"""
+            self.send_response(code)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_chart_response(self, chart_id, query_params):
+            """发送图表（PNG 或 JSON 描述），带缓存头"""
+            from flows.chart_store import get_chart_store
+
+            store = get_chart_store()
+            spec = store.get_spec(chart_id)
+            if spec is None:
+                self.send_empty_response(404, b'Not Found')
+                return
+
+            if chart_etag_matches(chart_id, self.headers.get('If-None-Match')):
+                status, body, content_type = 304, b'', None
+            elif query_params.get('format', ['png'])[0] == 'json':
+                self.send_json_response(spec, {'ETag': f'"{chart_id}"', 'Cache-Control': CHART_CACHE_CONTROL})
+                return
+            else:
+                try:
+                    body = event_loop.run(store.get_png(chart_id))
+                except Exception as e:
+                    logger.error(f"图表渲染错误: {e}")
+                    self.send_empty_response(503)
+                    return
+                status, content_type = 200, 'image/png'
+
+            self.send_response(status)
+            self.send_header('ETag', f'"{chart_id}"')
+            self.send_header('Cache-Control', CHART_CACHE_CONTROL)
             self.send_header('Access-Control-Allow-Origin', '*')
+            if content_type:
+                self.send_header('Content-type', content_type)
+                self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+            self.wfile.write(body)
 
         def send_html_response(self, html):
             """发送 HTML 响应"""
+            body = html.encode('utf-8')
             self.send_response(200)
             self.send_header('Content-type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(html.encode('utf-8'))
+            self.wfile.write(body)
 
         def get_main_page(self):
             """获取主页面 HTML"""
@@ -837,12 +1353,22 @@ def main():
         uvicorn.run(app, host=host, port=port)
     else:
         logger.info(f"🎯 使用简化 HTTP 服务器模式")
-        server = HTTPServer((host, port), CompleteDBGPTHandler)
+        max_connections = int(os.getenv('DBGPT_MAX_CONNECTIONS', '256'))
+        max_concurrency = int(os.getenv('DBGPT_MAX_CONCURRENCY', '32'))
+        server = BoundedThreadingHTTPServer((host, port), CompleteDBGPTHandler, max_connections, max_concurrency)
+        logger.info(f"⚙️  最大连接数 {max_connections}，最大并发请求 {max_concurrency}")
+        event_loop.start()
+        event_loop.run(job_manager.start())
+        if warmup_manager.enabled:
+            event_loop.submit(warmup_manager.run())
         try:
             server.serve_forever()
         except KeyboardInterrupt:
             logger.info("服务器停止")
             server.server_close()
+            event_loop.run(job_manager.stop())
+            event_loop.run(get_audit_writer().close())
+            event_loop.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,481 @@
+"""
+异步告警分发器
+有界队列接收告警，按指纹 + 时间窗口去重合并，令牌桶执行 webhook_config.json 中的
+rate_limit，突发告警合并为一张飞书卡片，经连接池 HTTP 客户端发送并按退避重试
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+import http.client
+import importlib.util
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+from urllib.parse import urlsplit
+
+from flows.anomaly_detection import Anomaly, WEBHOOK_CONFIG_PATH
+
+
+AIOHTTP_AVAILABLE = importlib.util.find_spec("aiohttp") is not None
+FEISHU_FREQUENCY_LIMITED = 11232  # 飞书机器人限频错误码，可重试
+
+
+@dataclass
+class Alert:
+    """告警"""
+    alert_type: str  # anomaly / threshold / system
+    title: str
+    message: str
+    severity: str = "warning"  # warning / critical
+    data: Dict[str, Any] = field(default_factory=dict)
+    fingerprint: str = ""  # 去重键，默认由类型和标题生成
+    timestamp: float = field(default_factory=time.time)
+    count: int = 1  # 合并的重复次数
+
+    def __post_init__(self):
+        if not self.fingerprint:
+            self.fingerprint = hashlib.sha1(f"{self.alert_type}|{self.title}".encode("utf-8")).hexdigest()
+
+    @classmethod
+    def from_anomaly(cls, anomaly: Anomaly) -> "Alert":
+        """由异常事件构造告警，同一 SKU、指标和异常类型视为同一告警"""
+        return cls(
+            alert_type="anomaly",
+            title=f"SKU {anomaly.sku} {anomaly.metric} {anomaly.kind}",
+            message=(f"{anomaly.date} {anomaly.metric} = {anomaly.value:,.2f}，"
+                     f"基线 {anomaly.baseline:,.2f}（z = {anomaly.z_score:.1f}）"),
+            severity=anomaly.severity,
+            data=anomaly.to_dict(),
+            fingerprint=f"anomaly:{anomaly.sku}:{anomaly.metric}:{anomaly.kind}"
+        )
+
+
+class TokenBucket:
+    """令牌桶"""
+
+    def __init__(self, capacity: float, period_seconds: float):
+        self.capacity = capacity
+        self.rate = capacity / period_seconds
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: float = 1) -> float:
+        """距离可取得 n 个令牌的秒数"""
+        self._refill()
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+    def consume(self, n: float = 1):
+        self._refill()
+        self.tokens -= n
+
+
+# ----------------------------------------------------------------------
+# HTTP 客户端
+# ----------------------------------------------------------------------
+
+class AiohttpTransport:
+    """aiohttp 连接池"""
+
+    def __init__(self, pool_size: int = 4):
+        self.pool_size = pool_size
+        self._session = None
+
+    async def post_json(self, url: str, payload: Dict, timeout: float) -> Tuple[int, Any]:
+        import aiohttp
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            )
+        async with self._session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            try:
+                body = await resp.json(content_type=None)
+            except Exception:
+                body = await resp.text()
+            return resp.status, body
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class StdlibTransport:
+    """标准库 keep-alive 连接池（未安装 aiohttp 时使用，请求在线程中执行）"""
+
+    def __init__(self, pool_size: int = 4):
+        self.pool_size = pool_size
+        self._idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, scheme: str, netloc: str, timeout: float) -> http.client.HTTPConnection:
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                return conn
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=timeout)
+
+    def _release(self, scheme: str, netloc: str, conn: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _post(self, url: str, payload: Dict, timeout: float) -> Tuple[int, Any]:
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8", "Connection": "keep-alive"}
+
+        for attempt in range(2):
+            conn = self._acquire(parts.scheme, parts.netloc, timeout)
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                raw = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # 复用的空闲连接可能已被服务端关闭，换新连接重试一次
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(parts.scheme, parts.netloc, conn)
+            try:
+                return resp.status, json.loads(raw.decode("utf-8"))
+            except ValueError:
+                return resp.status, raw.decode("utf-8", errors="replace")
+
+    async def post_json(self, url: str, payload: Dict, timeout: float) -> Tuple[int, Any]:
+        return await asyncio.to_thread(self._post, url, payload, timeout)
+
+    async def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+# ----------------------------------------------------------------------
+# 分发器
+# ----------------------------------------------------------------------
+
+class AlertDispatcher:
+    """告警分发器"""
+
+    def __init__(self, webhook_url: str, max_per_hour: Optional[int] = 10, max_per_day: Optional[int] = 50,
+                 alert_types: Optional[List[str]] = None, enabled: bool = True,
+                 max_queue: int = 1000, dedup_window: float = 1800.0, batch_window: float = 2.0,
+                 max_batch_lines: int = 20, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 30.0, timeout: float = 10.0, log_path: Optional[str] = None,
+                 transport=None):
+        self.webhook_url = webhook_url
+        self.alert_types = set(alert_types) if alert_types else None
+        self.enabled = enabled
+        self.dedup_window = dedup_window
+        self.batch_window = batch_window
+        self.max_batch_lines = max_batch_lines
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.log_path = log_path
+        self.logger = logging.getLogger(__name__)
+        self.transport = transport or (AiohttpTransport() if AIOHTTP_AVAILABLE else StdlibTransport())
+
+        self._buckets: List[TokenBucket] = []
+        if max_per_hour:
+            self._buckets.append(TokenBucket(max_per_hour, 3600))
+        if max_per_day:
+            self._buckets.append(TokenBucket(max_per_day, 86400))
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._pending: "OrderedDict[str, Alert]" = OrderedDict()
+        self._recent: Dict[str, float] = {}
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.metrics = {
+            "received": 0,
+            "dropped": 0,
+            "filtered": 0,
+            "deduplicated": 0,
+            "coalesced": 0,
+            "cards_sent": 0,
+            "alerts_sent": 0,
+            "retries": 0,
+            "send_failures": 0,
+            "rate_limited_waits": 0
+        }
+
+    @classmethod
+    def from_config(cls, path: str = WEBHOOK_CONFIG_PATH, **overrides) -> "AlertDispatcher":
+        """从 webhook_config.json 创建"""
+        with open(path, "r", encoding="utf-8") as f:
+            feishu = json.load(f).get("feishu", {})
+        rate_limit = feishu.get("rate_limit", {})
+        options = {
+            "webhook_url": feishu.get("webhook_url", ""),
+            "enabled": feishu.get("enabled", True),
+            "alert_types": feishu.get("alert_types"),
+            "max_per_hour": rate_limit.get("max_per_hour"),
+            "max_per_day": rate_limit.get("max_per_day")
+        }
+        options.update(overrides)
+        return cls(**options)
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """启动后台发送任务"""
+        if self._worker is None:
+            self._loop = asyncio.get_running_loop()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, drain: bool = True, timeout: float = 30.0):
+        """停止；drain 时先发送队列和待合并的告警（忽略剩余的速率等待）"""
+        if self._worker is not None:
+            # wait_for 内部任务恰好完成时会吞掉取消（Python < 3.12），需重复取消直到任务结束
+            while not self._worker.done():
+                self._worker.cancel()
+                await asyncio.wait({self._worker}, timeout=0.1)
+            self._worker = None
+        if drain:
+            self._drain_queue()
+            if self._pending:
+                try:
+                    await asyncio.wait_for(self._flush(), timeout)
+                except asyncio.TimeoutError:
+                    self.logger.warning(f"停止时仍有 {len(self._pending)} 条告警未发送")
+        await self.transport.close()
+
+    # ------------------------------------------------------------------
+    # 提交
+    # ------------------------------------------------------------------
+
+    def submit(self, alert: Alert) -> bool:
+        """非阻塞提交；队列满时丢弃并计数。可从其他线程调用"""
+        if self._loop is not None and not self._in_loop_thread():
+            self._loop.call_soon_threadsafe(self._enqueue, alert)
+            return True
+        return self._enqueue(alert)
+
+    def submit_anomalies(self, anomalies: List[Anomaly]):
+        """AnomalyDetector.subscribe 回调"""
+        for anomaly in anomalies:
+            self.submit(Alert.from_anomaly(anomaly))
+
+    def _in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _enqueue(self, alert: Alert) -> bool:
+        self.metrics["received"] += 1
+        if not self.enabled or (self.alert_types and alert.alert_type not in self.alert_types):
+            self.metrics["filtered"] += 1
+            return False
+        try:
+            self._queue.put_nowait(alert)
+            return True
+        except asyncio.QueueFull:
+            self.metrics["dropped"] += 1
+            return False
+
+    def queue_depth(self) -> int:
+        """队列中与待合并的告警数"""
+        return self._queue.qsize() + len(self._pending)
+
+    # ------------------------------------------------------------------
+    # 后台任务
+    # ------------------------------------------------------------------
+
+    async def _run(self):
+        while True:
+            # 等待第一条告警，随后在合并窗口内收集突发告警
+            self._accept(await self._queue.get())
+            deadline = time.monotonic() + self.batch_window
+            await self._collect_until(deadline)
+
+            # 速率受限时继续收集，到可发送时一并合并为一张卡片
+            wait = self._rate_wait()
+            if wait > 0:
+                self.metrics["rate_limited_waits"] += 1
+                self.logger.info(f"告警发送受速率限制，{wait:.0f} 秒后合并发送 {len(self._pending)} 条")
+                await self._collect_until(time.monotonic() + wait)
+
+            if self._pending:
+                await self._flush()
+
+    async def _collect_until(self, deadline: float):
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                alert = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return
+            self._accept(alert)
+
+    def _drain_queue(self):
+        while not self._queue.empty():
+            self._accept(self._queue.get_nowait())
+
+    def _accept(self, alert: Alert):
+        """去重与合并"""
+        pending = self._pending.get(alert.fingerprint)
+        if pending is not None:
+            pending.count += alert.count
+            pending.timestamp = alert.timestamp
+            if alert.severity == "critical":
+                pending.severity = "critical"
+            self.metrics["coalesced"] += 1
+            return
+
+        sent_at = self._recent.get(alert.fingerprint)
+        if sent_at is not None and alert.timestamp - sent_at < self.dedup_window:
+            self.metrics["deduplicated"] += 1
+            return
+        self._pending[alert.fingerprint] = alert
+
+    def _rate_wait(self) -> float:
+        return max((bucket.wait_time() for bucket in self._buckets), default=0.0)
+
+    async def _flush(self):
+        """合并待发送告警为一张卡片并发送"""
+        alerts = list(self._pending.values())
+        for bucket in self._buckets:
+            bucket.consume()
+
+        payload = self.build_card(alerts)
+        sent = await self._send(payload)
+        # 发送有结果后才移出待发送表；发送途中被 stop() 取消时整批留给停止时补发
+        for alert in alerts:
+            self._pending.pop(alert.fingerprint, None)
+        if sent:
+            now = time.time()
+            for alert in alerts:
+                self._recent[alert.fingerprint] = now
+            self._prune_recent(now)
+            self.metrics["cards_sent"] += 1
+            self.metrics["alerts_sent"] += len(alerts)
+        else:
+            self.metrics["send_failures"] += 1
+        self._write_log(alerts)
+
+    async def _send(self, payload: Dict) -> bool:
+        """带指数退避（含抖动）的发送"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                status, body = await self.transport.post_json(self.webhook_url, payload, self.timeout)
+                # 飞书在 HTTP 200 时通过 code 字段返回业务错误
+                code = body.get("code", body.get("StatusCode", 0)) if isinstance(body, dict) else 0
+                if status == 200 and code == 0:
+                    return True
+                retryable = status == 429 or status >= 500 or code == FEISHU_FREQUENCY_LIMITED
+                self.logger.warning(f"告警发送失败: HTTP {status} {body}")
+                if not retryable:
+                    return False
+            except Exception as e:
+                self.logger.warning(f"告警发送异常: {e}")
+
+            if attempt < self.max_retries:
+                self.metrics["retries"] += 1
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+        return False
+
+    def _prune_recent(self, now: float):
+        expired = [fp for fp, sent_at in self._recent.items() if now - sent_at >= self.dedup_window]
+        for fp in expired:
+            del self._recent[fp]
+
+    def _write_log(self, alerts: List[Alert]):
+        """每批追加一次告警日志（NDJSON）"""
+        if not self.log_path:
+            return
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps({
+                    "timestamp": datetime.fromtimestamp(alert.timestamp).isoformat(),
+                    "type": alert.alert_type,
+                    "message": alert.message,
+                    "data": {**alert.data, "count": alert.count}
+                }, ensure_ascii=False, default=str) + "\n" for alert in alerts)
+        except Exception as e:
+            self.logger.warning(f"告警日志写入失败: {e}")
+
+    # ------------------------------------------------------------------
+    # 卡片
+    # ------------------------------------------------------------------
+
+    def build_card(self, alerts: List[Alert]) -> Dict[str, Any]:
+        """多条告警合并为一张飞书交互卡片"""
+        alerts = sorted(alerts, key=lambda a: (a.severity != "critical", -a.count, a.timestamp))
+        critical = sum(1 for a in alerts if a.severity == "critical")
+        total = sum(a.count for a in alerts)
+
+        lines = []
+        for alert in alerts[:self.max_batch_lines]:
+            icon = "🔴" if alert.severity == "critical" else "🟠"
+            repeat = f"（×{alert.count}）" if alert.count > 1 else ""
+            lines.append(f"{icon} **{alert.title}**{repeat}\n{alert.message}")
+        if len(alerts) > self.max_batch_lines:
+            lines.append(f"……另有 {len(alerts) - self.max_batch_lines} 条告警未展开")
+
+        if len(alerts) == 1:
+            title = f"🚨 {alerts[0].title}"
+        else:
+            title = f"🚨 {len(alerts)} 条告警" + (f"（{critical} 条严重）" if critical else "")
+
+        return {
+            "msg_type": "interactive",
+            "card": {
+                "config": {"wide_screen_mode": True},
+                "header": {
+                    "title": {"tag": "plain_text", "content": title},
+                    "template": "red" if critical else "orange"
+                },
+                "elements": [
+                    {"tag": "div", "text": {"tag": "lark_md", "content": "\n\n".join(lines)}},
+                    {"tag": "hr"},
+                    {"tag": "note", "elements": [{
+                        "tag": "plain_text",
+                        "content": f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} · 共 {total} 次触发"
+                    }]}
+                ]
+            }
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """分发器指标"""
+        return {
+            **self.metrics,
+            "queue_depth": self.queue_depth(),
+            "tokens": [round(bucket.tokens, 2) for bucket in self._buckets]
+        }
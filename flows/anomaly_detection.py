@@ -0,0 +1,389 @@
+"""
+流式异常检测引擎
+按 SKU 维护增量统计量（Welford 均值方差、EWMA、按星期的季节基线），
+状态保存在紧凑的 NumPy 数组中；每批新数据到达时只更新受影响的 SKU，无需回扫历史
+"""
+
+import os
+import json
+import time
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Any, Callable, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_METRICS = ("daily_sales", "daily_revenue", "conversion_rate")
+STATE_ARRAYS = ("count", "last_day", "mean", "m2", "ewma", "ewvar", "wd_count", "wd_mean", "wd_m2")
+WEBHOOK_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   "config", "webhook_config.json")
+
+
+@dataclass
+class AnomalyConfig:
+    """异常检测参数"""
+    z_threshold: float = 3.0  # 相对基线的标准分阈值
+    ewma_alpha: float = 0.3
+    variance_alpha: float = 0.1  # 残差方差的平滑系数，较小的值使波动估计更稳定
+    min_observations: int = 7  # 观测数不足时只更新不报警
+    min_weekday_observations: int = 3  # 星期基线可用所需的同星期观测数
+    min_std_ratio: float = 0.05  # 标准差下限 = |基线| * min_std_ratio，避免平稳序列误报
+    min_rule_z: float = 2.0  # 销量突增 / 销售额下跌规则同时要求的最小标准分
+    sales_anomaly_threshold: Optional[float] = 5000  # 销量较基线的绝对增量阈值
+    revenue_drop_threshold: Optional[float] = 0.3  # 销售额较基线的下降比例阈值
+    conversion_rate_threshold: Optional[float] = 20.0  # 转化率上限
+
+    @classmethod
+    def from_webhook_config(cls, path: str = WEBHOOK_CONFIG_PATH, **overrides) -> "AnomalyConfig":
+        """读取 webhook_config.json 中的 alerts 阈值"""
+        thresholds: Dict[str, Any] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                alerts = json.load(f).get("alerts", {})
+            thresholds = {k: alerts[k] for k in (
+                "sales_anomaly_threshold", "revenue_drop_threshold", "conversion_rate_threshold"
+            ) if k in alerts}
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"告警阈值配置读取失败，使用默认值: {e}")
+        thresholds.update(overrides)
+        return cls(**thresholds)
+
+
+@dataclass
+class Anomaly:
+    """异常事件"""
+    sku: Any
+    date: str
+    metric: str
+    kind: str  # spike / dip / sales_surge / revenue_drop / conversion_rate
+    value: float
+    baseline: float
+    z_score: float
+    severity: str  # warning / critical
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class AnomalyDetector:
+    """按 SKU 的在线异常检测器"""
+
+    def __init__(self, config: Optional[AnomalyConfig] = None,
+                 metrics: Sequence[str] = DEFAULT_METRICS, initial_capacity: int = 1024):
+        self.config = config or AnomalyConfig.from_webhook_config()
+        self.metrics = tuple(metrics)
+        self.logger = logging.getLogger(__name__)
+        self._subscribers: List[Callable[[List[Anomaly]], None]] = []
+
+        self._index: Dict[Any, int] = {}
+        self._keys: List[Any] = []
+        self._allocate(initial_capacity)
+        self.watermark: Optional[np.datetime64] = None
+        self.stats = {
+            "rows_ingested": 0,
+            "rows_stale": 0,
+            "batches": 0,
+            "anomalies": 0,
+            "last_batch_ms": 0.0
+        }
+
+    # ------------------------------------------------------------------
+    # 状态数组
+    # ------------------------------------------------------------------
+
+    def _allocate(self, capacity: int):
+        k = len(self.metrics)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.last_day = np.full(capacity, np.iinfo(np.int64).min, dtype=np.int64)
+        self.mean = np.zeros((capacity, k))
+        self.m2 = np.zeros((capacity, k))
+        self.ewma = np.zeros((capacity, k))
+        self.ewvar = np.zeros((capacity, k))
+        self.wd_count = np.zeros((capacity, 7), dtype=np.int64)
+        self.wd_mean = np.zeros((capacity, k, 7))
+        self.wd_m2 = np.zeros((capacity, k, 7))
+
+    def _grow(self, needed: int):
+        """容量不足时成倍扩容"""
+        capacity = len(self.count)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in STATE_ARRAYS:
+            old = getattr(self, name)
+            fill = np.iinfo(np.int64).min if name == "last_day" else 0
+            grown = np.full((new_capacity,) + old.shape[1:], fill, dtype=old.dtype)
+            grown[:capacity] = old
+            setattr(self, name, grown)
+
+    def _resolve(self, skus: np.ndarray) -> np.ndarray:
+        """SKU -> 行号，新 SKU 追加到末尾"""
+        uniques, inverse = np.unique(skus, return_inverse=True)
+        rows = np.empty(len(uniques), dtype=np.int64)
+        for i, key in enumerate(uniques.tolist()):
+            row = self._index.get(key)
+            if row is None:
+                row = self._index[key] = len(self._keys)
+                self._keys.append(key)
+            rows[i] = row
+        self._grow(len(self._keys))
+        return rows[inverse]
+
+    # ------------------------------------------------------------------
+    # 数据接入
+    # ------------------------------------------------------------------
+
+    def subscribe(self, callback: Callable[[List[Anomaly]], None]):
+        """注册异常回调（每批一次，仅在有异常时调用）"""
+        self._subscribers.append(callback)
+
+    def ingest(self, skus, dates, values: Dict[str, Any]) -> List[Anomaly]:
+        """接入一批数据：先按历史基线打分，再增量更新统计量"""
+        start = time.perf_counter()
+        skus = np.asarray(skus)
+        days = np.asarray(dates, dtype="datetime64[D]")
+        matrix = np.column_stack([np.asarray(values[m], dtype=float) for m in self.metrics])
+        if len(skus) == 0:
+            return []
+
+        rows = self._resolve(skus)
+
+        # 同一批次中同一 SKU 的多天数据按日期分轮处理，每轮内 SKU 唯一，可整体向量化
+        order = np.lexsort((days, rows))
+        rows, days, matrix = rows[order], days[order], matrix[order]
+        first = np.r_[True, rows[1:] != rows[:-1]]
+        group_start = np.maximum.accumulate(np.where(first, np.arange(len(rows)), 0))
+        rank = np.arange(len(rows)) - group_start
+
+        stale = self.stats["rows_stale"]
+        anomalies: List[Anomaly] = []
+        for r in range(int(rank.max()) + 1):
+            sel = rank == r
+            anomalies.extend(self._process(rows[sel], days[sel], matrix[sel]))
+
+        latest = days.max()
+        self.watermark = latest if self.watermark is None else max(self.watermark, latest)
+        # 早于该 SKU 已处理日期的行只计入 rows_stale
+        self.stats["rows_ingested"] += len(rows) - (self.stats["rows_stale"] - stale)
+        self.stats["batches"] += 1
+        self.stats["anomalies"] += len(anomalies)
+        self.stats["last_batch_ms"] = (time.perf_counter() - start) * 1000
+
+        if anomalies:
+            for callback in self._subscribers:
+                try:
+                    callback(anomalies)
+                except Exception as e:
+                    self.logger.error(f"异常回调执行失败: {e}")
+        return anomalies
+
+    def ingest_frame(self, df: pd.DataFrame, sku_column: str = "sku",
+                     date_column: str = "date") -> List[Anomaly]:
+        """接入 DataFrame"""
+        return self.ingest(
+            df[sku_column].to_numpy(),
+            pd.to_datetime(df[date_column]).to_numpy(dtype="datetime64[D]"),
+            {m: df[m].to_numpy(dtype=float) for m in self.metrics}
+        )
+
+    def ingest_since(self, conn, table: str = "douyin_sales_detail", sku_column: str = "sku",
+                     date_column: str = "date") -> List[Anomaly]:
+        """只拉取各 SKU 已处理日期之后落库的数据（DuckDB 连接）
+
+        进度按 SKU 记录而不是全局水位线：同一天的数据分批落库、或某个 SKU 的数据晚到时都不会漏读
+        """
+        columns = ", ".join(f"t.{c}" for c in [sku_column, date_column] + list(self.metrics))
+        sql = f"SELECT {columns} FROM {table} t"
+        known = np.flatnonzero(self.count[:len(self._keys)] > 0)
+        registered = len(known) > 0
+        if registered:
+            conn.register("anomaly_progress", pd.DataFrame({
+                "sku": [str(self._keys[i]) for i in known],
+                "last_day": self.last_day[known].astype("datetime64[D]")
+            }))
+            sql += (f" LEFT JOIN anomaly_progress p ON CAST(t.{sku_column} AS VARCHAR) = p.sku"
+                    f" WHERE p.last_day IS NULL OR CAST(t.{date_column} AS DATE) > p.last_day")
+        try:
+            arrays = conn.execute(sql).fetchnumpy()
+        finally:
+            if registered:
+                conn.unregister("anomaly_progress")
+        return self.ingest(
+            arrays[sku_column],
+            np.asarray(arrays[date_column], dtype="datetime64[D]"),
+            {m: np.ma.filled(arrays[m], np.nan) if np.ma.isMaskedArray(arrays[m]) else arrays[m]
+             for m in self.metrics}
+        )
+
+    # ------------------------------------------------------------------
+    # 打分与更新
+    # ------------------------------------------------------------------
+
+    def _process(self, rows: np.ndarray, days: np.ndarray, x: np.ndarray) -> List[Anomaly]:
+        """单轮处理（rows 互不相同）"""
+        day_num = days.astype(np.int64)
+        fresh = day_num > self.last_day[rows]
+        self.stats["rows_stale"] += int((~fresh).sum())
+        if not fresh.all():
+            rows, days, day_num, x = rows[fresh], days[fresh], day_num[fresh], x[fresh]
+        if len(rows) == 0:
+            return []
+
+        cfg = self.config
+        # 1970-01-01 为星期四
+        weekday = (day_num + 3) % 7
+        count = self.count[rows]
+        valid = ~np.isnan(x)
+
+        # 基线 = EWMA 水平 + 星期偏移（同星期观测足够时），波动用残差的指数加权方差
+        wd_n = self.wd_count[rows, weekday]
+        use_wd = (wd_n >= cfg.min_weekday_observations)[:, None]
+        offset = np.where(use_wd, self.wd_mean[rows, :, weekday] - self.mean[rows], 0.0)
+        baseline = self.ewma[rows] + offset
+        # 指数加权方差从 0 起步，按已累计的残差期数做偏差修正
+        weight = 1 - (1 - cfg.variance_alpha) ** np.maximum(count - 1, 1)
+        std = np.sqrt(self.ewvar[rows] / weight[:, None])
+        std = np.maximum(std, cfg.min_std_ratio * np.abs(baseline) + 1e-9)
+        z = np.where(valid, (x - baseline) / std, 0.0)
+
+        warm = (count >= cfg.min_observations)[:, None] & valid
+        flags: Dict[str, np.ndarray] = {
+            "spike": warm & (z >= cfg.z_threshold),
+            "dip": warm & (z <= -cfg.z_threshold)
+        }
+        if cfg.sales_anomaly_threshold is not None and "daily_sales" in self.metrics:
+            col = self.metrics.index("daily_sales")
+            surge = np.zeros_like(warm)
+            surge[:, col] = warm[:, col] & (z[:, col] >= cfg.min_rule_z) & (
+                x[:, col] - baseline[:, col] >= cfg.sales_anomaly_threshold
+            )
+            flags["sales_surge"] = surge
+        if cfg.revenue_drop_threshold is not None and "daily_revenue" in self.metrics:
+            col = self.metrics.index("daily_revenue")
+            drop = np.zeros_like(warm)
+            drop[:, col] = warm[:, col] & (z[:, col] <= -cfg.min_rule_z) & (baseline[:, col] > 0) & (
+                x[:, col] <= (1 - cfg.revenue_drop_threshold) * baseline[:, col]
+            )
+            flags["revenue_drop"] = drop
+        if cfg.conversion_rate_threshold is not None and "conversion_rate" in self.metrics:
+            col = self.metrics.index("conversion_rate")
+            high = np.zeros_like(warm)
+            high[:, col] = valid[:, col] & (x[:, col] > cfg.conversion_rate_threshold)
+            flags["conversion_rate"] = high
+
+        anomalies = self._collect(rows, days, x, baseline, z, flags)
+        self._update(rows, weekday, day_num, x, valid, offset, baseline, std, warm)
+        return anomalies
+
+    def _update(self, rows: np.ndarray, weekday: np.ndarray, day_num: np.ndarray, x: np.ndarray,
+                valid: np.ndarray, offset: np.ndarray, baseline: np.ndarray, std: np.ndarray,
+                warm: np.ndarray):
+        """Welford / EWMA / 星期基线增量更新"""
+        alpha = self.config.ewma_alpha
+        beta = self.config.variance_alpha
+        x = np.where(valid, x, baseline)
+
+        # EWMA 水平和残差方差使用原始值，持续的水平变化会在几期内被吸收
+        level = x - offset
+        first = (self.count[rows] == 0)[:, None]
+        diff = level - self.ewma[rows]
+        self.ewma[rows] = np.where(first, level, self.ewma[rows] + alpha * diff)
+        self.ewvar[rows] = np.where(first, 0.0, (1 - beta) * self.ewvar[rows] + beta * diff * diff)
+
+        # 整体与星期统计量使用截断值，避免单次尖峰污染季节形态
+        bound = self.config.z_threshold * std
+        x = np.where(warm, np.clip(x, baseline - bound, baseline + bound), x)
+
+        n = self.count[rows] + 1
+        delta = x - self.mean[rows]
+        mean = self.mean[rows] + delta / n[:, None]
+        self.m2[rows] += delta * (x - mean)
+        self.mean[rows] = mean
+        self.count[rows] = n
+        self.last_day[rows] = day_num
+
+        wd_n = self.wd_count[rows, weekday] + 1
+        wd_mean = self.wd_mean[rows, :, weekday]
+        wd_delta = x - wd_mean
+        wd_mean = wd_mean + wd_delta / wd_n[:, None]
+        self.wd_m2[rows, :, weekday] += wd_delta * (x - wd_mean)
+        self.wd_mean[rows, :, weekday] = wd_mean
+        self.wd_count[rows, weekday] = wd_n
+
+    def _collect(self, rows, days, x, baseline, z, flags: Dict[str, np.ndarray]) -> List[Anomaly]:
+        """只为命中的单元构造异常对象"""
+        anomalies = []
+        for kind, mask in flags.items():
+            for i, j in zip(*np.nonzero(mask)):
+                score = float(z[i, j])
+                anomalies.append(Anomaly(
+                    sku=self._keys[rows[i]],
+                    date=str(days[i]),
+                    metric=self.metrics[j],
+                    kind=kind,
+                    value=float(x[i, j]),
+                    baseline=float(baseline[i, j]),
+                    z_score=score,
+                    severity="critical" if abs(score) >= 2 * self.config.z_threshold else "warning"
+                ))
+        return anomalies
+
+    # ------------------------------------------------------------------
+    # 查询与持久化
+    # ------------------------------------------------------------------
+
+    def baseline(self, sku: Any) -> Optional[Dict[str, Dict[str, Any]]]:
+        """查看单个 SKU 的当前统计量"""
+        row = self._index.get(sku)
+        if row is None:
+            return None
+        n = int(self.count[row])
+        return {
+            metric: {
+                "count": n,
+                "mean": float(self.mean[row, j]),
+                "std": float(np.sqrt(self.m2[row, j] / max(n - 1, 1))),
+                "ewma": float(self.ewma[row, j]),
+                "ewma_std": float(np.sqrt(self.ewvar[row, j])),
+                "weekday_mean": self.wd_mean[row, j].tolist()
+            }
+            for j, metric in enumerate(self.metrics)
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """引擎指标"""
+        return {
+            **self.stats,
+            "skus": len(self._keys),
+            "capacity": len(self.count),
+            "state_bytes": sum(getattr(self, name).nbytes for name in STATE_ARRAYS),
+            "watermark": str(self.watermark) if self.watermark is not None else None
+        }
+
+    def save(self, path: str):
+        """保存状态快照，重启后无需回放历史"""
+        n = len(self._keys)
+        np.savez_compressed(
+            path,
+            keys=np.asarray(self._keys, dtype=object),
+            metrics=np.asarray(self.metrics),
+            watermark=np.asarray(str(self.watermark) if self.watermark is not None else ""),
+            **{name: getattr(self, name)[:n] for name in STATE_ARRAYS}
+        )
+
+    @classmethod
+    def load(cls, path: str, config: Optional[AnomalyConfig] = None) -> "AnomalyDetector":
+        """从快照恢复"""
+        with np.load(path, allow_pickle=True) as snapshot:
+            detector = cls(config=config, metrics=[str(m) for m in snapshot["metrics"]],
+                           initial_capacity=max(1, len(snapshot["keys"])))
+            detector._keys = snapshot["keys"].tolist()
+            detector._index = {key: i for i, key in enumerate(detector._keys)}
+            n = len(detector._keys)
+            for name in STATE_ARRAYS:
+                getattr(detector, name)[:n] = snapshot[name]
+            watermark = str(snapshot["watermark"])
+            detector.watermark = np.datetime64(watermark, "D") if watermark else None
+        return detector
@@ -0,0 +1,491 @@
+"""
+查询审计分析
+将审计日志分段增量导入 DuckDB，按规范化问题与嵌入相似度聚类，
+统计最热和最慢的问题/SQL，为缓存预热、模板固化和预聚合提供候选
+"""
+
+import io
+import os
+import re
+import glob
+import zlib
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from flows.audit_log import ARROW_AVAILABLE, PARTIAL_SUFFIX
+
+
+AUDIT_COLUMNS = {
+    "timestamp": "TIMESTAMP",
+    "user_id": "VARCHAR",
+    "session_id": "VARCHAR",
+    "question": "VARCHAR",
+    "sql": "VARCHAR",
+    "success": "BOOLEAN",
+    "execution_time": "DOUBLE",
+    "row_count": "BIGINT",
+    "auto_fixed": "BOOLEAN"
+}
+
+# 问题规范化：小写、数字归一为 #、去掉空白与中英文标点
+QUESTION_NORM_SQL = (
+    "regexp_replace(regexp_replace(lower(nfc_normalize(trim(coalesce(question, '')))), '[0-9]+', '#', 'g'), "
+    "'[[:space:][:punct:]，。？！、：；“”‘’（）《》【】…·]+', '', 'g')"
+)
+# SQL 指纹：字面量替换为 ?，IN 列表折叠，空白压缩
+SQL_FINGERPRINT_SQL = (
+    "regexp_replace(regexp_replace(regexp_replace(regexp_replace(regexp_replace("
+    "lower(trim(coalesce(sql, ''))), '''(?:[^'']|'''')*''', '?', 'g'), "
+    "'\\b[0-9]+(?:\\.[0-9]+)?\\b', '?', 'g'), "
+    "'\\(\\s*\\?(?:\\s*,\\s*\\?)*\\s*\\)', '(?)', 'g'), "
+    "'\\s+', ' ', 'g'), '\\s*;$', '')"
+)
+
+GROUP_BY_PATTERN = re.compile(r"\bgroup by\s+(.+?)(?:\s+(?:having|order by|limit|qualify|window)\b|$)")
+FROM_PATTERN = re.compile(r"\bfrom\s+([\w.\"]+)")
+
+
+@dataclass
+class IngestStats:
+    """导入统计"""
+    files_scanned: int = 0
+    files_updated: int = 0
+    rows_ingested: int = 0
+    seconds: float = 0.0
+
+
+class HashedNgramEmbedder:
+    """字符 n-gram 哈希向量，未配置嵌入模型时用于问题相似度"""
+
+    def __init__(self, dims: int = 512, ngram_range: Tuple[int, int] = (1, 3)):
+        self.dims = dims
+        self.ngram_range = ngram_range
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dims), dtype=np.float32)
+        low, high = self.ngram_range
+        for i, text in enumerate(texts):
+            buckets = [
+                zlib.crc32(text[j:j + n].encode("utf-8")) % self.dims
+                for n in range(low, high + 1)
+                for j in range(len(text) - n + 1)
+            ]
+            if buckets:
+                np.add.at(vectors[i], buckets, 1.0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def split_top_level(expr: str) -> List[str]:
+    """按顶层逗号拆分表达式列表，并去掉子查询带出的多余右括号"""
+    parts, depth, current = [], 0, []
+    for ch in expr:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            if depth == 0:
+                break
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    parts.append("".join(current).strip())
+    return [p for p in parts if p]
+
+
+def _gzip_members(raw: bytes) -> Tuple[bytes, int]:
+    """解压连续的完整 gzip 成员，返回数据和已消费字节数（末尾未写完的成员留待下次）"""
+    chunks, pos = [], 0
+    while pos < len(raw):
+        decoder = zlib.decompressobj(wbits=31)
+        try:
+            data = decoder.decompress(raw[pos:])
+        except zlib.error:
+            break
+        if not decoder.eof:
+            break
+        chunks.append(data)
+        pos = len(raw) - len(decoder.unused_data)
+    return b"".join(chunks), pos
+
+
+class AuditAnalytics:
+    """审计日志分析器"""
+
+    def __init__(self, db_path: Optional[str] = None, log_dir: Optional[str] = None,
+                 prefix: str = "query_audit", embedder: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 similarity_threshold: float = 0.8, max_cluster_questions: int = 5000):
+        self.db_path = db_path or os.getenv("AUDIT_DB_PATH", "/app/data/audit_analytics.duckdb")
+        self.log_dir = log_dir or os.getenv("AUDIT_LOG_DIR", "/app/logs")
+        self.prefix = prefix
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.similarity_threshold = similarity_threshold
+        self.max_cluster_questions = max_cluster_questions
+        self.logger = logging.getLogger(__name__)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            import duckdb
+            if self.db_path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = duckdb.connect(self.db_path)
+            columns = ", ".join(f"{name} {type_name}" for name, type_name in AUDIT_COLUMNS.items())
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS audit_queries (
+                    {columns}, question_norm VARCHAR, sql_fingerprint VARCHAR, source_file VARCHAR
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS audit_ingest_state (
+                    path VARCHAR PRIMARY KEY, offset_bytes BIGINT, rows BIGINT, updated_at TIMESTAMP
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS audit_question_clusters (
+                    question_norm VARCHAR, cluster_id VARCHAR, representative VARCHAR
+                )
+            """)
+        return self._conn
+
+    # ------------------------------------------------------------------
+    # 增量导入
+    # ------------------------------------------------------------------
+
+    def ingest(self) -> IngestStats:
+        """导入新增的审计记录：按文件记录已读偏移，只读取新增部分"""
+        start = datetime.now()
+        stats = IngestStats()
+        with self._lock:
+            conn = self._connection()
+            offsets = dict(conn.execute("SELECT path, offset_bytes FROM audit_ingest_state").fetchall())
+            for path in sorted(glob.glob(os.path.join(self.log_dir, f"{self.prefix}*"))):
+                if path.endswith(PARTIAL_SUFFIX):
+                    continue
+                stats.files_scanned += 1
+                try:
+                    rows = self._ingest_file(conn, path, offsets.get(path, 0))
+                except Exception as e:
+                    self.logger.error(f"审计日志导入失败 {path}: {e}")
+                    continue
+                if rows is not None:
+                    stats.files_updated += 1
+                    stats.rows_ingested += rows
+        stats.seconds = (datetime.now() - start).total_seconds()
+        if stats.rows_ingested:
+            self.logger.info(f"导入审计记录 {stats.rows_ingested} 条（{stats.files_updated} 个文件）")
+        return stats
+
+    def _ingest_file(self, conn, path: str, offset: int) -> Optional[int]:
+        size = os.path.getsize(path)
+        if size < offset:
+            # 文件被截断或替换，从头读取
+            offset = 0
+        if size == offset:
+            return None
+
+        if path.endswith(".parquet"):
+            # Parquet 分段关闭后才可见，只需导入一次
+            frame = conn.execute("SELECT * FROM read_parquet(?)", [path]).df()
+            new_offset = size
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                raw = f.read()
+            if path.endswith(".gz"):
+                data, consumed = _gzip_members(raw)
+            else:
+                # 只读到最后一个完整行
+                consumed = raw.rfind(b"\n") + 1
+                data = raw[:consumed]
+            new_offset = offset + consumed
+            if not data.strip():
+                return None
+            frame = self._parse_ndjson(data)
+
+        # 记录与偏移量在同一事务中提交，中途失败不会重复导入或跳过数据
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            rows = self._insert(conn, frame, path)
+            conn.execute(
+                "INSERT OR REPLACE INTO audit_ingest_state VALUES (?, ?, "
+                "coalesce((SELECT rows FROM audit_ingest_state WHERE path = ?), 0) + ?, now())",
+                [path, new_offset, path, rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    @staticmethod
+    def _parse_ndjson(data: bytes):
+        if ARROW_AVAILABLE:
+            import pyarrow.json as pa_json
+            return pa_json.read_json(io.BytesIO(data))
+        return pd.read_json(io.BytesIO(data), lines=True, dtype=False)
+
+    def _insert(self, conn, frame, source: str) -> int:
+        """按审计字段对齐后写入，缺失字段补 NULL，规范化在 SQL 中完成"""
+        present = set(frame.column_names if hasattr(frame, "column_names") else frame.columns)
+        selected = ", ".join(
+            f"TRY_CAST({name} AS {type_name}) AS {name}" if name in present else f"NULL::{type_name} AS {name}"
+            for name, type_name in AUDIT_COLUMNS.items()
+        )
+        conn.register("audit_batch", frame)
+        try:
+            conn.execute(f"""
+                INSERT INTO audit_queries
+                SELECT *, {QUESTION_NORM_SQL} AS question_norm, {SQL_FINGERPRINT_SQL} AS sql_fingerprint, ? AS source_file
+                FROM (SELECT {selected} FROM audit_batch)
+            """, [source])
+        finally:
+            conn.unregister("audit_batch")
+        return len(frame)
+
+    # ------------------------------------------------------------------
+    # 问题聚类
+    # ------------------------------------------------------------------
+
+    def cluster_questions(self) -> int:
+        """规范化问题先精确合并，再按嵌入余弦相似度做贪心聚类；返回簇数"""
+        with self._lock:
+            conn = self._connection()
+            groups = conn.execute("""
+                SELECT question_norm, mode(question) AS representative, count(*) AS n
+                FROM audit_queries
+                WHERE question_norm <> ''
+                GROUP BY question_norm
+                ORDER BY n DESC, question_norm
+                LIMIT ?
+            """, [self.max_cluster_questions]).fetchall()
+            if not groups:
+                return 0
+
+            vectors = np.asarray(self.embedder([g[0] for g in groups]), dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+            # 按频次从高到低，每个问题归入最相似的已有簇首，否则自成一簇
+            leaders = np.empty_like(vectors)
+            leader_rows: List[int] = []
+            assignment = np.empty(len(groups), dtype=np.int64)
+            for i, vector in enumerate(vectors):
+                if leader_rows:
+                    sims = leaders[:len(leader_rows)] @ vector
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.similarity_threshold:
+                        assignment[i] = best
+                        continue
+                leaders[len(leader_rows)] = vector
+                assignment[i] = len(leader_rows)
+                leader_rows.append(i)
+
+            clusters = pd.DataFrame({
+                "question_norm": [g[0] for g in groups],
+                "cluster_id": [hashlib.md5(groups[leader_rows[a]][0].encode("utf-8")).hexdigest()[:12]
+                               for a in assignment],
+                "representative": [groups[leader_rows[a]][1] for a in assignment]
+            })
+            conn.register("cluster_frame", clusters)
+            try:
+                conn.execute("DELETE FROM audit_question_clusters")
+                conn.execute("INSERT INTO audit_question_clusters SELECT * FROM cluster_frame")
+            finally:
+                conn.unregister("cluster_frame")
+            return len(leader_rows)
+
+    # ------------------------------------------------------------------
+    # 报表
+    # ------------------------------------------------------------------
+
+    def _query(self, sql: str, params: List[Any]) -> List[Dict[str, Any]]:
+        cursor = self._connection().execute(sql, params)
+        names = [d[0] for d in cursor.description]
+        return [
+            {k: (round(v, 4) if isinstance(v, float) else v.isoformat() if isinstance(v, datetime) else v)
+             for k, v in zip(names, row)}
+            for row in cursor.fetchall()
+        ]
+
+    def hot_questions(self, top: int = 20, since_days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """最热问题簇，含主导 SQL 及其占比"""
+        with self._lock:
+            return self._query(f"""
+                WITH q AS (
+                    SELECT a.*, coalesce(c.cluster_id, md5(a.question_norm)[:12]) AS cluster_id,
+                           coalesce(c.representative, a.question) AS representative
+                    FROM audit_queries a
+                    LEFT JOIN audit_question_clusters c USING (question_norm)
+                    WHERE a.question_norm <> '' {self._since_filter(since_days)}
+                ),
+                dominant AS (
+                    SELECT cluster_id, sql_fingerprint, count(*) AS n, arg_max(sql, timestamp) AS example_sql,
+                           row_number() OVER (PARTITION BY cluster_id ORDER BY count(*) DESC) AS rn
+                    FROM q WHERE success
+                    GROUP BY cluster_id, sql_fingerprint
+                )
+                SELECT q.cluster_id,
+                       any_value(q.representative) AS question,
+                       count(*) AS queries,
+                       count(DISTINCT q.user_id) AS users,
+                       count(DISTINCT q.question_norm) AS variants,
+                       avg(q.success::INTEGER) AS success_rate,
+                       avg(q.auto_fixed::INTEGER) AS auto_fix_rate,
+                       avg(q.execution_time) AS avg_seconds,
+                       quantile_cont(q.execution_time, 0.95) AS p95_seconds,
+                       any_value(d.sql_fingerprint) AS dominant_sql,
+                       coalesce(any_value(d.n), 0) / count(*) AS dominant_sql_share,
+                       any_value(d.example_sql) AS example_sql,
+                       max(q.timestamp) AS last_seen
+                FROM q LEFT JOIN dominant d ON d.cluster_id = q.cluster_id AND d.rn = 1
+                GROUP BY q.cluster_id
+                ORDER BY queries DESC, q.cluster_id
+                LIMIT ?
+            """, [top])
+
+    def hot_pairs(self, top: int = 20, since_days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """成功执行的原始问题/SQL 对，按频次排序（缓存键是原始问题）"""
+        with self._lock:
+            return self._query(f"""
+                SELECT question, sql, count(*) AS queries, avg(execution_time) AS avg_seconds,
+                       max(timestamp) AS last_seen
+                FROM audit_queries
+                WHERE success AND question <> '' AND sql <> '' {self._since_filter(since_days)}
+                GROUP BY question, sql
+                ORDER BY queries DESC, avg_seconds DESC
+                LIMIT ?
+            """, [top])
+
+    def slow_queries(self, top: int = 20, since_days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按累计耗时排序的 SQL 指纹"""
+        with self._lock:
+            return self._query(f"""
+                SELECT sql_fingerprint,
+                       count(*) AS queries,
+                       sum(execution_time) AS total_seconds,
+                       avg(execution_time) AS avg_seconds,
+                       quantile_cont(execution_time, 0.5) AS p50_seconds,
+                       quantile_cont(execution_time, 0.95) AS p95_seconds,
+                       max(execution_time) AS max_seconds,
+                       avg(row_count) AS avg_rows,
+                       mode(question) AS question,
+                       arg_max(sql, execution_time) AS example_sql
+                FROM audit_queries
+                WHERE sql_fingerprint <> '' {self._since_filter(since_days)}
+                GROUP BY sql_fingerprint
+                ORDER BY total_seconds DESC NULLS LAST, sql_fingerprint
+                LIMIT ?
+            """, [top])
+
+    def summary(self, since_days: Optional[int] = None) -> Dict[str, Any]:
+        """总体统计"""
+        with self._lock:
+            rows = self._query(f"""
+                SELECT count(*) AS queries,
+                       count(DISTINCT question_norm) AS distinct_questions,
+                       count(DISTINCT sql_fingerprint) AS distinct_sql,
+                       avg(success::INTEGER) AS success_rate,
+                       avg(auto_fixed::INTEGER) AS auto_fix_rate,
+                       quantile_cont(execution_time, 0.95) AS p95_seconds,
+                       min(timestamp) AS first_seen,
+                       max(timestamp) AS last_seen
+                FROM audit_queries
+                WHERE TRUE {self._since_filter(since_days)}
+            """, [])
+            return rows[0]
+
+    def workload(self, limit: Optional[int] = None, since_days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按时间顺序返回原始问题和 SQL，供压测回放"""
+        with self._lock:
+            return self._query(f"""
+                SELECT timestamp, question, sql
+                FROM audit_queries
+                WHERE (question <> '' OR sql <> '') {self._since_filter(since_days)}
+                ORDER BY timestamp
+                {'LIMIT ' + str(int(limit)) if limit else ''}
+            """, [])
+
+    @staticmethod
+    def _since_filter(since_days: Optional[int]) -> str:
+        if not since_days:
+            return ""
+        return f"AND timestamp >= now()::TIMESTAMP - INTERVAL {int(since_days)} DAY"
+
+    def recommendations(self, hot: List[Dict], pairs: List[Dict], slow: List[Dict],
+                        min_support: int = 5) -> Dict[str, List[Dict]]:
+        """由热点与慢查询生成优化建议"""
+        cache_prewarm = [
+            {"question": p["question"], "sql": p["sql"], "queries": p["queries"]}
+            for p in pairs
+            if p["queries"] >= min_support
+        ]
+        # 问题稳定映射到同一 SQL 形态，可固化为模板，跳过 LLM 生成
+        template_promotion = [
+            {"question": h["question"], "sql_template": h["dominant_sql"], "support": h["queries"],
+             "variants": h["variants"], "dominant_sql_share": h["dominant_sql_share"]}
+            for h in hot
+            if h["queries"] >= min_support and h["dominant_sql"] and h["dominant_sql_share"] >= 0.8
+        ]
+        rollups = []
+        for s in slow:
+            group_by = GROUP_BY_PATTERN.search(s["sql_fingerprint"])
+            source = FROM_PATTERN.search(s["sql_fingerprint"])
+            if s["queries"] < min_support or not group_by or not source:
+                continue
+            columns = split_top_level(group_by.group(1))
+            rollups.append({
+                "table": source.group(1),
+                "group_by": columns,
+                "queries": s["queries"],
+                "total_seconds": s["total_seconds"],
+                "sql_fingerprint": s["sql_fingerprint"],
+                "suggestion": f"按 {', '.join(columns)} 预聚合 {source.group(1)}"
+            })
+        return {"cache_prewarm": cache_prewarm, "template_promotion": template_promotion, "rollups": rollups}
+
+    def report(self, top: int = 20, since_days: Optional[int] = None, refresh: bool = True,
+               min_support: int = 5) -> Dict[str, Any]:
+        """增量导入、聚类并生成 top-N 报告"""
+        ingest = self.ingest() if refresh else IngestStats()
+        clusters = self.cluster_questions() if refresh else None
+        hot = self.hot_questions(top, since_days)
+        pairs = self.hot_pairs(top, since_days)
+        slow = self.slow_queries(top, since_days)
+        return {
+            "generated_at": datetime.now().isoformat(),
+            "ingest": ingest.__dict__,
+            "clusters": clusters,
+            "summary": self.summary(since_days),
+            "hot_questions": hot,
+            "hot_pairs": pairs,
+            "slow_queries": slow,
+            "recommendations": self.recommendations(hot, pairs, slow, min_support)
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_analytics: Optional[AuditAnalytics] = None
+
+
+def get_audit_analytics() -> AuditAnalytics:
+    """获取进程内共享的审计分析器"""
+    global _default_analytics
+    if _default_analytics is None:
+        _default_analytics = AuditAnalytics()
+    return _default_analytics
@@ -0,0 +1,238 @@
+"""
+查询审计日志写入器
+审计记录先进入内存缓冲，由后台任务按批写入分段文件（在线程中执行文件 I/O），
+分段按大小和时间轮转，可选 gzip 压缩 NDJSON 或 Parquet；缓冲满时写入方等待而不是静默丢弃
+"""
+
+import os
+import json
+import gzip
+import time
+import asyncio
+import logging
+import importlib.util
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+
+AUDIT_FORMATS = {"ndjson": ".ndjson", "ndjson.gz": ".ndjson.gz", "parquet": ".parquet"}
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+# Parquet 分段写完（轮转或关闭）前带此后缀，读取方只需读取已完成的分段
+PARTIAL_SUFFIX = ".part"
+
+
+class AuditLogWriter:
+    """缓冲批量审计日志写入器"""
+
+    def __init__(self, directory: Optional[str] = None, prefix: str = "query_audit",
+                 format: Optional[str] = None, max_segment_bytes: int = 64 * 1024 * 1024,
+                 rotate_interval: float = 3600.0, flush_interval: float = 1.0,
+                 flush_batch: int = 1000, max_buffer: int = 20000, put_timeout: float = 5.0):
+        self.directory = directory or os.getenv("AUDIT_LOG_DIR", "/app/logs")
+        self.prefix = prefix
+        self.format = format or os.getenv("AUDIT_LOG_FORMAT", "ndjson.gz")
+        if self.format not in AUDIT_FORMATS:
+            raise ValueError(f"不支持的审计日志格式: {self.format}")
+        if self.format == "parquet" and not ARROW_AVAILABLE:
+            raise ValueError("Parquet 审计日志需要安装 pyarrow")
+        self.max_segment_bytes = max_segment_bytes
+        self.rotate_interval = rotate_interval
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.put_timeout = put_timeout
+        self.logger = logging.getLogger(__name__)
+
+        self._buffer: Optional[asyncio.Queue] = None
+        self._max_buffer = max_buffer
+        self._flush_now: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        # 当前分段，仅由刷写线程访问
+        self._segment_path: Optional[str] = None
+        self._segment_file = None
+        self._segment_opened = 0.0
+        self._segment_bytes = 0
+        self._segment_seq = 0
+        self._parquet_writer = None
+
+        self.metrics = {
+            "written": 0,
+            "batches": 0,
+            "segments": 0,
+            "bytes_written": 0,
+            "backpressure_waits": 0,
+            "dropped": 0,
+            "write_failures": 0,
+            "max_flush_seconds": 0.0
+        }
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self):
+        """在当前事件循环中延迟启动后台刷写任务"""
+        if self._task is None or self._task.done():
+            self._buffer = asyncio.Queue(maxsize=self._max_buffer)
+            self._flush_now = asyncio.Event()
+            self._closing = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def write(self, entry: Dict[str, Any]) -> bool:
+        """写入一条审计记录；缓冲满时等待刷写腾出空间，超时后丢弃并告警"""
+        self._ensure_started()
+        try:
+            self._buffer.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.metrics["backpressure_waits"] += 1
+            self._flush_now.set()
+            try:
+                await asyncio.wait_for(self._buffer.put(entry), self.put_timeout)
+            except asyncio.TimeoutError:
+                self.metrics["dropped"] += 1
+                self.logger.warning(f"审计日志缓冲已满 {self.put_timeout} 秒，丢弃记录（累计 {self.metrics['dropped']} 条）")
+                return False
+
+        if self._buffer.qsize() >= self.flush_batch:
+            self._flush_now.set()
+        return True
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self._flush()
+        await self._flush()
+
+    async def _flush(self):
+        """取出缓冲中的全部记录并在线程中写入"""
+        batch = []
+        while not self._buffer.empty():
+            batch.append(self._buffer.get_nowait())
+        if not batch:
+            # 空闲时也检查按时间轮转
+            if self._segment_file is not None and self._segment_expired():
+                await asyncio.to_thread(self._close_segment)
+            return
+
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+            self.metrics["written"] += len(batch)
+            self.metrics["batches"] += 1
+        except Exception as e:
+            self.metrics["write_failures"] += 1
+            self.metrics["dropped"] += len(batch)
+            self.logger.error(f"审计日志写入失败，丢弃 {len(batch)} 条记录: {e}")
+        self.metrics["max_flush_seconds"] = max(self.metrics["max_flush_seconds"], time.perf_counter() - start)
+
+    async def close(self):
+        """写出剩余记录并关闭当前分段"""
+        if self._task is not None:
+            # 不取消任务：正在进行的刷写在线程中，取消无法中止，只会丢失这一批
+            self._closing = True
+            self._flush_now.set()
+            await self._task
+            self._task = None
+        await asyncio.to_thread(self._close_segment)
+
+    # ------------------------------------------------------------------
+    # 分段文件（刷写线程）
+    # ------------------------------------------------------------------
+
+    def _segment_expired(self) -> bool:
+        return (time.time() - self._segment_opened >= self.rotate_interval
+                or self._segment_bytes >= self.max_segment_bytes)
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._segment_seq += 1
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        name = f"{self.prefix}-{stamp}-{os.getpid()}-{self._segment_seq:04d}{AUDIT_FORMATS[self.format]}"
+        self._segment_path = os.path.join(self.directory, name)
+        self._segment_opened = time.time()
+        self._segment_bytes = 0
+        if self.format != "parquet":
+            self._segment_file = open(self._segment_path, "ab")
+        else:
+            self._segment_file = open(self._segment_path + PARTIAL_SUFFIX, "wb")
+        self.metrics["segments"] += 1
+
+    def _close_segment(self):
+        if self._segment_file is None:
+            return
+        try:
+            if self._parquet_writer is not None:
+                self._parquet_writer.close()
+            self._segment_file.close()
+            if self.format == "parquet":
+                os.replace(self._segment_path + PARTIAL_SUFFIX, self._segment_path)
+        finally:
+            self._segment_file = None
+            self._parquet_writer = None
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        if self._segment_file is not None and self._segment_expired():
+            self._close_segment()
+        if self._segment_file is None:
+            self._open_segment()
+
+        segment = self._segment_file
+        before = segment.tell()
+        if self.format == "parquet":
+            self._write_parquet(batch)
+        else:
+            data = "".join(json.dumps(entry, ensure_ascii=False, default=str) + "\n" for entry in batch).encode("utf-8")
+            if self.format == "ndjson.gz":
+                # 每批一个完整的 gzip 成员，文件在任何时刻都可被完整解压
+                data = gzip.compress(data, compresslevel=6)
+            self._segment_file.write(data)
+        self._segment_file.flush()
+
+        if self._segment_file is not segment:
+            # Parquet 字段类型变化时已换新分段，本批从新分段开头写入
+            before = 0
+        written = self._segment_file.tell() - before
+        self._segment_bytes += written
+        self.metrics["bytes_written"] += written
+
+    def _write_parquet(self, batch: List[Dict[str, Any]]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._parquet_writer is None:
+            table = pa.Table.from_pylist(batch)
+            self._parquet_writer = pq.ParquetWriter(self._segment_file, table.schema, compression="zstd")
+        else:
+            try:
+                table = pa.Table.from_pylist(batch, schema=self._parquet_writer.schema)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # 字段类型与当前分段不一致时换新分段
+                self._close_segment()
+                self._open_segment()
+                table = pa.Table.from_pylist(batch)
+                self._parquet_writer = pq.ParquetWriter(self._segment_file, table.schema, compression="zstd")
+        self._parquet_writer.write_table(table)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """审计日志指标"""
+        return {
+            **self.metrics,
+            "buffered": self._buffer.qsize() if self._buffer is not None else 0,
+            "segment": self._segment_path
+        }
+
+
+_default_writer: Optional[AuditLogWriter] = None
+
+
+def get_audit_writer() -> AuditLogWriter:
+    """获取进程内共享的审计日志写入器"""
+    global _default_writer
+    if _default_writer is None:
+        _default_writer = AuditLogWriter()
+    return _default_writer
@@ -0,0 +1,349 @@
+"""
+变点检测引擎
+基于累积和的 O(n) 滑动窗口检测，支持 CUSUM、PELT 和二分分割后端，
+可一次处理多序列（长表）布局
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Any
+from dataclasses import dataclass, replace
+
+
+CHANGEPOINT_METHODS = ("window", "cusum", "pelt", "binseg")
+
+
+@dataclass
+class ChangepointConfig:
+    """变点检测参数"""
+    method: str = "window"
+    window_size: Optional[int] = None  # 默认 max(5, n // 10)
+    threshold: float = 0.2  # window 方法的相对变化阈值
+    min_distance: Optional[int] = None  # 非极大值抑制半径，默认等于窗口大小
+    baseline_floor: float = 0.01  # 分母下限 = 序列均值绝对值 * baseline_floor
+    cusum_drift: float = 0.5  # CUSUM 漂移量 k（标准差单位）
+    cusum_threshold: float = 5.0  # CUSUM 报警阈值 h（标准差单位）
+    penalty: Optional[float] = None  # PELT / binseg 惩罚项，默认 BIC
+    min_segment: int = 5
+    max_changepoints: int = 10
+
+
+class ChangepointDetector:
+    """变点检测器"""
+
+    def __init__(self, config: Optional[ChangepointConfig] = None):
+        self.config = config or ChangepointConfig()
+        self.logger = logging.getLogger(__name__)
+
+    def detect(self, values, dates=None, method: Optional[str] = None) -> List[Dict]:
+        """检测单条序列的变点"""
+        values = np.asarray(values, dtype=float)
+        config = self._resolve_config(method)
+
+        if config.method == "window":
+            series_ids = np.zeros(len(values), dtype=np.int64)
+            changepoints = self._window_batch(values, series_ids, np.array([0, len(values)]), config).get(0, [])
+        else:
+            changepoints = self._detect_segments(values, config)
+
+        if dates is not None:
+            labels = pd.to_datetime(pd.Series(dates)).dt.strftime('%Y-%m-%d').to_numpy()
+            for cp in changepoints:
+                cp["date"] = labels[cp["index"]]
+        return changepoints
+
+    def detect_frame(self, df: pd.DataFrame, date_column: str, value_column: str,
+                     series_column: Optional[str] = None,
+                     method: Optional[str] = None) -> Dict[Any, List[Dict]]:
+        """检测长表中每条序列的变点，返回 {序列标识: 变点列表}"""
+        config = self._resolve_config(method)
+
+        if series_column:
+            df = df.sort_values([series_column, date_column], kind="mergesort")
+            codes, keys = pd.factorize(df[series_column], sort=False)
+        else:
+            df = df.sort_values(date_column, kind="mergesort")
+            codes, keys = np.zeros(len(df), dtype=np.int64), np.array([None], dtype=object)
+
+        values = df[value_column].to_numpy(dtype=float)
+        dates = pd.to_datetime(df[date_column]).dt.strftime('%Y-%m-%d').to_numpy()
+        codes = np.asarray(codes, dtype=np.int64)
+
+        # 按序列切分的边界，codes 在排序后连续
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1, [len(codes)]))
+
+        if config.method == "window":
+            found = self._window_batch(values, codes, bounds, config)
+        else:
+            found = {}
+            for s in range(len(bounds) - 1):
+                start, end = bounds[s], bounds[s + 1]
+                cps = self._detect_segments(values[start:end], config)
+                if cps:
+                    found[s] = cps
+
+        results = {}
+        for s in range(len(bounds) - 1):
+            start = bounds[s]
+            key = keys[codes[start]] if len(codes) else None
+            key = key.item() if isinstance(key, np.generic) else key
+            cps = found.get(s, [])
+            for cp in cps:
+                cp["date"] = dates[start + cp["index"]]
+            results[key] = cps
+
+        return results
+
+    def _resolve_config(self, method: Optional[str]) -> ChangepointConfig:
+        """合并请求级方法选择"""
+        config = replace(self.config, method=method) if method else self.config
+        if config.method not in CHANGEPOINT_METHODS:
+            raise ValueError(f"未知的变点检测方法: {config.method}")
+        return config
+
+    def _window_batch(self, values: np.ndarray, series_ids: np.ndarray, bounds: np.ndarray,
+                      config: ChangepointConfig) -> Dict[int, List[Dict]]:
+        """基于累积和的滑动窗口均值差检测，所有序列一次计算"""
+        n_total = len(values)
+        if n_total == 0:
+            return {}
+
+        lengths = np.diff(bounds)
+        starts = bounds[:-1]
+        if config.window_size:
+            windows = np.full(len(lengths), config.window_size, dtype=np.int64)
+        else:
+            windows = np.maximum(5, lengths // 10)
+
+        # 每个位置所属序列的窗口和起止
+        w = windows[series_ids]
+        seg_start = starts[series_ids]
+        seg_end = bounds[1:][series_ids]
+        pos = np.arange(n_total)
+
+        valid = (pos - w >= seg_start) & (pos + w < seg_end)
+        if not valid.any():
+            return {}
+
+        csum = np.concatenate(([0.0], np.cumsum(values)))
+        idx = pos[valid]
+        wv = w[valid]
+        before = (csum[idx] - csum[idx - wv]) / wv
+        after = (csum[idx + wv] - csum[idx]) / wv
+
+        # 分母下限，避免均值接近 0 时幅度爆炸
+        seg_sums = csum[bounds[1:]] - csum[starts]
+        seg_means = np.abs(seg_sums / np.maximum(lengths, 1))
+        floor = np.maximum(seg_means * config.baseline_floor, np.finfo(float).eps)
+        denom = np.maximum(np.abs(before), floor[series_ids[valid]])
+        magnitude = np.abs(after - before) / denom
+
+        hit = magnitude > config.threshold
+        if not hit.any():
+            return {}
+
+        cand_idx = idx[hit]
+        cand_mag = magnitude[hit]
+        cand_series = series_ids[cand_idx]
+        cand_before = before[hit]
+        cand_after = after[hit]
+
+        # 非极大值抑制：按幅度降序贪心保留，抑制邻域内的重复变点
+        results: Dict[int, List[Dict]] = {}
+        for s in np.unique(cand_series):
+            members = np.flatnonzero(cand_series == s)
+            radius = config.min_distance or int(windows[s])
+            kept = self._suppress(cand_idx[members], cand_mag[members], radius)
+            offset = starts[s]
+            results[int(s)] = [
+                self._make_changepoint(
+                    int(cand_idx[members][k] - offset),
+                    float(cand_mag[members][k]),
+                    float(cand_before[members][k]),
+                    float(cand_after[members][k]),
+                    config.method
+                )
+                for k in kept
+            ]
+        return results
+
+    @staticmethod
+    def _suppress(positions: np.ndarray, magnitudes: np.ndarray, radius: int) -> List[int]:
+        """非极大值抑制，返回保留项的下标（按位置排序）"""
+        order = np.argsort(-magnitudes, kind="mergesort")
+        kept: List[int] = []
+        taken = np.empty(0, dtype=np.int64)
+        for k in order:
+            if taken.size and np.min(np.abs(taken - positions[k])) < radius:
+                continue
+            kept.append(int(k))
+            taken = np.append(taken, positions[k])
+        kept.sort(key=lambda k: positions[k])
+        return kept
+
+    def _detect_segments(self, values: np.ndarray, config: ChangepointConfig) -> List[Dict]:
+        """CUSUM / PELT / 二分分割后端"""
+        n = len(values)
+        if n < 2 * config.min_segment:
+            return []
+
+        if config.method == "cusum":
+            breaks = self._cusum(values, config)
+        elif config.method == "pelt":
+            breaks = self._pelt(values, config)
+        else:
+            breaks = self._binseg(values, config)
+
+        csum = np.concatenate(([0.0], np.cumsum(values)))
+        floor = max(abs(csum[-1] / n) * config.baseline_floor, np.finfo(float).eps)
+        edges = [0] + sorted(breaks) + [n]
+
+        changepoints = []
+        for k in range(1, len(edges) - 1):
+            left, cp, right = edges[k - 1], edges[k], edges[k + 1]
+            before = (csum[cp] - csum[left]) / (cp - left)
+            after = (csum[right] - csum[cp]) / (right - cp)
+            magnitude = abs(after - before) / max(abs(before), floor)
+            changepoints.append(self._make_changepoint(cp, magnitude, before, after, config.method))
+        return changepoints
+
+    @staticmethod
+    def _noise_scale(values: np.ndarray) -> float:
+        """基于一阶差分 MAD 的稳健噪声估计，不受均值突变影响"""
+        diffs = np.diff(values)
+        sigma = np.median(np.abs(diffs - np.median(diffs))) / (0.6745 * np.sqrt(2)) if len(diffs) else 0.0
+        if sigma <= 0:
+            sigma = np.std(values)
+        return float(sigma) if sigma > 0 else 1.0
+
+    def _default_penalty(self, values: np.ndarray, config: ChangepointConfig) -> float:
+        """BIC 惩罚项：2 * log(n) * sigma^2"""
+        if config.penalty is not None:
+            return config.penalty
+        sigma = self._noise_scale(values)
+        return 2.0 * np.log(len(values)) * sigma ** 2
+
+    def _cusum(self, values: np.ndarray, config: ChangepointConfig) -> List[int]:
+        """双侧表格 CUSUM，报警后以新段重新估计基线"""
+        sigma = self._noise_scale(values)
+        k = config.cusum_drift * sigma
+        h = config.cusum_threshold * sigma
+
+        breaks = []
+        start = 0
+        n = len(values)
+        while start < n - config.min_segment:
+            ref = values[start:start + config.min_segment].mean()
+            pos = neg = 0.0
+            pos_zero = neg_zero = start
+            alarm = None
+            for i in range(start, n):
+                x = values[i] - ref
+                pos = max(0.0, pos + x - k)
+                neg = max(0.0, neg - x - k)
+                if pos == 0.0:
+                    pos_zero = i + 1
+                if neg == 0.0:
+                    neg_zero = i + 1
+                if pos > h or neg > h:
+                    alarm = pos_zero if pos > h else neg_zero
+                    break
+            if alarm is None:
+                break
+            if alarm - start >= config.min_segment and n - alarm >= config.min_segment:
+                breaks.append(alarm)
+            start = max(alarm, start + 1)
+        return breaks
+
+    def _pelt(self, values: np.ndarray, config: ChangepointConfig) -> List[int]:
+        """PELT 精确分割（均值变化，高斯代价）"""
+        n = len(values)
+        penalty = self._default_penalty(values, config)
+        m = config.min_segment
+
+        csum = np.concatenate(([0.0], np.cumsum(values)))
+        csum2 = np.concatenate(([0.0], np.cumsum(values ** 2)))
+
+        def cost(starts: np.ndarray, end: int) -> np.ndarray:
+            length = end - starts
+            seg = csum[end] - csum[starts]
+            return (csum2[end] - csum2[starts]) - seg ** 2 / length
+
+        f = np.full(n + 1, np.inf)
+        f[0] = -penalty
+        last = np.zeros(n + 1, dtype=np.int64)
+        candidates = np.array([0], dtype=np.int64)
+
+        for t in range(1, n + 1):
+            usable_mask = t - candidates >= m
+            usable = candidates[usable_mask]
+            if usable.size:
+                costs = cost(usable, t)
+                totals = f[usable] + costs + penalty
+                best = int(np.argmin(totals))
+                f[t] = totals[best]
+                last[t] = usable[best]
+                # 剪枝：永远无法成为最优起点的候选被移除
+                keep = np.ones(len(candidates), dtype=bool)
+                keep[usable_mask] = f[usable] + costs <= f[t]
+                candidates = candidates[keep]
+            if np.isfinite(f[t]):
+                candidates = np.append(candidates, t)
+
+        breaks = []
+        t = n
+        while t > 0:
+            t = int(last[t])
+            if t > 0:
+                breaks.append(t)
+        return sorted(breaks)
+
+    def _binseg(self, values: np.ndarray, config: ChangepointConfig) -> List[int]:
+        """二分分割：每次选择代价下降最大的切分点"""
+        penalty = self._default_penalty(values, config)
+        m = config.min_segment
+        csum = np.concatenate(([0.0], np.cumsum(values)))
+        csum2 = np.concatenate(([0.0], np.cumsum(values ** 2)))
+
+        def best_split(left: int, right: int):
+            splits = np.arange(left + m, right - m + 1)
+            if splits.size == 0:
+                return None, 0.0
+            total = (csum2[right] - csum2[left]) - (csum[right] - csum[left]) ** 2 / (right - left)
+            s1 = csum[splits] - csum[left]
+            s2 = csum[right] - csum[splits]
+            c1 = (csum2[splits] - csum2[left]) - s1 ** 2 / (splits - left)
+            c2 = (csum2[right] - csum2[splits]) - s2 ** 2 / (right - splits)
+            gains = total - (c1 + c2)
+            k = int(np.argmax(gains))
+            return int(splits[k]), float(gains[k])
+
+        segments = [(0, len(values))]
+        breaks = []
+        while len(breaks) < config.max_changepoints:
+            best = None
+            for seg_idx, (left, right) in enumerate(segments):
+                split, gain = best_split(left, right)
+                if split is not None and gain > penalty and (best is None or gain > best[2]):
+                    best = (seg_idx, split, gain)
+            if best is None:
+                break
+            seg_idx, split, _ = best
+            left, right = segments.pop(seg_idx)
+            segments.extend([(left, split), (split, right)])
+            breaks.append(split)
+        return sorted(breaks)
+
+    @staticmethod
+    def _make_changepoint(index: int, magnitude: float, before: float, after: float,
+                          method: str) -> Dict:
+        """构建变点记录"""
+        return {
+            "index": index,
+            "change_magnitude": float(magnitude),
+            "direction": "increase" if after > before else "decrease",
+            "before_mean": float(before),
+            "after_mean": float(after),
+            "method": method
+        }
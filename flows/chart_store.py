@@ -0,0 +1,174 @@
+"""
+趋势图表存储
+图表以内容寻址 ID 标识：检测时只生成轻量 JSON 图表描述，
+PNG 在首次请求时才交给工作进程渲染并缓存
+"""
+
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+
+from flows.forecast_executor import ForecastExecutor, get_forecast_executor
+
+
+CHART_SPEC_VERSION = 1
+
+
+def build_trend_spec(dates: List[str], values: List[float], value_column: str,
+                     forecast_result: Optional[Dict], changepoints: List[Dict],
+                     bins: int = 20) -> Dict[str, Any]:
+    """构建趋势图 JSON 描述，前端可直接绘制，也是 PNG 渲染的唯一输入"""
+    values = [float(v) for v in values]
+    series = [{
+        "name": "历史数据",
+        "kind": "line",
+        "x": list(dates),
+        "y": values
+    }]
+
+    if forecast_result:
+        series.append({
+            "name": "预测数据",
+            "kind": "line",
+            "dashed": True,
+            "x": list(forecast_result["dates"]),
+            "y": [float(v) for v in forecast_result["values"]]
+        })
+        ci = forecast_result.get("confidence_intervals")
+        if ci:
+            series.append({
+                "name": "置信区间",
+                "kind": "band",
+                "x": list(forecast_result["dates"]),
+                "lower": [float(v) for v in ci["lower"]],
+                "upper": [float(v) for v in ci["upper"]]
+            })
+
+    counts, edges = np.histogram(np.asarray(values, dtype=float), bins=bins)
+
+    return {
+        "version": CHART_SPEC_VERSION,
+        "type": "trend",
+        "title": f"{value_column} 趋势分析",
+        "value_label": value_column,
+        "series": series,
+        "annotations": [
+            {
+                "kind": "changepoint",
+                "x": cp["date"],
+                "y": values[cp["index"]],
+                "label": f"变点\n{cp['direction']}"
+            }
+            for cp in changepoints
+        ],
+        "histogram": {
+            "title": "数值分布",
+            "edges": edges.tolist(),
+            "counts": counts.tolist()
+        }
+    }
+
+
+def chart_id_for(spec: Dict[str, Any]) -> str:
+    """内容寻址 ID：相同数据总是得到相同 ID"""
+    payload = json.dumps(spec, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class ChartStore:
+    """图表描述与渲染结果缓存"""
+
+    def __init__(self, max_specs: int = 1024, max_images: int = 128,
+                 executor: Optional[ForecastExecutor] = None, render_timeout: float = 30.0):
+        self.max_specs = max_specs
+        self.max_images = max_images
+        self.render_timeout = render_timeout
+        self._executor = executor
+        self._specs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self.logger = logging.getLogger(__name__)
+        self.metrics = {"specs_stored": 0, "renders": 0, "image_hits": 0, "render_failures": 0}
+
+    @property
+    def executor(self) -> ForecastExecutor:
+        if self._executor is None:
+            self._executor = get_forecast_executor()
+        return self._executor
+
+    def put_spec(self, spec: Dict[str, Any]) -> str:
+        """登记图表描述，返回图表 ID"""
+        chart_id = chart_id_for(spec)
+        if chart_id not in self._specs:
+            self.metrics["specs_stored"] += 1
+        self._specs[chart_id] = spec
+        self._specs.move_to_end(chart_id)
+        while len(self._specs) > self.max_specs:
+            evicted, _ = self._specs.popitem(last=False)
+            self._images.pop(evicted, None)
+        return chart_id
+
+    def get_spec(self, chart_id: str) -> Optional[Dict[str, Any]]:
+        """获取图表描述"""
+        spec = self._specs.get(chart_id)
+        if spec is not None:
+            self._specs.move_to_end(chart_id)
+        return spec
+
+    async def get_png(self, chart_id: str) -> Optional[bytes]:
+        """获取 PNG，首次请求时在工作进程中渲染；并发请求共享同一次渲染"""
+        image = self._images.get(chart_id)
+        if image is not None:
+            self._images.move_to_end(chart_id)
+            self.metrics["image_hits"] += 1
+            return image
+
+        spec = self.get_spec(chart_id)
+        if spec is None:
+            return None
+
+        pending = self._rendering.get(chart_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        from flows.forecast_jobs import render_chart_png
+
+        future = asyncio.get_running_loop().create_future()
+        self._rendering[chart_id] = future
+        try:
+            image = await self.executor.submit(render_chart_png, spec, timeout=self.render_timeout)
+            self.metrics["renders"] += 1
+            self._images[chart_id] = image
+            self._images.move_to_end(chart_id)
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+            future.set_result(image)
+            return image
+        except BaseException as e:
+            self.metrics["render_failures"] += 1
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._rendering.pop(chart_id, None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """图表缓存指标"""
+        return {**self.metrics, "specs": len(self._specs), "images": len(self._images)}
+
+
+_default_store: Optional[ChartStore] = None
+
+
+def get_chart_store() -> ChartStore:
+    """获取进程内共享的图表存储"""
+    global _default_store
+    if _default_store is None:
+        _default_store = ChartStore()
+    return _default_store
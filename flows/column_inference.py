@@ -0,0 +1,176 @@
+"""
+查询结果列角色推断
+优先依据 DuckDB 结果类型（DATE / TIMESTAMP / 数值类型）确定日期列和数值列，
+没有类型信息时对抽样行做统计推断
+"""
+
+import re
+import logging
+from datetime import date, datetime
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+
+NUMERIC_TYPES = {
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "UHUGEINT",
+    "INT", "INT1", "INT2", "INT4", "INT8", "LONG", "SHORT",
+    "FLOAT", "FLOAT4", "FLOAT8", "REAL", "DOUBLE", "DECIMAL", "NUMERIC"
+}
+DATE_NAME_HINTS = ("date", "day", "dt", "time", "日期", "时间")
+# 标识列和日历派生列不作为预测目标
+EXCLUDED_VALUE_NAMES = re.compile(
+    r"(^id$|_id$|^sku$|_sku$|^code$|_code$|编号|day_of_week|weekday|^is_|_flag$|^year$|^month$|^week$)",
+    re.IGNORECASE
+)
+DATE_LIKE_STRING = re.compile(r"^\s*\d{4}[-/年.]\d{1,2}")
+
+
+@dataclass
+class ColumnRoles:
+    """列角色推断结果"""
+    date_column: Optional[str]
+    value_columns: List[str] = field(default_factory=list)
+    dimension_columns: List[str] = field(default_factory=list)
+    source: str = "schema"  # schema / statistics
+
+    @property
+    def value_column(self) -> Optional[str]:
+        """主数值列"""
+        return self.value_columns[0] if self.value_columns else None
+
+
+def normalize_type(type_name: str) -> str:
+    """DECIMAL(18,2) -> DECIMAL，TIMESTAMP WITH TIME ZONE -> TIMESTAMP"""
+    base = str(type_name).split("(")[0].strip().upper()
+    return "TIMESTAMP" if base.startswith("TIMESTAMP") else base
+
+
+class ColumnInferer:
+    """列角色推断器"""
+
+    def __init__(self, sample_size: int = 256, min_parse_ratio: float = 0.9,
+                 max_value_columns: int = 8):
+        self.sample_size = sample_size
+        self.min_parse_ratio = min_parse_ratio
+        self.max_value_columns = max_value_columns
+        self.logger = logging.getLogger(__name__)
+
+    def infer(self, columns: List[str], data: Optional[List[Dict]] = None,
+              column_types: Optional[Union[Dict[str, str], List[str]]] = None) -> ColumnRoles:
+        """推断列角色；类型信息缺少日期列或数值列时用抽样统计补齐"""
+        if isinstance(column_types, list):
+            column_types = dict(zip(columns, column_types))
+
+        roles = None
+        if column_types:
+            roles = self._from_types(columns, column_types)
+            if roles.date_column and roles.value_columns:
+                return roles
+
+        if not data:
+            return roles or ColumnRoles(date_column=None, source="statistics")
+
+        sampled = self._from_sample(columns, data)
+        if roles is None:
+            return sampled
+        date_column = roles.date_column or sampled.date_column
+        value_columns = roles.value_columns or sampled.value_columns
+        return ColumnRoles(
+            date_column=date_column,
+            value_columns=value_columns,
+            dimension_columns=[c for c in columns if c != date_column and c not in value_columns],
+            source="schema+statistics"
+        )
+
+    # ------------------------------------------------------------------
+    # 基于类型
+    # ------------------------------------------------------------------
+
+    def _from_types(self, columns: List[str], column_types: Dict[str, str]) -> ColumnRoles:
+        date_candidates, values, dimensions = [], [], []
+        for col in columns:
+            type_name = normalize_type(column_types.get(col, ""))
+            if type_name in ("DATE", "TIMESTAMP"):
+                date_candidates.append(col)
+            elif type_name in NUMERIC_TYPES and not EXCLUDED_VALUE_NAMES.search(col):
+                values.append(col)
+            else:
+                dimensions.append(col)
+
+        date_column = self._pick_date_column(date_candidates)
+        dimensions.extend(c for c in date_candidates if c != date_column)
+        return ColumnRoles(
+            date_column=date_column,
+            value_columns=values[:self.max_value_columns],
+            dimension_columns=dimensions,
+            source="schema"
+        )
+
+    # ------------------------------------------------------------------
+    # 基于抽样统计
+    # ------------------------------------------------------------------
+
+    def _from_sample(self, columns: List[str], data: List[Dict]) -> ColumnRoles:
+        # 等间隔抽样，避免只看开头的若干行
+        step = max(1, len(data) // self.sample_size)
+        sample = data[::step][:self.sample_size]
+
+        date_candidates, values, dimensions = [], [], []
+        for col in columns:
+            raw = pd.Series([row.get(col) for row in sample], dtype=object).dropna()
+            if raw.empty:
+                dimensions.append(col)
+            elif self._date_ratio(raw) >= self.min_parse_ratio:
+                date_candidates.append(col)
+            elif not EXCLUDED_VALUE_NAMES.search(col) and self._is_measure(raw):
+                values.append(col)
+            else:
+                dimensions.append(col)
+
+        date_column = self._pick_date_column(date_candidates)
+        dimensions.extend(c for c in date_candidates if c != date_column)
+        return ColumnRoles(
+            date_column=date_column,
+            value_columns=values[:self.max_value_columns],
+            dimension_columns=dimensions,
+            source="statistics"
+        )
+
+    @staticmethod
+    def _date_ratio(raw: pd.Series) -> float:
+        """可解析为日期的比例；纯数字不视为日期"""
+        if raw.map(lambda v: isinstance(v, (date, datetime, np.datetime64))).all():
+            return 1.0
+        strings = raw[raw.map(lambda v: isinstance(v, str))]
+        if len(strings) < len(raw):
+            return 0.0
+        looks_like_date = strings.str.match(DATE_LIKE_STRING)
+        if looks_like_date.mean() < 0.5:
+            return 0.0
+        parsed = pd.to_datetime(strings, errors="coerce", format="mixed")
+        return float(parsed.notna().mean())
+
+    def _is_measure(self, raw: pd.Series) -> bool:
+        """数值比例足够高、非常量、且不像超长整数标识"""
+        if raw.map(lambda v: isinstance(v, bool)).any():
+            return False
+        numeric = pd.to_numeric(raw, errors="coerce")
+        if numeric.notna().mean() < self.min_parse_ratio:
+            return False
+        numeric = numeric.dropna().to_numpy(dtype=float)
+        if len(numeric) > 1 and np.ptp(numeric) == 0:
+            return False
+        is_integer = np.all(np.mod(numeric, 1) == 0)
+        return not (is_integer and np.median(np.abs(numeric)) >= 1e12)
+
+    @staticmethod
+    def _pick_date_column(candidates: List[str]) -> Optional[str]:
+        """多个日期列时优先名称像日期的列"""
+        for col in candidates:
+            if any(hint in col.lower() for hint in DATE_NAME_HINTS):
+                return col
+        return candidates[0] if candidates else None
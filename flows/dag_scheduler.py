@@ -0,0 +1,209 @@
+"""
+DAG 调度器
+各阶段声明数据依赖，依赖全部完成的阶段立即以 asyncio 任务并发执行；
+阶段可按条件跳过（分支），也可抛出 ShortCircuit 提前结束整次运行（如缓存命中），
+此时仍在运行的兄弟阶段会被取消。每次运行记录各阶段起止时间并给出关键路径
+"""
+
+import time
+import asyncio
+import inspect
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from flows.metrics import get_metrics_registry
+
+
+StageFunction = Callable[[Dict[str, Any]], Union[Any, Awaitable[Any]]]
+
+
+@dataclass
+class Stage:
+    """调度单元：fn 接收运行状态（初始输入 + 已完成阶段的输出，以阶段名为键）"""
+    name: str
+    fn: StageFunction
+    depends_on: Tuple[str, ...] = ()
+    when: Optional[Callable[[Dict[str, Any]], bool]] = None  # 返回 False 时跳过，输出为 None
+
+
+class ShortCircuit(Exception):
+    """阶段提前给出最终结果，其余阶段不再需要"""
+
+    def __init__(self, result: Any):
+        super().__init__("short circuit")
+        self.result = result
+
+
+@dataclass
+class StageTiming:
+    """相对运行开始的起止时间（秒）"""
+    start: float
+    end: float
+    skipped: bool = False
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class DAGRun:
+    """一次运行的状态、各阶段耗时和关键路径"""
+    state: Dict[str, Any]
+    timings: Dict[str, StageTiming] = field(default_factory=dict)
+    critical_path: List[str] = field(default_factory=list)
+    wall_seconds: float = 0.0
+    short_circuit: Optional[str] = None  # 提前结束运行的阶段
+    result: Any = None  # ShortCircuit 携带的结果
+    cancelled: List[str] = field(default_factory=list)  # 因提前结束或出错被取消的阶段
+
+    @property
+    def critical_path_seconds(self) -> float:
+        """关键路径上各阶段耗时之和；与 wall_seconds 的差值为调度开销"""
+        return sum(self.timings[name].seconds for name in self.critical_path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "critical_path": self.critical_path,
+            "critical_path_seconds": round(self.critical_path_seconds, 6),
+            "wall_seconds": round(self.wall_seconds, 6),
+            "short_circuit": self.short_circuit,
+            "cancelled": self.cancelled,
+            "stages": {
+                name: {"start": round(t.start, 6), "seconds": round(t.seconds, 6), "skipped": t.skipped}
+                for name, t in self.timings.items()
+            }
+        }
+
+
+class DAGScheduler:
+    """按数据依赖并发执行阶段的调度器"""
+
+    def __init__(self, name: str, stages: List[Stage]):
+        self.name = name
+        self.logger = logging.getLogger(__name__)
+        self.metrics = get_metrics_registry()
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"阶段重名: {stage.name}")
+            self.stages[stage.name] = stage
+
+        self._dependents: Dict[str, List[str]] = {name: [] for name in self.stages}
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"阶段 {stage.name} 依赖未定义的阶段: {dependency}")
+                self._dependents[dependency].append(stage.name)
+        self.order = self._topological_order()
+        self.stats = {"runs": 0, "short_circuits": 0, "failures": 0, "cancelled_stages": 0}
+
+    def _topological_order(self) -> List[str]:
+        """Kahn 算法；有环时报错"""
+        pending = {name: len(stage.depends_on) for name, stage in self.stages.items()}
+        queue = deque(name for name, count in pending.items() if count == 0)
+        order = []
+        while queue:
+            name = queue.popleft()
+            order.append(name)
+            for dependent in self._dependents[name]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    queue.append(dependent)
+        if len(order) != len(self.stages):
+            raise ValueError(f"DAG {self.name} 存在环: {sorted(set(self.stages) - set(order))}")
+        return order
+
+    def critical_path(self, timings: Dict[str, StageTiming], sink: Optional[str] = None) -> List[str]:
+        """从最后结束的阶段沿“最晚完成的依赖”回溯，得到决定总延迟的阶段链"""
+        if not timings:
+            return []
+        path = [sink or max(timings, key=lambda name: timings[name].end)]
+        while True:
+            finished = [d for d in self.stages[path[-1]].depends_on if d in timings]
+            if not finished:
+                break
+            path.append(max(finished, key=lambda name: timings[name].end))
+        return path[::-1]
+
+    async def run(self, state: Optional[Dict[str, Any]] = None) -> DAGRun:
+        """执行一次；ShortCircuit 时取消其余阶段并返回其结果，其他异常取消其余阶段后向上抛出"""
+        run = DAGRun(state=dict(state or {}))
+        started = time.perf_counter()
+        remaining = {name: set(stage.depends_on) for name, stage in self.stages.items()}
+        running: Dict[asyncio.Task, str] = {}
+        ready = deque(name for name in self.order if not remaining[name])
+        self.stats["runs"] += 1
+
+        def complete(name: str):
+            for dependent in self._dependents[name]:
+                remaining[dependent].discard(name)
+                if not remaining[dependent]:
+                    ready.append(dependent)
+
+        try:
+            while ready or running:
+                while ready:
+                    name = ready.popleft()
+                    stage = self.stages[name]
+                    if stage.when is not None and not stage.when(run.state):
+                        offset = time.perf_counter() - started
+                        run.timings[name] = StageTiming(offset, offset, skipped=True)
+                        run.state[name] = None
+                        complete(name)
+                        continue
+                    running[asyncio.ensure_future(self._run_stage(stage, run, started))] = name
+
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    if run.short_circuit is not None:
+                        continue
+                    try:
+                        run.state[name] = task.result()
+                    except ShortCircuit as e:
+                        run.short_circuit, run.result = name, e.result
+                        continue
+                    complete(name)
+                if run.short_circuit is not None:
+                    self.stats["short_circuits"] += 1
+                    self.metrics.inc("dag_short_circuits_total", dag=self.name, stage=run.short_circuit)
+                    break
+
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+
+        finally:
+            if running:
+                run.cancelled = sorted(running.values())
+                self.stats["cancelled_stages"] += len(running)
+                for task in running:
+                    task.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
+            run.wall_seconds = time.perf_counter() - started
+
+        run.critical_path = self.critical_path(
+            {name: timing for name, timing in run.timings.items() if name not in run.cancelled},
+            run.short_circuit
+        )
+        self.metrics.observe("dag_critical_path_seconds", run.critical_path_seconds, dag=self.name)
+        return run
+
+    async def _run_stage(self, stage: Stage, run: DAGRun, started: float) -> Any:
+        """执行单个阶段并记录起止时间（取消或出错也记录结束时间）"""
+        run.timings[stage.name] = StageTiming(time.perf_counter() - started, 0.0)
+        try:
+            result = stage.fn(run.state)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            run.timings[stage.name].end = time.perf_counter() - started
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {"dag": self.name, "stages": self.order, **self.stats}
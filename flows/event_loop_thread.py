@@ -0,0 +1,86 @@
+"""
+后台常驻事件循环
+同步代码（简化 HTTP 服务器的请求线程）通过 run() 把协程提交到同一个长期运行的事件循环，
+不再为每个请求新建事件循环；审计日志缓冲、预热等依赖事件循环的组件因此始终绑定在同一循环上
+"""
+
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import Any, Awaitable, Optional
+
+
+class EventLoopThread:
+    """在守护线程中运行的事件循环"""
+
+    def __init__(self, name: str = "event-loop"):
+        self.name = name
+        self.logger = logging.getLogger(__name__)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """启动循环线程（幂等），返回事件循环"""
+        with self._lock:
+            if self.running:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def serve():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=serve, name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            self.logger.info(f"后台事件循环已启动: {self.name}")
+            return loop
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """提交协程，不等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """提交协程并阻塞等待结果；超时会取消协程"""
+        if self._loop is not None and threading.current_thread() is self._thread:
+            raise RuntimeError("不能在事件循环线程内同步等待协程")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float = 5.0):
+        """停止循环并关闭"""
+        with self._lock:
+            if not self.running:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self._loop.close()
+            self._thread = None
+            self._loop = None
+
+
+_default_loop_thread: Optional[EventLoopThread] = None
+_default_lock = threading.Lock()
+
+
+def get_event_loop_thread() -> EventLoopThread:
+    """获取进程内共享的后台事件循环"""
+    global _default_loop_thread
+    with _default_lock:
+        if _default_loop_thread is None:
+            _default_loop_thread = EventLoopThread()
+        return _default_loop_thread
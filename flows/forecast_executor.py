@@ -0,0 +1,174 @@
+"""
+预测任务执行器
+将 Prophet 拟合、预测和图表渲染等 CPU 密集任务放入有界进程池，避免阻塞事件循环
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Any, Callable
+
+
+class ForecastQueueFullError(RuntimeError):
+    """预测任务队列已满"""
+
+
+class ForecastExecutor:
+    """有界进程池预测执行器"""
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: int = 32,
+                 default_timeout: float = 60.0, initializer: Optional[Callable] = None):
+        self.max_workers = max_workers or int(os.getenv("FORECAST_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.logger = logging.getLogger(__name__)
+
+        if initializer is None:
+            from flows.forecast_jobs import warm_worker
+            initializer = warm_worker
+        self._initializer = initializer
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # 进程池会预取任务，排队与运行状态在这里自行维护，保证队列深度准确
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._waiting = 0
+        self._running = 0
+        self.metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "cancelled": 0,
+            "rejected": 0,
+            "abandoned": 0,
+            "run_seconds_total": 0.0,
+            "max_run_seconds": 0.0
+        }
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """延迟创建进程池（spawn 方式，避免 fork 继承事件循环线程状态）"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self._initializer
+            )
+        return self._pool
+
+    def queue_depth(self) -> int:
+        """等待空闲工作进程的任务数"""
+        return self._waiting
+
+    def running_jobs(self) -> int:
+        """占用工作进程的任务数"""
+        return self._running
+
+    async def submit(self, fn: Callable, *args, timeout: Optional[float] = None,
+                     job_id: Optional[str] = None, **kwargs) -> Any:
+        """提交任务并等待结果；超时（含排队时间）或取消时撤回任务"""
+        if self._waiting + self._running >= self.max_workers + self.max_queue:
+            self.metrics["rejected"] += 1
+            raise ForecastQueueFullError(f"预测任务队列已满 ({self._waiting} 个任务等待中)")
+
+        job_id = job_id or str(uuid.uuid4())
+        task = asyncio.ensure_future(self._run(job_id, fn, args, kwargs))
+        self._tasks[job_id] = task
+        self.metrics["submitted"] += 1
+
+        try:
+            result, run_seconds = await asyncio.wait_for(task, timeout or self.default_timeout)
+            self.metrics["completed"] += 1
+            self.metrics["run_seconds_total"] += run_seconds
+            self.metrics["max_run_seconds"] = max(self.metrics["max_run_seconds"], run_seconds)
+            return result
+        except asyncio.TimeoutError:
+            self.metrics["timeouts"] += 1
+            raise
+        except asyncio.CancelledError:
+            self.metrics["cancelled"] += 1
+            raise
+        except Exception:
+            self.metrics["failed"] += 1
+            raise
+        finally:
+            self._tasks.pop(job_id, None)
+
+    async def _run(self, job_id: str, fn: Callable, args: tuple, kwargs: Dict) -> tuple:
+        """排队等待工作进程并执行任务"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_pool().submit(_timed_call, fn, args, kwargs)
+        except BaseException:
+            # 进程池已损坏或已关闭时任务没有进入工作进程，立即归还名额
+            self._release_slot()
+            raise
+        # 工作进程真正空闲后才释放名额，被放弃的任务仍计入运行数
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release_slot))
+
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.cancel():
+                self.metrics["abandoned"] += 1
+                self.logger.warning(f"预测任务 {job_id} 已在运行，结果将被丢弃")
+            raise
+
+    def _release_slot(self):
+        self._running -= 1
+        self._slots.release()
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务：排队中的任务直接撤回，运行中的任务放弃结果"""
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        return task.cancel()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """执行器指标"""
+        metrics = dict(self.metrics)
+        metrics["max_workers"] = self.max_workers
+        metrics["max_queue"] = self.max_queue
+        metrics["queue_depth"] = self.queue_depth()
+        metrics["running"] = self.running_jobs()
+        finished = metrics["completed"]
+        metrics["avg_run_seconds"] = metrics["run_seconds_total"] / finished if finished else 0.0
+        return metrics
+
+    def shutdown(self, wait: bool = True):
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: Dict) -> tuple:
+    """在工作进程中执行任务并返回耗时"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+_default_executor: Optional[ForecastExecutor] = None
+
+
+def get_forecast_executor() -> ForecastExecutor:
+    """获取进程内共享的预测执行器"""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = ForecastExecutor()
+    return _default_executor
@@ -0,0 +1,175 @@
+"""
+预测工作进程任务
+可在进程池中执行的顶层函数：Prophet 拟合预测、趋势检测与趋势图渲染
+"""
+
+import time
+import logging
+from io import BytesIO
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+import pandas as pd
+
+
+def warm_worker():
+    """进程池初始化：预先导入 prophet 和 matplotlib，避免首个任务承担导入开销"""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        setup_plotting()
+    except ImportError:
+        pass
+    try:
+        import prophet  # noqa: F401
+        logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    except ImportError:
+        pass
+
+
+def setup_plotting():
+    """设置绘图样式"""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.style.use('seaborn-v0_8')
+    sns.set_palette("husl")
+    plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
+    plt.rcParams['axes.unicode_minus'] = False
+
+
+def fit_prophet(ds: np.ndarray, y: np.ndarray, hyperparams: Dict[str, Any], periods: int,
+                init: Optional[Dict[str, Any]] = None,
+                model_json: Optional[str] = None) -> Dict[str, Any]:
+    """拟合（或复用已序列化模型）并预测
+
+    返回预测结果、Stan 参数、序列化模型和拟合耗时，供主进程写入模型缓存
+    """
+    from prophet import Prophet
+    from prophet.serialize import model_to_json, model_from_json
+
+    prophet_df = pd.DataFrame({"ds": pd.to_datetime(ds), "y": y})
+    fit_seconds = 0.0
+    warm_started = False
+
+    if model_json:
+        model = model_from_json(model_json)
+    else:
+        model = Prophet(**hyperparams)
+        fit_start = time.perf_counter()
+        if init is not None:
+            try:
+                model.fit(prophet_df, init=init)
+                warm_started = True
+            except Exception as e:
+                logging.getLogger(__name__).info(f"热启动失败，改为冷启动训练: {e}")
+                model = Prophet(**hyperparams)
+                fit_start = time.perf_counter()
+                model.fit(prophet_df)
+        else:
+            model.fit(prophet_df)
+        fit_seconds = time.perf_counter() - fit_start
+
+    # 创建未来日期并预测
+    future = model.make_future_dataframe(periods=periods)
+    forecast = model.predict(future)
+
+    forecast_start_idx = len(prophet_df)
+    result = {
+        "values": forecast['yhat'][forecast_start_idx:].tolist(),
+        "dates": forecast['ds'][forecast_start_idx:].dt.strftime('%Y-%m-%d').tolist(),
+        "confidence_intervals": {
+            "lower": forecast['yhat_lower'][forecast_start_idx:].tolist(),
+            "upper": forecast['yhat_upper'][forecast_start_idx:].tolist()
+        }
+    }
+
+    fitted = {"result": result, "fit_seconds": fit_seconds, "warm_started": warm_started}
+    if not model_json:
+        fitted["params"] = {
+            "k": float(model.params["k"][0][0]),
+            "m": float(model.params["m"][0][0]),
+            "sigma_obs": float(model.params["sigma_obs"][0][0]),
+            "delta": np.asarray(model.params["delta"][0], dtype=float).tolist(),
+            "beta": np.asarray(model.params["beta"][0], dtype=float).tolist()
+        }
+        fitted["model_json"] = model_to_json(model)
+    return fitted
+
+
+def detect_trends_job(prepared, date_column: str, value_columns: List[str], forecast_periods: int = 7,
+                      backend: str = "auto", changepoint_method: str = "window",
+                      source: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """对已预处理的序列做趋势检测、预测和变点检测（原生后端，不渲染图表）
+
+    返回各数值列的 TrendResult 字段；图表描述以内容寻址，调用方在主进程登记后得到相同的图表 ID
+    """
+    import asyncio
+    from dataclasses import asdict
+    from flows.trend_detection import TrendDetector, TrendDetectionRequest
+
+    request = TrendDetectionRequest(
+        data=[],
+        date_column=date_column,
+        value_column=value_columns[0],
+        forecast_periods=forecast_periods,
+        changepoint_method=changepoint_method,
+        forecast_backend=backend,
+        prepared=prepared,
+        source=source
+    )
+    results = asyncio.run(TrendDetector().detect_trends(request, value_columns))
+    return {column: asdict(result) for column, result in results.items()}
+
+
+def render_chart_png(spec: Dict[str, Any]) -> bytes:
+    """按图表描述渲染 PNG（见 flows.chart_store.build_trend_spec）"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10))
+
+    for series in spec["series"]:
+        x = pd.to_datetime(series["x"])
+        if series["kind"] == "band":
+            # 绘制置信区间
+            ax1.fill_between(x, series["lower"], series["upper"], alpha=0.3, label=series["name"])
+        elif series.get("dashed"):
+            # 绘制预测数据
+            ax1.plot(x, series["y"], 's--', label=series["name"], linewidth=2, markersize=4, alpha=0.8)
+        else:
+            # 绘制历史数据
+            ax1.plot(x, series["y"], 'o-', label=series["name"], linewidth=2, markersize=4)
+
+    # 标记变点
+    for annotation in spec["annotations"]:
+        cp_date = pd.to_datetime(annotation["x"])
+        ax1.axvline(x=cp_date, color='red', linestyle=':', alpha=0.7)
+        ax1.annotate(annotation["label"],
+                     xy=(cp_date, annotation["y"]),
+                     xytext=(10, 10), textcoords='offset points',
+                     bbox=dict(boxstyle='round,pad=0.3', facecolor='yellow', alpha=0.7),
+                     arrowprops=dict(arrowstyle='->', connectionstyle='arc3,rad=0'))
+
+    ax1.set_title(spec["title"], fontsize=14, fontweight='bold')
+    ax1.set_xlabel('日期')
+    ax1.set_ylabel(spec["value_label"])
+    ax1.legend()
+    ax1.grid(True, alpha=0.3)
+
+    # 分布图（直方图已在描述中分箱）
+    hist = spec["histogram"]
+    edges = np.asarray(hist["edges"], dtype=float)
+    ax2.bar(edges[:-1], hist["counts"], width=np.diff(edges), align='edge', alpha=0.7, edgecolor='black')
+    ax2.set_title(hist["title"], fontsize=12)
+    ax2.set_xlabel(spec["value_label"])
+    ax2.set_ylabel('频次')
+    ax2.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+
+    buffer = BytesIO()
+    plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
+    return buffer.getvalue()
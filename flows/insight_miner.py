@@ -0,0 +1,383 @@
+"""
+数据洞察挖掘
+比较两个时期的指标，按类目、品牌、主播、价格带、星期等维度做贡献度分析：
+可加指标（销售额、销量）直接按分组差值分解；比率指标（客单价）按差值分解为结构（mix）效应和
+费率（rate）效应。所有维度在一次 GROUPING SETS 扫描中聚合，结果用 NumPy 向量化计算后按影响排序。
+行数超过上限时改为抽样扫描，并以时间预算作为硬上限（超时中断查询后降低抽样比例重试一次）
+"""
+
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Any, Tuple
+
+import numpy as np
+
+from config.model_config import model_config, DatabaseType
+from flows.sales_report import resolve_time_range, CUSTOM_RANGE
+
+
+@dataclass(frozen=True)
+class Dimension:
+    """分析维度：name 为结果中的标识，expression 为 douyin_products 上的 SQL 表达式
+
+    labels 不为空时 expression 产出整数编码（分组比字符串快约三成），结果中再换成标签
+    """
+    name: str
+    label: str
+    expression: str
+    labels: Optional[Tuple[str, ...]] = None
+
+
+@dataclass(frozen=True)
+class Metric:
+    """分析指标；denominator 不为空时为比率指标 SUM(numerator) / SUM(denominator)"""
+    name: str
+    label: str
+    numerator: str
+    denominator: Optional[str] = None
+    unit: str = ""
+
+
+PRICE_BANDS = ((0, 50), (50, 100), (100, 300), (300, 1000), (1000, None))
+PRICE_BAND_LABELS = tuple(f"{low}-{high}元" if high is not None else f"{low}元以上" for low, high in PRICE_BANDS)
+WEEKDAYS = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+
+def _price_band_sql() -> str:
+    cases = " ".join(f"WHEN price < {high} THEN {i}" for i, (_, high) in enumerate(PRICE_BANDS) if high is not None)
+    return f"CASE {cases} ELSE {len(PRICE_BANDS) - 1} END"
+
+
+DIMENSIONS = (
+    Dimension("category", "类目", "category"),
+    Dimension("brand", "品牌", "brand"),
+    Dimension("anchor", "主播", "anchor_name"),
+    Dimension("price_band", "价格带", _price_band_sql(), PRICE_BAND_LABELS),
+    Dimension("weekday", "星期", "isodow(created_date) - 1", WEEKDAYS),
+)
+METRICS = {
+    "sales_amount": Metric("sales_amount", "销售额", "sales_amount", unit="元"),
+    "sales_volume": Metric("sales_volume", "销量", "sales_volume", unit="件"),
+    "avg_price": Metric("avg_price", "客单价", "sales_amount", "sales_volume", unit="元"),
+}
+# 贡献占总变化的比例达到该阈值时视为高 / 中影响
+HIGH_IMPACT, MEDIUM_IMPACT = 0.3, 0.1
+
+
+class InsightTimeoutError(TimeoutError):
+    """洞察分析超出时间预算"""
+
+
+def build_insight_sql(metric: Metric, dimensions: List[Dimension], current: Tuple[date, date],
+                      baseline: Tuple[date, date], max_segments: int, sample_percent: Optional[float] = None) -> str:
+    """一次扫描得到全部维度各分段在两个时期的分子 / 分母之和
+
+    每个维度只保留变化量（分子差值绝对值）最大的 max_segments 个分段，外加一行总计
+    """
+    in_current = f"created_date BETWEEN DATE '{current[0]}' AND DATE '{current[1]}'"
+    in_baseline = f"created_date BETWEEN DATE '{baseline[0]}' AND DATE '{baseline[1]}'"
+    denominator = f"CAST({metric.denominator} AS DOUBLE)" if metric.denominator else "1.0"
+    sample = f" TABLESAMPLE {sample_percent:.6f}%" if sample_percent else ""
+    columns = ", ".join(f"{d.expression} AS {d.name}" for d in dimensions)
+    dimension_case = " ".join(f"WHEN GROUPING({d.name}) = 0 THEN '{d.name}'" for d in dimensions)
+    segment = ", ".join(f"CAST({d.name} AS VARCHAR)" for d in dimensions)
+    grouping_sets = ", ".join(f"({d.name})" for d in dimensions)
+    return f"""
+WITH base AS (
+    SELECT {columns}, {in_current} AS is_current,
+           CAST({metric.numerator} AS DOUBLE) AS num, {denominator} AS den
+    FROM douyin_products{sample}
+    WHERE ({in_current}) OR ({in_baseline})
+),
+grouped AS (
+    SELECT
+        CASE {dimension_case} ELSE 'total' END AS dimension,
+        COALESCE({segment}) AS segment,
+        COALESCE(SUM(num) FILTER (WHERE is_current), 0) AS current_num,
+        COALESCE(SUM(den) FILTER (WHERE is_current), 0) AS current_den,
+        COALESCE(SUM(num) FILTER (WHERE NOT is_current), 0) AS baseline_num,
+        COALESCE(SUM(den) FILTER (WHERE NOT is_current), 0) AS baseline_den
+    FROM base
+    GROUP BY GROUPING SETS ((), {grouping_sets})
+)
+SELECT * FROM grouped
+QUALIFY dimension = 'total'
+     OR ROW_NUMBER() OVER (PARTITION BY dimension ORDER BY abs(current_num - baseline_num) DESC) <= {int(max_segments)}
+"""
+
+
+def decompose(metric: Metric, arrays: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """向量化计算各分段对指标变化的贡献
+
+    可加指标：贡献 = 分段本期值 - 分段基期值。
+    比率指标 R = ΣN / ΣD：贡献 = N1_i/ΣD1 - N0_i/ΣD0（各分段之和恰为 ΔR），
+    其中 rate 效应 = w1_i (r1_i - r0_i)（分段自身比率变化），其余为 mix 效应（结构变化）
+    """
+    dimension = arrays["dimension"]
+    total = dimension == "total"
+    cn, cd = arrays["current_num"], arrays["current_den"]
+    bn, bd = arrays["baseline_num"], arrays["baseline_den"]
+    total_cn, total_cd = float(cn[total].sum()), float(cd[total].sum())
+    total_bn, total_bd = float(bn[total].sum()), float(bd[total].sum())
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if metric.denominator:
+            current_value = total_cn / total_cd if total_cd else np.nan
+            baseline_value = total_bn / total_bd if total_bd else np.nan
+            contribution = (cn / total_cd if total_cd else 0.0) - (bn / total_bd if total_bd else 0.0)
+            r1, r0 = cn / cd, bn / bd
+            both = (cd > 0) & (bd > 0)
+            weight = cd / total_cd if total_cd else np.zeros_like(cd)
+            rate_effect = np.where(both, weight * (r1 - r0), 0.0)
+            mix_effect = contribution - rate_effect
+            segment_current, segment_baseline = np.where(cd > 0, r1, np.nan), np.where(bd > 0, r0, np.nan)
+        else:
+            current_value, baseline_value = total_cn, total_bn
+            contribution = cn - bn
+            rate_effect = mix_effect = None
+            segment_current, segment_baseline = cn, bn
+
+        change = current_value - baseline_value
+        # 总变化接近 0 时按基期值衡量影响，避免比例失真
+        scale = abs(change) if abs(change) > 1e-9 * max(abs(baseline_value), 1.0) else abs(baseline_value) or 1.0
+        share = contribution / scale
+
+    return {
+        "current": current_value,
+        "baseline": baseline_value,
+        "change": change,
+        "change_rate": change / baseline_value if baseline_value else None,
+        "mask": ~total,
+        "contribution": contribution,
+        "share": share,
+        "rate_effect": rate_effect,
+        "mix_effect": mix_effect,
+        "segment_current": segment_current,
+        "segment_baseline": segment_baseline
+    }
+
+
+def _number(value) -> Optional[float]:
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), 4)
+
+
+class InsightMiner:
+    """基于 DuckDB 的贡献度分析"""
+
+    def __init__(self, database: str = "douyin_analytics", connection=None,
+                 time_budget: Optional[float] = None, max_scan_rows: Optional[int] = None,
+                 max_dimensions: int = len(DIMENSIONS), max_segments: int = 50):
+        self.database = database
+        self.logger = logging.getLogger(__name__)
+        self.time_budget = time_budget or float(os.getenv("INSIGHT_TIME_BUDGET", "5"))
+        # 超过该行数时抽样扫描；单核 DuckDB 上五个维度的分组集合约每秒五百万行
+        self.max_scan_rows = max_scan_rows or int(os.getenv("INSIGHT_MAX_SCAN_ROWS", "5000000"))
+        self.max_dimensions = max_dimensions
+        self.max_segments = max_segments
+        self._conn = connection
+        self._lock = threading.Lock()
+
+    def supports_database(self) -> bool:
+        """需要已存在的 DuckDB 数据库文件（或外部传入的连接）"""
+        if self._conn is not None:
+            return True
+        db_config = model_config.get_database_config(self.database)
+        return (db_config is not None and db_config.type == DatabaseType.DUCKDB
+                and os.path.exists(model_config.get_connection_string(self.database)))
+
+    def _connection(self):
+        """延迟建立只读连接，调用方各自使用游标"""
+        with self._lock:
+            if self._conn is None:
+                import duckdb
+                self._conn = duckdb.connect(model_config.get_connection_string(self.database), read_only=True)
+            return self._conn.cursor()
+
+    def _periods(self, cursor, parameters: Dict[str, Any]) -> Tuple[Tuple[date, date], Tuple[date, date]]:
+        """本期 / 基期：显式 current、baseline 区间优先，否则按 time_range 与紧邻的上一期比较"""
+        current, baseline = parameters.get("current"), parameters.get("baseline")
+        if current and baseline:
+            periods = []
+            for value in (current, baseline):
+                match = CUSTOM_RANGE.match(value)
+                if not match:
+                    raise ValueError(f"时间区间格式应为 YYYY-MM-DD..YYYY-MM-DD: {value}")
+                periods.append((date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))))
+            return periods[0], periods[1]
+
+        as_of = parameters.get("as_of")
+        anchor = date.fromisoformat(as_of) if as_of else \
+            cursor.execute("SELECT MAX(created_date) FROM douyin_products").fetchone()[0]
+        if anchor is None:
+            raise ValueError("douyin_products 中没有数据")
+        start, end, previous_start, previous_end = resolve_time_range(parameters.get("time_range", "last_7_days"), anchor)
+        return (start, end), (previous_start, previous_end)
+
+    def _execute(self, cursor, sql: str, budget: float) -> Dict[str, np.ndarray]:
+        """执行查询，超出预算时中断"""
+        import duckdb
+
+        timer = threading.Timer(budget, cursor.interrupt)
+        timer.start()
+        try:
+            return cursor.execute(sql).fetchnumpy()
+        except duckdb.InterruptException:
+            raise InsightTimeoutError(f"洞察查询超过 {budget:.2f}s")
+        finally:
+            timer.cancel()
+
+    def analyze(self, metric: str = "sales_amount", dimensions: Optional[List[str]] = None,
+                parameters: Optional[Dict[str, Any]] = None, top_k: int = 10) -> Dict[str, Any]:
+        """对两个时期做贡献度分析，返回按影响排序的驱动因素"""
+        start_time = time.perf_counter()
+        parameters = parameters or {}
+        if metric not in METRICS:
+            raise ValueError(f"不支持的指标: {metric}")
+        selected = [d for d in DIMENSIONS if dimensions is None or d.name in dimensions][:self.max_dimensions]
+        if not selected:
+            raise ValueError(f"没有可分析的维度: {dimensions}")
+        spec = METRICS[metric]
+
+        cursor = self._connection()
+        try:
+            current, baseline = self._periods(cursor, parameters)
+            rows = cursor.execute(
+                "SELECT COUNT(*) FROM douyin_products WHERE created_date BETWEEN ? AND ? OR created_date BETWEEN ? AND ?",
+                [current[0], current[1], baseline[0], baseline[1]]
+            ).fetchone()[0]
+            fraction = min(1.0, self.max_scan_rows / rows) if rows else 1.0
+            retried = False
+
+            while True:
+                remaining = self.time_budget - (time.perf_counter() - start_time)
+                if fraction > 0.01 and not retried:
+                    # 首次尝试留出 30% 预算给降级后的抽样查询
+                    remaining *= 0.7
+                sql = build_insight_sql(spec, selected, current, baseline, self.max_segments,
+                                        fraction * 100 if fraction < 1.0 else None)
+                try:
+                    arrays = self._execute(cursor, sql, max(remaining, 0.01))
+                    break
+                except InsightTimeoutError:
+                    # 只降级一次：抽样比例降到十分之一，使用剩余预算
+                    if retried or fraction <= 0.01 or time.perf_counter() - start_time >= self.time_budget:
+                        raise
+                    retried = True
+                    fraction = max(fraction * 0.1, 0.01)
+                    self.logger.warning(f"洞察查询超时，改为 {fraction:.1%} 抽样重试")
+        finally:
+            cursor.close()
+
+        if fraction < 1.0:
+            # 抽样总和按比例放大；比率指标不受影响
+            for column in ("current_num", "current_den", "baseline_num", "baseline_den"):
+                arrays[column] = arrays[column] / fraction
+        result = decompose(spec, arrays)
+        drivers = self._drivers(spec, selected, arrays, result, top_k)
+
+        return {
+            "metric": metric,
+            "metric_label": spec.label,
+            "current_period": {"start": current[0], "end": current[1]},
+            "baseline_period": {"start": baseline[0], "end": baseline[1]},
+            "current_value": _number(result["current"]),
+            "baseline_value": _number(result["baseline"]),
+            "change": _number(result["change"]),
+            "change_rate": _number(result["change_rate"]),
+            "drivers": drivers,
+            "dimensions": [d.name for d in selected],
+            "scanned_rows": rows,
+            "sample_fraction": round(fraction, 6),
+            "execution_time": round(time.perf_counter() - start_time, 6)
+        }
+
+    def _drivers(self, metric: Metric, dimensions: List[Dimension], arrays: Dict[str, np.ndarray],
+                 result: Dict[str, Any], top_k: int) -> List[Dict[str, Any]]:
+        """按 |贡献占比| 取前 top_k 个分段
+
+        不同维度的分段覆盖完全相同的数据时（如单一品牌独占一个类目）只保留一个，其余记入 equivalent_segments
+        """
+        by_name = {d.name: d for d in dimensions}
+        candidates = np.flatnonzero(result["mask"])
+        order = candidates[np.argsort(-np.abs(result["share"][candidates]), kind="stable")]
+        drivers: List[Dict[str, Any]] = []
+        seen: Dict[Tuple[float, ...], Dict[str, Any]] = {}
+        for i in order:
+            dimension, segment = str(arrays["dimension"][i]), arrays["segment"][i]
+            if by_name[dimension].labels and segment is not None:
+                segment = by_name[dimension].labels[int(segment)]
+            segment = "(空)" if segment is None else str(segment)
+            key = tuple(float(arrays[c][i]) for c in ("current_num", "current_den", "baseline_num", "baseline_den"))
+            if key in seen:
+                seen[key].setdefault("equivalent_segments", []).append(f"{by_name[dimension].label}「{segment}」")
+                continue
+            if len(drivers) >= top_k:
+                break
+            share = float(result["share"][i])
+            driver = {
+                "dimension": dimension,
+                "dimension_label": by_name[dimension].label,
+                "segment": segment,
+                "current": _number(result["segment_current"][i]),
+                "baseline": _number(result["segment_baseline"][i]),
+                "contribution": _number(result["contribution"][i]),
+                "contribution_share": _number(share),
+                "impact": "high" if abs(share) >= HIGH_IMPACT else "medium" if abs(share) >= MEDIUM_IMPACT else "low"
+            }
+            if metric.denominator:
+                driver["rate_effect"] = _number(result["rate_effect"][i])
+                driver["mix_effect"] = _number(result["mix_effect"][i])
+            seen[key] = driver
+            drivers.append(driver)
+        return drivers
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def describe_driver(analysis: Dict[str, Any], driver: Dict[str, Any]) -> Dict[str, Any]:
+    """把驱动因素整理为洞察条目（与工作流原有的 insights 结构一致）"""
+    metric = METRICS[analysis["metric"]]
+    name = f"{driver['dimension_label']}「{driver['segment']}」"
+    contribution = driver["contribution"] or 0.0
+    direction = "拉动" if (contribution >= 0) == ((analysis["change"] or 0.0) >= 0) else "抵消"
+    trend = "增长" if contribution >= 0 else "下降"
+    description = (f"{name}{metric.label}由 {driver['baseline']} 变为 {driver['current']}，"
+                   f"{direction}整体变化的 {abs((driver['contribution_share'] or 0.0) * 100):.1f}%")
+    if metric.denominator and driver.get("rate_effect") is not None:
+        description += f"（自身变化 {driver['rate_effect']:+.2f}{metric.unit}，结构变化 {driver['mix_effect']:+.2f}{metric.unit}）"
+    if contribution >= 0:
+        recommendation = f"{name}带来{metric.label}{trend}，建议加大该方向的资源投入"
+    else:
+        recommendation = f"{name}导致{metric.label}{trend}，建议排查原因并及时调整"
+    return {
+        "type": f"{driver['dimension']}_driver",
+        "title": f"{name}{metric.label}{trend}",
+        "description": description,
+        "impact": driver["impact"],
+        "recommendation": recommendation,
+        **driver
+    }
+
+
+_default_miner: Optional[InsightMiner] = None
+_default_lock = threading.Lock()
+
+
+def get_insight_miner() -> InsightMiner:
+    """获取全局洞察分析器"""
+    global _default_miner
+    with _default_lock:
+        if _default_miner is None:
+            _default_miner = InsightMiner()
+        return _default_miner
@@ -0,0 +1,309 @@
+"""
+指标采集
+HDR 风格的对数-线性延迟直方图（相对误差约 3%，记录为 O(1)）、带标签的计数器，
+以及 Prometheus 文本格式导出；AWEL 操作符通过 timed 包装按单调时钟计时
+"""
+
+import time
+import asyncio
+import threading
+import functools
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Callable, Tuple
+
+
+# 每个 2 的幂区间细分为 32 个子桶；以微秒记录，覆盖 1µs 到约 19 小时
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_SHIFT = 31
+BUCKET_COUNT = (MAX_SHIFT + 2) * SUB_BUCKETS
+PROMETHEUS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _bucket_index(micros: int) -> int:
+    shift = max(0, micros.bit_length() - SUB_BUCKET_BITS - 1)
+    if shift > MAX_SHIFT:
+        return BUCKET_COUNT - 1
+    return shift * SUB_BUCKETS + (micros >> shift)
+
+
+def _bucket_bounds(index: int) -> Tuple[int, int]:
+    """桶覆盖的微秒区间 [low, high)"""
+    shift = max(0, index // SUB_BUCKETS - 1)
+    mantissa = index - shift * SUB_BUCKETS
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+# 桶代表值（区间中点，秒）
+BUCKET_VALUES = [sum(_bucket_bounds(i)) / 2 / 1e6 for i in range(BUCKET_COUNT)]
+
+
+class LatencyHistogram:
+    """对数-线性延迟直方图"""
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        seconds = max(0.0, seconds)
+        index = _bucket_index(int(seconds * 1e6))
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds < self.min:
+                self.min = seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def merge(self, other: "LatencyHistogram"):
+        with self._lock:
+            for i, c in enumerate(other.counts):
+                if c:
+                    self.counts[i] += c
+            self.count += other.count
+            self.total += other.total
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> float:
+        """第 p 百分位（0-100），返回所在桶的代表值，并限制在实际最小/最大值之间"""
+        if self.count == 0:
+            return 0.0
+        rank = max(1, int(round(p / 100.0 * self.count)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(max(BUCKET_VALUES[i], self.min), self.max)
+        return self.max
+
+    def cumulative(self, bounds=PROMETHEUS_BUCKETS) -> List[int]:
+        """各上界（秒）以内的累计计数"""
+        result, seen, i = [], 0, 0
+        for bound in bounds:
+            while i < BUCKET_COUNT and BUCKET_VALUES[i] <= bound:
+                seen += self.counts[i]
+                i += 1
+            result.append(seen)
+        return result
+
+    def snapshot(self) -> Dict[str, float]:
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "min_ms": round(self.min * 1000, 3),
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p90_ms": round(self.percentile(90) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "p999_ms": round(self.percentile(99.9) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """计数器与直方图注册表"""
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, LatencyHistogram]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, Callable[[], float]]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """计数器累加"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def gauge(self, name: str, fn: Callable[[], float], **labels):
+        """注册仪表：读取指标时调用 fn 取当前值（同名同标签的后注册者覆盖前者）"""
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = fn
+
+    def histogram(self, name: str, **labels) -> LatencyHistogram:
+        key = _label_key(labels)
+        series = self._histograms.get(name)
+        if series is None or key not in series:
+            with self._lock:
+                series = self._histograms.setdefault(name, {})
+                if key not in series:
+                    series[key] = LatencyHistogram()
+        return series[key]
+
+    def observe(self, name: str, seconds: float, **labels):
+        self.histogram(name, **labels).record(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """以单调时钟计时的上下文管理器"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels) -> Callable:
+        """计时装饰器，支持同步与异步函数；异常也计入，并另计 {name}_errors_total
+
+        协程被取消（如 DAG 短路时取消兄弟阶段）不算错误，也不记录耗时
+        """
+        histogram = self.histogram(name, **labels)
+        error_name = name.replace("_duration_seconds", "") + "_errors_total"
+
+        def decorator(fn: Callable) -> Callable:
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        result = await fn(*args, **kwargs)
+                    except asyncio.CancelledError:
+                        raise
+                    except BaseException:
+                        self.inc(error_name, **labels)
+                        histogram.record(time.perf_counter() - start)
+                        raise
+                    histogram.record(time.perf_counter() - start)
+                    return result
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                except BaseException:
+                    self.inc(error_name, **labels)
+                    raise
+                finally:
+                    histogram.record(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def counter_value(self, name: str, **labels) -> float:
+        """计数值；只给部分标签时对其余标签求和"""
+        wanted = _label_key(labels)
+        series = self._counters.get(name, {})
+        return sum(v for key, v in list(series.items()) if set(wanted) <= set(key))
+
+    def merged_histogram(self, name: str, **labels) -> LatencyHistogram:
+        """按部分标签合并直方图"""
+        wanted = _label_key(labels)
+        merged = LatencyHistogram()
+        for key, hist in list(self._histograms.get(name, {}).items()):
+            if set(wanted) <= set(key):
+                merged.merge(hist)
+        return merged
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON 友好的全部指标"""
+        def label_str(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key) or "_"
+
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "counters": {
+                name: {label_str(k): v for k, v in list(series.items())}
+                for name, series in list(self._counters.items())
+            },
+            "histograms": {
+                name: {label_str(k): h.snapshot() for k, h in list(series.items())}
+                for name, series in list(self._histograms.items())
+            },
+            "gauges": {
+                name: {label_str(k): fn() for k, fn in list(series.items())}
+                for name, series in list(self._gauges.items())
+            }
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        for name, series in sorted(self._counters.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+        for name, series in sorted(self._histograms.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in sorted(series.items()):
+                for bound, count in zip(PROMETHEUS_BUCKETS, hist.cumulative()):
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {hist.count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {hist.total:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+
+        for name, series in sorted(self._gauges.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, fn in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {fn():g}")
+
+        lines.append("# TYPE process_uptime_seconds gauge")
+        lines.append(f"process_uptime_seconds {time.time() - self.started_at:.1f}")
+        return "\n".join(lines) + "\n"
+
+
+_default_registry: Optional[MetricsRegistry] = None
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取进程内共享的指标注册表"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = MetricsRegistry()
+        _default_registry.describe("awel_operator_duration_seconds", "AWEL 操作符耗时")
+        _default_registry.describe("awel_operator_errors_total", "AWEL 操作符异常次数")
+        _default_registry.describe("dag_critical_path_seconds", "DAG 每次运行关键路径耗时")
+        _default_registry.describe("dag_short_circuits_total", "DAG 被阶段提前结束的次数")
+        _default_registry.describe("nl2sql_query_duration_seconds", "按数据库统计的 SQL 执行耗时")
+        _default_registry.describe("nl2sql_request_duration_seconds", "NL2SQL 端到端耗时")
+        _default_registry.describe("nl2sql_validation_failures_total", "SQL 验证失败次数")
+        _default_registry.describe("nl2sql_autofix_total", "SQL 自动修复次数")
+        _default_registry.describe("cache_requests_total", "缓存查询次数")
+        _default_registry.describe("singleflight_calls_total", "在途请求合并调用次数（leader 执行，follower 复用）")
+        _default_registry.describe("singleflight_coalescing_ratio", "被合并到在途请求的调用占比")
+        _default_registry.describe("http_request_duration_seconds", "HTTP 请求耗时")
+        _default_registry.describe("http_requests_total", "HTTP 请求次数")
+        _default_registry.describe("workflow_executions_total", "工作流执行次数")
+        _default_registry.describe("workflow_duration_seconds", "工作流执行耗时")
+        _default_registry.describe("workflow_jobs_total", "异步工作流任务状态变化次数")
+        _default_registry.describe("workflow_job_queue_seconds", "异步工作流任务排队耗时")
+    return _default_registry
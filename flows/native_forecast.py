@@ -0,0 +1,175 @@
+"""
+原生快速预测层
+纯 NumPy 实现的加法 Holt-Winters（阻尼趋势 + 周季节性）与线性回归，
+参数网格在序列和参数维度上同时向量化，支持批量序列与解析预测区间
+"""
+
+import itertools
+from statistics import NormalDist
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+
+
+# 自动选择：序列长度不少于两个完整季节周期时才估计季节项。
+# 阈值来自 scripts/benchmark_forecast.py 在 30 天生成数据上的滚动回测
+MIN_SEASONAL_CYCLES = 2
+MIN_POINTS_FOR_TREND = 4
+
+NATIVE_BACKENDS = ("holt_winters", "damped_trend", "linear")
+FORECAST_BACKENDS = ("auto", "prophet") + NATIVE_BACKENDS
+
+
+def select_backend(n_points: int, requested: str = "auto", season_length: Optional[int] = 7) -> str:
+    """根据请求和序列长度选择预测后端；Prophet 只在显式请求时使用，无季节周期时不选 Holt-Winters"""
+    if requested not in FORECAST_BACKENDS:
+        raise ValueError(f"未知的预测后端: {requested}")
+    if requested != "auto":
+        return requested
+    if season_length and n_points >= MIN_SEASONAL_CYCLES * season_length:
+        return "holt_winters"
+    if n_points >= MIN_POINTS_FOR_TREND:
+        return "damped_trend"
+    return "linear"
+
+
+def linear_forecast(values, horizon: int, confidence: float = 0.95) -> Dict[str, np.ndarray]:
+    """线性回归预测，区间为残差标准差的常数带"""
+    values = np.asarray(values, dtype=float)
+    x = np.arange(len(values))
+    slope, intercept = np.polyfit(x, values, 1)
+    mean = slope * np.arange(len(values), len(values) + horizon) + intercept
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    std_dev = np.std(values)
+    return {"mean": mean, "lower": mean - z * std_dev, "upper": mean + z * std_dev}
+
+
+class HoltWintersForecaster:
+    """加法阻尼 Holt-Winters（ETS(A,Ad,A)）"""
+
+    ALPHAS = (0.05, 0.1, 0.2, 0.35, 0.5, 0.7, 0.9)
+    BETAS = (0.0, 0.01, 0.05, 0.1, 0.2)
+    GAMMAS = (0.0, 0.05, 0.1, 0.2, 0.35)
+    PHIS = (0.8, 0.9, 0.98)
+
+    def __init__(self, season_length: Optional[int] = 7, damped: bool = True,
+                 batch_size: int = 512):
+        self.season_length = season_length if season_length and season_length > 1 else None
+        self.damped = damped
+        self.batch_size = batch_size
+        self._grid = self._build_grid()
+
+    def _build_grid(self) -> np.ndarray:
+        """参数网格 (alpha, beta, gamma, phi)，约束 beta <= alpha"""
+        gammas = self.GAMMAS if self.season_length else (0.0,)
+        phis = self.PHIS if self.damped else (1.0,)
+        grid = [
+            combo for combo in itertools.product(self.ALPHAS, self.BETAS, gammas, phis)
+            if combo[1] <= combo[0] and combo[2] <= 1 - combo[0]
+        ]
+        return np.asarray(grid, dtype=float)
+
+    def forecast(self, values, horizon: int, confidence: float = 0.95) -> Dict[str, Any]:
+        """单条序列预测"""
+        result = self.forecast_batch(np.asarray(values, dtype=float)[None, :], horizon, confidence)
+        return {key: value[0] for key, value in result.items()}
+
+    def forecast_many(self, series: List[np.ndarray], horizon: int,
+                      confidence: float = 0.95) -> List[Dict[str, Any]]:
+        """不等长序列批量预测：按长度分组后逐组向量化"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(series)
+        by_length: Dict[int, List[int]] = {}
+        for i, values in enumerate(series):
+            by_length.setdefault(len(values), []).append(i)
+
+        for length, members in by_length.items():
+            batch = np.vstack([np.asarray(series[i], dtype=float) for i in members])
+            out = self.forecast_batch(batch, horizon, confidence)
+            for row, i in enumerate(members):
+                results[i] = {key: value[row] for key, value in out.items()}
+        return results
+
+    def forecast_batch(self, values: np.ndarray, horizon: int,
+                       confidence: float = 0.95) -> Dict[str, np.ndarray]:
+        """等长序列批量预测，values 形状为 (序列数, 长度)"""
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        outputs = [
+            self._fit_forecast(values[i:i + self.batch_size], horizon, confidence)
+            for i in range(0, len(values), self.batch_size)
+        ]
+        return {key: np.concatenate([o[key] for o in outputs]) for key in outputs[0]}
+
+    def _fit_forecast(self, y: np.ndarray, horizon: int, confidence: float) -> Dict[str, np.ndarray]:
+        n_series, n = y.shape
+        m = self.season_length if self.season_length and n >= 2 * self.season_length else None
+        grid = self._grid if m else self._grid[self._grid[:, 2] == 0.0]
+        alpha, beta, gamma, phi = (grid[:, k][None, :] for k in range(4))
+
+        level, trend, season, start = self._initial_state(y, m)
+        n_grid = len(grid)
+        level = np.repeat(level[:, None], n_grid, axis=1)
+        trend = np.repeat(trend[:, None], n_grid, axis=1)
+        # 季节项按 (周期位置, 序列, 参数) 存放，每步访问连续内存
+        season = np.repeat(season.T[:, :, None], n_grid, axis=2)
+        period = season.shape[0]
+
+        # 一步预测误差递推（误差修正形式），序列 × 参数同时计算
+        sse = np.zeros((n_series, n_grid))
+        for t in range(start, n):
+            s_prev = season[t % period]
+            error = y[:, t, None] - (level + phi * trend + s_prev)
+            sse += error * error
+            level = level + phi * trend + alpha * error
+            trend = phi * trend + beta * error
+            s_prev += gamma * error
+
+        best = np.argmin(sse, axis=1)
+        rows = np.arange(n_series)
+        a, b, g, p = (grid[best, k] for k in range(4))
+        level_n = level[rows, best]
+        trend_n = trend[rows, best]
+        season_n = season[:, rows, best].T
+
+        # 点预测：l + (phi + ... + phi^h) b + s
+        steps = np.arange(1, horizon + 1)
+        phi_pow = p[:, None] ** steps[None, :]
+        damp_sum = np.cumsum(phi_pow, axis=1)
+        slots = (n + steps - 1) % period
+        mean = level_n[:, None] + damp_sum * trend_n[:, None] + season_n[:, slots]
+
+        # 预测区间：sigma^2 * (1 + sum_{j<h} c_j^2)，c_j = alpha + beta * phi(1-phi^j)/(1-phi) + gamma * [j % m == 0]
+        n_obs = n - start
+        n_params = 2 + (1 if m else 0) + (1 if self.damped else 0) + 2 + (m or 0)
+        sigma2 = sse[rows, best] / max(n_obs - n_params, 1)
+        j = np.arange(1, horizon)
+        damp_j = np.cumsum(p[:, None] ** j[None, :], axis=1) if horizon > 1 else np.zeros((n_series, 0))
+        c = a[:, None] + b[:, None] * damp_j
+        if m:
+            c = c + g[:, None] * (j[None, :] % m == 0)
+        var_factor = np.concatenate([np.ones((n_series, 1)), 1 + np.cumsum(c * c, axis=1)], axis=1)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        half_width = z * np.sqrt(sigma2[:, None] * var_factor)
+
+        return {
+            "mean": mean,
+            "lower": mean - half_width,
+            "upper": mean + half_width,
+            "params": np.stack([a, b, g, p], axis=1),
+            "sigma": np.sqrt(sigma2)
+        }
+
+    @staticmethod
+    def _initial_state(y: np.ndarray, m: Optional[int]):
+        """经典初始化：首季均值为水平，前两季均值差为趋势，首季去均值为季节项"""
+        n_series, n = y.shape
+        if m:
+            first = y[:, :m]
+            level = first.mean(axis=1)
+            trend = (y[:, m:2 * m].mean(axis=1) - level) / m
+            season = first - level[:, None]
+            return level, trend, season, m
+
+        k = min(MIN_POINTS_FOR_TREND, n) - 1
+        level = y[:, 0].copy()
+        trend = (y[:, k] - y[:, 0]) / k if k > 0 else np.zeros(n_series)
+        return level, trend, np.zeros((n_series, 1)), 1
@@ -4,20 +4,29 @@ NL2SQL AWEL 工作流管道
 """
 
 import os
+import re
 import json
+import time
 import logging
 import asyncio
+import functools
+from collections import OrderedDict, deque
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 
-from dbgpt.core.awel import DAG, MapOperator, JoinOperator, BranchOperator
-from dbgpt.core.awel.flow import IOField, ViewMetadata, Parameter
 from dbgpt.core.interface.llm import LLMClient
 from dbgpt.core.interface.embeddings import EmbeddingClient
 from dbgpt.datasource.manages.connector_manager import ConnectorManager
 from dbgpt.rag.retriever.embedding import EmbeddingRetriever
 
+from flows.audit_log import get_audit_writer
+from flows.metrics import get_metrics_registry
+from flows.tracing import get_tracer, llm_usage_attributes
+from flows.query_cache import QueryCache, normalize_question, normalize_sql
+from flows.singleflight import SingleFlight
+from flows.dag_scheduler import DAGScheduler, Stage, ShortCircuit
+
 
 @dataclass
 class NL2SQLRequest:
@@ -48,6 +57,7 @@ class QueryResult:
     row_count: int = 0
     execution_time: float = 0.0
     error_message: str = ""
+    column_types: Dict[str, str] = None  # 列名 -> 数据库类型
 
 
 class SchemaRetriever:
@@ -61,17 +71,23 @@ class SchemaRetriever:
     async def retrieve_relevant_schemas(self, question: str, top_k: int = 3) -> List[Dict]:
         """检索相关的表结构"""
         try:
+            tracer = get_tracer()
+
             # 生成问题的嵌入向量
-            question_embedding = await self.embedding_client.aembed_query(question)
+            with tracer.span("embedding.embed_query", kind="client"):
+                question_embedding = await self.embedding_client.aembed_query(question)
             
             # 在 Weaviate 中搜索相似的表结构
-            result = self.weaviate_client.query.get("TableSchema", [
-                "database_name", "table_name", "table_comment", 
-                "business_description", "columns_info", "common_queries"
-            ]).with_near_vector({
-                "vector": question_embedding,
-                "certainty": 0.7
-            }).with_limit(top_k).do()
+            with tracer.span("vectorstore.query", kind="client", **{
+                "db.system": "weaviate", "db.collection.name": "TableSchema", "vectorstore.top_k": top_k
+            }):
+                result = self.weaviate_client.query.get("TableSchema", [
+                    "database_name", "table_name", "table_comment", 
+                    "business_description", "columns_info", "common_queries"
+                ]).with_near_vector({
+                    "vector": question_embedding,
+                    "certainty": 0.7
+                }).with_limit(top_k).do()
             
             schemas = []
             if "data" in result and "Get" in result["data"]:
@@ -99,14 +115,17 @@ class SQLGenerator:
         self.llm_client = llm_client
         self.logger = logging.getLogger(__name__)
     
-    async def generate_sql(self, question: str, schemas: List[Dict]) -> str:
-        """生成 SQL 查询"""
+    async def generate_sql(self, question: str, schemas: List[Dict],
+                           history: Optional[List[Dict]] = None) -> str:
+        """生成 SQL 查询；history 为同一会话最近几轮的问题与 SQL"""
         try:
             # 构建提示词
-            prompt = self._build_prompt(question, schemas)
+            prompt = self._build_prompt(question, schemas, history)
             
             # 调用 LLM 生成 SQL
-            response = await self.llm_client.agenerate(prompt)
+            with get_tracer().span("llm.generate", kind="client", **{"nl2sql.purpose": "generate"}) as span:
+                response = await self.llm_client.agenerate(prompt)
+                span.set_attributes(llm_usage_attributes(response, prompt))
             sql = self._extract_sql_from_response(response.text)
             
             self.logger.info(f"生成 SQL: {sql}")
@@ -116,7 +135,7 @@ class SQLGenerator:
             self.logger.error(f"SQL 生成失败: {e}")
             return ""
     
-    def _build_prompt(self, question: str, schemas: List[Dict]) -> str:
+    def _build_prompt(self, question: str, schemas: List[Dict], history: Optional[List[Dict]] = None) -> str:
         """构建 LLM 提示词"""
         schema_info = ""
         for schema in schemas:
@@ -129,12 +148,17 @@ class SQLGenerator:
 列信息: {columns_desc}
 业务说明: {schema['business_description']}
 """
+        history_info = ""
+        if history:
+            history_info = "\n本会话最近的查询（用户问题可能承接上文）:\n" + "".join(
+                f"问题: {turn['question']}\nSQL: {turn['sql']}\n" for turn in history
+            )
         
         prompt = f"""
 你是一个专业的SQL查询生成助手，专门为抖音电商数据分析平台生成SQL查询。
 
 数据库表结构信息:
-{schema_info}
+{schema_info}{history_info}
 
 用户问题: {question}
 
@@ -180,6 +204,12 @@ class SQLValidator:
     
     async def validate_sql(self, sql: str, database: str) -> SQLValidationResult:
         """验证 SQL 查询"""
+        with get_tracer().span("sql.validate", **{"db.name": database}) as span:
+            result = await self._validate(sql, database)
+            span.set_attributes({"sql.valid": result.is_valid, "sql.error": result.error_message or None})
+            return result
+
+    async def _validate(self, sql: str, database: str) -> SQLValidationResult:
         try:
             # 1. 基础语法检查
             if not sql or not sql.strip():
@@ -282,29 +312,35 @@ class AutoFixEngine:
     
     async def fix_sql(self, original_sql: str, error_message: str, schemas: List[Dict]) -> Optional[str]:
         """自动修复 SQL"""
+        tracer = get_tracer()
         for attempt in range(self.max_attempts):
-            try:
-                self.logger.info(f"尝试修复 SQL (第 {attempt + 1} 次)")
-                
-                # 构建修复提示词
-                fix_prompt = self._build_fix_prompt(original_sql, error_message, schemas)
-                
-                # 生成修复后的 SQL
-                response = await self.llm_client.agenerate(fix_prompt)
-                fixed_sql = self._extract_sql_from_response(response.text)
-                
-                # 验证修复后的 SQL
-                validation_result = await self.sql_validator.validate_sql(fixed_sql, "douyin_analytics")
-                
-                if validation_result.is_valid:
-                    self.logger.info(f"SQL 修复成功: {fixed_sql}")
-                    return fixed_sql
-                else:
-                    error_message = validation_result.error_message
-                    original_sql = fixed_sql
+            with tracer.span("sql.fix_attempt", **{"sql.fix.attempt": attempt + 1}) as attempt_span:
+                try:
+                    self.logger.info(f"尝试修复 SQL (第 {attempt + 1} 次)")
+                    
+                    # 构建修复提示词
+                    fix_prompt = self._build_fix_prompt(original_sql, error_message, schemas)
+                    
+                    # 生成修复后的 SQL
+                    with tracer.span("llm.generate", kind="client", **{"nl2sql.purpose": "fix"}) as span:
+                        response = await self.llm_client.agenerate(fix_prompt)
+                        span.set_attributes(llm_usage_attributes(response, fix_prompt))
+                    fixed_sql = self._extract_sql_from_response(response.text)
                     
-            except Exception as e:
-                self.logger.error(f"SQL 修复失败 (第 {attempt + 1} 次): {e}")
+                    # 验证修复后的 SQL
+                    validation_result = await self.sql_validator.validate_sql(fixed_sql, "douyin_analytics")
+                    attempt_span.set_attribute("sql.valid", validation_result.is_valid)
+                    
+                    if validation_result.is_valid:
+                        self.logger.info(f"SQL 修复成功: {fixed_sql}")
+                        return fixed_sql
+                    else:
+                        error_message = validation_result.error_message
+                        original_sql = fixed_sql
+                        
+                except Exception as e:
+                    attempt_span.record_exception(e)
+                    self.logger.error(f"SQL 修复失败 (第 {attempt + 1} 次): {e}")
         
         self.logger.warning("SQL 自动修复失败，已达到最大尝试次数")
         return None
@@ -348,6 +384,10 @@ class AutoFixEngine:
         return sql.strip()
 
 
+# DuckDB EXPLAIN 中的基数估算，如 "~10,000 rows"
+ESTIMATED_ROWS = re.compile(r"~([\d,]+) rows", re.IGNORECASE)
+
+
 class QueryExecutor:
     """查询执行器"""
     
@@ -355,8 +395,16 @@ class QueryExecutor:
         self.connector_manager = connector_manager
         self.logger = logging.getLogger(__name__)
     
-    async def execute_query(self, sql: str, database: str) -> QueryResult:
-        """执行 SQL 查询"""
+    async def execute_query(self, sql: str, database: str, describe: bool = True) -> QueryResult:
+        """执行 SQL 查询；describe 为 False 时不取结果列类型（已由代价估算取得）"""
+        with get_tracer().span("db.query", kind="client", **{"db.name": database, "db.statement": sql}) as span:
+            result = await self._execute(sql, database, describe)
+            span.set_attributes({"db.success": result.success, "db.row_count": result.row_count})
+            if not result.success:
+                span.set_attribute("error.message", result.error_message)
+            return result
+
+    async def _execute(self, sql: str, database: str, describe: bool = True) -> QueryResult:
         start_time = datetime.now()
         
         try:
@@ -373,7 +421,8 @@ class QueryExecutor:
                 data=result.data,
                 columns=result.columns,
                 row_count=len(result.data) if result.data else 0,
-                execution_time=execution_time
+                execution_time=execution_time,
+                column_types=await self._describe_columns(connector, sql, database) if describe else None
             )
             
         except Exception as e:
@@ -387,6 +436,47 @@ class QueryExecutor:
             )
 
 
+    async def _describe_columns(self, connector, sql: str, database: str) -> Optional[Dict[str, str]]:
+        """DuckDB 数据源通过 DESCRIBE 取得结果列类型（只做查询规划，不执行）"""
+        from config.model_config import model_config, DatabaseType
+        
+        db_config = model_config.get_database_config(database)
+        if db_config is None or db_config.type != DatabaseType.DUCKDB:
+            return None
+        
+        try:
+            described = await connector.aquery(f"DESCRIBE {sql.strip().rstrip(';')}")
+            return {row["column_name"]: row["column_type"] for row in described.data}
+        except Exception as e:
+            self.logger.warning(f"结果列类型获取失败: {e}")
+            return None
+
+    async def estimate_cost(self, sql: str, database: str) -> Optional[Dict[str, Any]]:
+        """只做查询规划：DuckDB 数据源取结果列类型和 EXPLAIN 估算的输出 / 扫描行数"""
+        from config.model_config import model_config, DatabaseType
+        
+        db_config = model_config.get_database_config(database)
+        if db_config is None or db_config.type != DatabaseType.DUCKDB:
+            return None
+        
+        connector = self.connector_manager.get_connector(database)
+        column_types = await self._describe_columns(connector, sql, database)
+        try:
+            explained = await connector.aquery(f"EXPLAIN {sql.strip().rstrip(';')}")
+            plan = "\n".join(str(row["explain_value"]) for row in explained.data)
+            # 计划自顶向下排列：第一个估算值为输出行数，最大值近似扫描行数
+            estimates = [int(n.replace(",", "")) for n in ESTIMATED_ROWS.findall(plan)]
+        except Exception as e:
+            self.logger.warning(f"查询代价估算失败: {e}")
+            estimates = []
+        return {
+            "sql": sql,
+            "column_types": column_types,
+            "estimated_rows": estimates[0] if estimates else None,
+            "estimated_scan_rows": max(estimates) if estimates else None
+        }
+
+
 # ============================================
 # AWEL 工作流定义
 # ============================================
@@ -394,120 +484,207 @@ class QueryExecutor:
 class NL2SQLPipeline:
     """NL2SQL 工作流管道"""
     
+    SESSION_TURNS = 3  # 每个会话保留的最近轮数
+    MAX_SESSIONS = 1024
+    
     def __init__(self):
-        self.dag = DAG("nl2sql_pipeline")
+        self.metrics = get_metrics_registry()
+        self.tracer = get_tracer()
+        # 结果缓存命中时整条管道提前结束；SQL 模板为执行成功过的 SQL，命中时跳过 LLM 生成
+        self.result_cache = QueryCache(max_entries=1024, ttl=300, name="nl2sql_pipeline_result")
+        self.template_cache = QueryCache(max_entries=4096, ttl=86400, name="nl2sql_pipeline_template")
+        self.sessions: "OrderedDict[str, deque]" = OrderedDict()
+        # 相同问题 / SQL 的并发请求共享一次检索、生成和执行
+        self.retrieval_flight = SingleFlight("nl2sql_retrieval")
+        self.generation_flight = SingleFlight("nl2sql_generation")
+        self.execution_flight = SingleFlight("nl2sql_execution")
         self._build_pipeline()
+
+    def _timed(self, task_name: str, fn, traced: bool = False):
+        """按单调时钟记录操作符耗时；traced 时在请求的追踪下创建同名 Span"""
+        if traced:
+            fn = self._traced(task_name, fn)
+        return self.metrics.timed("awel_operator_duration_seconds", operator=task_name)(fn)
+
+    def _traced(self, task_name: str, fn):
+        @functools.wraps(fn)
+        async def wrapper(context: Dict):
+            with self.tracer.span(f"nl2sql.{task_name}", parent=context.get("trace_span")):
+                return await fn(context)
+        return wrapper
     
     def _build_pipeline(self):
-        """构建工作流管道"""
-        
-        # 1. Schema 检索节点
-        schema_retrieval = MapOperator(
-            map_function=self._retrieve_schemas,
-            task_name="schema_retrieval"
-        )
-        
-        # 2. SQL 生成节点
-        sql_generation = MapOperator(
-            map_function=self._generate_sql,
-            task_name="sql_generation"
-        )
-        
-        # 3. SQL 验证节点
-        sql_validation = MapOperator(
-            map_function=self._validate_sql,
-            task_name="sql_validation"
-        )
-        
-        # 4. 分支节点：验证通过或需要修复
-        validation_branch = BranchOperator(
-            branch_function=self._validation_branch,
-            task_name="validation_branch"
-        )
-        
-        # 5. 自动修复节点
-        auto_fix = MapOperator(
-            map_function=self._auto_fix_sql,
-            task_name="auto_fix"
-        )
-        
-        # 6. 查询执行节点
-        query_execution = MapOperator(
-            map_function=self._execute_query,
-            task_name="query_execution"
-        )
-        
-        # 7. 结果处理节点
-        result_processing = MapOperator(
-            map_function=self._process_results,
-            task_name="result_processing"
-        )
+        """构建工作流管道：各阶段声明依赖，互不依赖的阶段并发执行"""
+        self.dag = DAGScheduler("nl2sql_pipeline", [
+            # 1. 检索类阶段并发；结果缓存命中时其余阶段被取消
+            Stage("cache_lookup", self._timed("cache_lookup", self._lookup_cache)),
+            Stage("template_matching", self._timed("template_matching", self._match_template)),
+            Stage("schema_retrieval", self._timed("schema_retrieval", self._retrieve_schemas)),
+            Stage("session_context", self._timed("session_context", self._load_session_context)),
+            
+            # 2. SQL 生成（模板命中时不调用 LLM）
+            Stage("sql_generation", self._timed("sql_generation", self._generate_sql, traced=True),
+                  depends_on=("cache_lookup", "template_matching", "schema_retrieval", "session_context")),
+            
+            # 3. SQL 验证
+            Stage("sql_validation", self._timed("sql_validation", self._validate_sql, traced=True),
+                  depends_on=("sql_generation",)),
+            
+            # 4. 分支：验证未通过时自动修复；验证通过时代价估算与查询执行并发
+            #    （未经验证的 SQL 不得进入 DESCRIBE / EXPLAIN）
+            Stage("auto_fix", self._timed("auto_fix", self._auto_fix_sql, traced=True),
+                  depends_on=("sql_validation",),
+                  when=lambda state: self._validation_branch(state) == "fix"),
+            Stage("cost_estimation", self._timed("cost_estimation", self._estimate_cost, traced=True),
+                  depends_on=("sql_validation",),
+                  when=lambda state: self._validation_branch(state) == "execute"),
+            
+            # 5. 查询执行与结果处理
+            Stage("query_execution", self._timed("query_execution", self._execute_query, traced=True),
+                  depends_on=("sql_validation", "auto_fix")),
+            Stage("result_processing", self._timed("result_processing", self._process_results),
+                  depends_on=("query_execution", "cost_estimation"))
+        ])
+    
+    async def run(self, request: NL2SQLRequest) -> Dict:
+        """执行管道并返回最终响应；metadata.pipeline 中带各阶段耗时与关键路径"""
+        started_at = time.perf_counter()
+        # 整条管道的根 Span，随运行状态传递给各阶段
+        trace_span = self.tracer.start_span("nl2sql.pipeline", attributes={
+            "nl2sql.question": request.question,
+            "db.name": request.database,
+            "enduser.id": request.user_id
+        })
+        try:
+            run = await self.dag.run({"request": request, "started_at": started_at, "trace_span": trace_span})
+            if run.short_circuit:
+                # 缓存命中跳过了结果处理阶段，在此补记审计日志、请求指标和会话轮次
+                response = run.result
+                metadata = response["metadata"]
+                await self._record_request(request, response["sql"], response,
+                                           metadata.get("auto_fixed", False), metadata["processing_time"])
+                self._remember_turn(request, response["sql"])
+            else:
+                response = run.state["result_processing"]
+            response["metadata"]["pipeline"] = run.to_dict()
+            trace_span.set_attributes({
+                "nl2sql.success": response.get("success", False),
+                "nl2sql.auto_fixed": response["metadata"].get("auto_fixed", False),
+                "nl2sql.critical_path": ",".join(run.critical_path),
+                "nl2sql.short_circuit": run.short_circuit
+            })
+            return response
+        finally:
+            trace_span.end()
+    
+    def _cache_key(self, request: NL2SQLRequest) -> Tuple[str, str, Optional[float]]:
+        """问题、数据库和 Schema 版本；库变更后不会命中变更前缓存的 SQL 与结果"""
+        return normalize_question(request.question), request.database, self._schema_version(request.database)
+    
+    def _use_cache(self, request: NL2SQLRequest) -> bool:
+        """有会话历史的追问依赖上下文（如"那上个月呢"），不读写按问题缓存的 SQL 与结果"""
+        return request.enable_cache and not self.sessions.get(request.session_id)
+    
+    def _schema_version(self, database: str) -> Optional[float]:
+        """DuckDB 库文件修改时间作为 Schema 版本，库变更后的请求不会合并到变更前的在途请求"""
+        from config.model_config import model_config, DatabaseType
         
-        # 构建工作流
-        self.dag >> schema_retrieval >> sql_generation >> sql_validation >> validation_branch
-        validation_branch >> query_execution  # 验证通过分支
-        validation_branch >> auto_fix >> query_execution  # 需要修复分支
-        query_execution >> result_processing
+        db_config = model_config.get_database_config(database)
+        if db_config is None or db_config.type != DatabaseType.DUCKDB:
+            return None
+        path = model_config.get_connection_string(database)
+        return os.path.getmtime(path) if os.path.exists(path) else None
+    
+    async def _lookup_cache(self, state: Dict) -> None:
+        """结果缓存命中时提前结束管道"""
+        request = state["request"]
+        if not self._use_cache(request):
+            return None
+        cached = self.result_cache.get(self._cache_key(request))
+        if cached is not None:
+            raise ShortCircuit({
+                **cached,
+                "request_id": f"{request.session_id}_{datetime.now().timestamp()}",
+                "metadata": {**cached["metadata"], "cache_hit": True,
+                             "processing_time": time.perf_counter() - state["started_at"]}
+            })
+        return None
+    
+    async def _match_template(self, state: Dict) -> Optional[str]:
+        """同一问题此前执行成功的 SQL"""
+        request = state["request"]
+        if not self._use_cache(request):
+            return None
+        return self.template_cache.get(self._cache_key(request))
+    
+    async def _load_session_context(self, state: Dict) -> List[Dict]:
+        """同一会话最近几轮的问题与 SQL"""
+        return list(self.sessions.get(state["request"].session_id, ()))
     
-    async def _retrieve_schemas(self, request: NL2SQLRequest) -> Dict:
+    def _remember_turn(self, request: NL2SQLRequest, sql: str):
+        turns = self.sessions.pop(request.session_id, None) or deque(maxlen=self.SESSION_TURNS)
+        turns.append({"question": request.question, "sql": sql})
+        self.sessions[request.session_id] = turns
+        while len(self.sessions) > self.MAX_SESSIONS:
+            self.sessions.popitem(last=False)
+    
+    async def _retrieve_schemas(self, state: Dict) -> Dict:
         """检索相关 Schema"""
+        request = state["request"]
         try:
-            # 初始化 Schema 检索器
-            schema_retriever = SchemaRetriever(
-                embedding_client=self._get_embedding_client(),
-                weaviate_client=self._get_weaviate_client()
-            )
-
-            # 检索相关表结构
-            schemas = await schema_retriever.retrieve_relevant_schemas(
-                question=request.question,
-                top_k=3
-            )
-
-            return {
-                "request": request,
-                "schemas": schemas,
-                "timestamp": datetime.now().isoformat()
-            }
+            with self.tracer.span("nl2sql.schema_retrieval", parent=state.get("trace_span")) as span:
+                # 初始化 Schema 检索器
+                schema_retriever = SchemaRetriever(
+                    embedding_client=self._get_embedding_client(),
+                    weaviate_client=self._get_weaviate_client()
+                )
+
+                # 检索相关表结构；相同问题的并发请求共享一次检索
+                flight_key = self._cache_key(request)
+                schemas = await self.retrieval_flight.do(flight_key, lambda: schema_retriever.retrieve_relevant_schemas(
+                    question=request.question,
+                    top_k=3
+                ))
+                span.set_attribute("nl2sql.schema_count", len(schemas))
+
+            return {"schemas": schemas, "timestamp": datetime.now().isoformat()}
 
         except Exception as e:
             logging.error(f"Schema 检索失败: {e}")
-            return {
-                "request": request,
-                "schemas": [],
-                "error": str(e)
-            }
+            return {"schemas": [], "error": str(e)}
 
-    async def _generate_sql(self, context: Dict) -> Dict:
+    async def _generate_sql(self, state: Dict) -> Dict:
         """生成 SQL"""
+        template = state.get("template_matching")
+        if template:
+            return {"sql": template, "source": "template", "timestamp": datetime.now().isoformat()}
+
         try:
-            request = context["request"]
-            schemas = context["schemas"]
+            request = state["request"]
 
             # 初始化 SQL 生成器
             sql_generator = SQLGenerator(llm_client=self._get_llm_client())
 
-            # 生成 SQL
-            sql = await sql_generator.generate_sql(
+            # 生成 SQL；问题、Schema 版本和会话上下文都相同的并发请求共享一次生成
+            history = state.get("session_context") or []
+            flight_key = self._cache_key(request) + (tuple((turn["question"], turn["sql"]) for turn in history),)
+            sql = await self.generation_flight.do(flight_key, lambda: sql_generator.generate_sql(
                 question=request.question,
-                schemas=schemas
-            )
-
-            context["generated_sql"] = sql
-            context["generation_timestamp"] = datetime.now().isoformat()
+                schemas=state["schema_retrieval"]["schemas"],
+                history=history
+            ))
 
-            return context
+            return {"sql": sql, "source": "llm", "timestamp": datetime.now().isoformat()}
 
         except Exception as e:
             logging.error(f"SQL 生成失败: {e}")
-            context["error"] = str(e)
-            return context
+            return {"sql": "", "source": "llm", "error": str(e)}
 
-    async def _validate_sql(self, context: Dict) -> Dict:
+    async def _validate_sql(self, state: Dict) -> Dict:
         """验证 SQL"""
         try:
-            sql = context.get("generated_sql", "")
-            request = context["request"]
+            sql = state["sql_generation"]["sql"]
+            request = state["request"]
 
             # 初始化 SQL 验证器
             sql_validator = SQLValidator()
@@ -518,38 +695,51 @@ class NL2SQLPipeline:
                 database=request.database
             )
 
-            context["validation_result"] = {
+            if not validation_result.is_valid:
+                self.metrics.inc("nl2sql_validation_failures_total", database=request.database)
+
+            return {
                 "is_valid": validation_result.is_valid,
                 "sql": validation_result.sql,
                 "error_message": validation_result.error_message,
-                "suggestions": validation_result.suggestions or []
+                "suggestions": validation_result.suggestions or [],
+                "timestamp": datetime.now().isoformat()
             }
-            context["validation_timestamp"] = datetime.now().isoformat()
-
-            return context
 
         except Exception as e:
             logging.error(f"SQL 验证失败: {e}")
-            context["validation_result"] = {
+            return {
                 "is_valid": False,
                 "error_message": str(e)
             }
-            return context
 
-    def _validation_branch(self, context: Dict) -> str:
+    async def _estimate_cost(self, state: Dict) -> Optional[Dict]:
+        """验证通过后与查询执行并发：取结果列类型和估算行数（只做规划，不执行）"""
+        try:
+            sql = state["sql_generation"]["sql"]
+            if not sql:
+                return None
+            query_executor = QueryExecutor(connector_manager=self._get_connector_manager())
+            return await query_executor.estimate_cost(sql, state["request"].database)
+
+        except Exception as e:
+            logging.error(f"查询代价估算失败: {e}")
+            return None
+
+    def _validation_branch(self, state: Dict) -> str:
         """验证分支逻辑"""
-        validation_result = context.get("validation_result", {})
+        validation_result = state.get("sql_validation") or {}
         if validation_result.get("is_valid", False):
             return "execute"
         else:
             return "fix"
 
-    async def _auto_fix_sql(self, context: Dict) -> Dict:
+    async def _auto_fix_sql(self, state: Dict) -> Dict:
         """自动修复 SQL"""
         try:
-            original_sql = context.get("generated_sql", "")
-            error_message = context.get("validation_result", {}).get("error_message", "")
-            schemas = context.get("schemas", [])
+            original_sql = state["sql_generation"]["sql"]
+            error_message = state["sql_validation"].get("error_message", "")
+            schemas = state["schema_retrieval"]["schemas"]
 
             # 初始化自动修复引擎
             auto_fix_engine = AutoFixEngine(
@@ -564,132 +754,169 @@ class NL2SQLPipeline:
                 schemas=schemas
             )
 
-            if fixed_sql:
-                context["fixed_sql"] = fixed_sql
-                context["final_sql"] = fixed_sql
-                context["fix_success"] = True
-            else:
-                context["fix_success"] = False
-                context["final_sql"] = original_sql
-
-            context["fix_timestamp"] = datetime.now().isoformat()
-
-            return context
+            self.metrics.inc("nl2sql_autofix_total", result="success" if fixed_sql else "failure")
+            return {
+                "fixed_sql": fixed_sql,
+                "fix_success": bool(fixed_sql),
+                "timestamp": datetime.now().isoformat()
+            }
 
         except Exception as e:
             logging.error(f"SQL 自动修复失败: {e}")
-            context["fix_success"] = False
-            context["fix_error"] = str(e)
-            return context
+            return {"fix_success": False, "fix_error": str(e)}
+
+    def _final_sql(self, state: Dict) -> str:
+        """修复成功时为修复后的 SQL，否则为生成的 SQL"""
+        fix = state.get("auto_fix") or {}
+        return fix.get("fixed_sql") or state["sql_generation"]["sql"]
 
-    async def _execute_query(self, context: Dict) -> Dict:
+    async def _execute_query(self, state: Dict) -> Dict:
         """执行查询"""
         try:
-            sql = context.get("final_sql") or context.get("generated_sql", "")
-            request = context["request"]
+            sql = self._final_sql(state)
+            request = state["request"]
 
             # 初始化查询执行器
             query_executor = QueryExecutor(
                 connector_manager=self._get_connector_manager()
             )
 
-            # 执行查询
-            query_result = await query_executor.execute_query(
-                sql=sql,
-                database=request.database
-            )
+            # 执行查询；未修复时结果列类型由并发的代价估算取得
+            fixed = (state.get("auto_fix") or {}).get("fix_success", False)
+            # 相同 SQL 的并发执行共享一次查询
+            flight_key = (normalize_sql(sql), request.database, fixed, self._schema_version(request.database))
+            with self.metrics.timer("nl2sql_query_duration_seconds", database=request.database):
+                query_result = await self.execution_flight.do(flight_key, lambda: query_executor.execute_query(
+                    sql=sql,
+                    database=request.database,
+                    describe=fixed
+                ))
+            self.metrics.inc("nl2sql_queries_total", database=request.database,
+                             success=str(query_result.success).lower())
 
-            context["query_result"] = {
+            return {
                 "success": query_result.success,
                 "data": query_result.data,
                 "columns": query_result.columns,
+                "column_types": query_result.column_types,
                 "row_count": query_result.row_count,
                 "execution_time": query_result.execution_time,
-                "error_message": query_result.error_message
+                "error_message": query_result.error_message,
+                "timestamp": datetime.now().isoformat()
             }
-            context["execution_timestamp"] = datetime.now().isoformat()
-
-            return context
 
         except Exception as e:
             logging.error(f"查询执行失败: {e}")
-            context["query_result"] = {
+            return {
                 "success": False,
                 "error_message": str(e)
             }
-            return context
 
-    async def _process_results(self, context: Dict) -> Dict:
+    async def _process_results(self, state: Dict) -> Dict:
         """处理结果"""
+        request = state["request"]
         try:
-            request = context["request"]
-            query_result = context.get("query_result", {})
+            query_result = state["query_execution"]
+            sql = self._final_sql(state)
+            fix = state.get("auto_fix") or {}
+            cost = state.get("cost_estimation") or {}
+            column_types = query_result.get("column_types")
+            if column_types is None and cost.get("sql") == sql:
+                column_types = cost.get("column_types")
 
-            # 记录查询日志
-            await self._log_query(context)
+            processing_time = self._calculate_processing_time(state)
+            await self._record_request(request, sql, query_result, fix.get("fix_success", False), processing_time)
 
             # 构建最终响应
             response = {
                 "request_id": f"{request.session_id}_{datetime.now().timestamp()}",
                 "question": request.question,
-                "sql": context.get("final_sql") or context.get("generated_sql", ""),
+                "sql": sql,
                 "success": query_result.get("success", False),
                 "data": query_result.get("data", []),
                 "columns": query_result.get("columns", []),
+                "column_types": column_types,
                 "row_count": query_result.get("row_count", 0),
                 "execution_time": query_result.get("execution_time", 0.0),
                 "error_message": query_result.get("error_message", ""),
                 "metadata": {
-                    "schemas_used": len(context.get("schemas", [])),
-                    "validation_passed": context.get("validation_result", {}).get("is_valid", False),
-                    "auto_fixed": context.get("fix_success", False),
-                    "processing_time": self._calculate_processing_time(context)
+                    "schemas_used": len(state["schema_retrieval"]["schemas"]),
+                    "validation_passed": state["sql_validation"].get("is_valid", False),
+                    "auto_fixed": fix.get("fix_success", False),
+                    "sql_source": state["sql_generation"]["source"],
+                    "estimated_rows": cost.get("estimated_rows"),
+                    "processing_time": processing_time,
+                    "cache_hit": False
                 }
             }
+            trace_span = state.get("trace_span")
+            if trace_span is not None and trace_span.recording:
+                response["metadata"]["trace_id"] = trace_span.trace_id_hex
 
-            context["final_response"] = response
+            if response["success"]:
+                # 依赖会话上下文生成的 SQL 不作为模板复用
+                if request.enable_cache and not state.get("session_context"):
+                    self.template_cache.put(self._cache_key(request), sql)
+                    self.result_cache.put(self._cache_key(request),
+                                          {**response, "metadata": dict(response["metadata"])})
+                self._remember_turn(request, sql)
 
-            return context
+            return response
 
         except Exception as e:
             logging.error(f"结果处理失败: {e}")
-            context["processing_error"] = str(e)
-            return context
+            return {
+                "question": request.question,
+                "success": False,
+                "error_message": f"结果处理失败: {e}",
+                "metadata": {}
+            }
 
-    def _calculate_processing_time(self, context: Dict) -> float:
-        """计算处理时间"""
-        try:
-            start_time = datetime.fromisoformat(context["timestamp"])
-            end_time = datetime.now()
-            return (end_time - start_time).total_seconds()
-        except:
-            return 0.0
+    def _calculate_processing_time(self, state: Dict) -> float:
+        """计算处理时间（单调时钟，从管道开始）"""
+        started_at = state.get("started_at")
+        return time.perf_counter() - started_at if started_at is not None else 0.0
+
+    async def _record_request(self, request: NL2SQLRequest, sql: str, query_result: Dict, auto_fixed: bool,
+                              processing_time: float):
+        """记录查询日志与请求指标"""
+        await self._log_query(request, sql, query_result, auto_fixed)
+        self.metrics.observe("nl2sql_request_duration_seconds", processing_time)
+        self.metrics.inc("nl2sql_requests_total", success=str(query_result.get("success", False)).lower())
 
-    async def _log_query(self, context: Dict):
+    async def _log_query(self, request: NL2SQLRequest, sql: str, query_result: Dict, auto_fixed: bool):
         """记录查询日志"""
         try:
             log_entry = {
                 "timestamp": datetime.now().isoformat(),
-                "user_id": context["request"].user_id,
-                "session_id": context["request"].session_id,
-                "question": context["request"].question,
-                "sql": context.get("final_sql", ""),
-                "success": context.get("query_result", {}).get("success", False),
-                "execution_time": context.get("query_result", {}).get("execution_time", 0.0),
-                "row_count": context.get("query_result", {}).get("row_count", 0),
-                "auto_fixed": context.get("fix_success", False)
+                "user_id": request.user_id,
+                "session_id": request.session_id,
+                "question": request.question,
+                "sql": sql,
+                "success": query_result.get("success", False),
+                "execution_time": query_result.get("execution_time", 0.0),
+                "row_count": query_result.get("row_count", 0),
+                "auto_fixed": auto_fixed
             }
 
-            # 写入日志文件
-            log_file = "/app/logs/query_audit.log"
-            os.makedirs(os.path.dirname(log_file), exist_ok=True)
-
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+            # 进入缓冲，由后台任务批量写入
+            await get_audit_writer().write(log_entry)
 
         except Exception as e:
             logging.error(f"查询日志记录失败: {e}")
 
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "dag": self.dag.get_metrics(),
+            "result_cache": self.result_cache.get_metrics(),
+            "template_cache": self.template_cache.get_metrics(),
+            "singleflight": {
+                "retrieval": self.retrieval_flight.get_metrics(),
+                "generation": self.generation_flight.get_metrics(),
+                "execution": self.execution_flight.get_metrics()
+            }
+        }
+
     def _get_embedding_client(self):
         """获取嵌入客户端"""
         # 这里应该返回实际的嵌入客户端实例
@@ -0,0 +1,282 @@
+"""
+Prophet 模型缓存
+按 (序列标识, 超参数) 持久化已训练模型与参数，支持数据未变时直接返回预测、
+数据增量时以历史参数热启动重训，以及按容量和时间淘汰
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Any
+from dataclasses import dataclass, field, asdict
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class ModelEntry:
+    """缓存条目元数据"""
+    key: str
+    series_id: str
+    data_hash: str
+    params: Dict[str, Any]
+    fit_seconds: float
+    cold_fit_seconds: float
+    created_at: float
+    last_used: float
+    size_bytes: int = 0
+    forecasts: Dict[str, Dict] = field(default_factory=dict)
+
+
+class ProphetModelStore:
+    """Prophet 模型存储"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 256,
+                 max_bytes: int = 512 * 1024 * 1024, max_age_seconds: float = 7 * 24 * 3600,
+                 memory_entries: int = 16):
+        self.cache_dir = cache_dir or os.getenv("PROPHET_CACHE_DIR", "/app/cache/prophet")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.memory_entries = memory_entries
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.RLock()
+        self._index: Dict[str, ModelEntry] = {}
+        self._models: "OrderedDict[str, str]" = OrderedDict()
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "model_reuses": 0,
+            "warm_starts": 0,
+            "cold_fits": 0,
+            "evictions": 0,
+            "fit_seconds_total": 0.0,
+            "fit_seconds_saved": 0.0
+        }
+        self._load_index()
+
+    # ------------------------------------------------------------------
+    # 键与哈希
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def make_key(series_id: str, hyperparams: Dict[str, Any]) -> str:
+        """根据序列标识和超参数生成缓存键"""
+        payload = json.dumps({"series": series_id, "params": hyperparams}, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_data(prophet_df: pd.DataFrame) -> str:
+        """计算 ds/y 数据指纹"""
+        digest = hashlib.sha1()
+        digest.update(pd.to_datetime(prophet_df["ds"]).to_numpy(dtype="datetime64[ns]").tobytes())
+        digest.update(prophet_df["y"].to_numpy(dtype=float).tobytes())
+        return digest.hexdigest()
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def lookup(self, key: str) -> Optional[ModelEntry]:
+        """查找缓存条目（过期条目视为不存在）"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry and time.time() - entry.last_used > self.max_age_seconds:
+                self._remove(key)
+                self.metrics["evictions"] += 1
+                entry = None
+            return entry
+
+    def cached_forecast(self, entry: Optional[ModelEntry], data_hash: str, periods: int) -> Optional[Dict]:
+        """数据未变且已有同周期预测时直接返回"""
+        with self._lock:
+            if entry is None or entry.data_hash != data_hash:
+                self.metrics["misses"] += 1
+                return None
+            forecast = entry.forecasts.get(str(periods))
+            if forecast is None:
+                return None
+            entry.last_used = time.time()
+            self.metrics["hits"] += 1
+            self.metrics["fit_seconds_saved"] += entry.cold_fit_seconds
+            self._write_meta(entry)
+            return forecast
+
+    def load_model_json(self, entry: ModelEntry, data_hash: str) -> Optional[str]:
+        """数据未变时取出已训练模型的序列化结果（无需重新拟合）"""
+        if entry.data_hash != data_hash:
+            return None
+        with self._lock:
+            model_json = self._models.get(entry.key)
+            if model_json is not None:
+                self._models.move_to_end(entry.key)
+        if model_json is None:
+            try:
+                with open(self._model_path(entry.key), "r", encoding="utf-8") as f:
+                    model_json = f.read()
+            except Exception as e:
+                self.logger.warning(f"模型读取失败，将重新训练: {e}")
+                return None
+            self._remember_model(entry.key, model_json)
+        with self._lock:
+            self.metrics["model_reuses"] += 1
+            self.metrics["fit_seconds_saved"] += entry.cold_fit_seconds
+            entry.last_used = time.time()
+        return model_json
+
+    @staticmethod
+    def warm_start_params(entry: Optional[ModelEntry]) -> Optional[Dict[str, Any]]:
+        """历史拟合参数，作为 Prophet.fit(init=...) 的初值"""
+        if not entry or not entry.params:
+            return None
+        return {
+            name: (np.asarray(value, dtype=float) if isinstance(value, list) else float(value))
+            for name, value in entry.params.items()
+        }
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def store(self, key: str, series_id: str, params: Dict[str, Any], model_json: str,
+              data_hash: str, periods: int, forecast: Dict, fit_seconds: float,
+              warm_started: bool, previous: Optional[ModelEntry] = None) -> ModelEntry:
+        """保存新拟合的模型、参数与预测结果"""
+        now = time.time()
+        if warm_started and previous:
+            cold_fit_seconds = previous.cold_fit_seconds
+        else:
+            cold_fit_seconds = fit_seconds
+
+        entry = ModelEntry(
+            key=key,
+            series_id=series_id,
+            data_hash=data_hash,
+            params=params,
+            fit_seconds=fit_seconds,
+            cold_fit_seconds=cold_fit_seconds,
+            created_at=now,
+            last_used=now,
+            forecasts={str(periods): forecast}
+        )
+
+        with self._lock:
+            self.metrics["fit_seconds_total"] += fit_seconds
+            if warm_started:
+                self.metrics["warm_starts"] += 1
+                self.metrics["fit_seconds_saved"] += max(0.0, cold_fit_seconds - fit_seconds)
+            else:
+                self.metrics["cold_fits"] += 1
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._model_path(key), "w", encoding="utf-8") as f:
+                f.write(model_json)
+            entry.size_bytes = os.path.getsize(self._model_path(key))
+        except Exception as e:
+            self.logger.warning(f"模型持久化失败，仅保留参数: {e}")
+
+        with self._lock:
+            self._index[key] = entry
+            self._write_meta(entry)
+            self._remember_model(key, model_json)
+            self.evict()
+        return entry
+
+    def add_forecast(self, entry: ModelEntry, periods: int, forecast: Dict):
+        """为复用的模型追加新周期的预测结果"""
+        with self._lock:
+            entry.forecasts[str(periods)] = forecast
+            entry.last_used = time.time()
+            self._write_meta(entry)
+
+    # ------------------------------------------------------------------
+    # 淘汰
+    # ------------------------------------------------------------------
+
+    def evict(self) -> int:
+        """按过期时间、条目数和磁盘占用淘汰，返回淘汰数量"""
+        removed = 0
+        with self._lock:
+            now = time.time()
+            for key in [k for k, e in self._index.items() if now - e.last_used > self.max_age_seconds]:
+                self._remove(key)
+                removed += 1
+
+            by_age = sorted(self._index.values(), key=lambda e: e.last_used)
+            total_bytes = sum(e.size_bytes for e in by_age)
+            while by_age and (len(by_age) > self.max_entries or total_bytes > self.max_bytes):
+                oldest = by_age.pop(0)
+                total_bytes -= oldest.size_bytes
+                self._remove(oldest.key)
+                removed += 1
+
+            self.metrics["evictions"] += removed
+        return removed
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """缓存指标"""
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics["entries"] = len(self._index)
+            metrics["bytes"] = sum(e.size_bytes for e in self._index.values())
+            lookups = metrics["hits"] + metrics["misses"]
+            metrics["hit_rate"] = metrics["hits"] / lookups if lookups else 0.0
+        return metrics
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+
+    def _model_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.model.json")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.meta.json")
+
+    def _remember_model(self, key: str, model_json: str):
+        with self._lock:
+            self._models[key] = model_json
+            self._models.move_to_end(key)
+            while len(self._models) > self.memory_entries:
+                self._models.popitem(last=False)
+
+    def _write_meta(self, entry: ModelEntry):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._meta_path(entry.key), "w", encoding="utf-8") as f:
+                json.dump(asdict(entry), f, ensure_ascii=False)
+        except Exception as e:
+            self.logger.warning(f"模型元数据写入失败: {e}")
+
+    def _remove(self, key: str):
+        self._index.pop(key, None)
+        self._models.pop(key, None)
+        for path in (self._model_path(key), self._meta_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                self.logger.warning(f"缓存文件删除失败 {path}: {e}")
+
+    def _load_index(self):
+        """启动时从磁盘恢复元数据索引"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".meta.json"):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name), "r", encoding="utf-8") as f:
+                    entry = ModelEntry(**json.load(f))
+                self._index[entry.key] = entry
+            except Exception as e:
+                self.logger.warning(f"跳过损坏的缓存元数据 {name}: {e}")
+        self.evict()
@@ -0,0 +1,82 @@
+"""
+查询缓存
+带过期时间的 LRU 缓存，用于 NL2SQL 转换结果和查询结果；线程安全，可在简化 HTTP 服务器的工作线程中共用
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Hashable
+
+from flows.metrics import get_metrics_registry
+
+
+def normalize_question(question: str) -> str:
+    """问题缓存键：去掉首尾空白并压缩连续空白"""
+    return " ".join(str(question).split())
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL 缓存键：压缩空白并去掉末尾分号（不改变字面量大小写）"""
+    return " ".join(str(sql).split()).rstrip(";").rstrip()
+
+
+class QueryCache:
+    """LRU + TTL 缓存"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600.0, name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # 指定名称时命中情况同时计入 cache_requests_total
+        self.name = name
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "puts": 0}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._get(key)
+        if self.name:
+            get_metrics_registry().inc("cache_requests_total", cache=self.name,
+                                       result="miss" if value is None else "hit")
+        return value
+
+    def _get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.metrics["expired"] += 1
+                self.metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            self.metrics["puts"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """缓存指标"""
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        return {
+            **self.metrics,
+            "entries": len(self._entries),
+            "hit_rate": round(self.metrics["hits"] / lookups, 4) if lookups else 0.0
+        }
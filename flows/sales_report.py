@@ -0,0 +1,271 @@
+"""
+销售报告引擎
+在 douyin_products 上一次扫描（GROUPING SETS + 窗口函数）同时算出本期与上期的汇总指标、
+类目占比、品牌 / 主播排行和环比增长；time_range 转换为常量日期区间谓词，
+DuckDB 据此按行组 min/max 统计（Parquet 按分区目录）跳过无关数据。
+结果按 (report_type, time_range, 数据版本) 缓存，数据变化后自动失效
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Any, Tuple
+
+from config.model_config import model_config, DatabaseType
+from flows.query_cache import QueryCache
+from flows.timeseries_prep import table_version
+
+
+# report_type -> 各排行返回的条数
+REPORT_TYPES = {"summary": 5, "detailed": 20}
+TIME_RANGES = ("today", "yesterday", "last_7_days", "last_30_days", "last_90_days",
+               "this_month", "last_month", "this_year")
+# 也支持显式区间 2025-06-01..2025-06-30
+CUSTOM_RANGE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})$")
+# 分组集合编号，对应 GROUPING(category, brand, anchor_name)
+DIMENSIONS = {"total": 7, "category": 3, "brand": 5, "anchor": 6}
+
+
+def resolve_time_range(time_range: str, as_of: date) -> Tuple[date, date, date, date]:
+    """把时间范围名称换算为本期和上期的闭区间 (start, end, previous_start, previous_end)
+
+    as_of 为报告基准日（默认取数据中的最新日期）；上期为紧邻本期、长度相同的区间，
+    自然月区间的上期取上一个自然月
+    """
+    match = CUSTOM_RANGE.match(time_range)
+    if match:
+        start, end = date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))
+        if start > end:
+            raise ValueError(f"时间范围起点晚于终点: {time_range}")
+    elif time_range == "today":
+        start = end = as_of
+    elif time_range == "yesterday":
+        start = end = as_of - timedelta(days=1)
+    elif time_range.startswith("last_") and time_range.endswith("_days") and time_range in TIME_RANGES:
+        days = int(time_range[len("last_"):-len("_days")])
+        start, end = as_of - timedelta(days=days - 1), as_of
+    elif time_range == "this_month":
+        start, end = as_of.replace(day=1), as_of
+    elif time_range == "last_month":
+        end = as_of.replace(day=1) - timedelta(days=1)
+        start = end.replace(day=1)
+    elif time_range == "this_year":
+        start, end = as_of.replace(month=1, day=1), as_of
+    else:
+        raise ValueError(f"不支持的时间范围: {time_range}")
+
+    if time_range in ("this_month", "last_month"):
+        previous_end = start - timedelta(days=1)
+        previous_start = previous_end.replace(day=1)
+    else:
+        previous_end = start - timedelta(days=1)
+        previous_start = previous_end - (end - start)
+    return start, end, previous_start, previous_end
+
+
+def build_report_sql(start: date, end: date, previous_start: date, previous_end: date, top_n: int) -> str:
+    """单次扫描的报告 SQL：每个分组集合一行，带本期 / 上期指标、占比和排名
+
+    日期以字面量写入（均来自 date 对象），使过滤条件在规划阶段即可下推到扫描
+    """
+    current = f"created_date BETWEEN DATE '{start}' AND DATE '{end}'"
+    previous = f"created_date BETWEEN DATE '{previous_start}' AND DATE '{previous_end}'"
+    return f"""
+WITH grouped AS (
+    SELECT
+        GROUPING(category, brand, anchor_name) AS grouping_id,
+        COALESCE(category, brand, anchor_name) AS name,
+        CAST(SUM(sales_amount) FILTER (WHERE {current}) AS DOUBLE) AS sales,
+        SUM(sales_volume) FILTER (WHERE {current}) AS volume,
+        COUNT(*) FILTER (WHERE {current}) AS products,
+        CAST(AVG(rating) FILTER (WHERE {current}) AS DOUBLE) AS avg_rating,
+        CAST(SUM(sales_amount) FILTER (WHERE {previous}) AS DOUBLE) AS previous_sales,
+        SUM(sales_volume) FILTER (WHERE {previous}) AS previous_volume
+    FROM douyin_products
+    WHERE created_date BETWEEN DATE '{previous_start}' AND DATE '{end}'
+    GROUP BY GROUPING SETS ((), (category), (brand), (anchor_name))
+)
+SELECT
+    grouping_id, name, sales, volume, products, avg_rating, previous_sales, previous_volume,
+    sales / NULLIF(SUM(sales) OVER (PARTITION BY grouping_id), 0) AS share,
+    (sales - previous_sales) / NULLIF(previous_sales, 0) AS growth,
+    RANK() OVER (PARTITION BY grouping_id ORDER BY sales DESC NULLS LAST) AS rank
+FROM grouped
+WHERE grouping_id = {DIMENSIONS["total"]} OR sales IS NOT NULL
+QUALIFY rank <= {int(top_n)} OR grouping_id = {DIMENSIONS["total"]}
+ORDER BY grouping_id, rank
+"""
+
+
+def build_traffic_sql(start: date, end: date, previous_start: date, previous_end: date) -> str:
+    """douyin_sales_detail 上的流量与转化指标（本期 / 上期）"""
+    current = f"date BETWEEN DATE '{start}' AND DATE '{end}'"
+    previous = f"date BETWEEN DATE '{previous_start}' AND DATE '{previous_end}'"
+    return f"""
+SELECT
+    SUM(daily_sales) FILTER (WHERE {current}) AS orders,
+    SUM(clicks) FILTER (WHERE {current}) AS clicks,
+    SUM(exposure) FILTER (WHERE {current}) AS exposure,
+    SUM(live_sales) FILTER (WHERE {current}) AS live_orders,
+    SUM(daily_sales) FILTER (WHERE {previous}) AS previous_orders,
+    SUM(clicks) FILTER (WHERE {previous}) AS previous_clicks
+FROM douyin_sales_detail
+WHERE date BETWEEN DATE '{previous_start}' AND DATE '{end}'
+"""
+
+
+def _ratio(numerator, denominator, scale: float = 1.0, digits: int = 2) -> Optional[float]:
+    if numerator is None or not denominator:
+        return None
+    return round(numerator / denominator * scale, digits)
+
+
+class SalesReportEngine:
+    """DuckDB 销售报告引擎"""
+
+    def __init__(self, database: str = "douyin_analytics", connection=None,
+                 cache: Optional[QueryCache] = None):
+        self.database = database
+        self.logger = logging.getLogger(__name__)
+        self.cache = cache or QueryCache(max_entries=256, ttl=3600, name="sales_report")
+        self._conn = connection
+        self._lock = threading.Lock()
+
+    def supports_database(self) -> bool:
+        """需要已存在的 DuckDB 数据库文件（或外部传入的连接）"""
+        if self._conn is not None:
+            return True
+        db_config = model_config.get_database_config(self.database)
+        return (db_config is not None and db_config.type == DatabaseType.DUCKDB
+                and os.path.exists(model_config.get_connection_string(self.database)))
+
+    def _connection(self):
+        """延迟建立只读连接，调用方各自使用游标"""
+        with self._lock:
+            if self._conn is None:
+                import duckdb
+                self._conn = duckdb.connect(model_config.get_connection_string(self.database), read_only=True)
+            return self._conn.cursor()
+
+    def data_version(self, cursor) -> Tuple[Any, ...]:
+        return table_version(cursor, "douyin_products", "created_date", model_config.get_connection_string(self.database))
+
+    def _has_table(self, cursor, table: str) -> bool:
+        return cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [table]
+        ).fetchone()[0] > 0
+
+    def generate(self, report_type: str = "summary", time_range: str = "last_7_days",
+                 as_of: Optional[str] = None, top_n: Optional[int] = None) -> Dict[str, Any]:
+        """生成报告；as_of 缺省为数据中的最新日期"""
+        if report_type not in REPORT_TYPES:
+            raise ValueError(f"不支持的报告类型: {report_type}")
+        top_n = top_n or REPORT_TYPES[report_type]
+
+        cursor = self._connection()
+        try:
+            version = self.data_version(cursor)
+            cache_key = (report_type, time_range, as_of, top_n, version)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "cache_hit": True}
+
+            start_time = time.perf_counter()
+            anchor = date.fromisoformat(as_of) if as_of else version[2]
+            if anchor is None:
+                raise ValueError("douyin_products 中没有数据")
+            period = resolve_time_range(time_range, anchor)
+            rows = cursor.execute(build_report_sql(*period, top_n)).fetchall()
+            columns = [d[0] for d in cursor.description]
+            traffic = None
+            if self._has_table(cursor, "douyin_sales_detail"):
+                traffic_cursor = cursor.execute(build_traffic_sql(*period))
+                traffic = dict(zip([d[0] for d in traffic_cursor.description], traffic_cursor.fetchone()))
+        finally:
+            cursor.close()
+
+        report = self._assemble([dict(zip(columns, row)) for row in rows], traffic, report_type, time_range, period)
+        report["data_version"] = {"rows": version[1], "latest_date": version[2]}
+        report["execution_time"] = round(time.perf_counter() - start_time, 6)
+        self.cache.put(cache_key, report)
+        return {**report, "cache_hit": False}
+
+    def _assemble(self, rows: List[Dict[str, Any]], traffic: Optional[Dict[str, Any]], report_type: str,
+                  time_range: str, period: Tuple[date, date, date, date]) -> Dict[str, Any]:
+        """把分组集合结果整理为报告结构"""
+        by_dimension: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_dimension.setdefault(row["grouping_id"], []).append(row)
+        total = (by_dimension.get(DIMENSIONS["total"]) or [{}])[0]
+
+        def ranking(dimension: str) -> List[Dict[str, Any]]:
+            return [{
+                "rank": row["rank"],
+                "name": row["name"],
+                "sales": round(row["sales"] or 0.0, 2),
+                "volume": int(row["volume"] or 0),
+                "percentage": _ratio(row["share"], 1, 100),
+                "growth_rate": _ratio(row["growth"], 1, 100)
+            } for row in by_dimension.get(DIMENSIONS[dimension], [])]
+
+        sales, volume = total.get("sales") or 0.0, int(total.get("volume") or 0)
+        summary = {
+            "total_sales": round(sales, 2),
+            "total_volume": volume,
+            "total_products": int(total.get("products") or 0),
+            "avg_order_value": _ratio(sales, volume),
+            "conversion_rate": None
+        }
+        performance = {
+            "growth_rate": _ratio(total.get("growth"), 1, 100),
+            "volume_growth_rate": _ratio(volume - (total.get("previous_volume") or 0), total.get("previous_volume"), 100),
+            "previous_sales": round(total.get("previous_sales") or 0.0, 2),
+            "customer_satisfaction": round(total["avg_rating"], 2) if total.get("avg_rating") is not None else None
+        }
+        if traffic is not None:
+            summary["total_orders"] = int(traffic["orders"] or 0)
+            summary["conversion_rate"] = _ratio(traffic["orders"], traffic["clicks"], 100)
+            summary["live_share"] = _ratio(traffic["live_orders"], traffic["orders"], 100)
+            previous_conversion = _ratio(traffic["previous_orders"], traffic["previous_clicks"], 100)
+            if summary["conversion_rate"] is not None and previous_conversion is not None:
+                performance["conversion_rate_change"] = round(summary["conversion_rate"] - previous_conversion, 2)
+
+        start, end, previous_start, previous_end = period
+        report = {
+            "report_type": report_type,
+            "time_range": time_range,
+            "period": {"start": start, "end": end, "previous_start": previous_start, "previous_end": previous_end},
+            "summary": summary,
+            "top_categories": ranking("category"),
+            "performance_metrics": performance
+        }
+        if report_type == "detailed":
+            report["brand_ranking"] = ranking("brand")
+            report["anchor_ranking"] = ranking("anchor")
+        return report
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return self.cache.get_metrics()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_engine: Optional[SalesReportEngine] = None
+_default_lock = threading.Lock()
+
+
+def get_sales_report_engine() -> SalesReportEngine:
+    """获取全局销售报告引擎"""
+    global _default_engine
+    with _default_lock:
+        if _default_engine is None:
+            _default_engine = SalesReportEngine()
+        return _default_engine
@@ -0,0 +1,79 @@
+"""
+在途请求合并（singleflight）
+同一键的并发调用只执行一次：第一个调用方（leader）启动共享任务，其后的调用方（follower）
+等待同一个任务的结果或异常。共享任务独立于任何调用方运行，单个调用方被取消不影响其他等待者；
+所有等待者都放弃后才取消共享任务
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from flows.metrics import get_metrics_registry
+
+
+@dataclass
+class _Call:
+    task: asyncio.Future
+    waiters: int = 0
+
+
+class SingleFlight:
+    """按键合并并发的异步调用"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.logger = logging.getLogger(__name__)
+        self.metrics = get_metrics_registry()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = {"leaders": 0, "followers": 0, "failures": 0, "abandoned": 0}
+        self.metrics.gauge("singleflight_coalescing_ratio", self.coalescing_ratio, group=name)
+
+    def coalescing_ratio(self) -> float:
+        """被合并的调用占全部调用的比例"""
+        total = self.stats["leaders"] + self.stats["followers"]
+        return self.stats["followers"] / total if total else 0.0
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """键不在途时执行 fn 并登记，否则等待已在途的执行；结果与异常对所有等待者相同"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            role = "leader"
+        else:
+            role = "follower"
+        self.stats[f"{role}s"] += 1
+        self.metrics.inc("singleflight_calls_total", group=self.name, role=role)
+
+        call.waiters += 1
+        try:
+            # shield：调用方被取消只结束自己的等待
+            return await asyncio.shield(call.task)
+        except Exception:
+            if role == "leader":
+                self.stats["failures"] += 1
+            raise
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 所有等待者都已放弃：取消共享任务，并立即摘除，后来者重新执行
+                self.stats["abandoned"] += 1
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "in_flight": self.in_flight(),
+            "coalescing_ratio": round(self.coalescing_ratio(), 4)
+        }
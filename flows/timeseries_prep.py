@@ -0,0 +1,217 @@
+"""
+时序数据库内预处理
+在 DuckDB 中完成日期分桶（date_trunc）、按日期骨架补齐缺口和按粒度聚合，
+结果经 Arrow 直接转为 NumPy 数组，避免逐行构造 Python 对象
+"""
+
+import os
+import re
+import logging
+import threading
+import importlib.util
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Any, Union
+
+import numpy as np
+import pandas as pd
+
+from config.model_config import model_config, DatabaseType
+
+
+GRAINS = ("hour", "day", "week", "month", "quarter", "year")
+AGGREGATIONS = {"sum": "SUM", "avg": "AVG", "min": "MIN", "max": "MAX", "count": "COUNT"}
+# 比率、价格类指标跨行求和没有意义，auto 聚合时取均值
+AVERAGED_COLUMN = re.compile(r"(rate|ratio|ctr|cvr|price|avg|mean|pct|percent|率|均)", re.IGNORECASE)
+FILL_METHODS = ("auto", "zero", "forward", "null")
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+
+@dataclass
+class PreparedSeries:
+    """预处理后的时序数组（按序列、日期排序）"""
+    dates: np.ndarray  # datetime64
+    values: Dict[str, np.ndarray]  # 数值列 -> float64 数组，缺失为 NaN
+    grain: str
+    series_keys: Optional[np.ndarray] = None  # 多序列时每行所属序列
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def to_frame(self, date_column: str, series_column: Optional[str] = None) -> pd.DataFrame:
+        """按列数组构造 DataFrame（无逐行对象开销）"""
+        columns: Dict[str, Any] = {date_column: self.dates}
+        if series_column and self.series_keys is not None:
+            columns[series_column] = self.series_keys
+        columns.update(self.values)
+        return pd.DataFrame(columns)
+
+
+def table_version(cursor, table: str, date_column: str, path: Optional[str] = None) -> tuple:
+    """数据版本：库文件修改时间 + 行数 + 最新日期，用作结果缓存键的一部分
+
+    行数取自表统计，最新日期只读一列；追加或重写数据后版本随之变化
+    """
+    mtime = os.path.getmtime(path) if path and os.path.exists(path) else None
+    rows, latest = cursor.execute(
+        f"SELECT COUNT(*), MAX({quote_identifier(date_column)}) FROM {quote_identifier(table)}"
+    ).fetchone()
+    return mtime, rows, latest
+
+
+def quote_identifier(name: str) -> str:
+    """DuckDB 标识符转义"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def default_aggregation(column: str) -> str:
+    """按列名推断聚合方式"""
+    return "avg" if AVERAGED_COLUMN.search(column) else "sum"
+
+
+def build_prepare_sql(source_sql: str, date_column: str, value_columns: List[str],
+                      grain: str = "day", aggregation: Union[str, Dict[str, str]] = "sum",
+                      fill: str = "auto", series_column: Optional[str] = None) -> str:
+    """生成分桶、补齐和聚合的 SQL；aggregation 可按列指定，auto 按列名推断"""
+    if grain not in GRAINS:
+        raise ValueError(f"不支持的时间粒度: {grain}")
+    if fill not in FILL_METHODS:
+        raise ValueError(f"不支持的补齐方式: {fill}")
+
+    partition = "PARTITION BY s.series_key " if series_column else ""
+    aggregated, filled = [], []
+    for column in value_columns:
+        agg = aggregation.get(column, "auto") if isinstance(aggregation, dict) else aggregation
+        if agg == "auto":
+            agg = default_aggregation(column)
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"不支持的聚合方式: {agg}")
+        # 累加型指标缺口即为 0，均值型指标沿用上一期
+        column_fill = ("zero" if agg in ("sum", "count") else "forward") if fill == "auto" else fill
+
+        c = quote_identifier(column)
+        aggregated.append(f"{AGGREGATIONS[agg]}(TRY_CAST({c} AS DOUBLE)) AS {c}")
+        if column_fill == "zero":
+            filled.append(f"COALESCE(b.{c}, 0) AS {c}")
+        elif column_fill == "forward":
+            filled.append(
+                f"LAST_VALUE(b.{c} IGNORE NULLS) OVER ({partition}ORDER BY s.bucket "
+                f"ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS {c}"
+            )
+        else:
+            filled.append(f"b.{c} AS {c}")
+    aggregated, filled = ", ".join(aggregated), ", ".join(filled)
+
+    date_col = quote_identifier(date_column)
+    key_select = f"{quote_identifier(series_column)} AS series_key, " if series_column else ""
+    key_col = "series_key, " if series_column else ""
+    key_join = " AND s.series_key IS NOT DISTINCT FROM b.series_key" if series_column else ""
+
+    return f"""
+WITH bucketed AS (
+    SELECT {key_select}date_trunc('{grain}', TRY_CAST({date_col} AS TIMESTAMP)) AS bucket, {aggregated}
+    FROM ({source_sql.strip().rstrip(';')}) AS src
+    WHERE TRY_CAST({date_col} AS TIMESTAMP) IS NOT NULL
+    GROUP BY ALL
+),
+spine AS (
+    SELECT {key_col}UNNEST(generate_series(MIN(bucket), MAX(bucket), INTERVAL 1 {grain})) AS bucket
+    FROM bucketed
+    {"GROUP BY series_key" if series_column else ""}
+)
+SELECT {"s.series_key, " if series_column else ""}s.bucket, {filled}
+FROM spine s
+LEFT JOIN bucketed b ON s.bucket = b.bucket{key_join}
+ORDER BY {"s.series_key, " if series_column else ""}s.bucket
+"""
+
+
+class TimeSeriesPreparer:
+    """DuckDB 时序预处理器"""
+
+    def __init__(self, database: str = "douyin_analytics", connection=None):
+        self.database = database
+        self.logger = logging.getLogger(__name__)
+        self._conn = connection
+        self._lock = threading.Lock()
+
+    def supports_database(self, database: Optional[str] = None) -> bool:
+        """只有 DuckDB 数据源可以直接下推 SQL"""
+        db_config = model_config.get_database_config(database or self.database)
+        return db_config is not None and db_config.type == DatabaseType.DUCKDB
+
+    def _connection(self):
+        """延迟建立只读连接，调用方各自使用游标"""
+        with self._lock:
+            if self._conn is None:
+                import duckdb
+                path = model_config.get_connection_string(self.database)
+                self._conn = duckdb.connect(path, read_only=True)
+            return self._conn.cursor()
+
+    def describe(self, source_sql: str) -> Dict[str, str]:
+        """不执行查询，取回结果列的 DuckDB 类型"""
+        cursor = self._connection()
+        try:
+            rows = cursor.execute(f"DESCRIBE {source_sql.strip().rstrip(';')}").fetchall()
+            return {row[0]: row[1] for row in rows}
+        finally:
+            cursor.close()
+
+    def prepare(self, source_sql: str, date_column: str, value_columns: List[str],
+                grain: str = "day", aggregation: Union[str, Dict[str, str]] = "sum",
+                fill: str = "auto", series_column: Optional[str] = None) -> PreparedSeries:
+        """在数据库中对查询结果做时序预处理"""
+        sql = build_prepare_sql(source_sql, date_column, value_columns, grain, aggregation, fill, series_column)
+        cursor = self._connection()
+        try:
+            return self._fetch(cursor, sql, value_columns, grain, series_column)
+        finally:
+            cursor.close()
+
+    def prepare_rows(self, rows: List[Dict], date_column: str, value_columns: List[str],
+                     grain: str = "day", aggregation: Union[str, Dict[str, str]] = "sum",
+                     fill: str = "auto", series_column: Optional[str] = None) -> PreparedSeries:
+        """没有可下推的 SQL 时，将已取回的行注册为内存表后走同一条 SQL"""
+        import duckdb
+
+        conn = duckdb.connect()
+        try:
+            if ARROW_AVAILABLE:
+                import pyarrow as pa
+                conn.register("query_rows", pa.Table.from_pylist(rows))
+            else:
+                conn.register("query_rows", pd.DataFrame(rows))
+            sql = build_prepare_sql("SELECT * FROM query_rows", date_column, value_columns,
+                                    grain, aggregation, fill, series_column)
+            return self._fetch(conn, sql, value_columns, grain, series_column)
+        finally:
+            conn.close()
+
+    def _fetch(self, conn, sql: str, value_columns: List[str], grain: str,
+               series_column: Optional[str]) -> PreparedSeries:
+        """执行并经 Arrow 取回列式数组"""
+        relation = conn.execute(sql)
+        if ARROW_AVAILABLE:
+            table = relation.arrow()
+            if hasattr(table, "read_all"):
+                # 新版 DuckDB 返回 RecordBatchReader
+                table = table.read_all()
+            arrays = {name: table.column(name).to_numpy() for name in table.column_names}
+        else:
+            # 未安装 pyarrow 时退回 DuckDB 原生 NumPy 导出
+            arrays = {name: np.ma.filled(col, np.nan) if np.ma.isMaskedArray(col) else col
+                      for name, col in relation.fetchnumpy().items()}
+
+        return PreparedSeries(
+            dates=np.asarray(arrays["bucket"], dtype="datetime64[us]"),
+            values={c: np.asarray(arrays[c], dtype=float) for c in value_columns},
+            grain=grain,
+            series_keys=arrays.get("series_key") if series_column else None
+        )
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
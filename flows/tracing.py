@@ -0,0 +1,451 @@
+"""
+请求追踪
+与 OpenTelemetry 兼容的轻量追踪：W3C traceparent 传播、contextvars 维护当前 Span，
+按 TraceId 比例采样（未采样的请求只有一次随机数和比较的开销），
+结束的 Span 由后台线程批量导出为 OTLP/JSON（本地文件或 OTLP HTTP 收集器）
+"""
+
+import os
+import json
+import time
+import random
+import atexit
+import queue
+import logging
+import threading
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Any, Iterator
+
+
+# OTLP SpanKind / StatusCode
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+# 属性值超长时截断（SQL、提示词等）
+MAX_ATTRIBUTE_LENGTH = 2048
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional["Span"]:
+    """当前上下文中的 Span"""
+    return _current_span.get()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional["NonRecordingSpan"]:
+    """解析 W3C traceparent（00-<trace_id>-<span_id>-<flags>），返回远端父 Span"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        trace_id, span_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if trace_id == 0 or span_id == 0:
+        return None
+    return NonRecordingSpan(trace_id, span_id, sampled=bool(flags & 0x01))
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)[:MAX_ATTRIBUTE_LENGTH]}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+class NonRecordingSpan:
+    """不记录的 Span：未采样或远端父 Span，只携带上下文"""
+
+    recording = False
+
+    def __init__(self, trace_id: int, span_id: int, sampled: bool = False):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def trace_id_hex(self) -> str:
+        return f"{self.trace_id:032x}"
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id:032x}-{self.span_id:016x}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def add_event(self, name: str, **attributes):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+    def set_status(self, code: int, message: str = ""):
+        pass
+
+    def end(self):
+        pass
+
+
+class Span(NonRecordingSpan):
+    """记录中的 Span；起止时间以墙钟为基准、按单调时钟计算时长"""
+
+    recording = True
+
+    def __init__(self, processor: Optional["BatchSpanProcessor"], name: str, trace_id: int,
+                 parent_id: Optional[int] = None, kind: str = "internal",
+                 attributes: Optional[Dict[str, Any]] = None):
+        super().__init__(trace_id, random.getrandbits(64) or 1, sampled=True)
+        self.processor = processor
+        self.name = name
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.events: List[Dict[str, Any]] = []
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter()
+        self.end_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def record_exception(self, exc: BaseException):
+        self.add_event("exception", **{"exception.type": type(exc).__name__, "exception.message": str(exc)})
+        self.set_status(STATUS_ERROR, str(exc))
+
+    def set_status(self, code: int, message: str = ""):
+        self.status_code = code
+        self.status_message = message
+
+    @property
+    def duration_seconds(self) -> float:
+        if self.end_ns is None:
+            return time.perf_counter() - self._start_perf
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = self.start_ns + int((time.perf_counter() - self._start_perf) * 1e9)
+        if self.processor is not None:
+            self.processor.on_end(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": f"{self.trace_id:032x}",
+            "spanId": f"{self.span_id:016x}",
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status_code, "message": self.status_message}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = f"{self.parent_id:016x}"
+        if self.events:
+            span["events"] = [
+                {"timeUnixNano": str(e["time_ns"]), "name": e["name"], "attributes": _otlp_attributes(e["attributes"])}
+                for e in self.events
+            ]
+        return span
+
+
+class TraceIdRatioSampler:
+    """按 TraceId 低 64 位的比例采样（与 OTel TraceIdRatioBased 相同的判定）"""
+
+    def __init__(self, ratio: float):
+        self.ratio = min(1.0, max(0.0, ratio))
+        self._bound = int(self.ratio * (1 << 64))
+
+    def should_sample(self, trace_id: int) -> bool:
+        return (trace_id & 0xFFFFFFFFFFFFFFFF) < self._bound
+
+
+def _otlp_payload(spans: List[Span], service_name: str) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": service_name})},
+            "scopeSpans": [{
+                "scope": {"name": "flows.tracing"},
+                "spans": [span.to_otlp() for span in spans]
+            }]
+        }]
+    }
+
+
+class FileSpanExporter:
+    """每批写一行 OTLP/JSON（ExportTraceServiceRequest）"""
+
+    def __init__(self, path: str, service_name: str = "dbgpt-nl2sql"):
+        self.path = path
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        line = json.dumps(_otlp_payload(spans, self.service_name), ensure_ascii=False)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def shutdown(self):
+        pass
+
+
+class OTLPHttpSpanExporter:
+    """以 OTLP/HTTP JSON 编码推送到收集器的 /v1/traces"""
+
+    def __init__(self, endpoint: str, service_name: str = "dbgpt-nl2sql", timeout: float = 5.0,
+                 headers: Optional[Dict[str, str]] = None):
+        self.url = endpoint.rstrip("/") + ("" if endpoint.rstrip("/").endswith("/v1/traces") else "/v1/traces")
+        self.service_name = service_name
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+    def export(self, spans: List[Span]):
+        body = json.dumps(_otlp_payload(spans, self.service_name)).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def shutdown(self):
+        pass
+
+
+class InMemorySpanExporter:
+    """保存在内存中，便于测试和调试"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def export(self, spans: List[Span]):
+        self.spans.extend(spans)
+
+    def shutdown(self):
+        pass
+
+
+class BatchSpanProcessor:
+    """后台线程批量导出结束的 Span；队列满时丢弃而不阻塞请求"""
+
+    def __init__(self, exporter, max_queue: int = 4096, batch_size: int = 256, interval: float = 2.0):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.logger = logging.getLogger(__name__)
+        self.metrics = {"exported": 0, "dropped": 0, "export_errors": 0}
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def on_end(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.metrics["dropped"] += 1
+
+    def _run(self):
+        while not self._closed:
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            if first is not None:
+                self._export([first] + self._drain(self.batch_size - 1))
+
+    def _drain(self, limit: int) -> List[Span]:
+        spans = []
+        while len(spans) < limit:
+            try:
+                span = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if span is not None:
+                spans.append(span)
+        return spans
+
+    def _export(self, spans: List[Span]):
+        if not spans:
+            return
+        with self._flush_lock:
+            try:
+                self.exporter.export(spans)
+                self.metrics["exported"] += len(spans)
+            except Exception as e:
+                self.metrics["export_errors"] += 1
+                self.logger.warning(f"Span 导出失败: {e}")
+
+    def force_flush(self):
+        """导出队列中剩余的 Span"""
+        while True:
+            spans = self._drain(self.batch_size)
+            if not spans:
+                break
+            self._export(spans)
+
+    def shutdown(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=self.interval + 1)
+        self.force_flush()
+        self.exporter.shutdown()
+
+
+class Tracer:
+    """追踪器"""
+
+    def __init__(self, service_name: str = "dbgpt-nl2sql", sampler: Optional[TraceIdRatioSampler] = None,
+                 processor: Optional[BatchSpanProcessor] = None, enabled: bool = True):
+        self.service_name = service_name
+        self.sampler = sampler or TraceIdRatioSampler(1.0)
+        self.processor = processor
+        self.enabled = enabled and processor is not None
+
+    def start_span(self, name: str, parent: Optional[NonRecordingSpan] = None, kind: str = "internal",
+                   attributes: Optional[Dict[str, Any]] = None, root: bool = False) -> NonRecordingSpan:
+        """创建 Span（不激活）；父 Span 未采样时直接复用它，不产生任何记录"""
+        if not self.enabled:
+            return _DISABLED_SPAN
+        if parent is None and not root:
+            parent = _current_span.get()
+
+        if parent is None:
+            trace_id = random.getrandbits(128) or 1
+            if not self.sampler.should_sample(trace_id):
+                return NonRecordingSpan(trace_id, random.getrandbits(64) or 1)
+            return Span(self.processor, name, trace_id, kind=kind, attributes=attributes)
+
+        if not parent.sampled:
+            return parent
+        return Span(self.processor, name, parent.trace_id, parent_id=parent.span_id, kind=kind, attributes=attributes)
+
+    @contextmanager
+    def activate(self, span: NonRecordingSpan) -> Iterator[NonRecordingSpan]:
+        """把已有 Span 设为当前 Span（不结束它）"""
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[NonRecordingSpan] = None, kind: str = "internal",
+             **attributes) -> Iterator[NonRecordingSpan]:
+        """创建并激活子 Span，退出时结束；异常记录到 Span 后继续抛出"""
+        span = self.start_span(name, parent=parent, kind=kind, attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    @contextmanager
+    def start_trace(self, name: str, traceparent: Optional[str] = None, kind: str = "server",
+                    **attributes) -> Iterator[NonRecordingSpan]:
+        """开始一次请求的追踪；带 traceparent 时延续上游的追踪和采样决定"""
+        remote = parse_traceparent(traceparent) if self.enabled else None
+        span = self.start_span(name, parent=remote, kind=kind, attributes=attributes, root=remote is None)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def shutdown(self):
+        if self.processor is not None:
+            self.processor.shutdown()
+
+
+_DISABLED_SPAN = NonRecordingSpan(0, 0)
+
+
+def llm_usage_attributes(response: Any, prompt: str = "") -> Dict[str, Any]:
+    """LLM 调用的 token 用量属性；模型输出没有 usage 时按字符数估算并标记"""
+    usage = getattr(response, "usage", None) or {}
+    if not isinstance(usage, dict):
+        usage = getattr(usage, "__dict__", {})
+    input_tokens = usage.get("prompt_tokens", usage.get("input_tokens"))
+    output_tokens = usage.get("completion_tokens", usage.get("output_tokens"))
+    attributes = {"gen_ai.operation.name": "text_completion"}
+    if input_tokens is None and output_tokens is None:
+        # 中英文混合时约 2 个字符一个 token，只作量级参考
+        text = getattr(response, "text", "") or ""
+        input_tokens, output_tokens = (len(prompt) + 1) // 2, (len(text) + 1) // 2
+        attributes["gen_ai.usage.estimated"] = True
+    attributes["gen_ai.usage.input_tokens"] = int(input_tokens or 0)
+    attributes["gen_ai.usage.output_tokens"] = int(output_tokens or 0)
+    return attributes
+
+
+_default_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """获取进程内共享的追踪器（环境变量配置）
+
+    TRACE_ENABLED: 是否启用（默认 1）
+    TRACE_SAMPLE_RATIO: 采样比例（默认 0.01）
+    TRACE_EXPORTER: file / otlp / none（默认 file）
+    TRACE_FILE: 文件导出路径（默认 /app/logs/traces.ndjson）
+    OTEL_EXPORTER_OTLP_ENDPOINT: OTLP 收集器地址（默认 http://localhost:4318）
+    """
+    global _default_tracer
+    if _default_tracer is None:
+        service_name = os.getenv("OTEL_SERVICE_NAME", "dbgpt-nl2sql")
+        exporter_name = os.getenv("TRACE_EXPORTER", "file").lower()
+        enabled = os.getenv("TRACE_ENABLED", "1") not in ("0", "false") and exporter_name != "none"
+
+        processor = None
+        if enabled:
+            if exporter_name == "otlp":
+                exporter = OTLPHttpSpanExporter(
+                    os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"), service_name
+                )
+            else:
+                exporter = FileSpanExporter(os.getenv("TRACE_FILE", "/app/logs/traces.ndjson"), service_name)
+            processor = BatchSpanProcessor(exporter)
+
+        _default_tracer = Tracer(
+            service_name=service_name,
+            sampler=TraceIdRatioSampler(float(os.getenv("TRACE_SAMPLE_RATIO", "0.01"))),
+            processor=processor,
+            enabled=enabled
+        )
+        atexit.register(_default_tracer.shutdown)
+    return _default_tracer
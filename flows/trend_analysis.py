@@ -0,0 +1,251 @@
+"""
+趋势分析工作流
+在 DuckDB 中按 date_trunc 把明细聚合为日 / 周 / 月序列（见 timeseries_prep），
+在预测进程池中运行 TrendDetector 得到趋势方向、预测与变点，再计算增长率和波动率。
+结果按 (data_source, period, 数据版本) 缓存
+"""
+
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Any
+
+import numpy as np
+import pandas as pd
+
+from config.model_config import model_config, DatabaseType
+from flows.query_cache import QueryCache
+from flows.timeseries_prep import TimeSeriesPreparer, PreparedSeries, quote_identifier, table_version
+from flows.forecast_executor import ForecastExecutor, get_forecast_executor
+from flows.forecast_jobs import detect_trends_job
+from flows.chart_store import ChartStore, get_chart_store
+from flows.trend_detection import FORECAST_STEPS, MIN_POINTS
+
+
+@dataclass(frozen=True)
+class DataSource:
+    """可分析的指标：表、日期列和数值列"""
+    table: str
+    date_column: str
+    value_column: str
+    label: str
+
+
+DATA_SOURCES = {
+    "sales": DataSource("douyin_sales_detail", "date", "daily_revenue", "销售额"),
+    "orders": DataSource("douyin_sales_detail", "date", "daily_sales", "销量"),
+    "conversion": DataSource("douyin_sales_detail", "date", "conversion_rate", "转化率"),
+    "products": DataSource("douyin_products", "created_date", "sales_amount", "商品销售额"),
+}
+PERIODS = {"daily": ("day", "日"), "weekly": ("week", "周"), "monthly": ("month", "月")}
+# 相邻两期增长率标准差（%）低于该值为“低”，低于第二个值为“中等”
+VOLATILITY_LEVELS = (5.0, 15.0)
+
+
+def complete_periods(prepared: PreparedSeries, first, last) -> PreparedSeries:
+    """去掉首尾未覆盖完整的周 / 月桶，避免半期数据拉低增长率和预测"""
+    if prepared.grain == "day" or first is None or last is None or not len(prepared):
+        return prepared
+    starts = pd.DatetimeIndex(prepared.dates)
+    ends = starts + FORECAST_STEPS[prepared.grain] - pd.Timedelta(days=1)
+    mask = np.asarray((starts >= pd.Timestamp(first)) & (ends <= pd.Timestamp(last)))
+    return PreparedSeries(
+        dates=prepared.dates[mask],
+        values={column: values[mask] for column, values in prepared.values.items()},
+        grain=prepared.grain
+    )
+
+
+def series_statistics(values: np.ndarray) -> Dict[str, Any]:
+    """整体增长、平均每期增长和波动率（增长率的标准差）"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = np.diff(values) / np.abs(values[:-1]) * 100
+    growth = growth[np.isfinite(growth)]
+    volatility = float(np.std(growth)) if growth.size else 0.0
+    level = "低" if volatility < VOLATILITY_LEVELS[0] else "中等" if volatility < VOLATILITY_LEVELS[1] else "高"
+    first, last = float(values[0]), float(values[-1])
+    return {
+        "total_growth": round((last - first) / abs(first) * 100, 2) if first else None,
+        "avg_period_growth": round(float(np.mean(growth)), 2) if growth.size else 0.0,
+        "volatility": level,
+        "volatility_pct": round(volatility, 2),
+        "mean": round(float(np.mean(values)), 2),
+        "latest": round(last, 2),
+        "points": int(values.size)
+    }
+
+
+class TrendAnalysisService:
+    """DuckDB 序列构建 + 进程池趋势检测"""
+
+    def __init__(self, database: str = "douyin_analytics", connection=None,
+                 executor: Optional[ForecastExecutor] = None, chart_store: Optional[ChartStore] = None,
+                 cache: Optional[QueryCache] = None):
+        self.database = database
+        self.logger = logging.getLogger(__name__)
+        self.executor = executor or get_forecast_executor()
+        self.chart_store = chart_store or get_chart_store()
+        self.cache = cache or QueryCache(max_entries=256, ttl=3600, name="trend_analysis")
+        self._conn = connection
+        self._preparer: Optional[TimeSeriesPreparer] = None
+        self._lock = threading.Lock()
+
+    def supports_database(self) -> bool:
+        """需要已存在的 DuckDB 数据库文件（或外部传入的连接）"""
+        if self._conn is not None:
+            return True
+        db_config = model_config.get_database_config(self.database)
+        return (db_config is not None and db_config.type == DatabaseType.DUCKDB
+                and os.path.exists(model_config.get_connection_string(self.database)))
+
+    def _connection(self):
+        """延迟建立只读连接；预处理器共用同一连接"""
+        with self._lock:
+            if self._conn is None:
+                import duckdb
+                self._conn = duckdb.connect(model_config.get_connection_string(self.database), read_only=True)
+            if self._preparer is None:
+                self._preparer = TimeSeriesPreparer(self.database, connection=self._conn)
+            return self._conn.cursor()
+
+    def _load(self, source: DataSource, grain: str, cache_key: tuple):
+        """读取数据版本；缓存未命中时在数据库中构建序列"""
+        cursor = self._connection()
+        try:
+            version = table_version(cursor, source.table, source.date_column,
+                                    model_config.get_connection_string(self.database))
+        finally:
+            cursor.close()
+        cached = self.cache.get(cache_key + (version,))
+        if cached is not None:
+            return version, cached, None
+
+        source_sql = (f"SELECT {quote_identifier(source.date_column)}, {quote_identifier(source.value_column)} "
+                      f"FROM {quote_identifier(source.table)}")
+        prepared = self._preparer.prepare(source_sql, source.date_column, [source.value_column], grain, "auto")
+        if grain != "day":
+            cursor = self._connection()
+            try:
+                first = cursor.execute(
+                    f"SELECT MIN({quote_identifier(source.date_column)}) FROM {quote_identifier(source.table)}"
+                ).fetchone()[0]
+            finally:
+                cursor.close()
+            prepared = complete_periods(prepared, first, version[2])
+        return version, None, prepared
+
+    async def analyze(self, data_source: str = "sales", period: str = "daily", forecast_periods: int = 7,
+                      backend: str = "auto", timeout: float = 60.0) -> Dict[str, Any]:
+        """构建序列并检测趋势；阻塞的数据库读取放在线程中，检测在预测进程池中执行"""
+        import asyncio
+
+        if data_source not in DATA_SOURCES:
+            raise ValueError(f"不支持的数据源: {data_source}")
+        if period not in PERIODS:
+            raise ValueError(f"不支持的周期: {period}")
+        if backend == "prophet":
+            # 检测已在工作进程中运行，不再嵌套提交 Prophet 拟合
+            raise ValueError("趋势分析工作流仅支持原生预测后端")
+        source, (grain, unit) = DATA_SOURCES[data_source], PERIODS[period]
+        start_time = time.perf_counter()
+
+        cache_key = (data_source, period, forecast_periods, backend)
+        version, cached, prepared = await asyncio.to_thread(self._load, source, grain, cache_key)
+        if cached is not None:
+            return {**cached, "cache_hit": True}
+
+        series_time = time.perf_counter() - start_time
+        valid = np.isfinite(prepared.values[source.value_column])
+        if valid.sum() < MIN_POINTS[grain]:
+            raise ValueError(f"数据点不足，至少需要{MIN_POINTS[grain]}个{unit}数据点，当前只有{int(valid.sum())}个")
+
+        results = await self.executor.submit(
+            detect_trends_job, prepared, source.date_column, [source.value_column], forecast_periods, backend,
+            source=f"{self.database}:{source.table}", timeout=timeout
+        )
+        trend = results[source.value_column]
+        # 图表描述以内容寻址，在主进程登记后与工作进程中得到的 ID 相同
+        chart_id = self.chart_store.put_spec(trend["chart_spec"]) if trend["chart_spec"] else ""
+
+        result = self._assemble(data_source, period, source, unit, prepared, trend, chart_id)
+        result["data_version"] = {"rows": version[1], "latest_date": version[2]}
+        result["timing"] = {
+            "series_seconds": round(series_time, 6),
+            "total_seconds": round(time.perf_counter() - start_time, 6)
+        }
+        self.cache.put(cache_key + (version,), result)
+        return {**result, "cache_hit": False}
+
+    def _assemble(self, data_source: str, period: str, source: DataSource, unit: str,
+                  prepared: PreparedSeries, trend: Dict[str, Any], chart_id: str) -> Dict[str, Any]:
+        values = prepared.values[source.value_column]
+        valid = np.isfinite(values)
+        values, dates = values[valid], prepared.dates[valid]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = np.concatenate([[0.0], np.diff(values) / np.abs(values[:-1]) * 100])
+        growth = np.where(np.isfinite(growth), growth, 0.0)
+        labels = np.datetime_as_string(dates, unit="D").tolist()
+
+        statistics = series_statistics(values)
+        forecast = trend["forecast_values"]
+        insights = [f"{source.label}呈{trend['trend_direction']}趋势（强度 {trend['trend_strength']:.2f}）"]
+        if statistics["total_growth"] is not None:
+            insights.append(f"分析期内{source.label}累计变化 {statistics['total_growth']:+.1f}%，"
+                            f"每{unit}平均变化 {statistics['avg_period_growth']:+.1f}%，波动{statistics['volatility']}")
+        if forecast and values[-1]:
+            change = (float(np.mean(forecast)) - float(values[-1])) / abs(float(values[-1])) * 100
+            insights.append(f"预测未来{len(forecast)}{unit}{source.label}均值较最近一{unit}{change:+.1f}%")
+        if trend["changepoints"]:
+            insights.append(f"检测到 {len(trend['changepoints'])} 个趋势变点")
+        weekly = trend["seasonality_components"].get("weekly") or []
+        if period == "daily" and len(weekly) == 7:
+            insights.append(f"{'一二三四五六日'[int(np.argmax(weekly))]}为一周中{source.label}最高的一天")
+
+        return {
+            "trend_type": f"{data_source}_trend",
+            "period": period,
+            "metric": source.value_column,
+            "data_points": [
+                {"date": label, "value": round(float(value), 2), "growth": round(float(g), 1)}
+                for label, value, g in zip(labels, values, growth)
+            ],
+            "trend_direction": trend["trend_direction"],
+            "trend_strength": round(float(trend["trend_strength"]), 4),
+            "forecast": {
+                "values": forecast,
+                "dates": trend["forecast_dates"],
+                "confidence_intervals": trend["confidence_intervals"],
+                "backend": trend["forecast_backend"]
+            },
+            "changepoints": trend["changepoints"],
+            "insights": insights,
+            "statistics": statistics,
+            "chart_id": chart_id,
+            "chart_url": f"/charts/{chart_id}" if chart_id else ""
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return self.cache.get_metrics()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._preparer = None
+
+
+_default_service: Optional[TrendAnalysisService] = None
+_default_lock = threading.Lock()
+
+
+def get_trend_analysis_service() -> TrendAnalysisService:
+    """获取全局趋势分析服务"""
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = TrendAnalysisService()
+        return _default_service
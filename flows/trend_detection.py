@@ -4,18 +4,66 @@
 """
 
 import os
+import base64
+import hashlib
+import asyncio
 import logging
+import importlib.util
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
-import base64
 
-from dbgpt.core.awel import MapOperator
+if importlib.util.find_spec("dbgpt") is not None:
+    from dbgpt.core.awel import MapOperator
+else:
+    class MapOperator:
+        """未安装 dbgpt 时 TrendDetector 仍可在服务中直接使用，只有 AWEL 操作符不可用"""
+
+        def __init__(self, *args, **kwargs):
+            raise ImportError("TrendDetectionOperator 需要安装 dbgpt")
+
+from flows.changepoint_detection import ChangepointDetector
+from flows.prophet_model_store import ProphetModelStore
+from flows.forecast_executor import ForecastExecutor, get_forecast_executor
+from flows.forecast_jobs import fit_prophet
+from flows.chart_store import ChartStore, build_trend_spec, get_chart_store
+from flows.native_forecast import HoltWintersForecaster, linear_forecast, select_backend
+from flows.timeseries_prep import TimeSeriesPreparer, PreparedSeries
+from flows.column_inference import ColumnInferer, ColumnRoles
+from flows.metrics import get_metrics_registry
+from flows.query_cache import normalize_sql
+
+
+# 各时间粒度的预测步长
+FORECAST_STEPS = {
+    "hour": pd.DateOffset(hours=1),
+    "day": pd.DateOffset(days=1),
+    "week": pd.DateOffset(weeks=1),
+    "month": pd.DateOffset(months=1),
+    "quarter": pd.DateOffset(months=3),
+    "year": pd.DateOffset(years=1)
+}
+# 各时间粒度的季节周期（点数）；None 表示不估计季节项
+SEASON_LENGTHS = {
+    "hour": 24,
+    "day": 7,
+    "week": 52,
+    "month": 12,
+    "quarter": 4,
+    "year": None
+}
+# 各时间粒度检测所需的最少点数：粗粒度序列点数天然较少（120 天只有 3 个完整月），
+# 不足 MIN_POINTS_FOR_TREND 时由线性后端预测
+MIN_POINTS = {
+    "hour": 10,
+    "day": 10,
+    "week": 8,
+    "month": 3,
+    "quarter": 3,
+    "year": 3
+}
 
 
 @dataclass
@@ -28,6 +76,14 @@ class TrendDetectionRequest:
     confidence_interval: float = 0.95
     enable_changepoint_detection: bool = True
     enable_seasonality: bool = True
+    changepoint_method: str = "window"  # window / cusum / pelt / binseg
+    series_column: Optional[str] = None  # 多序列长表的序列标识列（如 sku）
+    series_id: Optional[str] = None  # 模型缓存使用的序列标识，默认由 source、时间粒度和 value_column 派生
+    source: Optional[str] = None  # 数据来源（数据库 + 源 SQL 或数据源名称），区分同名数值列
+    timeout: float = 60.0  # 单个预测 / 绘图任务的超时秒数
+    forecast_backend: str = "auto"  # auto / holt_winters / damped_trend / linear / prophet
+    inline_chart: bool = False  # 是否同步渲染 PNG 并以 base64 内联返回（默认只返回图表 ID 与描述）
+    prepared: Optional[PreparedSeries] = None  # 已在数据库中完成分桶补齐的数组，提供时忽略 data
 
 
 @dataclass
@@ -39,23 +95,26 @@ class TrendResult:
     forecast_dates: List[str]
     changepoints: List[Dict]
     seasonality_components: Dict[str, List[float]]
-    chart_base64: str
     confidence_intervals: Dict[str, List[float]]
+    forecast_backend: str = ""
+    chart_id: str = ""  # 通过 /charts/{chart_id} 按需获取 PNG
+    chart_spec: Dict[str, Any] = field(default_factory=dict)
+    chart_base64: str = ""
 
 
 class TrendDetector:
     """趋势检测器"""
     
-    def __init__(self):
+    def __init__(self, model_store: Optional[ProphetModelStore] = None,
+                 executor: Optional[ForecastExecutor] = None,
+                 chart_store: Optional[ChartStore] = None):
         self.logger = logging.getLogger(__name__)
-        self._setup_plotting()
-    
-    def _setup_plotting(self):
-        """设置绘图样式"""
-        plt.style.use('seaborn-v0_8')
-        sns.set_palette("husl")
-        plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
-        plt.rcParams['axes.unicode_minus'] = False
+        self.changepoint_detector = ChangepointDetector()
+        self.model_store = model_store or ProphetModelStore()
+        # 拟合、预测和绘图在进程池中执行，不阻塞事件循环
+        self.executor = executor or get_forecast_executor()
+        # 图表按需渲染：检测时只登记描述，PNG 在首次请求时生成
+        self.chart_store = chart_store or get_chart_store()
     
     async def detect_trend(self, request: TrendDetectionRequest) -> TrendResult:
         """检测趋势"""
@@ -63,57 +122,133 @@ class TrendDetector:
             # 1. 数据预处理
             df = self._prepare_data(request)
             
-            if len(df) < 10:
-                raise ValueError(f"数据点不足，至少需要10个数据点，当前只有{len(df)}个")
-            
-            # 2. 趋势分析
-            trend_info = self._analyze_trend(df, request.value_column)
+            min_points = MIN_POINTS[self._grain(request)]
+            if len(df) < min_points:
+                raise ValueError(f"数据点不足，至少需要{min_points}个数据点，当前只有{len(df)}个")
             
-            # 3. 使用 Prophet 进行预测
-            forecast_result = await self._prophet_forecast(df, request)
+            # 2. 预测：默认使用原生快速层，Prophet 仅在显式请求时运行
+            backend = select_backend(len(df), request.forecast_backend, self._season_length(request))
+            if backend == "prophet":
+                forecast_result = await self._prophet_forecast(df, request)
+            else:
+                forecast_result = self._native_forecast(df, request, backend)
             
-            # 4. 变点检测
+            # 3. 变点检测
             changepoints = []
             if request.enable_changepoint_detection:
-                changepoints = self._detect_changepoints(df, request.value_column)
+                changepoints = self._detect_changepoints(df, request)
             
-            # 5. 季节性分析
-            seasonality = {}
-            if request.enable_seasonality:
-                seasonality = self._analyze_seasonality(df, request.value_column)
+            return await self._build_result(df, request, forecast_result, changepoints)
             
-            # 6. 生成可视化图表
-            chart_base64 = self._generate_chart(
-                df, forecast_result, changepoints, request
-            )
+        except Exception as e:
+            self.logger.error(f"趋势检测失败: {e}")
+            raise
+    
+    async def detect_trends(self, request: TrendDetectionRequest,
+                            value_columns: List[str]) -> Dict[str, TrendResult]:
+        """多个数值列共用一次预处理，原生后端一次向量化完成全部预测和变点检测"""
+        try:
+            df = self._prepare_data(request, value_columns)
             
-            return TrendResult(
-                trend_direction=trend_info["direction"],
-                trend_strength=trend_info["strength"],
-                forecast_values=forecast_result["values"],
-                forecast_dates=forecast_result["dates"],
-                changepoints=changepoints,
-                seasonality_components=seasonality,
-                chart_base64=chart_base64,
-                confidence_intervals=forecast_result["confidence_intervals"]
-            )
+            min_points = MIN_POINTS[self._grain(request)]
+            if len(df) < min_points:
+                raise ValueError(f"数据点不足，至少需要{min_points}个数据点，当前只有{len(df)}个")
+            
+            backend = select_backend(len(df), request.forecast_backend, self._season_length(request))
+            if backend == "prophet":
+                return {
+                    column: await self.detect_trend(replace(request, value_column=column))
+                    for column in value_columns
+                }
+            
+            forecasts = self._native_forecast_batch(df, request, backend, value_columns)
+            
+            changepoints: Dict[str, List[Dict]] = {}
+            if request.enable_changepoint_detection:
+                # 转为长表，各数值列作为独立序列一次检测
+                long_df = df.melt(id_vars=[request.date_column], value_vars=value_columns,
+                                  var_name="_metric", value_name="_value")
+                changepoints = self.changepoint_detector.detect_frame(
+                    long_df,
+                    date_column=request.date_column,
+                    value_column="_value",
+                    series_column="_metric",
+                    method=request.changepoint_method
+                )
+            
+            return {
+                column: await self._build_result(
+                    df, replace(request, value_column=column), forecasts[column], changepoints.get(column, [])
+                )
+                for column in value_columns
+            }
             
         except Exception as e:
-            self.logger.error(f"趋势检测失败: {e}")
+            self.logger.error(f"多指标趋势检测失败: {e}")
             raise
     
-    def _prepare_data(self, request: TrendDetectionRequest) -> pd.DataFrame:
+    async def _build_result(self, df: pd.DataFrame, request: TrendDetectionRequest,
+                            forecast_result: Dict[str, Any], changepoints: List[Dict]) -> TrendResult:
+        """趋势、季节性与图表描述汇总为结果"""
+        # 4. 趋势分析
+        trend_info = self._analyze_trend(df, request.value_column)
+        
+        # 5. 季节性分析
+        seasonality = {}
+        if request.enable_seasonality:
+            seasonality = self._analyze_seasonality(df, request.value_column)
+        
+        # 6. 登记图表描述，PNG 仅在显式要求时同步渲染
+        chart_id, chart_spec = self._register_chart(df, forecast_result, changepoints, request)
+        chart_base64 = ""
+        if request.inline_chart and chart_id:
+            chart_base64 = await self._render_chart(chart_id)
+        
+        return TrendResult(
+            trend_direction=trend_info["direction"],
+            trend_strength=trend_info["strength"],
+            forecast_values=forecast_result["values"],
+            forecast_dates=forecast_result["dates"],
+            changepoints=changepoints,
+            seasonality_components=seasonality,
+            confidence_intervals=forecast_result["confidence_intervals"],
+            forecast_backend=forecast_result.get("backend", ""),
+            chart_id=chart_id,
+            chart_spec=chart_spec,
+            chart_base64=chart_base64
+        )
+    
+    async def detect_changepoints(self, request: TrendDetectionRequest) -> Dict[Any, List[Dict]]:
+        """批量检测变点，series_column 指定时一次覆盖全部序列"""
+        df = self._prepare_data(request)
+        return self.changepoint_detector.detect_frame(
+            df,
+            date_column=request.date_column,
+            value_column=request.value_column,
+            series_column=request.series_column,
+            method=request.changepoint_method
+        )
+    
+    def _prepare_data(self, request: TrendDetectionRequest,
+                      value_columns: Optional[List[str]] = None) -> pd.DataFrame:
         """数据预处理"""
+        value_columns = value_columns or [request.value_column]
+        if request.prepared is not None:
+            # 数据库已完成类型转换、分桶和排序，只需去掉补齐后仍缺失的点
+            df = request.prepared.to_frame(request.date_column, request.series_column)
+            return df.dropna(subset=value_columns).reset_index(drop=True)
+        
         df = pd.DataFrame(request.data)
         
         # 转换日期列
         df[request.date_column] = pd.to_datetime(df[request.date_column])
         
         # 转换数值列
-        df[request.value_column] = pd.to_numeric(df[request.value_column], errors='coerce')
+        for column in value_columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
         
         # 移除空值
-        df = df.dropna(subset=[request.date_column, request.value_column])
+        df = df.dropna(subset=[request.date_column] + value_columns)
         
         # 按日期排序
         df = df.sort_values(request.date_column)
@@ -158,118 +293,128 @@ class TrendDetector:
         """使用 Prophet 进行预测"""
         try:
             # 尝试导入 Prophet
-            try:
-                from prophet import Prophet
-            except ImportError:
-                self.logger.warning("Prophet 未安装，使用简单线性预测")
-                return self._simple_forecast(df, request)
+            if importlib.util.find_spec("prophet") is None:
+                self.logger.warning("Prophet 未安装，使用原生快速预测")
+                backend = select_backend(len(df), season_length=self._season_length(request))
+                return self._native_forecast(df, request, backend)
             
             # 准备 Prophet 数据格式
-            prophet_df = df[[request.date_column, request.value_column]].copy()
-            prophet_df.columns = ['ds', 'y']
-            
-            # 创建 Prophet 模型
-            model = Prophet(
-                yearly_seasonality=request.enable_seasonality,
-                weekly_seasonality=request.enable_seasonality,
-                daily_seasonality=False,
-                interval_width=request.confidence_interval,
-                changepoint_prior_scale=0.05
+            ds = df[request.date_column].to_numpy(dtype="datetime64[ns]")
+            y = df[request.value_column].to_numpy(dtype=float)
+            prophet_df = pd.DataFrame({"ds": ds, "y": y})
+            
+            hyperparams = {
+                "yearly_seasonality": request.enable_seasonality,
+                "weekly_seasonality": request.enable_seasonality,
+                "daily_seasonality": False,
+                "interval_width": request.confidence_interval,
+                "changepoint_prior_scale": 0.05
+            }
+            series_id = self._series_id(request)
+            cache_key = self.model_store.make_key(series_id, hyperparams)
+            data_hash = self.model_store.hash_data(prophet_df)
+            # 模型缓存的读写都会访问磁盘，放到线程中执行以免阻塞事件循环
+            entry = await asyncio.to_thread(self.model_store.lookup, cache_key)
+            
+            # 数据未变：直接返回缓存的预测
+            cached = await asyncio.to_thread(self.model_store.cached_forecast, entry, data_hash,
+                                             request.forecast_periods)
+            if cached is not None:
+                return {**cached, "backend": "prophet"}
+            
+            # 数据未变但预测周期不同：复用已训练模型；否则以历史参数热启动
+            model_json = await asyncio.to_thread(self.model_store.load_model_json, entry, data_hash) if entry else None
+            init = None if model_json else self.model_store.warm_start_params(entry)
+            
+            fitted = await self.executor.submit(
+                fit_prophet, ds, y, hyperparams, request.forecast_periods,
+                init=init, model_json=model_json, timeout=request.timeout
             )
+            result = fitted["result"]
             
-            # 训练模型
-            model.fit(prophet_df)
-            
-            # 创建未来日期
-            future = model.make_future_dataframe(periods=request.forecast_periods)
-            
-            # 进行预测
-            forecast = model.predict(future)
-            
-            # 提取预测结果
-            forecast_start_idx = len(prophet_df)
-            forecast_values = forecast['yhat'][forecast_start_idx:].tolist()
-            forecast_dates = forecast['ds'][forecast_start_idx:].dt.strftime('%Y-%m-%d').tolist()
-            
-            # 置信区间
-            confidence_intervals = {
-                "lower": forecast['yhat_lower'][forecast_start_idx:].tolist(),
-                "upper": forecast['yhat_upper'][forecast_start_idx:].tolist()
-            }
+            if model_json:
+                await asyncio.to_thread(self.model_store.add_forecast, entry, request.forecast_periods, result)
+            else:
+                await asyncio.to_thread(
+                    self.model_store.store, cache_key, series_id, fitted["params"], fitted["model_json"], data_hash,
+                    request.forecast_periods, result, fitted["fit_seconds"],
+                    fitted["warm_started"], previous=entry
+                )
             
-            return {
-                "values": forecast_values,
-                "dates": forecast_dates,
-                "confidence_intervals": confidence_intervals,
-                "model": model,
-                "forecast_df": forecast
-            }
+            return {**result, "backend": "prophet"}
             
         except Exception as e:
             self.logger.error(f"Prophet 预测失败: {e}")
-            return self._simple_forecast(df, request)
+            backend = select_backend(len(df), season_length=self._season_length(request))
+            return self._native_forecast(df, request, backend)
+    
+    @staticmethod
+    def _grain(request: TrendDetectionRequest) -> str:
+        """序列的时间粒度：未经数据库预处理的明细按日处理"""
+        return request.prepared.grain if request.prepared is not None else "day"
+    
+    def _series_id(self, request: TrendDetectionRequest) -> str:
+        """显式的 series_id 优先；否则为数据来源指纹 + 粒度 + 数值列，不同查询的同名列不共用模型"""
+        if request.series_id:
+            return request.series_id
+        source = hashlib.sha1((request.source or "").encode("utf-8")).hexdigest()[:16]
+        return f"{source}:{self._grain(request)}:{request.value_column}"
     
-    def _simple_forecast(self, df: pd.DataFrame, request: TrendDetectionRequest) -> Dict[str, Any]:
-        """简单线性预测（备用方案）"""
-        values = df[request.value_column].values
+    def _season_length(self, request: TrendDetectionRequest) -> Optional[int]:
+        """按时间粒度取季节周期，关闭季节性时为 None"""
+        return SEASON_LENGTHS.get(self._grain(request)) if request.enable_seasonality else None
+    
+    def _native_forecast(self, df: pd.DataFrame, request: TrendDetectionRequest,
+                         backend: str) -> Dict[str, Any]:
+        """原生快速预测：Holt-Winters / 阻尼趋势 / 线性回归"""
+        return self._native_forecast_batch(df, request, backend, [request.value_column])[request.value_column]
+    
+    def _native_forecast_batch(self, df: pd.DataFrame, request: TrendDetectionRequest,
+                               backend: str, value_columns: List[str]) -> Dict[str, Dict[str, Any]]:
+        """多列等长序列一次批量预测"""
+        values = df[value_columns].to_numpy(dtype=float).T
         dates = df[request.date_column]
         
-        # 线性回归
-        x = np.arange(len(values))
-        slope, intercept = np.polyfit(x, values, 1)
-        
-        # 预测未来值
-        future_x = np.arange(len(values), len(values) + request.forecast_periods)
-        forecast_values = (slope * future_x + intercept).tolist()
+        if backend == "linear":
+            outputs = [
+                linear_forecast(row, request.forecast_periods, request.confidence_interval)
+                for row in values
+            ]
+            forecast = {key: np.vstack([o[key] for o in outputs]) for key in ("mean", "lower", "upper")}
+        else:
+            season_length = self._season_length(request) if backend == "holt_winters" else None
+            forecaster = HoltWintersForecaster(season_length=season_length, damped=True)
+            forecast = forecaster.forecast_batch(values, request.forecast_periods, request.confidence_interval)
         
-        # 生成未来日期
+        # 生成未来日期（按预处理的时间粒度递增）
         last_date = dates.iloc[-1]
-        forecast_dates = []
-        for i in range(1, request.forecast_periods + 1):
-            future_date = last_date + timedelta(days=i)
-            forecast_dates.append(future_date.strftime('%Y-%m-%d'))
-        
-        # 简单置信区间（基于历史标准差）
-        std_dev = np.std(values)
-        confidence_intervals = {
-            "lower": [v - 1.96 * std_dev for v in forecast_values],
-            "upper": [v + 1.96 * std_dev for v in forecast_values]
-        }
+        step = FORECAST_STEPS[self._grain(request)]
+        forecast_dates = [
+            (last_date + step * i).strftime('%Y-%m-%d')
+            for i in range(1, request.forecast_periods + 1)
+        ]
         
         return {
-            "values": forecast_values,
-            "dates": forecast_dates,
-            "confidence_intervals": confidence_intervals
+            column: {
+                "values": forecast["mean"][i].tolist(),
+                "dates": forecast_dates,
+                "confidence_intervals": {
+                    "lower": forecast["lower"][i].tolist(),
+                    "upper": forecast["upper"][i].tolist()
+                },
+                "backend": backend
+            }
+            for i, column in enumerate(value_columns)
         }
     
-    def _detect_changepoints(self, df: pd.DataFrame, value_column: str) -> List[Dict]:
+    def _detect_changepoints(self, df: pd.DataFrame, request: TrendDetectionRequest) -> List[Dict]:
         """检测变点"""
         try:
-            # 简单的变点检测算法
-            values = df[value_column].values
-            dates = df[df.columns[0]]  # 假设第一列是日期
-            
-            changepoints = []
-            window_size = max(5, len(values) // 10)
-            
-            for i in range(window_size, len(values) - window_size):
-                # 计算前后窗口的均值差异
-                before_mean = np.mean(values[i-window_size:i])
-                after_mean = np.mean(values[i:i+window_size])
-                
-                # 计算变化幅度
-                change_magnitude = abs(after_mean - before_mean) / before_mean if before_mean != 0 else 0
-                
-                # 如果变化幅度超过阈值，认为是变点
-                if change_magnitude > 0.2:  # 20% 变化阈值
-                    changepoints.append({
-                        "date": dates.iloc[i].strftime('%Y-%m-%d'),
-                        "index": i,
-                        "change_magnitude": change_magnitude,
-                        "direction": "increase" if after_mean > before_mean else "decrease"
-                    })
-            
-            return changepoints
+            return self.changepoint_detector.detect(
+                df[request.value_column].values,
+                dates=df[request.date_column],
+                method=request.changepoint_method
+            )
             
         except Exception as e:
             self.logger.error(f"变点检测失败: {e}")
@@ -299,66 +444,28 @@ class TrendDetector:
             self.logger.error(f"季节性分析失败: {e}")
             return {}
     
-    def _generate_chart(self, df: pd.DataFrame, forecast_result: Dict, 
-                       changepoints: List[Dict], request: TrendDetectionRequest) -> str:
-        """生成趋势图表"""
+    def _register_chart(self, df: pd.DataFrame, forecast_result: Dict, changepoints: List[Dict],
+                        request: TrendDetectionRequest) -> Tuple[str, Dict[str, Any]]:
+        """生成图表描述并登记到图表存储"""
+        try:
+            spec = build_trend_spec(
+                df[request.date_column].dt.strftime('%Y-%m-%d').tolist(),
+                df[request.value_column].astype(float).tolist(),
+                request.value_column,
+                forecast_result,
+                changepoints
+            )
+            return self.chart_store.put_spec(spec), spec
+            
+        except Exception as e:
+            self.logger.error(f"图表描述生成失败: {e}")
+            return "", {}
+    
+    async def _render_chart(self, chart_id: str) -> str:
+        """渲染 PNG 并返回 base64 编码"""
         try:
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10))
-            
-            # 主趋势图
-            dates = df[request.date_column]
-            values = df[request.value_column]
-            
-            # 绘制历史数据
-            ax1.plot(dates, values, 'o-', label='历史数据', linewidth=2, markersize=4)
-            
-            # 绘制预测数据
-            if forecast_result:
-                forecast_dates = pd.to_datetime(forecast_result['dates'])
-                forecast_values = forecast_result['values']
-                
-                ax1.plot(forecast_dates, forecast_values, 's--', 
-                        label='预测数据', linewidth=2, markersize=4, alpha=0.8)
-                
-                # 绘制置信区间
-                if 'confidence_intervals' in forecast_result:
-                    ci = forecast_result['confidence_intervals']
-                    ax1.fill_between(forecast_dates, ci['lower'], ci['upper'], 
-                                   alpha=0.3, label='置信区间')
-            
-            # 标记变点
-            for cp in changepoints:
-                cp_date = pd.to_datetime(cp['date'])
-                ax1.axvline(x=cp_date, color='red', linestyle=':', alpha=0.7)
-                ax1.annotate(f"变点\n{cp['direction']}", 
-                           xy=(cp_date, values.iloc[cp['index']]),
-                           xytext=(10, 10), textcoords='offset points',
-                           bbox=dict(boxstyle='round,pad=0.3', facecolor='yellow', alpha=0.7),
-                           arrowprops=dict(arrowstyle='->', connectionstyle='arc3,rad=0'))
-            
-            ax1.set_title(f'{request.value_column} 趋势分析', fontsize=14, fontweight='bold')
-            ax1.set_xlabel('日期')
-            ax1.set_ylabel(request.value_column)
-            ax1.legend()
-            ax1.grid(True, alpha=0.3)
-            
-            # 分布图
-            ax2.hist(values, bins=20, alpha=0.7, edgecolor='black')
-            ax2.set_title('数值分布', fontsize=12)
-            ax2.set_xlabel(request.value_column)
-            ax2.set_ylabel('频次')
-            ax2.grid(True, alpha=0.3)
-            
-            plt.tight_layout()
-            
-            # 转换为 base64
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-            buffer.seek(0)
-            chart_base64 = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            
-            return chart_base64
+            image = await self.chart_store.get_png(chart_id)
+            return base64.b64encode(image).decode() if image else ""
             
         except Exception as e:
             self.logger.error(f"图表生成失败: {e}")
@@ -368,12 +475,29 @@ class TrendDetector:
 class TrendDetectionOperator(MapOperator):
     """趋势检测 AWEL 操作符"""
     
-    def __init__(self):
+    def __init__(self, grain: str = "day", aggregation: str = "auto",
+                 value_columns: Optional[List[str]] = None):
         super().__init__(
-            map_function=self._detect_trend,
+            map_function=get_metrics_registry().timed(
+                "awel_operator_duration_seconds", operator="trend_detection"
+            )(self._detect_trend),
             task_name="trend_detection"
         )
         self.detector = TrendDetector()
+        self.grain = grain
+        self.aggregation = aggregation
+        # 指定时只预测这些列，否则预测推断出的全部数值列
+        self.value_columns = value_columns
+        self.column_inferer = ColumnInferer()
+        self._preparers: Dict[str, TimeSeriesPreparer] = {}
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """预测执行器与模型缓存指标（含队列深度）"""
+        return {
+            "executor": self.detector.executor.get_metrics(),
+            "model_store": self.detector.model_store.get_metrics(),
+            "charts": self.detector.chart_store.get_metrics()
+        }
     
     async def _detect_trend(self, context: Dict) -> Dict:
         """执行趋势检测"""
@@ -389,40 +513,44 @@ class TrendDetectionOperator(MapOperator):
                 }
                 return context
             
-            # 自动识别日期和数值列
-            date_column, value_column = self._identify_columns(data, columns)
+            # 依据结果类型（无类型时抽样统计）识别日期列和数值列
+            preparer = self._get_preparer(context)
+            roles = await self._identify_columns(context, preparer, data, columns)
+            value_columns = [c for c in (self.value_columns or roles.value_columns) if c in columns]
             
-            if not date_column or not value_column:
+            if not roles.date_column or not value_columns:
                 context["trend_result"] = {
                     "error": "未找到合适的日期列或数值列"
                 }
                 return context
             
+            # 时序预处理下推到 DuckDB
+            prepared = await self._prepare_series(context, preparer, data, roles.date_column, value_columns)
+            
             # 创建趋势检测请求
             trend_request = TrendDetectionRequest(
                 data=data,
-                date_column=date_column,
-                value_column=value_column,
+                date_column=roles.date_column,
+                value_column=value_columns[0],
                 forecast_periods=7,
                 enable_changepoint_detection=True,
-                enable_seasonality=True
+                enable_seasonality=True,
+                prepared=prepared,
+                source=self._source(context)
             )
             
-            # 执行趋势检测
-            trend_result = await self.detector.detect_trend(trend_request)
+            # 全部数值列一次批量检测
+            results = await self.detector.detect_trends(trend_request, value_columns)
+            metrics = {column: self._format_result(result) for column, result in results.items()}
             
+            # 主指标字段保持原有结构，其余指标放在 metrics 中
             context["trend_result"] = {
                 "success": True,
-                "trend_direction": trend_result.trend_direction,
-                "trend_strength": trend_result.trend_strength,
-                "forecast": {
-                    "values": trend_result.forecast_values,
-                    "dates": trend_result.forecast_dates,
-                    "confidence_intervals": trend_result.confidence_intervals
-                },
-                "changepoints": trend_result.changepoints,
-                "seasonality": trend_result.seasonality_components,
-                "chart": trend_result.chart_base64
+                **metrics[value_columns[0]],
+                "date_column": roles.date_column,
+                "value_column": value_columns[0],
+                "column_inference": roles.source,
+                "metrics": metrics
             }
             
             return context
@@ -434,34 +562,75 @@ class TrendDetectionOperator(MapOperator):
             }
             return context
     
-    def _identify_columns(self, data: List[Dict], columns: List[str]) -> Tuple[Optional[str], Optional[str]]:
-        """自动识别日期列和数值列"""
-        if not data or not columns:
-            return None, None
+    @staticmethod
+    def _format_result(trend_result: TrendResult) -> Dict[str, Any]:
+        """单个指标的输出结构"""
+        return {
+            "trend_direction": trend_result.trend_direction,
+            "trend_strength": trend_result.trend_strength,
+            "forecast": {
+                "values": trend_result.forecast_values,
+                "dates": trend_result.forecast_dates,
+                "confidence_intervals": trend_result.confidence_intervals
+            },
+            "forecast_backend": trend_result.forecast_backend,
+            "changepoints": trend_result.changepoints,
+            "seasonality": trend_result.seasonality_components,
+            "chart": trend_result.chart_base64,
+            "chart_id": trend_result.chart_id,
+            "chart_url": f"/charts/{trend_result.chart_id}" if trend_result.chart_id else "",
+            "chart_spec": trend_result.chart_spec
+        }
+    
+    @staticmethod
+    def _database(context: Dict) -> str:
+        return getattr(context.get("request"), "database", None) or "douyin_analytics"
+    
+    def _source(self, context: Dict) -> Optional[str]:
+        """数据库 + 规范化后的源 SQL，作为序列的来源标识"""
+        sql = context.get("final_sql") or context.get("generated_sql")
+        return f"{self._database(context)}:{normalize_sql(sql)}" if sql else None
+    
+    def _get_preparer(self, context: Dict) -> TimeSeriesPreparer:
+        """按数据库复用预处理器"""
+        database = self._database(context)
+        preparer = self._preparers.get(database)
+        if preparer is None:
+            preparer = self._preparers[database] = TimeSeriesPreparer(database)
+        return preparer
+    
+    async def _prepare_series(self, context: Dict, preparer: TimeSeriesPreparer, data: List[Dict],
+                              date_column: str, value_columns: List[str]) -> Optional[PreparedSeries]:
+        """优先将原始 SQL 包装后在数据库中分桶、补齐、聚合（不受结果行数上限影响），
+        否则对已取回的行执行同样的处理；都失败时返回 None，沿用 pandas 预处理"""
+        sql = context.get("final_sql") or context.get("generated_sql")
         
-        sample_row = data[0]
-        date_column = None
-        value_column = None
+        if sql and preparer.supports_database():
+            try:
+                return await asyncio.to_thread(
+                    preparer.prepare, sql, date_column, value_columns, self.grain, self.aggregation
+                )
+            except Exception as e:
+                logging.warning(f"SQL 下推预处理失败，改用查询结果: {e}")
         
-        # 查找日期列
-        for col in columns:
-            if col in sample_row:
-                value = sample_row[col]
-                if isinstance(value, str):
-                    # 尝试解析为日期
-                    try:
-                        pd.to_datetime(value)
-                        date_column = col
-                        break
-                    except:
-                        continue
+        try:
+            return await asyncio.to_thread(
+                preparer.prepare_rows, data, date_column, value_columns, self.grain, self.aggregation
+            )
+        except Exception as e:
+            logging.warning(f"数据库内预处理失败，改用 pandas 预处理: {e}")
+            return None
+    
+    async def _identify_columns(self, context: Dict, preparer: TimeSeriesPreparer,
+                                data: List[Dict], columns: List[str]) -> ColumnRoles:
+        """识别列角色：查询结果自带类型优先，其次对 SQL 做 DESCRIBE，最后抽样统计"""
+        column_types = context.get("query_result", {}).get("column_types")
+        sql = context.get("final_sql") or context.get("generated_sql")
         
-        # 查找数值列
-        for col in columns:
-            if col != date_column and col in sample_row:
-                value = sample_row[col]
-                if isinstance(value, (int, float)) or (isinstance(value, str) and value.replace('.', '').isdigit()):
-                    value_column = col
-                    break
+        if not column_types and sql and preparer.supports_database():
+            try:
+                column_types = await asyncio.to_thread(preparer.describe, sql)
+            except Exception as e:
+                logging.warning(f"获取结果列类型失败，改用抽样推断: {e}")
         
-        return date_column, value_column
+        return self.column_inferer.infer(columns, data, column_types)
@@ -0,0 +1,155 @@
+"""
+启动预热
+服务启动后在后台按审计历史回放最热的问题和 SQL（有限并发），
+填充 NL2SQL 缓存、结果缓存和 DuckDB 缓冲池，并对外报告预热进度
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable, Awaitable
+
+from config.model_config import model_config, DatabaseType
+
+
+@dataclass
+class WarmupProgress:
+    """预热进度"""
+    status: str = "pending"  # pending / running / completed / failed / disabled
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    elapsed_seconds: float = 0.0
+    error: str = ""
+
+    @property
+    def ready(self) -> bool:
+        """预热结束（无论成败）即视为就绪，预热失败不阻止服务"""
+        return self.status not in ("pending", "running")
+
+    def to_dict(self) -> Dict[str, Any]:
+        done = self.completed + self.failed
+        return {
+            **asdict(self),
+            "ready": self.ready,
+            "progress": round(done / self.total, 4) if self.total else (1.0 if self.ready else 0.0)
+        }
+
+
+class DuckDBWarmer:
+    """在只读连接上执行热点 SELECT，把涉及的数据页读入 DuckDB 缓冲池"""
+
+    def __init__(self, database: str = "douyin_analytics"):
+        self.database = database
+        self.logger = logging.getLogger(__name__)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def supports_database(self) -> bool:
+        db_config = model_config.get_database_config(self.database)
+        return (db_config is not None and db_config.type == DatabaseType.DUCKDB
+                and os.path.exists(model_config.get_connection_string(self.database)))
+
+    def warm(self, sql: str) -> bool:
+        """执行 SQL 并丢弃结果；只执行只读查询"""
+        if not sql.lstrip().lower().startswith(("select", "with")):
+            return False
+        with self._lock:
+            if self._conn is None:
+                import duckdb
+                self._conn = duckdb.connect(model_config.get_connection_string(self.database), read_only=True)
+            cursor = self._conn.cursor()
+        try:
+            cursor.execute(sql).fetchall()
+            return True
+        finally:
+            cursor.close()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class WarmupManager:
+    """启动预热管理器"""
+
+    def __init__(self, warm_item: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 load_items: Optional[Callable[[int], List[Dict[str, Any]]]] = None,
+                 top_n: Optional[int] = None, concurrency: Optional[int] = None,
+                 item_timeout: float = 30.0, enabled: Optional[bool] = None):
+        self.warm_item = warm_item
+        self.load_items = load_items or load_hot_pairs
+        self.top_n = top_n if top_n is not None else int(os.getenv("WARMUP_TOP_N", "50"))
+        self.concurrency = concurrency or int(os.getenv("WARMUP_CONCURRENCY", "4"))
+        self.item_timeout = item_timeout
+        self.enabled = enabled if enabled is not None else os.getenv("WARMUP_ENABLED", "1") not in ("0", "false")
+        self.progress = WarmupProgress(status="pending" if self.enabled else "disabled")
+        self.logger = logging.getLogger(__name__)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> Optional[asyncio.Task]:
+        """在当前事件循环中启动后台预热"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def run(self) -> WarmupProgress:
+        """加载热点并以有限并发回放"""
+        progress = self.progress
+        progress.status = "running"
+        progress.started_at = datetime.now().isoformat()
+        start = time.perf_counter()
+
+        try:
+            items = await asyncio.to_thread(self.load_items, self.top_n)
+            progress.total = len(items)
+            self.logger.info(f"开始预热 {len(items)} 个热点查询（并发 {self.concurrency}）")
+
+            slots = asyncio.Semaphore(self.concurrency)
+
+            async def warm(item: Dict[str, Any]):
+                async with slots:
+                    try:
+                        await asyncio.wait_for(self.warm_item(item), self.item_timeout)
+                        progress.completed += 1
+                    except Exception as e:
+                        progress.failed += 1
+                        self.logger.debug(f"预热失败 {item.get('question')}: {e}")
+                    progress.elapsed_seconds = round(time.perf_counter() - start, 3)
+
+            await asyncio.gather(*(warm(item) for item in items))
+            progress.status = "completed"
+        except Exception as e:
+            progress.status = "failed"
+            progress.error = str(e)
+            self.logger.warning(f"预热失败: {e}")
+        finally:
+            progress.finished_at = datetime.now().isoformat()
+            progress.elapsed_seconds = round(time.perf_counter() - start, 3)
+
+        self.logger.info(f"预热结束: {progress.completed} 成功，{progress.failed} 失败，"
+                         f"耗时 {progress.elapsed_seconds:.2f}s")
+        return progress
+
+    def get_status(self) -> Dict[str, Any]:
+        """预热进度（/health 就绪检查使用）"""
+        return self.progress.to_dict()
+
+
+def load_hot_pairs(top_n: int) -> List[Dict[str, Any]]:
+    """从审计历史增量导入后取最热的问题/SQL 对"""
+    from flows.audit_analytics import get_audit_analytics
+
+    analytics = get_audit_analytics()
+    if not os.path.isdir(analytics.log_dir):
+        return []
+    analytics.ingest()
+    return analytics.hot_pairs(top_n)
@@ -0,0 +1,390 @@
+"""
+异步工作流任务
+提交后立即返回任务 ID，任务按优先级进入有界队列，由固定数量的工作协程执行；
+状态、进度和结果持久化在本地 SQLite，支持轮询、SSE 进度推送、取消和结果过期清理。
+工作流中的阻塞计算应放入线程或进程池（见 ForecastExecutor），以免占用事件循环
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+import contextvars
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Any, Callable, Awaitable, AsyncIterator
+
+from flows.json_response import dumps
+from flows.metrics import get_metrics_registry
+
+
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = "queued", "running", "completed", "failed", "cancelled"
+FINISHED_STATUSES = (COMPLETED, FAILED, CANCELLED)
+# 数值越小越先执行
+PRIORITIES = {"high": 0, "normal": 5, "low": 9}
+
+# 当前任务的进度回调，工作流内部通过 report_progress 上报
+_current_progress: contextvars.ContextVar[Optional[Callable[[float, str], None]]] = \
+    contextvars.ContextVar("workflow_job_progress", default=None)
+
+
+def report_progress(fraction: float, message: str = ""):
+    """上报当前任务进度（0-1）；不在任务中执行时忽略"""
+    callback = _current_progress.get()
+    if callback is not None:
+        callback(fraction, message)
+
+
+class JobQueueFullError(RuntimeError):
+    """任务队列已满"""
+
+
+@dataclass
+class WorkflowJob:
+    """任务状态"""
+    job_id: str
+    workflow_type: str
+    status: str
+    priority: int
+    input_data: Dict[str, Any]
+    parameters: Dict[str, Any]
+    progress: float = 0.0
+    message: str = ""
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    expires_at: Optional[float] = None
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = asdict(self)
+        if not include_result:
+            data.pop("result")
+        data.pop("input_data")
+        data.pop("parameters")
+        if self.started_at and self.finished_at:
+            data["execution_time"] = round(self.finished_at - self.started_at, 6)
+        return data
+
+
+class JobStore:
+    """SQLite 任务存储（WAL 模式，单连接加锁，可在线程和事件循环中调用）"""
+
+    COLUMNS = ("job_id", "workflow_type", "status", "priority", "input_data", "parameters", "progress",
+               "message", "result", "error", "created_at", "started_at", "finished_at", "expires_at")
+    JSON_COLUMNS = ("input_data", "parameters", "result")
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("WORKFLOW_JOB_DB", "/app/data/workflow_jobs.sqlite")
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.db_path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS workflow_jobs (
+                    job_id TEXT PRIMARY KEY, workflow_type TEXT, status TEXT, priority INTEGER,
+                    input_data TEXT, parameters TEXT, progress REAL, message TEXT, result TEXT, error TEXT,
+                    created_at REAL, started_at REAL, finished_at REAL, expires_at REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_workflow_jobs_status ON workflow_jobs (status)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_workflow_jobs_expires ON workflow_jobs (expires_at)")
+        return self._conn
+
+    def _row(self, row) -> WorkflowJob:
+        values = dict(zip(self.COLUMNS, row))
+        for column in self.JSON_COLUMNS:
+            values[column] = json.loads(values[column]) if values[column] is not None else None
+        return WorkflowJob(**values)
+
+    def save(self, job: WorkflowJob):
+        values = asdict(job)
+        for column in self.JSON_COLUMNS:
+            values[column] = dumps(values[column]).decode("utf-8") if values[column] is not None else None
+        placeholders = ", ".join("?" for _ in self.COLUMNS)
+        with self._lock:
+            self._connection().execute(
+                f"INSERT OR REPLACE INTO workflow_jobs ({', '.join(self.COLUMNS)}) VALUES ({placeholders})",
+                [values[c] for c in self.COLUMNS]
+            )
+
+    def update(self, job_id: str, **fields):
+        """只更新进度等少量字段，避免重写输入与结果"""
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._connection().execute(f"UPDATE workflow_jobs SET {assignments} WHERE job_id = ?",
+                                       [*fields.values(), job_id])
+
+    def get(self, job_id: str) -> Optional[WorkflowJob]:
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM workflow_jobs WHERE job_id = ?", [job_id]
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def by_status(self, *statuses: str) -> List[WorkflowJob]:
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM workflow_jobs WHERE status IN ({placeholders}) "
+                f"ORDER BY priority, created_at", list(statuses)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def delete_expired(self, now: Optional[float] = None) -> int:
+        with self._lock:
+            cursor = self._connection().execute(
+                "DELETE FROM workflow_jobs WHERE expires_at IS NOT NULL AND expires_at < ?", [now or time.time()]
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection().execute("SELECT status, count(*) FROM workflow_jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class WorkflowJobManager:
+    """按优先级调度工作流任务的有界工作池"""
+
+    def __init__(self, runner: Callable[[str, Dict, Dict], Awaitable[Dict[str, Any]]],
+                 store: Optional[JobStore] = None, workers: Optional[int] = None,
+                 max_queue: int = 1000, result_ttl: Optional[float] = None,
+                 cleanup_interval: float = 60.0):
+        self.runner = runner
+        self.store = store or JobStore()
+        self.workers = workers or int(os.getenv("WORKFLOW_JOB_WORKERS", "4"))
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl if result_ttl is not None else float(os.getenv("WORKFLOW_JOB_TTL", "3600"))
+        self.cleanup_interval = cleanup_interval
+        self.logger = logging.getLogger(__name__)
+        self.metrics = get_metrics_registry()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._seq = 0
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """在当前事件循环中启动工作协程；重新排入上次未执行的任务"""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._queue = asyncio.PriorityQueue()
+        for job in await asyncio.to_thread(self.store.by_status, RUNNING):
+            # 执行中途服务重启，结果不可知
+            await self._finish(job, FAILED, error="服务重启，任务中断")
+        for job in await asyncio.to_thread(self.store.by_status, QUEUED):
+            self._enqueue(job)
+        self._tasks = [self._loop.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(self._loop.create_task(self._cleanup()))
+        self.logger.info(f"工作流任务池已启动：{self.workers} 个工作协程，结果保留 {self.result_ttl:.0f}s")
+
+    async def stop(self):
+        for task in self._tasks + list(self._running.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ------------------------------------------------------------------
+    # 提交与查询
+    # ------------------------------------------------------------------
+
+    async def submit(self, workflow_type: str, input_data: Dict[str, Any], parameters: Dict[str, Any],
+                     priority: Any = "normal") -> WorkflowJob:
+        if self._queue.qsize() >= self.max_queue:
+            self.metrics.inc("workflow_jobs_total", workflow_type=workflow_type, status="rejected")
+            raise JobQueueFullError(f"工作流任务队列已满 ({self._queue.qsize()} 个任务等待中)")
+        job = WorkflowJob(
+            job_id=str(uuid.uuid4()),
+            workflow_type=workflow_type,
+            status=QUEUED,
+            priority=PRIORITIES.get(priority, priority) if not isinstance(priority, int) else priority,
+            input_data=input_data or {},
+            parameters=parameters or {},
+            message="排队中",
+            created_at=time.time()
+        )
+        if not isinstance(job.priority, int):
+            raise ValueError(f"未知的优先级: {priority}")
+        await asyncio.to_thread(self.store.save, job)
+        self._enqueue(job)
+        self.metrics.inc("workflow_jobs_total", workflow_type=workflow_type, status="submitted")
+        return job
+
+    def get(self, job_id: str) -> Optional[WorkflowJob]:
+        return self.store.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[WorkflowJob]:
+        """等待任务结束（最多 timeout 秒），返回最新状态"""
+        try:
+            await asyncio.wait_for(self._wait_finished(job_id), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _wait_finished(self, job_id: str):
+        async for event in self.events(job_id):
+            if event["status"] in FINISHED_STATUSES:
+                return
+
+    async def cancel(self, job_id: str) -> Optional[WorkflowJob]:
+        """取消排队或执行中的任务；已结束的任务保持原状态"""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            # 由工作协程在 CancelledError 中落库
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        else:
+            # 仍在队列中，工作协程取到时会跳过
+            await self._finish(job, CANCELLED, message="已取消")
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def events(self, job_id: str, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """任务状态事件流：先给出当前状态，之后每次进度或状态变化推送一次，任务结束后停止
+
+        设置 heartbeat 时，超过该秒数没有变化则产出 None，供调用方发送保活并及时发现断开的客户端
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        try:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None:
+                return
+            event = job.to_dict(include_result=False)
+            while True:
+                yield event
+                if event["status"] in FINISHED_STATUSES:
+                    return
+                while True:
+                    try:
+                        event = await asyncio.wait_for(queue.get(), heartbeat)
+                        break
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            subscribers = self._subscribers.get(job_id, [])
+            if queue in subscribers:
+                subscribers.remove(queue)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": len(self._running),
+            "stored": self.store.counts()
+        }
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    def _enqueue(self, job: WorkflowJob):
+        self._seq += 1
+        self._queue.put_nowait((job.priority, self._seq, job.job_id, job.created_at))
+
+    def _publish(self, job: WorkflowJob):
+        event = job.to_dict(include_result=False)
+        for queue in self._subscribers.get(job.job_id, []):
+            queue.put_nowait(event)
+
+    async def _worker(self, index: int):
+        while True:
+            _, _, job_id, created_at = await self._queue.get()
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None or job.status != QUEUED:
+                continue
+            task = asyncio.current_task()
+            self.metrics.observe("workflow_job_queue_seconds", time.time() - created_at,
+                                 workflow_type=job.workflow_type)
+            job.status, job.started_at, job.message = RUNNING, time.time(), "执行中"
+            await asyncio.to_thread(self.store.update, job_id, status=RUNNING, started_at=job.started_at,
+                                    message=job.message)
+            self._publish(job)
+
+            run = self._loop.create_task(self._run(job))
+            self._running[job_id] = run
+            try:
+                await asyncio.shield(run)
+            except asyncio.CancelledError:
+                if task.cancelling():
+                    # 任务池停止
+                    run.cancel()
+                    raise
+            finally:
+                self._running.pop(job_id, None)
+
+    async def _run(self, job: WorkflowJob):
+        def progress(fraction: float, message: str = ""):
+            job.progress = max(0.0, min(1.0, float(fraction)))
+            job.message = message or job.message
+            self.store.update(job.job_id, progress=job.progress, message=job.message)
+            # 工作流可能在 asyncio.to_thread 的线程中上报进度
+            if threading.get_ident() == self._loop_thread:
+                self._publish(job)
+            else:
+                self._loop.call_soon_threadsafe(self._publish, job)
+
+        _current_progress.set(progress)
+        try:
+            result = await self.runner(job.workflow_type, job.input_data, job.parameters)
+        except asyncio.CancelledError:
+            await self._finish(job, CANCELLED, message="已取消")
+            return
+        except Exception as e:
+            self.logger.error(f"工作流任务执行失败 {job.job_id}: {e}")
+            await self._finish(job, FAILED, error=str(e))
+            return
+        await self._finish(job, COMPLETED, result=result)
+
+    async def _finish(self, job: WorkflowJob, status: str, result: Optional[Dict] = None,
+                      error: Optional[str] = None, message: Optional[str] = None):
+        job.status = status
+        job.finished_at = time.time()
+        job.expires_at = job.finished_at + self.result_ttl
+        job.result, job.error = result, error
+        job.message = message or {COMPLETED: "已完成", FAILED: "执行失败"}.get(status, job.message)
+        if status == COMPLETED:
+            job.progress = 1.0
+        await asyncio.to_thread(self.store.save, job)
+        self.metrics.inc("workflow_jobs_total", workflow_type=job.workflow_type, status=status)
+        self._publish(job)
+
+    async def _cleanup(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                removed = await asyncio.to_thread(self.store.delete_expired)
+                if removed:
+                    self.logger.info(f"清理过期工作流任务 {removed} 个")
+            except Exception as e:
+                self.logger.error(f"工作流任务清理失败: {e}")
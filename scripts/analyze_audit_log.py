@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+查询审计日志分析
+增量导入审计日志分段到 DuckDB，输出最热问题、最慢 SQL 以及缓存预热、模板固化和预聚合建议
+"""
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.audit_analytics import AuditAnalytics
+
+
+def shorten(text, width: int = 60) -> str:
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询审计日志热点分析")
+    parser.add_argument("--log-dir", help="审计日志目录（默认 AUDIT_LOG_DIR 或 /app/logs）")
+    parser.add_argument("--db", help="分析库路径（默认 AUDIT_DB_PATH 或 /app/data/audit_analytics.duckdb）")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--since-days", type=int, help="只统计最近 N 天")
+    parser.add_argument("--min-support", type=int, default=5, help="生成建议所需的最少查询次数")
+    parser.add_argument("--threshold", type=float, default=0.8, help="问题聚类的余弦相似度阈值")
+    parser.add_argument("--output", help="报告 JSON 输出路径")
+    args = parser.parse_args()
+
+    analytics = AuditAnalytics(db_path=args.db, log_dir=args.log_dir, similarity_threshold=args.threshold)
+    report = analytics.report(top=args.top, since_days=args.since_days, min_support=args.min_support)
+    analytics.close()
+
+    ingest, summary = report["ingest"], report["summary"]
+    print(f"📥 扫描 {ingest['files_scanned']} 个文件，新增 {ingest['rows_ingested']} 条记录（{ingest['seconds']:.2f}s）")
+    print(f"📊 共 {summary['queries']} 次查询，{summary['distinct_questions']} 种问题，{report['clusters']} 个问题簇，"
+          f"成功率 {(summary['success_rate'] or 0) * 100:.1f}%，P95 {summary['p95_seconds'] or 0:.3f}s")
+
+    print(f"\n🔥 最热问题 Top {args.top}")
+    print(f"{'次数':>6}{'用户':>6}{'成功率':>8}{'P95s':>8}  问题")
+    for row in report["hot_questions"]:
+        print(f"{row['queries']:>6}{row['users']:>6}{(row['success_rate'] or 0) * 100:>7.0f}%"
+              f"{row['p95_seconds'] or 0:>8.3f}  {shorten(row['question'])}")
+
+    print(f"\n🐢 累计耗时最长的 SQL Top {args.top}")
+    print(f"{'次数':>6}{'累计s':>10}{'P95s':>8}  SQL 指纹")
+    for row in report["slow_queries"]:
+        print(f"{row['queries']:>6}{row['total_seconds'] or 0:>10.2f}{row['p95_seconds'] or 0:>8.3f}"
+              f"  {shorten(row['sql_fingerprint'], 80)}")
+
+    recommendations = report["recommendations"]
+    print(f"\n💡 建议")
+    print(f"  缓存预热: {len(recommendations['cache_prewarm'])} 个问题/SQL 对")
+    for item in recommendations["template_promotion"]:
+        print(f"  模板固化: {shorten(item['question'], 30)} → {shorten(item['sql_template'], 60)}"
+              f"（{item['support']} 次，主导 SQL 占比 {item['dominant_sql_share'] * 100:.0f}%）")
+    for item in recommendations["rollups"]:
+        print(f"  预聚合: {item['suggestion']}（{item['queries']} 次，累计 {item['total_seconds']:.1f}s）")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+        print(f"\n✅ 报告已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
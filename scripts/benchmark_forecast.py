@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+预测后端精度基准
+在生成的 30 天测试数据上做滚动起点回测，比较 linear / damped_trend / holt_winters
+（以及可选的 Prophet）的 sMAPE、区间覆盖率和拟合耗时，用于校准自动选择阈值
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.native_forecast import (
+    HoltWintersForecaster, linear_forecast, select_backend, NATIVE_BACKENDS
+)
+
+
+def load_series(csv_path: str, value_column: str) -> Dict[str, np.ndarray]:
+    """按 SKU 读取日序列"""
+    df = pd.read_csv(csv_path, encoding='utf-8-sig')
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.sort_values(['sku', 'date'])
+    return {str(sku): g[value_column].to_numpy(dtype=float) for sku, g in df.groupby('sku')}
+
+
+def run_backend(backend: str, history: np.ndarray, horizon: int) -> Dict[str, np.ndarray]:
+    """运行单个后端"""
+    if backend == "linear":
+        return linear_forecast(history, horizon)
+    if backend == "damped_trend":
+        return HoltWintersForecaster(season_length=None).forecast(history, horizon)
+    if backend == "holt_winters":
+        return HoltWintersForecaster(season_length=7).forecast(history, horizon)
+    if backend == "prophet":
+        from prophet import Prophet
+        dates = pd.date_range("2025-01-01", periods=len(history))
+        model = Prophet(weekly_seasonality=True, yearly_seasonality=False, daily_seasonality=False)
+        model.fit(pd.DataFrame({"ds": dates, "y": history}))
+        forecast = model.predict(model.make_future_dataframe(periods=horizon)).iloc[-horizon:]
+        return {
+            "mean": forecast['yhat'].to_numpy(),
+            "lower": forecast['yhat_lower'].to_numpy(),
+            "upper": forecast['yhat_upper'].to_numpy()
+        }
+    raise ValueError(f"未知后端: {backend}")
+
+
+def smape(actual: np.ndarray, predicted: np.ndarray) -> float:
+    denom = np.abs(actual) + np.abs(predicted)
+    return float(np.mean(np.where(denom > 0, 2 * np.abs(actual - predicted) / denom, 0.0)) * 100)
+
+
+def backtest(series: Dict[str, np.ndarray], backends: List[str], horizon: int,
+             min_train: int) -> Dict[str, Dict[int, Dict[str, float]]]:
+    """滚动起点回测，按训练长度汇总"""
+    results: Dict[str, Dict[int, Dict[str, List[float]]]] = {b: {} for b in backends}
+
+    for values in series.values():
+        for train_len in range(min_train, len(values) - horizon + 1):
+            history = values[:train_len]
+            actual = values[train_len:train_len + horizon]
+            for backend in backends:
+                start = time.perf_counter()
+                forecast = run_backend(backend, history, horizon)
+                elapsed = (time.perf_counter() - start) * 1000
+                bucket = results[backend].setdefault(train_len, {"smape": [], "coverage": [], "fit_ms": []})
+                bucket["smape"].append(smape(actual, forecast["mean"]))
+                bucket["coverage"].append(float(np.mean(
+                    (actual >= forecast["lower"]) & (actual <= forecast["upper"])
+                )))
+                bucket["fit_ms"].append(elapsed)
+
+    return {
+        backend: {
+            train_len: {name: float(np.mean(vals)) for name, vals in bucket.items()}
+            for train_len, bucket in by_len.items()
+        }
+        for backend, by_len in results.items()
+    }
+
+
+def summarize(report: Dict[str, Dict[int, Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+    """跨训练长度汇总"""
+    summary = {}
+    for backend, by_len in report.items():
+        rows = list(by_len.values())
+        summary[backend] = {
+            name: float(np.mean([r[name] for r in rows])) for name in ("smape", "coverage", "fit_ms")
+        }
+    return summary
+
+
+def main():
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="预测后端精度基准")
+    parser.add_argument("--csv", default=os.path.join(project_dir, "data", "csv", "douyin_test_data_30days.csv"))
+    parser.add_argument("--value-column", default="daily_sales")
+    parser.add_argument("--horizon", type=int, default=7)
+    parser.add_argument("--min-train", type=int, default=7)
+    parser.add_argument("--with-prophet", action="store_true", help="同时评估 Prophet（较慢）")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    series = load_series(args.csv, args.value_column)
+    backends = list(NATIVE_BACKENDS) + (["prophet"] if args.with_prophet else [])
+
+    print(f"📊 回测 {len(series)} 条序列，预测步长 {args.horizon}，后端: {', '.join(backends)}")
+    report = backtest(series, backends, args.horizon, args.min_train)
+    summary = summarize(report)
+
+    print(f"\n{'后端':<14}{'sMAPE%':>10}{'覆盖率':>10}{'耗时ms':>10}")
+    for backend, row in summary.items():
+        print(f"{backend:<14}{row['smape']:>10.2f}{row['coverage']:>10.2f}{row['fit_ms']:>10.2f}")
+
+    print(f"\n📏 按训练长度的最优后端（自动选择结果）:")
+    lengths = sorted(next(iter(report.values())).keys())
+    for train_len in lengths:
+        # 精度相同时优先更简单的后端（n < 14 时 holt_winters 退化为阻尼趋势）
+        best = min(reversed(backends), key=lambda b: report[b][train_len]["smape"])
+        print(f"  n={train_len:>3}: 最优 {best:<14} 自动选择 {select_backend(train_len)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "by_train_length": report}, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ 结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+简化 HTTP 服务器吞吐基准
+在本地临时端口分别启动当前工作区和基线版本（--baseline-ref，git 引用）的 complete_dbgpt_app.py，
+以闭环方式（每个客户端收到响应后立即发送下一个请求）按不同并发数测量 requests/s 与延迟分位。
+FastAPI 未安装时服务以简化 HTTP 服务器模式运行，即本基准的测量对象
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.metrics import LatencyHistogram
+from scripts.load_test import (
+    PROJECT_DIR, DEFAULT_MIX, ConnectionPool, Workload, parse_mix, synthetic_pools, spawn_server
+)
+
+
+async def closed_loop(url_port: int, workload: Workload, concurrency: int, duration: float,
+                      timeout: float) -> Dict[str, Any]:
+    """concurrency 个客户端各自串行发送请求 duration 秒"""
+    pool = ConnectionPool("127.0.0.1", url_port, concurrency)
+    histogram = LatencyHistogram()
+    errors = 0
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+
+    async def client():
+        nonlocal errors
+        while loop.time() < deadline:
+            item = workload.next()
+            body = json.dumps(item.body, ensure_ascii=False).encode("utf-8")
+            start = loop.time()
+            try:
+                status, _ = await asyncio.wait_for(pool.request(item.method, item.path, body), timeout)
+                failed = status >= 400
+            except Exception:
+                failed = True
+            histogram.record(loop.time() - start)
+            errors += failed
+
+    start = loop.time()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = loop.time() - start
+    pool.close()
+    return {
+        "concurrency": concurrency,
+        "requests": histogram.count,
+        "errors": errors,
+        "requests_per_second": round((histogram.count - errors) / elapsed, 1),
+        "p50_ms": round(histogram.percentile(50) * 1000, 2),
+        "p99_ms": round(histogram.percentile(99) * 1000, 2),
+        "connections_opened": pool.opened
+    }
+
+
+def export_ref(ref: str, directory: str):
+    """把 git 引用的源码树导出到 directory"""
+    archive = subprocess.run(["git", "-C", PROJECT_DIR, "archive", ref], check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+
+
+def bench_server(label: str, project_dir: str, args) -> List[Dict[str, Any]]:
+    workdir = tempfile.mkdtemp(prefix=f"dbgpt_http_{label}_")
+    process, url = spawn_server(workdir, project_dir=project_dir)
+    port = int(url.rsplit(":", 1)[1])
+    rows = []
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+            workload = Workload(synthetic_pools(), parse_mix(args.mix), args.seed)
+            asyncio.run(closed_loop(port, workload, concurrency, args.warmup, args.timeout))
+            row = asyncio.run(closed_loop(port, workload, concurrency, args.duration, args.timeout))
+            rows.append(row)
+            print(f"  {label:<10}并发 {concurrency:>4}: {row['requests_per_second']:>9,.1f} req/s，"
+                  f"P50 {row['p50_ms']:.1f}ms，P99 {row['p99_ms']:.1f}ms，错误 {row['errors']}，"
+                  f"连接 {row['connections_opened']}")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="简化 HTTP 服务器吞吐基准")
+    parser.add_argument("--baseline-ref", help="对比的 git 引用（如改动前的提交），不提供时只测当前工作区")
+    parser.add_argument("--concurrency", default="1,8,32,64", help="客户端并发数，逗号分隔")
+    parser.add_argument("--duration", type=float, default=5.0, help="每档测量时长（秒）")
+    parser.add_argument("--warmup", type=float, default=1.0, help="每档预热时长（秒）")
+    parser.add_argument("--timeout", type=float, default=10.0, help="单请求超时（秒）")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="请求类型权重")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="http_server_benchmark.json")
+    args = parser.parse_args()
+
+    results = {"generated_at": datetime.now().isoformat(), "config": vars(args), "servers": {}}
+    print(f"🏁 HTTP 服务器基准：并发 {args.concurrency}，每档 {args.duration:.0f}s")
+    results["servers"]["current"] = bench_server("current", PROJECT_DIR, args)
+
+    if args.baseline_ref:
+        with tempfile.TemporaryDirectory(prefix="dbgpt_baseline_") as directory:
+            export_ref(args.baseline_ref, directory)
+            results["servers"]["baseline"] = bench_server("baseline", directory, args)
+
+        print(f"\n{'并发':>6}{'基线 req/s':>14}{'当前 req/s':>14}{'倍数':>8}{'基线P99ms':>12}{'当前P99ms':>12}")
+        for base, current in zip(results["servers"]["baseline"], results["servers"]["current"]):
+            ratio = current["requests_per_second"] / max(base["requests_per_second"], 1e-9)
+            print(f"{current['concurrency']:>6}{base['requests_per_second']:>14,.1f}"
+                  f"{current['requests_per_second']:>14,.1f}{ratio:>7.1f}x"
+                  f"{base['p99_ms']:>12.1f}{current['p99_ms']:>12.1f}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ 结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
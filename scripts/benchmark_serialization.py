@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+响应序列化基准
+对典型结果形态（10k / 100 行查询结果、嵌套工作流结果、numpy 趋势序列）比较
+现状（标准库 json，indent=2）、标准库紧凑输出、orjson 以及 gzip / zstd 压缩的耗时与体积，
+并给出同规模 DuckDB 查询取数耗时作为参照
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.json_response import ORJSON_AVAILABLE, ZSTD_AVAILABLE, compress, dumps, json_default
+
+RESULT_SQL = """
+    SELECT i AS id,
+           'SKU' || lpad(i::VARCHAR, 8, '0') AS sku,
+           '抖音爆款商品 ' || (i % 997)::VARCHAR AS title,
+           round(10 + (i % 500) * 1.7, 2)::DECIMAL(10, 2) AS price,
+           (i * 37) % 5000 AS sales_volume,
+           round(((i * 37) % 5000) * (10 + (i % 500) * 1.7), 2) AS sales_amount,
+           DATE '2025-01-01' + (i % 180)::INTEGER AS created_date,
+           TIMESTAMP '2025-01-01 08:00:00' + to_seconds(i) AS updated_at
+    FROM range(?) t(i)
+"""
+
+
+def query_rows(rows: int) -> List[Dict[str, Any]]:
+    import duckdb
+
+    cursor = duckdb.connect().execute(RESULT_SQL, [rows])
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def query_result(rows: int) -> Dict[str, Any]:
+    data = query_rows(rows)
+    return {"data": data, "columns": list(data[0]), "row_count": len(data), "execution_time": 0.012}
+
+
+def workflow_result() -> Dict[str, Any]:
+    points = [{"date": f"2025-{1 + d // 28:02d}-{1 + d % 28:02d}", "value": 15000 + d * 37.5,
+               "growth": round((d % 13 - 6) * 1.7, 1)} for d in range(365)]
+    return {
+        "workflow_id": "7f1c3c9a-1d1e-4a43-9b73-3f7a1c2d9e10",
+        "status": "completed",
+        "result": {
+            "trend_type": "sales_trend",
+            "period": "daily",
+            "data_points": points,
+            "insights": ["销售数据呈上升趋势", "周末销售额较高", "预测下周将继续增长"],
+            "statistics": {"total_growth": 66.7, "avg_daily_growth": 15.1, "volatility": "中等"}
+        },
+        "execution_time": 0.034
+    }
+
+
+def numpy_series(points: int) -> Dict[str, Any]:
+    rng = np.random.default_rng(42)
+    values = np.cumsum(rng.normal(100, 20, points))
+    return {
+        "sku": "3737962838157820139",
+        "values": values,
+        "trend": np.convolve(values, np.ones(7) / 7, mode="same"),
+        "anomaly_index": np.flatnonzero(rng.random(points) < 0.01),
+        "z_scores": rng.normal(0, 1, points).astype(np.float32),
+        "mean": np.float64(values.mean()),
+        "points": np.int64(points)
+    }
+
+
+def stdlib_indent(data: Any) -> bytes:
+    """现状：标准库 json 缩进输出（补上同样的类型转换，否则 Decimal / numpy 无法序列化）"""
+    return json.dumps(data, ensure_ascii=False, indent=2, default=json_default).encode("utf-8")
+
+
+def stdlib_compact(data: Any) -> bytes:
+    """orjson 不可用时的回退路径"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=json_default).encode("utf-8")
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> float:
+    """多次运行取中位数（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    "json indent=2（现状）": stdlib_indent,
+    "json 紧凑": stdlib_compact
+}
+if ORJSON_AVAILABLE:
+    ENCODERS["orjson"] = dumps
+
+
+def bench_shape(name: str, data: Any, repeat: int) -> List[Dict[str, Any]]:
+    rows = []
+    for label, encoder in ENCODERS.items():
+        body = encoder(data)
+        rows.append({"shape": name, "encoder": label, "ms": round(timed(lambda: encoder(data), repeat), 3),
+                     "bytes": len(body)})
+
+    # 压缩在实际采用的序列化结果上测量
+    body = dumps(data)
+    for encoding in ("gzip", "zstd") if ZSTD_AVAILABLE else ("gzip",):
+        rows.append({"shape": name, "encoder": f"+{encoding}",
+                     "ms": round(timed(lambda: compress(body, encoding), repeat), 3),
+                     "bytes": len(compress(body, encoding))})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应序列化基准")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=10000, help="大查询结果行数")
+    parser.add_argument("--output", default="serialization_benchmark.json")
+    args = parser.parse_args()
+
+    duckdb_ms = timed(lambda: query_rows(args.rows), max(3, args.repeat // 4))
+    shapes = {
+        f"query_{args.rows}_rows": query_result(args.rows),
+        "query_100_rows": query_result(100),
+        "workflow_trend_365": workflow_result(),
+        "numpy_series_10k": numpy_series(10000)
+    }
+
+    print(f"🏁 序列化基准：orjson {'可用' if ORJSON_AVAILABLE else '不可用'}，"
+          f"zstd {'可用' if ZSTD_AVAILABLE else '不可用'}，重复 {args.repeat} 次取中位数")
+    print(f"🦆 DuckDB 查询并取出 {args.rows:,} 行: {duckdb_ms:.1f}ms")
+    rows = []
+    for name, data in shapes.items():
+        rows.extend(bench_shape(name, data, args.repeat))
+
+    print(f"\n{'形态':<22}{'编码':<22}{'耗时ms':>10}{'字节':>12}")
+    for row in rows:
+        print(f"{row['shape']:<22}{row['encoder']:<22}{row['ms']:>10.2f}{row['bytes']:>12,}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"generated_at": datetime.now().isoformat(), "duckdb_fetch_ms": round(duckdb_ms, 3),
+                   "orjson": ORJSON_AVAILABLE, "zstd": ZSTD_AVAILABLE, "rows": rows}, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ 结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
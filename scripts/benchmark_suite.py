@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+NL2SQL 与分析热路径基准套件
+用 generate_test_data.py 的生成器生成固定种子的 1× / 100× / 10000× 数据集，
+使用确定性的假 LLM 与嵌入后端，测量 NL2SQL 吞吐、SQL 验证 ops/s、analyze_data.sql 各查询延迟、
+导入 rows/s 和趋势批处理耗时；结果保存为 JSON，并可与基线比较发现回归
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import types
+import asyncio
+import argparse
+import platform
+import subprocess
+import tempfile
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_test_data import GeneratorConfig, TEXT_COLUMNS, iter_chunks
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANALYZE_SQL = os.path.join(PROJECT_DIR, "scripts", "analyze_data.sql")
+
+# 数据集版本：生成逻辑变化时递增，使缓存的数据集失效
+DATASET_VERSION = 2
+BASE_SKUS = 5
+DAYS = 30
+BASE_DATE = "2025-06-01"
+
+# NL2SQL 基准使用的固定问题集；标记 needs_fix 的问题首次生成的 SQL 不合法，用于覆盖自动修复路径
+QUESTIONS = [
+    {"question": "销量前10的商品", "sql": "SELECT title, sales_volume FROM douyin_products ORDER BY sales_volume DESC LIMIT 10"},
+    {"question": "各类目销售额", "sql": "SELECT category, SUM(sales_amount) AS total FROM douyin_products GROUP BY category ORDER BY total DESC"},
+    {"question": "每日销售趋势", "sql": "SELECT created_date, SUM(sales_amount) AS daily_sales FROM douyin_products GROUP BY created_date ORDER BY created_date"},
+    {"question": "品牌销售排行", "sql": "SELECT brand, SUM(sales_amount) AS brand_sales FROM douyin_products GROUP BY brand ORDER BY brand_sales DESC"},
+    {"question": "主播带货排行", "sql": "SELECT anchor_name, SUM(sales_volume) AS volume FROM douyin_products GROUP BY anchor_name ORDER BY volume DESC"},
+    {"question": "删除过期商品", "sql": "DELETE FROM douyin_products WHERE created_date < DATE '2025-06-02'", "needs_fix": True,
+     "fixed_sql": "SELECT COUNT(*) AS expired FROM douyin_products WHERE created_date < DATE '2025-06-02'"},
+]
+
+
+@dataclass
+class Measurement:
+    """单项测量结果"""
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool = False
+
+
+# ----------------------------------------------------------------------
+# 数据集
+# ----------------------------------------------------------------------
+
+def build_sales_frames(scale: int, seed: int, days: int = DAYS) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """用 generate_test_data 的生成器得到销售明细（douyin_sales_detail），并派生商品日表（douyin_products）"""
+    config = GeneratorConfig(skus=BASE_SKUS * scale, days=days, seed=seed, start_date=BASE_DATE)
+    detail = pd.concat(iter_chunks(config, workers=1), ignore_index=True)
+    # 各分片的分类编码取值不同，统一为普通字符串列
+    for column in TEXT_COLUMNS + ("date",):
+        detail[column] = detail[column].astype(str)
+
+    # 商品日表沿用 config/init_database.sql 的结构，供 analyze_data.sql 查询
+    rng = np.random.default_rng(seed)
+    rows = len(detail)
+    row_dates = pd.to_datetime(detail["date"]).to_numpy()
+    start_time = row_dates + pd.to_timedelta(rng.integers(18, 22, rows), unit="h").to_numpy()
+    products = pd.DataFrame({
+        "id": np.arange(rows, dtype=np.int64) + 1,
+        "product_id": detail["sku"],
+        "title": detail["product_name"],
+        "price": detail["avg_price"],
+        "sales_volume": detail["daily_sales"],
+        "sales_amount": detail["daily_revenue"],
+        "shop_name": detail["brand"] + "旗舰店",
+        "category": detail["category"],
+        "brand": detail["brand"],
+        "rating": np.round(rng.uniform(4.0, 5.0, rows), 2),
+        "comments_count": (detail["daily_sales"].to_numpy() * rng.uniform(0.1, 0.5, rows)).astype(int),
+        "live_room_title": detail["anchor_name"] + "的直播间",
+        "anchor_name": detail["anchor_name"],
+        "start_time": start_time,
+        "end_time": start_time + np.timedelta64(2, "h"),
+        "created_date": row_dates,
+        "updated_date": row_dates
+    })
+    return detail, products
+
+
+def prepare_dataset(workdir: str, scale: int, seed: int) -> Dict[str, str]:
+    """生成并缓存数据集（DuckDB 库 + CSV），同一版本与种子只生成一次"""
+    import duckdb
+
+    stem = os.path.join(workdir, f"sales_v{DATASET_VERSION}_x{scale}_s{seed}")
+    paths = {"db": stem + ".duckdb", "csv": stem + ".csv"}
+    if all(os.path.exists(p) for p in paths.values()):
+        return paths
+
+    os.makedirs(workdir, exist_ok=True)
+    detail, products = build_sales_frames(scale, seed)
+    detail.to_csv(paths["csv"], index=False)
+
+    tmp_db = paths["db"] + ".tmp"
+    if os.path.exists(tmp_db):
+        os.remove(tmp_db)
+    conn = duckdb.connect(tmp_db)
+    conn.register("detail_df", detail)
+    conn.register("products_df", products)
+    conn.execute("CREATE TABLE douyin_sales_detail AS SELECT * REPLACE (CAST(date AS DATE) AS date) FROM detail_df")
+    conn.execute("""
+        CREATE TABLE douyin_products AS
+        SELECT * REPLACE (CAST(price AS DECIMAL(10,2)) AS price, CAST(sales_amount AS DECIMAL(15,2)) AS sales_amount,
+                          CAST(rating AS DECIMAL(3,2)) AS rating, CAST(created_date AS DATE) AS created_date)
+        FROM products_df
+    """)
+    conn.execute("""
+        CREATE VIEW sales_summary AS
+        SELECT category, COUNT(*) as product_count, SUM(sales_volume) as total_sales_volume,
+               SUM(sales_amount) as total_sales_amount, AVG(price) as avg_price, AVG(rating) as avg_rating
+        FROM douyin_products GROUP BY category
+    """)
+    conn.close()
+    os.replace(tmp_db, paths["db"])
+    return paths
+
+
+def load_analyze_queries(path: str, anchor_date: str) -> List[Tuple[str, str]]:
+    """读取 analyze_data.sql：按编号注释命名，去掉 CLI 指令；SQLite 风格的 DATE('now', ...) 固定到数据集最后一天"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    queries, name = [], None
+    for statement in text.split(";"):
+        lines = []
+        for line in statement.splitlines():
+            stripped = line.strip()
+            match = re.match(r"--\s*(\d+)\.\s*(.+)", stripped)
+            if match:
+                name = f"q{int(match.group(1)):02d}_{match.group(2).strip()}"
+            elif stripped and not stripped.startswith(("--", ".")):
+                lines.append(line)
+        sql = "\n".join(lines).strip()
+        if sql and name:
+            sql = re.sub(r"DATE\('now',\s*'(-?\d+) days'\)", rf"(DATE '{anchor_date}' + INTERVAL (\1) DAY)", sql)
+            queries.append((name, sql))
+    return queries
+
+
+# ----------------------------------------------------------------------
+# 测量工具
+# ----------------------------------------------------------------------
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1) -> np.ndarray:
+    """重复执行并返回每次耗时（秒）"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return np.array(samples)
+
+
+def latency_measurements(prefix: str, samples: np.ndarray) -> List[Measurement]:
+    return [
+        Measurement(f"{prefix}.p50_ms", round(float(np.percentile(samples, 50)) * 1000, 3), "ms"),
+        Measurement(f"{prefix}.p95_ms", round(float(np.percentile(samples, 95)) * 1000, 3), "ms"),
+    ]
+
+
+def throughput(name: str, operations: int, seconds: float, unit: str = "ops/s") -> Measurement:
+    return Measurement(name, round(operations / seconds, 2) if seconds > 0 else 0.0, unit, higher_is_better=True)
+
+
+# ----------------------------------------------------------------------
+# 确定性的假后端
+# ----------------------------------------------------------------------
+
+class FakeLLMClient:
+    """按问题返回固定 SQL；修复提示返回修复后的 SQL；token 用量按字符数确定性计算"""
+
+    def __init__(self, questions: List[Dict] = QUESTIONS):
+        self.questions = questions
+
+    async def agenerate(self, prompt: str):
+        is_fix = "请修复" in prompt
+        text = "SELECT 1"
+        for item in self.questions:
+            if item["question"] in prompt or item["sql"] in prompt:
+                text = item.get("fixed_sql", item["sql"]) if is_fix else item["sql"]
+                break
+        return types.SimpleNamespace(
+            text=f"```sql\n{text}\n```",
+            usage={"prompt_tokens": len(prompt) // 2, "completion_tokens": len(text) // 2}
+        )
+
+
+class FakeEmbeddingClient:
+    """字符 n-gram 哈希向量"""
+
+    def __init__(self):
+        from flows.audit_analytics import HashedNgramEmbedder
+        self.embedder = HashedNgramEmbedder(dims=256)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embedder([text])[0].tolist()
+
+
+class FakeWeaviateClient:
+    """总是返回 douyin_products 的表结构"""
+
+    def __init__(self):
+        columns = [{"name": n, "type": t} for n, t in [
+            ("title", "VARCHAR"), ("category", "VARCHAR"), ("brand", "VARCHAR"), ("anchor_name", "VARCHAR"),
+            ("sales_volume", "INTEGER"), ("sales_amount", "DECIMAL"), ("created_date", "DATE")
+        ]]
+        self._result = {"data": {"Get": {"TableSchema": [{
+            "table_name": "douyin_products", "table_comment": "商品日表", "business_description": "抖音商品日销售",
+            "columns_info": json.dumps(columns, ensure_ascii=False), "common_queries": ""
+        }]}}}
+        self.query = self
+
+    def get(self, *args):
+        return self
+
+    def with_near_vector(self, *args):
+        return self
+
+    def with_limit(self, *args):
+        return self
+
+    def do(self):
+        return self._result
+
+
+class DuckDBConnectorManager:
+    """以 DuckDB 只读连接模拟数据源管理器"""
+
+    def __init__(self, db_path: str):
+        import duckdb
+        self.conn = duckdb.connect(db_path, read_only=True)
+
+    def get_connector(self, database: str):
+        return self
+
+    async def aquery(self, sql: str):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql)
+            columns = [d[0] for d in cursor.description]
+            return types.SimpleNamespace(data=cursor.fetchall(), columns=columns)
+        finally:
+            cursor.close()
+
+
+# ----------------------------------------------------------------------
+# 基准项
+# ----------------------------------------------------------------------
+
+def bench_queries(paths: Dict[str, str], scale: int, repeat: int) -> List[Measurement]:
+    """analyze_data.sql 中每条查询的延迟"""
+    import duckdb
+
+    conn = duckdb.connect(paths["db"], read_only=True)
+    anchor = str(conn.execute("SELECT MAX(created_date) FROM douyin_products").fetchone()[0])
+    results = []
+    for name, sql in load_analyze_queries(ANALYZE_SQL, anchor):
+        samples = measure(lambda: conn.execute(sql).fetchall(), repeat)
+        results.extend(latency_measurements(f"query[x{scale}].{name}", samples))
+    conn.close()
+    return results
+
+
+def bench_ingest(paths: Dict[str, str], scale: int, repeat: int) -> List[Measurement]:
+    """CSV 导入 DuckDB（与 import_test_data.sh 相同的 read_csv_auto 路径）"""
+    import duckdb
+
+    rows = BASE_SKUS * scale * DAYS
+    csv_path = paths["csv"].replace("'", "''")
+
+    def ingest():
+        conn = duckdb.connect()
+        conn.execute(f"CREATE TABLE douyin_sales_detail AS SELECT * FROM read_csv_auto('{csv_path}')")
+        conn.close()
+
+    samples = measure(ingest, repeat)
+    return [throughput(f"ingest[x{scale}].rows_per_sec", rows, float(samples.min()), "rows/s")]
+
+
+def bench_trend_batch(paths: Dict[str, str], scale: int, repeat: int) -> List[Measurement]:
+    """全部 SKU 的批量 Holt-Winters 预测 + 变点检测（TrendDetector 的原生计算路径）"""
+    import duckdb
+    from flows.native_forecast import HoltWintersForecaster
+    from flows.changepoint_detection import ChangepointDetector
+
+    conn = duckdb.connect(paths["db"], read_only=True)
+    df = conn.execute("SELECT sku, date, daily_sales FROM douyin_sales_detail ORDER BY sku, date").df()
+    conn.close()
+    values = df["daily_sales"].to_numpy(dtype=float).reshape(-1, DAYS)
+    forecaster = HoltWintersForecaster(season_length=7, damped=True)
+    detector = ChangepointDetector()
+
+    def run():
+        forecaster.forecast_batch(values, 7, 0.95)
+        detector.detect_frame(df, date_column="date", value_column="daily_sales", series_column="sku")
+
+    samples = measure(run, repeat)
+    return latency_measurements(f"trend_batch[x{scale}]", samples) + [
+        throughput(f"trend_batch[x{scale}].series_per_sec", values.shape[0], float(np.median(samples)), "series/s")
+    ]
+
+
+def bench_nl2sql_engine(iterations: int) -> List[Measurement]:
+    """服务内置的规则 NL2SQL 引擎：未命中缓存与命中缓存两条路径"""
+    from complete_dbgpt_app import NL2SQLEngine, DatabaseManager
+
+    engine = NL2SQLEngine(DatabaseManager())
+    # 问题带序号，首轮全部未命中缓存，第二轮全部命中
+    questions = [f"{QUESTIONS[i % len(QUESTIONS)]['question']} {i}" for i in range(iterations)]
+    start = time.perf_counter()
+    for question in questions:
+        engine.convert(question)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for question in questions:
+        engine.convert(question)
+    warm = time.perf_counter() - start
+    return [
+        throughput("nl2sql_engine.uncached_ops_per_sec", len(questions), cold),
+        throughput("nl2sql_engine.cached_ops_per_sec", len(questions), warm),
+    ]
+
+
+def bench_validator(iterations: int) -> List[Measurement]:
+    """SQLValidator 每秒验证次数（合法与非法 SQL 混合）"""
+    from flows.nl2sql_pipeline import SQLValidator
+
+    validator = SQLValidator()
+    corpus = [item["sql"] for item in QUESTIONS]
+
+    async def run():
+        for i in range(iterations):
+            await validator.validate_sql(corpus[i % len(corpus)], "benchmark")
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return [throughput("validator.ops_per_sec", iterations, time.perf_counter() - start)]
+
+
+def bench_nl2sql_pipeline(paths: Dict[str, str], scale: int, iterations: int) -> List[Measurement]:
+    """NL2SQL 管道端到端（假 LLM / 嵌入 / 向量库，真实验证与 DuckDB 执行），关闭缓存以测量完整路径"""
+    from flows.nl2sql_pipeline import NL2SQLPipeline, NL2SQLRequest
+
+    pipeline = NL2SQLPipeline()
+    connector_manager = DuckDBConnectorManager(paths["db"])
+    pipeline._get_llm_client = FakeLLMClient
+    pipeline._get_embedding_client = FakeEmbeddingClient
+    pipeline._get_weaviate_client = FakeWeaviateClient
+    pipeline._get_connector_manager = lambda: connector_manager
+
+    async def handle(question: str, i: int) -> Dict:
+        # 每次使用独立会话，避免会话上下文进入提示词
+        request = NL2SQLRequest(question=question, user_id="bench", session_id=f"bench-{i}",
+                                database="benchmark", enable_cache=False)
+        return await pipeline.run(request)
+
+    async def run() -> np.ndarray:
+        samples = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            await handle(QUESTIONS[i % len(QUESTIONS)]["question"], i)
+            samples.append(time.perf_counter() - start)
+        return np.array(samples)
+
+    samples = asyncio.run(run())
+    return latency_measurements(f"nl2sql_pipeline[x{scale}]", samples) + [
+        throughput(f"nl2sql_pipeline[x{scale}].ops_per_sec", len(samples), float(samples.sum()))
+    ]
+
+
+# ----------------------------------------------------------------------
+# 回归比较
+# ----------------------------------------------------------------------
+
+def compare(results: Dict, baseline: Dict, tolerance: float, min_delta_ms: float = 0.5) -> List[Dict]:
+    """与基线逐项比较；变差超过 tolerance（相对值）记为回归，亚毫秒级的延迟抖动不计"""
+    base = {m["name"]: m for m in baseline.get("measurements", [])}
+    rows = []
+    for m in results["measurements"]:
+        old = base.get(m["name"])
+        if old is None or not old["value"]:
+            continue
+        change = (m["value"] - old["value"]) / old["value"]
+        worse = -change if m["higher_is_better"] else change
+        noise = m["unit"] == "ms" and abs(m["value"] - old["value"]) < min_delta_ms
+        rows.append({
+            "name": m["name"], "baseline": old["value"], "current": m["value"], "unit": m["unit"],
+            "change": round(change, 4), "regression": worse > tolerance and not noise
+        })
+    return rows
+
+
+def environment_info() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        commit = ""
+    import duckdb
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": str(os.cpu_count()),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "duckdb": duckdb.__version__
+    }
+
+
+BENCHMARKS = ("queries", "ingest", "trend", "nl2sql_engine", "validator", "nl2sql_pipeline")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NL2SQL 与分析热路径基准套件")
+    parser.add_argument("--scales", default="1,100,10000", help="数据集倍数（基础 5 个 SKU × 30 天）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    parser.add_argument("--iterations", type=int, default=2000, help="NL2SQL / 验证器的调用次数")
+    parser.add_argument("--only", help=f"只运行指定基准，逗号分隔: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "dbgpt_benchmark"),
+                        help="数据集缓存目录")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="基线结果 JSON，提供时输出回归比较")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="允许的相对退化")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="低于该绝对差值的延迟变化视为噪声")
+    args = parser.parse_args()
+
+    # 审计日志和追踪写到临时目录，不污染服务目录
+    os.environ.setdefault("AUDIT_LOG_DIR", os.path.join(args.workdir, "logs"))
+    os.environ.setdefault("TRACE_EXPORTER", "none")
+    os.environ.setdefault("WARMUP_ENABLED", "0")
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    selected = set(args.only.split(",")) if args.only else set(BENCHMARKS)
+    measurements: List[Measurement] = []
+    skipped: Dict[str, str] = {}
+
+    def run(name: str, fn: Callable[[], List[Measurement]]):
+        if name.split("[")[0] not in selected:
+            return
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except ImportError as e:
+            skipped[name] = f"依赖不可用: {e}"
+            print(f"  ⏭️  {name}: 跳过（{e}）")
+            return
+        measurements.extend(result)
+        print(f"  ✅ {name}: {len(result)} 项，{time.perf_counter() - start:.1f}s")
+
+    print(f"🏁 基准套件：倍数 {scales}，种子 {args.seed}，重复 {args.repeat} 次")
+    run("nl2sql_engine", lambda: bench_nl2sql_engine(args.iterations))
+    run("validator", lambda: bench_validator(args.iterations))
+
+    for scale in scales:
+        start = time.perf_counter()
+        paths = prepare_dataset(args.workdir, scale, args.seed)
+        print(f"📦 数据集 x{scale}（{BASE_SKUS * scale * DAYS:,} 行）就绪，{time.perf_counter() - start:.1f}s")
+        run(f"queries[x{scale}]", lambda: bench_queries(paths, scale, args.repeat))
+        run(f"ingest[x{scale}]", lambda: bench_ingest(paths, scale, args.repeat))
+        run(f"trend[x{scale}]", lambda: bench_trend_batch(paths, scale, args.repeat))
+        run(f"nl2sql_pipeline[x{scale}]", lambda: bench_nl2sql_pipeline(paths, scale, max(1, args.iterations // 10)))
+
+    results = {
+        "environment": environment_info(),
+        "config": {"scales": scales, "seed": args.seed, "repeat": args.repeat,
+                   "iterations": args.iterations, "dataset_version": DATASET_VERSION},
+        "measurements": [asdict(m) for m in measurements],
+        "skipped": skipped
+    }
+
+    print(f"\n{'指标':<60}{'数值':>14}  单位")
+    for m in measurements:
+        print(f"{m.name:<60}{m.value:>14,.3f}  {m.unit}")
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        results["comparison"] = {"baseline": args.baseline, "tolerance": args.tolerance, "rows": comparison}
+        regressions = [row for row in comparison if row["regression"]]
+        print(f"\n📉 与基线比较（容差 {args.tolerance:.0%}）：{len(comparison)} 项，{len(regressions)} 项回归")
+        for row in regressions:
+            print(f"  ❌ {row['name']}: {row['baseline']} → {row['current']} {row['unit']}（{row['change']:+.1%}）")
+        exit_code = 1 if regressions else 0
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ 结果已保存到: {args.output}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
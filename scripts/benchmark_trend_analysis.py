@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+趋势分析工作流基准
+生成合成的 douyin_sales_detail（SKU 数 × 天数 = SKU-日行数），分别测量日 / 周 / 月序列的
+未命中缓存耗时（DuckDB 聚合 + 进程池趋势检测，拆分出序列构建耗时）与命中缓存耗时
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.trend_analysis import TrendAnalysisService, PERIODS
+from flows.forecast_executor import get_forecast_executor
+
+# 规模名称 -> (SKU 数, 天数)
+SCALES = {"1k": (10, 100), "1m": (1000, 1000)}
+
+DETAIL_SQL = """
+CREATE TABLE douyin_sales_detail AS
+SELECT
+    DATE '2023-01-01' + d::INTEGER AS date,
+    'SKU' || lpad(s::VARCHAR, 6, '0') AS sku,
+    ((s * 7 + d) % 97 + 5 + (d // 30))::INTEGER AS daily_sales,
+    round(((s * 7 + d) % 97 + 5 + (d // 30)) * (20 + s % 50) * (1 + 0.2 * (dayofweek(DATE '2023-01-01' + d::INTEGER) IN (0, 6))::INT), 2)::DOUBLE AS daily_revenue,
+    round(0.02 + ((s + d) % 13) / 1000.0, 4)::DOUBLE AS conversion_rate
+FROM range(?) t(s), range(?) u(d)
+ORDER BY date
+"""
+
+
+def build_dataset(path: str, skus: int, days: int):
+    import duckdb
+
+    conn = duckdb.connect(path)
+    conn.execute(DETAIL_SQL, [skus, days])
+    conn.close()
+
+
+async def bench_scale(path: str, repeat: int) -> List[Dict[str, Any]]:
+    import duckdb
+
+    service = TrendAnalysisService(connection=duckdb.connect(path, read_only=True))
+    rows = []
+    for period in PERIODS:
+        try:
+            await service.analyze("sales", period)
+        except ValueError as e:
+            rows.append({"period": period, "skipped": str(e)})
+            continue
+
+        uncached, series = [], []
+        for _ in range(repeat):
+            service.cache.clear()
+            start = time.perf_counter()
+            result = await service.analyze("sales", period)
+            uncached.append((time.perf_counter() - start) * 1000)
+            series.append(result["timing"]["series_seconds"] * 1000)
+
+        cached = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await service.analyze("sales", period)
+            cached.append((time.perf_counter() - start) * 1000)
+
+        rows.append({
+            "period": period,
+            "points": result["statistics"]["points"],
+            "uncached_ms": round(statistics.median(uncached), 2),
+            "series_ms": round(statistics.median(series), 2),
+            "cached_ms": round(statistics.median(cached), 3),
+            "trend_direction": result["trend_direction"]
+        })
+    service.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="趋势分析工作流基准")
+    parser.add_argument("--scales", default="1k,1m", help="逗号分隔: " + ",".join(SCALES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="trend_analysis_benchmark.json")
+    args = parser.parse_args()
+
+    executor = get_forecast_executor()
+    report = {"generated_at": datetime.now().isoformat(), "workers": executor.max_workers, "scales": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        # 首次提交包含工作进程启动与预热，单独计时
+        start = time.perf_counter()
+        asyncio.run(executor.submit(time.sleep, 0))
+        report["pool_startup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        print(f"🏁 预测进程池 {executor.max_workers} 个工作进程，启动耗时 {report['pool_startup_ms']:.0f}ms")
+
+        for scale in args.scales.split(","):
+            skus, days = SCALES[scale]
+            path = os.path.join(workdir, f"trend_{scale}.duckdb")
+            start = time.perf_counter()
+            build_dataset(path, skus, days)
+            print(f"\n📦 {scale}: {skus} SKU × {days} 天 = {skus * days:,} SKU-日，"
+                  f"生成耗时 {time.perf_counter() - start:.1f}s")
+
+            rows = asyncio.run(bench_scale(path, args.repeat))
+            report["scales"][scale] = {"sku_days": skus * days, "results": rows}
+            print(f"{'周期':<10}{'点数':>6}{'未缓存ms':>12}{'其中序列ms':>12}{'缓存ms':>10}")
+            for row in rows:
+                if "skipped" in row:
+                    print(f"{row['period']:<10}  跳过: {row['skipped']}")
+                    continue
+                print(f"{row['period']:<10}{row['points']:>6}{row['uncached_ms']:>12.1f}"
+                      f"{row['series_ms']:>12.1f}{row['cached_ms']:>10.2f}")
+    executor.shutdown()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ 结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,197 +1,405 @@
 #!/usr/bin/env python3
 """
 基于蝉妈妈格式的测试数据生成器
-生成30天的抖音电商销售数据用于验收测试
+默认生成 5 个商品 30 天的抖音电商销售数据用于验收测试；
+SKU、天数、类目、品牌、主播数量均可配置，按 SKU 分片在多进程中向量化生成，
+分块流式写入 CSV / Parquet / DuckDB，可生成上亿行的压测数据集。
+保留突增、节日增长、季节性与周期性形态，并附带注入异常的真值标签用于评估检测器
 """
-import pandas as pd
-import random
-from datetime import datetime, timedelta
 import os
+import sys
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Iterator, Tuple
 
-def generate_test_data():
-    """生成测试数据"""
-    print("🔄 正在生成测试数据...")
-    
-    # 商品基础数据 - 基于真实蝉妈妈格式
-    products = [
-        {
-            "sku": "3737962838157820139",
-            "product_name": "DIY儿童服装设计启蒙国潮国风汉服手工制作女孩生日礼物创意玩具",
-            "category": "礼品文创-创意礼品-创意礼品类-DIY礼品",
-            "commission_rate": 20.0,
-            "brand": "哈妹生活坊",
-            "base_price": 89.9
-        },
-        {
-            "sku": "3750278905861373956", 
-            "product_name": "六一儿童节生日礼物送女孩子女童6-12岁小朋友10实用型库洛米礼盒",
-            "category": "礼品文创-节日礼品",
-            "commission_rate": 10.0,
-            "brand": "童趣礼品店",
-            "base_price": 159.9
-        },
-        {
-            "sku": "3745623487291847362",
-            "product_name": "【中考专属-金榜题名礼盒】送男生女生仪式感可乐定制礼盒中考礼品",
-            "category": "礼品文创-定制礼品",
-            "commission_rate": 25.0,
-            "brand": "学霸文创",
-            "base_price": 39.9
-        },
-        {
-            "sku": "3758912345678901234",
-            "product_name": "夏季新款女装连衣裙韩版时尚修身显瘦中长款气质裙子",
-            "category": "服装鞋帽-女装-连衣裙",
-            "commission_rate": 15.0,
-            "brand": "时尚女装",
-            "base_price": 199.9
-        },
-        {
-            "sku": "3756789012345678901",
-            "product_name": "智能蓝牙耳机无线运动型超长续航降噪通话音质高清",
-            "category": "数码配件-音频设备",
-            "commission_rate": 18.0,
-            "brand": "数码科技",
-            "base_price": 299.9
-        }
-    ]
-    
-    # 生成30天的销售数据
-    all_data = []
-    base_date = datetime.now() - timedelta(days=30)
-    
-    for day in range(30):
-        current_date = base_date + timedelta(days=day)
-        day_of_week = current_date.weekday()
-        
-        for product in products:
-            # 根据产品类型生成不同的趋势
-            if "DIY儿童服装" in product["product_name"]:
-                # 模拟突增趋势 (用于测试异常检测)
-                if day < 20:
-                    base_sales = random.randint(1800, 2200)
-                else:
-                    base_sales = random.randint(7000, 8000)  # 突增
-            elif "六一儿童节" in product["product_name"]:
-                # 模拟节日商品增长趋势
-                base_sales = 800 + day * 50 + random.randint(-100, 200)
-            elif "中考专属" in product["product_name"]:
-                # 模拟季节性商品
-                if 15 <= day <= 25:  # 中考季
-                    base_sales = 4000 + random.randint(-500, 500)
-                else:
-                    base_sales = 1500 + random.randint(-200, 200)
+import numpy as np
+import pandas as pd
+
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# 商品基础数据 - 基于真实蝉妈妈格式；前 5 个 SKU 沿用这些商品，其余按类目/品牌池合成
+CATALOG = [
+    {
+        "sku": "3737962838157820139",
+        "product_name": "DIY儿童服装设计启蒙国潮国风汉服手工制作女孩生日礼物创意玩具",
+        "category": "礼品文创-创意礼品-创意礼品类-DIY礼品",
+        "commission_rate": 20.0,
+        "brand": "哈妹生活坊",
+        "base_price": 89.9
+    },
+    {
+        "sku": "3750278905861373956",
+        "product_name": "六一儿童节生日礼物送女孩子女童6-12岁小朋友10实用型库洛米礼盒",
+        "category": "礼品文创-节日礼品",
+        "commission_rate": 10.0,
+        "brand": "童趣礼品店",
+        "base_price": 159.9
+    },
+    {
+        "sku": "3745623487291847362",
+        "product_name": "【中考专属-金榜题名礼盒】送男生女生仪式感可乐定制礼盒中考礼品",
+        "category": "礼品文创-定制礼品",
+        "commission_rate": 25.0,
+        "brand": "学霸文创",
+        "base_price": 39.9
+    },
+    {
+        "sku": "3758912345678901234",
+        "product_name": "夏季新款女装连衣裙韩版时尚修身显瘦中长款气质裙子",
+        "category": "服装鞋帽-女装-连衣裙",
+        "commission_rate": 15.0,
+        "brand": "时尚女装",
+        "base_price": 199.9
+    },
+    {
+        "sku": "3756789012345678901",
+        "product_name": "智能蓝牙耳机无线运动型超长续航降噪通话音质高清",
+        "category": "数码配件-音频设备",
+        "commission_rate": 18.0,
+        "brand": "数码科技",
+        "base_price": 299.9
+    }
+]
+
+# 销量形态：与 CATALOG 顺序对应，合成 SKU 按序号循环
+PATTERN_SPIKE, PATTERN_HOLIDAY, PATTERN_SEASONAL, PATTERN_WEEKLY = 0, 1, 2, 3
+PATTERN_NAMES = ["spike", "holiday", "seasonal", "weekly"]
+ANOMALY_TYPES = ["", "spike", "seasonal_shift", "point_outlier"]
+ANCHOR_NAMES = ["美妆小雅", "时尚达人Anna", "科技小王", "健康小贴士", "吃货小美", "辣妈团长", "数码狂人", "健身教练Mike"]
+
+OUTPUT_FORMATS = ("csv", "parquet", "duckdb")
+TEXT_COLUMNS = ("sku", "product_name", "category", "brand", "anchor_name", "pattern", "anomaly_type")
+
+
+@dataclass
+class GeneratorConfig:
+    """生成参数"""
+    skus: int = 5
+    days: int = 30
+    categories: int = 5
+    brands: int = 5
+    anchors: int = 8
+    seed: int = 42
+    start_date: Optional[str] = None  # 默认从今天往前 days 天
+    chunk_skus: int = 20000  # 每个分片的 SKU 数，决定单块内存（20000 × 30 天约 60 万行）
+    outlier_rate: float = 0.002  # 注入点异常的比例
+
+    def resolved_start_date(self) -> str:
+        if self.start_date:
+            return self.start_date
+        return (datetime.now() - timedelta(days=self.days)).strftime("%Y-%m-%d")
+
+
+def _pool(prefix: str, size: int, known: List[str]) -> np.ndarray:
+    """名称池：先用真实名称，不足时合成"""
+    names = list(dict.fromkeys(known))[:size]
+    names += [f"{prefix}{i + 1}" for i in range(len(names), size)]
+    return np.array(names, dtype=object)
+
+
+def _repeat(codes: np.ndarray, categories, ordered: bool = False) -> pd.Categorical:
+    """重复的字符串列以分类编码构造，避免逐行生成字符串对象"""
+    return pd.Categorical.from_codes(codes, categories=categories, ordered=ordered)
+
+
+def generate_chunk(config: GeneratorConfig, chunk_index: int) -> pd.DataFrame:
+    """生成一个 SKU 分片的全部日数据；随机数由 (seed, 分片序号) 派生，与进程数无关"""
+    rng = np.random.default_rng(np.random.SeedSequence(config.seed, spawn_key=(chunk_index,)))
+    first = chunk_index * config.chunk_skus
+    sku_ids = np.arange(first, min(first + config.chunk_skus, config.skus))
+    n, days = len(sku_ids), config.days
+    day = np.arange(days)
+    dates = pd.date_range(config.resolved_start_date(), periods=days, freq="D")
+    weekday = dates.weekday.to_numpy()
+
+    # ---- SKU 维度属性 ----
+    pattern = sku_ids % len(CATALOG)
+    catalog = sku_ids < len(CATALOG)
+    categories = _pool("类目", config.categories, [p["category"] for p in CATALOG])
+    brands = _pool("品牌", config.brands, [p["brand"] for p in CATALOG])
+    anchors = _pool("主播", config.anchors, ANCHOR_NAMES)
+
+    # 真实商品使用各自的类目与品牌（池不足时取模），合成 SKU 随机分配
+    sku_category = np.where(catalog, sku_ids % config.categories, rng.integers(0, config.categories, n))
+    sku_brand = np.where(catalog, sku_ids % config.brands, rng.integers(0, config.brands, n))
+    sku_anchor = rng.integers(0, config.anchors, n)
+    base_price = np.where(catalog, np.array([p["base_price"] for p in CATALOG])[pattern],
+                          np.round(rng.lognormal(4.8, 0.6, n), 1))
+    commission = np.where(catalog, np.array([p["commission_rate"] for p in CATALOG])[pattern],
+                          rng.choice([5.0, 10.0, 15.0, 20.0, 25.0], n))
+    # 合成 SKU 的销量量级服从对数正态，真实商品保持原量级
+    level = np.where(catalog, 1.0, rng.lognormal(0.0, 0.5, n))[:, None]
+
+    # ---- 销量曲线（行：SKU，列：天），沿用原始形态按天数比例缩放 ----
+    spike_day = max(1, int(days * 2 / 3))
+    season_start, season_end = int(days / 2), int(days * 5 / 6)
+    spike = np.where(day < spike_day, rng.integers(1800, 2200, (n, days)), rng.integers(7000, 8000, (n, days)))
+    holiday = 800 + day * 50 + rng.integers(-100, 200, (n, days))
+    in_season = (day >= season_start) & (day <= season_end)
+    seasonal = np.where(in_season, 4000 + rng.integers(-500, 500, (n, days)), 1500 + rng.integers(-200, 200, (n, days)))
+    weekly = ((2000 + day * 30) * np.where(weekday >= 5, 1.3, 1.0) + rng.integers(-300, 300, (n, days))).astype(int)
+
+    p = pattern[:, None]
+    sales = np.select([p == PATTERN_SPIKE, p == PATTERN_HOLIDAY, p == PATTERN_SEASONAL], [spike, holiday, seasonal],
+                      default=weekly)
+    sales = np.maximum(100, (sales * level).astype(np.int64))
+
+    # ---- 真值标签：突增起点、季节窗口起止为变点，另注入随机点异常 ----
+    anomaly_type = np.zeros((n, days), dtype=np.int8)
+    anomaly_type[(p == PATTERN_SPIKE) & (day == spike_day)] = ANOMALY_TYPES.index("spike")
+    anomaly_type[(p == PATTERN_SEASONAL) & ((day == season_start) | (day == season_end + 1))] = \
+        ANOMALY_TYPES.index("seasonal_shift")
+    outliers = rng.random((n, days)) < config.outlier_rate
+    sales = np.where(outliers, (sales * rng.uniform(3.0, 6.0, (n, days))).astype(np.int64), sales)
+    anomaly_type[outliers] = ANOMALY_TYPES.index("point_outlier")
+
+    # ---- 展开为长表 ----
+    rows = n * days
+    sales = sales.ravel()
+    sku_index = np.repeat(np.arange(n), days)
+    unit_price = np.round(base_price[sku_index] * rng.uniform(0.8, 1.2, rows), 2)
+    live_sales = (sales * rng.uniform(0.5, 0.7, rows)).astype(np.int64)
+    conversion_rate = np.round(rng.uniform(3.0, 18.0, rows), 2)
+    row_weekday = np.tile(weekday, n)
+
+    # 每个 SKU 的编码和名称只生成一次，按行以分类编码展开
+    sku_codes = [CATALOG[i]["sku"] if i < len(CATALOG) else str(3800000000000000000 + i) for i in sku_ids]
+    names = [CATALOG[i]["product_name"] if i < len(CATALOG) else f"{brands[b]}爆款商品{i}"
+             for i, b in zip(sku_ids, sku_brand)]
+
+    anomaly_flat = anomaly_type.ravel()
+    return pd.DataFrame({
+        "date": _repeat(np.tile(day, n), dates.strftime("%Y-%m-%d"), ordered=True),
+        "sku": _repeat(sku_index, sku_codes),
+        "product_name": _repeat(sku_index, names),
+        "category": _repeat(sku_category[sku_index], categories),
+        "commission_rate": commission[sku_index],
+        "brand": _repeat(sku_brand[sku_index], brands),
+        "daily_sales": sales,
+        "daily_revenue": np.round(sales * unit_price, 2),
+        "live_sales": live_sales,
+        "card_sales": sales - live_sales,
+        "conversion_rate": conversion_rate,
+        "avg_price": unit_price,
+        "clicks": (sales / conversion_rate * 100).astype(np.int64),
+        "exposure": (sales / conversion_rate * 1000).astype(np.int64),
+        "ctr": np.round(rng.uniform(2.0, 8.0, rows), 2),
+        "day_of_week": row_weekday,
+        "is_weekend": row_weekday >= 5,
+        "anchor_name": _repeat(sku_anchor[sku_index], anchors),
+        "pattern": _repeat(np.minimum(pattern, PATTERN_WEEKLY)[sku_index], PATTERN_NAMES),
+        "is_anomaly": anomaly_flat != 0,
+        "anomaly_type": _repeat(anomaly_flat, ANOMALY_TYPES)
+    })
+
+
+def detect_threshold_anomalies(df: pd.DataFrame) -> pd.DataFrame:
+    """按 SKU 查找超过均值 2 个标准差的数据点（分组向量化，用于测试告警功能）"""
+    grouped = df.groupby("sku")["daily_sales"]
+    mean_sales = grouped.transform("mean")
+    threshold = mean_sales + 2 * grouped.transform("std")
+    hits = df[df["daily_sales"] > threshold]
+    return pd.DataFrame({
+        "date": hits["date"],
+        "sku": hits["sku"],
+        "product_name": hits["product_name"].str.slice(0, 50) + "...",
+        "sales": hits["daily_sales"],
+        "threshold": threshold[hits.index].astype(int),
+        "increase_rate": ((hits["daily_sales"] - mean_sales[hits.index]) / mean_sales[hits.index] * 100).round(1)
+    })
+
+
+def chunk_stats(df: pd.DataFrame) -> Dict[str, int]:
+    return {
+        "rows": len(df),
+        "skus": int(df["sku"].nunique()),
+        "labelled_anomalies": int(df["is_anomaly"].sum()),
+        "threshold_anomalies": len(detect_threshold_anomalies(df))
+    }
+
+
+# ----------------------------------------------------------------------
+# 分片生成与流式写入
+# ----------------------------------------------------------------------
+
+def _write_parquet_part(args: Tuple[GeneratorConfig, int, str]) -> Dict[str, int]:
+    """在工作进程中生成并直接写出一个 Parquet 分片，避免把数据传回主进程"""
+    config, chunk_index, directory = args
+    df = generate_chunk(config, chunk_index)
+    df.to_parquet(os.path.join(directory, f"part-{chunk_index:05d}.parquet"), index=False)
+    return chunk_stats(df)
+
+
+def _generate(args: Tuple[GeneratorConfig, int]) -> pd.DataFrame:
+    config, chunk_index = args
+    return generate_chunk(config, chunk_index)
+
+
+def iter_chunks(config: GeneratorConfig, workers: int) -> Iterator[pd.DataFrame]:
+    """按分片顺序产出数据块；workers > 1 时并行生成，最多同时持有 workers 个块"""
+    n_chunks = (config.skus + config.chunk_skus - 1) // config.chunk_skus
+    if workers <= 1:
+        for chunk_index in range(n_chunks):
+            yield generate_chunk(config, chunk_index)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_generate, [(config, i) for i in range(n_chunks)])
+
+
+def write_dataset(config: GeneratorConfig, output: str, fmt: str = "csv", workers: int = 1) -> Dict[str, int]:
+    """生成全部分片并流式写出，返回行数与标签统计
+
+    csv: output 为目录，写入 douyin_test_data_{days}days.csv 与最新一天的 douyin_test_data_latest.csv
+    parquet: output 为目录，写入 douyin_sales_detail/part-*.parquet（各进程直接写各自分片）
+    duckdb: output 为数据库文件，追加到 douyin_sales_detail 表
+    """
+    totals = {"rows": 0, "skus": 0, "labelled_anomalies": 0, "threshold_anomalies": 0}
+
+    def accumulate(stats: Dict[str, int]):
+        for key, value in stats.items():
+            totals[key] += value
+
+    n_chunks = (config.skus + config.chunk_skus - 1) // config.chunk_skus
+
+    if fmt == "parquet":
+        if not ARROW_AVAILABLE:
+            raise RuntimeError("Parquet 输出需要 pyarrow")
+        directory = os.path.join(output, "douyin_sales_detail")
+        os.makedirs(directory, exist_ok=True)
+        tasks = [(config, i, directory) for i in range(n_chunks)]
+        if workers <= 1:
+            for stats in map(_write_parquet_part, tasks):
+                accumulate(stats)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for stats in pool.map(_write_parquet_part, tasks):
+                    accumulate(stats)
+        return totals
+
+    if fmt == "duckdb":
+        import duckdb
+
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        conn = duckdb.connect(output)
+        conn.execute("DROP TABLE IF EXISTS douyin_sales_detail")
+        # 分类编码列在 DuckDB 中会成为 ENUM，各分片的取值不同，统一转为 VARCHAR
+        select = ("SELECT * REPLACE (CAST(date AS DATE) AS date, "
+                  + ", ".join(f"CAST({c} AS VARCHAR) AS {c}" for c in TEXT_COLUMNS) + ") FROM chunk_df")
+        for i, df in enumerate(iter_chunks(config, workers)):
+            conn.register("chunk_df", df)
+            if i == 0:
+                conn.execute(f"CREATE TABLE douyin_sales_detail AS {select}")
             else:
-                # 模拟普通商品的周期性
-                weekend_boost = 1.3 if day_of_week >= 5 else 1.0
-                base_sales = int((2000 + day * 30) * weekend_boost + random.randint(-300, 300))
-            
-            # 确保销量最小值
-            daily_sales = max(100, base_sales)
-            
-            # 计算价格（有一定波动）
-            price_variance = random.uniform(0.8, 1.2)
-            unit_price = round(product["base_price"] * price_variance, 2)
-            
-            # 计算各种指标
-            live_sales = int(daily_sales * random.uniform(0.5, 0.7))
-            card_sales = daily_sales - live_sales
-            daily_revenue = round(daily_sales * unit_price, 2)
-            conversion_rate = round(random.uniform(3.0, 18.0), 2)
-            
-            # 创建记录
-            record = {
-                "date": current_date.strftime("%Y-%m-%d"),
-                "sku": product["sku"],
-                "product_name": product["product_name"],
-                "category": product["category"],
-                "commission_rate": product["commission_rate"],
-                "brand": product["brand"],
-                "daily_sales": daily_sales,
-                "daily_revenue": daily_revenue,
-                "live_sales": live_sales,
-                "card_sales": card_sales,
-                "conversion_rate": conversion_rate,
-                "avg_price": unit_price,
-                "clicks": int(daily_sales / conversion_rate * 100),
-                "exposure": int(daily_sales / conversion_rate * 1000),
-                "ctr": round(random.uniform(2.0, 8.0), 2),
-                "day_of_week": day_of_week,
-                "is_weekend": day_of_week >= 5
-            }
-            all_data.append(record)
-    
-    # 转换为DataFrame
-    df = pd.DataFrame(all_data)
-    
+                conn.execute(f"INSERT INTO douyin_sales_detail {select}")
+            conn.unregister("chunk_df")
+            accumulate(chunk_stats(df))
+        conn.close()
+        return totals
+
+    os.makedirs(output, exist_ok=True)
+    full_path = os.path.join(output, f"douyin_test_data_{config.days}days.csv")
+    latest_path = os.path.join(output, "douyin_test_data_latest.csv")
+    for i, df in enumerate(iter_chunks(config, workers)):
+        mode, header = ("w", True) if i == 0 else ("a", False)
+        encoding = "utf-8-sig" if i == 0 else "utf-8"
+        df.to_csv(full_path, mode=mode, header=header, index=False, encoding=encoding)
+        latest = df[df["date"] == df["date"].iloc[-1]]
+        latest.to_csv(latest_path, mode=mode, header=header, index=False, encoding=encoding)
+        accumulate(chunk_stats(df))
+    return totals
+
+
+def generate_test_data(config: Optional[GeneratorConfig] = None, output_dir: Optional[str] = None):
+    """生成测试数据（单块，适合验收测试规模）"""
+    print("🔄 正在生成测试数据...")
+    config = config or GeneratorConfig()
+    df = pd.concat(list(iter_chunks(config, workers=1)), ignore_index=True)
+
     # 确保输出目录存在
-    output_dir = os.path.expanduser("~/douyin-analytics/data/csv")
+    output_dir = output_dir or os.path.expanduser("~/douyin-analytics/data/csv")
     os.makedirs(output_dir, exist_ok=True)
-    
+
     # 保存完整数据集
-    full_data_path = f"{output_dir}/douyin_test_data_30days.csv"
+    full_data_path = f"{output_dir}/douyin_test_data_{config.days}days.csv"
     df.to_csv(full_data_path, index=False, encoding='utf-8-sig')
-    
+
     # 保存最新一天数据
     latest_df = df[df['date'] == df['date'].max()]
     latest_data_path = f"{output_dir}/douyin_test_data_latest.csv"
     latest_df.to_csv(latest_data_path, index=False, encoding='utf-8-sig')
-    
-    # 生成汇总统计
-    summary_stats = df.groupby(['sku', 'product_name']).agg({
-        'daily_sales': ['sum', 'mean', 'max', 'std'],
-        'daily_revenue': ['sum', 'mean'],
-        'conversion_rate': 'mean',
-        'avg_price': 'mean'
-    }).round(2)
-    
-    # 检测异常值 (用于测试异常检测功能)
-    anomalies = []
-    for sku in df['sku'].unique():
-        sku_data = df[df['sku'] == sku]['daily_sales']
-        mean_sales = sku_data.mean()
-        std_sales = sku_data.std()
-        
-        # 查找超过2个标准差的数据点
-        anomaly_threshold = mean_sales + 2 * std_sales
-        anomaly_days = df[(df['sku'] == sku) & (df['daily_sales'] > anomaly_threshold)]
-        
-        if not anomaly_days.empty:
-            for _, row in anomaly_days.iterrows():
-                anomalies.append({
-                    'date': row['date'],
-                    'sku': row['sku'],
-                    'product_name': row['product_name'][:50] + '...',
-                    'sales': row['daily_sales'],
-                    'threshold': int(anomaly_threshold),
-                    'increase_rate': round((row['daily_sales'] - mean_sales) / mean_sales * 100, 1)
-                })
-    
+
+    anomalies = detect_threshold_anomalies(df).to_dict("records")
+
     print("✅ 测试数据生成完成！")
     print(f"📁 文件位置: {output_dir}")
     print(f"📊 生成记录数: {len(df)}")
-    print(f"📈 产品数量: {len(products)}")
+    print(f"📈 产品数量: {df['sku'].nunique()}")
     print(f"📅 时间范围: {df['date'].min()} ~ {df['date'].max()}")
-    
+    print(f"🏷️  注入异常标签: {int(df['is_anomaly'].sum())} 个")
+
     print(f"\n📈 销售统计概览:")
-    for sku in df['sku'].unique():
-        sku_data = df[df['sku'] == sku]
-        product_name = sku_data['product_name'].iloc[0][:30] + '...'
-        total_sales = sku_data['daily_sales'].sum()
-        total_revenue = sku_data['daily_revenue'].sum()
-        print(f"  {product_name}: 总销量 {total_sales:,}, 总收入 ¥{total_revenue:,.2f}")
-    
+    totals = df.groupby(['sku', 'product_name'], sort=False)[['daily_sales', 'daily_revenue']].sum()
+    for (sku, product_name), row in totals.head(20).iterrows():
+        print(f"  {product_name[:30]}...: 总销量 {int(row['daily_sales']):,}, 总收入 ¥{row['daily_revenue']:,.2f}")
+
     if anomalies:
         print(f"\n🚨 检测到 {len(anomalies)} 个异常数据点 (用于测试告警功能):")
         for anomaly in anomalies[:3]:  # 只显示前3个
             print(f"  📅 {anomaly['date']}: {anomaly['product_name']} 销量 {anomaly['sales']} (+{anomaly['increase_rate']}%)")
-    
+
     return df, anomalies
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="抖音电商测试数据生成器")
+    parser.add_argument("--skus", type=int, default=5)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--brands", type=int, default=5)
+    parser.add_argument("--anchors", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start-date", help="起始日期 YYYY-MM-DD（默认今天往前 days 天）")
+    parser.add_argument("--outlier-rate", type=float, default=0.002, help="注入点异常的比例")
+    parser.add_argument("--chunk-skus", type=int, default=20000, help="每个分片的 SKU 数")
+    parser.add_argument("--workers", type=int, default=1, help="生成进程数")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv")
+    parser.add_argument("--output", help="输出目录（csv / parquet）或数据库文件（duckdb）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = GeneratorConfig(
+        skus=args.skus, days=args.days, categories=args.categories, brands=args.brands,
+        anchors=args.anchors, seed=args.seed, start_date=args.start_date,
+        chunk_skus=args.chunk_skus, outlier_rate=args.outlier_rate
+    )
+
+    # 小规模 CSV 保持原有行为：一次生成并打印统计概览
+    if args.format == "csv" and args.workers <= 1 and config.skus <= config.chunk_skus:
+        generate_test_data(config, args.output)
+        return
+
+    output = args.output or (os.path.expanduser("~/douyin-analytics/data/db/loadtest.duckdb")
+                             if args.format == "duckdb" else os.path.expanduser("~/douyin-analytics/data/loadtest"))
+    print(f"🔄 正在生成 {config.skus:,} 个 SKU × {config.days} 天 = {config.skus * config.days:,} 行"
+          f"（{args.workers} 个进程，格式 {args.format}）...")
+    start = datetime.now()
+    totals = write_dataset(config, output, args.format, args.workers)
+    seconds = (datetime.now() - start).total_seconds()
+    print(f"✅ 生成完成: {totals['rows']:,} 行，{seconds:.1f}s（{totals['rows'] / max(seconds, 1e-9):,.0f} 行/秒）")
+    print(f"🏷️  注入异常标签 {totals['labelled_anomalies']:,} 个，阈值异常 {totals['threshold_anomalies']:,} 个")
+    print(f"📁 输出: {output}")
+    print(f"⚙️  参数: {asdict(config)}")
+
+
 if __name__ == "__main__":
     try:
-        data, anomalies = generate_test_data()
+        main()
         print("\n🎯 数据生成成功，可以继续执行导入步骤")
     except Exception as e:
         print(f"❌ 数据生成失败: {e}")
-        exit(1)
\ No newline at end of file
+        sys.exit(1)
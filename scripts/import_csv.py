@@ -1,15 +1,68 @@
 #!/usr/bin/env python3
 """
 蝉妈妈CSV数据导入脚本
-支持批量导入CSV文件到DuckDB数据库
+支持批量导入CSV文件到DuckDB数据库；每批导入后增量更新异常检测状态，并将新发现的异常推送到飞书
 """
 
 import duckdb
 import pandas as pd
 import sys
 import os
+import asyncio
 from datetime import datetime
 
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.anomaly_detection import AnomalyDetector
+from flows.alert_dispatcher import AlertDispatcher
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 异常检测状态快照，重启后无需回放历史
+ANOMALY_STATE_PATH = os.getenv("ANOMALY_STATE_PATH", os.path.join(PROJECT_DIR, "data", "anomaly_state.npz"))
+# 销售明细 CSV（generate_test_data.py 格式）的必需列
+SALES_DETAIL_COLUMNS = ("date", "sku", "daily_sales", "daily_revenue", "conversion_rate")
+
+
+def import_sales_detail(conn, df):
+    """追加销售明细：表不存在时按 CSV 建表，已存在时只写入表中已有的列"""
+    tables = {row[0] for row in conn.execute("SHOW TABLES").fetchall()}
+    if "douyin_sales_detail" not in tables:
+        conn.execute("CREATE TABLE douyin_sales_detail AS SELECT * REPLACE (CAST(date AS DATE) AS date) FROM df")
+        return
+    existing = [row[0] for row in conn.execute("DESCRIBE douyin_sales_detail").fetchall()]
+    columns = [c for c in existing if c in df.columns]
+    selected = ", ".join("CAST(date AS DATE)" if c == "date" else c for c in columns)
+    conn.execute(f"INSERT INTO douyin_sales_detail ({', '.join(columns)}) SELECT {selected} FROM df")
+
+
+async def dispatch_anomalies(anomalies):
+    """按 webhook_config.json 合并发送告警"""
+    dispatcher = AlertDispatcher.from_config()
+    if not dispatcher.enabled or not dispatcher.webhook_url:
+        return
+    await dispatcher.start()
+    dispatcher.submit_anomalies(anomalies)
+    await dispatcher.stop(drain=True)
+
+
+def update_anomaly_state(conn, state_path=ANOMALY_STATE_PATH, notify=True):
+    """读取新落库的销售明细，更新各 SKU 的统计量并保存快照；返回本批发现的异常"""
+    detector = AnomalyDetector.load(state_path) if os.path.exists(state_path) else AnomalyDetector()
+    anomalies = detector.ingest_since(conn)
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    detector.save(state_path)
+
+    metrics = detector.get_metrics()
+    print(f"🔎 异常检测: 新增 {metrics['rows_ingested']} 行，{metrics['skus']} 个SKU，发现 {len(anomalies)} 个异常")
+    if anomalies and notify:
+        try:
+            asyncio.run(dispatch_anomalies(anomalies))
+        except Exception as e:
+            print(f"⚠️ 异常告警发送失败: {str(e)}")
+    return anomalies
+
+
 def import_csv_to_duckdb(csv_file, db_file):
     """导入CSV文件到DuckDB"""
     try:
@@ -27,7 +80,17 @@ def import_csv_to_duckdb(csv_file, db_file):
         
         # 数据清洗和映射（根据实际CSV格式调整）
         # 这里是示例映射，需要根据蝉妈妈实际CSV格式调整
-        if 'title' in df.columns or '商品标题' in df.columns:
+        if all(column in df.columns for column in SALES_DETAIL_COLUMNS):
+            import_sales_detail(conn, df)
+            
+            print(f"✅ 销售明细导入成功！")
+            
+            result = conn.execute("SELECT COUNT(*) FROM douyin_sales_detail").fetchone()
+            print(f"📈 销售明细总记录数: {result[0]}")
+            
+            update_anomaly_state(conn)
+            
+        elif 'title' in df.columns or '商品标题' in df.columns:
             # 插入数据到DuckDB
             conn.execute("DELETE FROM douyin_products WHERE created_date = ?", [datetime.now().date()])
             conn.execute("INSERT INTO douyin_products SELECT * FROM df")
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+"""
+API 压测与工作负载回放工具
+按开环到达率（泊松或匀速）向 complete_dbgpt_app.py 发送 NL2SQL 问题、/api/v1/query SQL 和
+/api/v1/workflow 调用，工作负载来自审计日志或合成；复用 HTTP/1.1 长连接，
+延迟从计划发送时刻起算（避免协调遗漏），逐级提高到达率得到饱和曲线。
+--spawn 在本地临时端口启动服务（关闭预热、追踪导出，审计日志写入临时目录），可完全离线运行
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.metrics import LatencyHistogram
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 合成工作负载：覆盖 NL2SQL 引擎的各类模板
+QUESTIONS = [
+    "各类目的销售额是多少", "查询最新的20个商品", "最近的销售趋势如何", "销量排行前10的商品",
+    "各分类的商品数量", "品牌销售统计", "商品价格区间分布", "整体统计概览",
+    "本月营业额", "top 50 产品", "按日期统计变化", "哪个牌子卖得最好"
+]
+SQLS = [
+    "SELECT category, SUM(sales_amount) as total_sales FROM douyin_products GROUP BY category",
+    "SELECT DATE(created_date) as date, SUM(sales_amount) as daily_sales FROM douyin_products GROUP BY 1",
+    "SELECT COUNT(*) as total_products, AVG(price) as avg_price FROM douyin_products",
+    "SELECT * FROM douyin_products ORDER BY sales_volume DESC LIMIT 10"
+]
+WORKFLOWS = [
+    ("nl2sql_pipeline", {"question": "各类目的销售额是多少"}, {}),
+    ("trend_analysis", {"data_source": "sales"}, {"period": "daily"}),
+    ("data_insight", {"analysis_type": "comprehensive"}, {}),
+    ("sales_report", {}, {"report_type": "summary", "time_range": "last_7_days"})
+]
+DEFAULT_MIX = "nl2sql=6,query=3,workflow=1"
+# 工作流请求带 ?wait= 同步等待结果（服务端上限 60 秒），应小于单请求超时
+WORKFLOW_WAIT_SECONDS = 25.0
+
+
+@dataclass
+class WorkItem:
+    """一次请求"""
+    endpoint: str  # 报告中的分组名
+    method: str
+    path: str
+    body: Optional[Dict[str, Any]] = None
+    offset: Optional[float] = None  # 按时间戳回放时相对起点的秒数
+
+
+def nl2sql_item(question: str, offset: Optional[float] = None) -> WorkItem:
+    return WorkItem("nl2sql", "POST", "/api/v1/nl2sql", {"question": question}, offset)
+
+
+def query_item(sql: str, offset: Optional[float] = None) -> WorkItem:
+    return WorkItem("query", "POST", "/api/v1/query", {"sql": sql, "database": "analytics"}, offset)
+
+
+def workflow_item(workflow_type: str, input_data: Dict, parameters: Dict) -> WorkItem:
+    return WorkItem(f"workflow:{workflow_type}", "POST", f"/api/v1/workflow?wait={WORKFLOW_WAIT_SECONDS:g}",
+                    {"workflow_type": workflow_type, "input_data": input_data, "parameters": parameters})
+
+
+def workflow_outcome(status: int, payload: bytes) -> Tuple[str, bool]:
+    """工作流响应的状态分组和是否计为错误：等待期内未结束（202）或任务失败 / 取消都是错误"""
+    if status == 202:
+        return "202-pending", True
+    if status >= 400:
+        return str(status), True
+    try:
+        job_status = json.loads(payload).get("status")
+    except (ValueError, AttributeError):
+        return str(status), False
+    if job_status in ("failed", "cancelled"):
+        return f"{status}-{job_status}", True
+    return str(status), False
+
+
+class Workload:
+    """按权重混合的请求池；各类请求在池内按顺序轮换，保证可复现"""
+
+    def __init__(self, pools: Dict[str, List[WorkItem]], weights: Dict[str, float], seed: int = 42):
+        self.pools = {name: items for name, items in pools.items() if items and weights.get(name, 0) > 0}
+        if not self.pools:
+            raise ValueError("工作负载为空")
+        self.names = list(self.pools)
+        self.weights = [weights[name] for name in self.names]
+        self.rng = random.Random(seed)
+        self._positions = {name: 0 for name in self.names}
+
+    def next(self) -> WorkItem:
+        name = self.rng.choices(self.names, self.weights)[0]
+        pool = self.pools[name]
+        item = pool[self._positions[name] % len(pool)]
+        self._positions[name] += 1
+        return item
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    weights = {}
+    for part in text.split(","):
+        if part.strip():
+            name, _, weight = part.partition("=")
+            weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def synthetic_pools() -> Dict[str, List[WorkItem]]:
+    return {
+        "nl2sql": [nl2sql_item(q) for q in QUESTIONS],
+        "query": [query_item(s) for s in SQLS],
+        "workflow": [workflow_item(*w) for w in WORKFLOWS]
+    }
+
+
+def audit_records(log_dir: str, limit: Optional[int] = None, since_days: Optional[int] = None) -> List[Dict]:
+    """导入审计日志分段到内存库，按时间顺序取出问题和 SQL"""
+    from flows.audit_analytics import AuditAnalytics
+
+    analytics = AuditAnalytics(db_path=":memory:", log_dir=log_dir)
+    try:
+        analytics.ingest()
+        return analytics.workload(limit, since_days)
+    finally:
+        analytics.close()
+
+
+def audit_pools(records: List[Dict]) -> Dict[str, List[WorkItem]]:
+    """审计日志中的问题回放为 NL2SQL 请求，生成的 SQL 回放为查询请求；工作流仍为合成"""
+    pools = synthetic_pools()
+    pools["nl2sql"] = [nl2sql_item(r["question"]) for r in records if r["question"]] or pools["nl2sql"]
+    pools["query"] = [query_item(r["sql"]) for r in records if r["sql"]] or pools["query"]
+    return pools
+
+
+def audit_timeline(records: List[Dict], speedup: float) -> List[WorkItem]:
+    """按审计时间戳还原到达间隔（除以 speedup），每条记录回放为一次 NL2SQL 请求"""
+    stamped = [(datetime.fromisoformat(r["timestamp"]), r["question"]) for r in records
+               if r["timestamp"] and r["question"]]
+    if not stamped:
+        return []
+    first = stamped[0][0]
+    return [nl2sql_item(q, (ts - first).total_seconds() / speedup) for ts, q in stamped]
+
+
+# ----------------------------------------------------------------------
+# HTTP/1.1 长连接客户端
+# ----------------------------------------------------------------------
+
+class HTTPError(Exception):
+    pass
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.reusable = True
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    """最多 size 条到同一目标的长连接；连接用尽时请求排队，排队时间计入延迟"""
+
+    def __init__(self, host: str, port: int, size: int = 64):
+        self.host = host
+        self.port = port
+        self.size = size
+        self._idle: deque = deque()
+        self._slots = asyncio.Semaphore(size)
+        self.opened = 0
+        self.requests = 0
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                try:
+                    return await self._send(conn, method, path, body)
+                except (ConnectionError, asyncio.IncompleteReadError, HTTPError):
+                    # 空闲连接可能已被服务端关闭，重连重试一次
+                    conn.close()
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            self.opened += 1
+            return await self._send(_Connection(reader, writer), method, path, body)
+
+    async def _send(self, conn: _Connection, method: str, path: str, body: Optional[bytes]) -> Tuple[int, bytes]:
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive"]
+        if body is not None:
+            head += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        conn.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + (body or b""))
+        await conn.writer.drain()
+        try:
+            status, payload = await self._read_response(conn)
+        except BaseException:
+            conn.close()
+            raise
+        self.requests += 1
+        if conn.reusable:
+            self._idle.append(conn)
+        else:
+            conn.close()
+        return status, payload
+
+    @staticmethod
+    async def _read_response(conn: _Connection) -> Tuple[int, bytes]:
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise HTTPError("连接已关闭")
+        version, status = status_line.split(b" ", 2)[:2]
+        headers = {}
+        while True:
+            line = await conn.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        connection = headers.get("connection", "")
+        conn.reusable = connection == "keep-alive" if version == b"HTTP/1.0" else connection != "close"
+        if "content-length" in headers:
+            payload = await conn.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int((await conn.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await conn.reader.readline()
+                    break
+                chunks.append(await conn.reader.readexactly(size))
+                await conn.reader.readexactly(2)
+            payload = b"".join(chunks)
+        else:
+            # 无长度的响应以关闭连接结束
+            payload = await conn.reader.read()
+            conn.reusable = False
+        return int(status), payload
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+# ----------------------------------------------------------------------
+# 开环调度
+# ----------------------------------------------------------------------
+
+@dataclass
+class EndpointStats:
+    """单个端点的统计：response 从计划发送时刻计时，service 从实际发出计时"""
+    response: LatencyHistogram = field(default_factory=LatencyHistogram)
+    service: LatencyHistogram = field(default_factory=LatencyHistogram)
+    errors: int = 0
+    shed: int = 0
+    statuses: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class StepResult:
+    offered_rps: float
+    duration: float
+    endpoints: Dict[str, EndpointStats]
+    max_lag_ms: float = 0.0  # 调度器相对计划时刻的最大滞后
+
+    def total(self) -> EndpointStats:
+        merged = EndpointStats()
+        for stats in self.endpoints.values():
+            merged.response.merge(stats.response)
+            merged.service.merge(stats.service)
+            merged.errors += stats.errors
+            merged.shed += stats.shed
+        return merged
+
+
+class OpenLoopRunner:
+    """按计划时刻发出请求，不等待前一个请求完成"""
+
+    def __init__(self, pool: ConnectionPool, timeout: float = 30.0, max_inflight: int = 10000):
+        self.pool = pool
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+
+    async def _fire(self, item: WorkItem, intended: float, stats: EndpointStats, record: bool):
+        loop = asyncio.get_running_loop()
+        sent = loop.time()
+        body = json.dumps(item.body, ensure_ascii=False).encode("utf-8") if item.body is not None else None
+        try:
+            status, payload = await asyncio.wait_for(self.pool.request(item.method, item.path, body), self.timeout)
+            if item.endpoint.startswith("workflow:"):
+                key, failed = workflow_outcome(status, payload)
+            else:
+                key, failed = str(status), status >= 400
+        except asyncio.TimeoutError:
+            key, failed = "timeout", True
+        except Exception as e:
+            key, failed = type(e).__name__, True
+        if not record:
+            return
+        done = loop.time()
+        stats.response.record(done - intended)
+        stats.service.record(done - sent)
+        stats.statuses[key] = stats.statuses.get(key, 0) + 1
+        if failed:
+            stats.errors += 1
+
+    async def run(self, workload: Workload, rate: float, duration: float, warmup: float = 0.0,
+                  arrival: str = "poisson", seed: int = 42) -> StepResult:
+        """以 rate 请求/秒运行 warmup + duration 秒，只统计 warmup 之后计划发出的请求"""
+        rng = random.Random(seed)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = StepResult(rate, duration, {})
+        tasks = set()
+        intended = start
+        while True:
+            intended += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+            if intended - start >= warmup + duration:
+                break
+            await self._dispatch(workload.next(), intended, start + warmup, result, tasks)
+        await self._drain(tasks)
+        return result
+
+    async def replay(self, items: List[WorkItem], duration: Optional[float] = None) -> StepResult:
+        """按 WorkItem.offset 还原到达时刻回放"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        items = [item for item in items if duration is None or item.offset < duration]
+        span = max(items[-1].offset if items else 0.0, 1e-9)
+        result = StepResult(len(items) / span, span, {})
+        tasks = set()
+        for item in items:
+            await self._dispatch(item, start + item.offset, start, result, tasks)
+        await self._drain(tasks)
+        return result
+
+    async def _dispatch(self, item: WorkItem, intended: float, record_from: float, result: StepResult, tasks: set):
+        loop = asyncio.get_running_loop()
+        delay = intended - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        record = intended >= record_from
+        if record:
+            result.max_lag_ms = max(result.max_lag_ms, (loop.time() - intended) * 1000)
+        stats = result.endpoints.setdefault(item.endpoint, EndpointStats())
+        if len(tasks) >= self.max_inflight:
+            # 客户端自身已饱和：记为丢弃，不再排队放大负载
+            if record:
+                stats.shed += 1
+            return
+        task = loop.create_task(self._fire(item, intended, stats, record))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def _drain(self, tasks: set):
+        if tasks:
+            await asyncio.wait(set(tasks), timeout=self.timeout + 1)
+
+
+# ----------------------------------------------------------------------
+# 报告
+# ----------------------------------------------------------------------
+
+def summarize(stats: EndpointStats, duration: float) -> Dict[str, Any]:
+    response, service = stats.response, stats.service
+    completed = response.count
+    return {
+        "requests": completed + stats.shed,
+        "completed": completed,
+        "errors": stats.errors,
+        "shed": stats.shed,
+        "error_rate": round((stats.errors + stats.shed) / max(completed + stats.shed, 1), 4),
+        "throughput_rps": round((completed - stats.errors) / duration, 2) if duration else 0.0,
+        "p50_ms": round(response.percentile(50) * 1000, 2),
+        "p95_ms": round(response.percentile(95) * 1000, 2),
+        "p99_ms": round(response.percentile(99) * 1000, 2),
+        "max_ms": round(response.max * 1000, 2) if completed else 0.0,
+        "service_p50_ms": round(service.percentile(50) * 1000, 2),
+        "service_p99_ms": round(service.percentile(99) * 1000, 2),
+        "statuses": stats.statuses
+    }
+
+
+def step_report(step: StepResult) -> Dict[str, Any]:
+    return {
+        "offered_rps": round(step.offered_rps, 2),
+        "duration": round(step.duration, 2),
+        "max_schedule_lag_ms": round(step.max_lag_ms, 2),
+        "total": summarize(step.total(), step.duration),
+        "endpoints": {name: summarize(stats, step.duration) for name, stats in sorted(step.endpoints.items())}
+    }
+
+
+def find_knee(steps: List[Dict[str, Any]], slo_p99_ms: Optional[float], max_error_rate: float,
+              min_efficiency: float = 0.9) -> Optional[float]:
+    """饱和点：第一个吞吐跟不上到达率、错误率超限或 p99 超过 SLO 的档位"""
+    for step in steps:
+        total = step["total"]
+        if (total["throughput_rps"] < step["offered_rps"] * min_efficiency
+                or total["error_rate"] > max_error_rate
+                or (slo_p99_ms is not None and total["p99_ms"] > slo_p99_ms)):
+            return step["offered_rps"]
+    return None
+
+
+def print_step(report: Dict[str, Any]):
+    total = report["total"]
+    print(f"\n🚦 到达率 {report['offered_rps']:.1f} req/s，{report['duration']:.0f}s，"
+          f"调度最大滞后 {report['max_schedule_lag_ms']:.1f}ms")
+    print(f"{'端点':<28}{'请求':>8}{'错误':>7}{'吞吐/s':>10}{'P50ms':>10}{'P95ms':>10}{'P99ms':>10}{'服务P99':>10}")
+    for name, row in list(report["endpoints"].items()) + [("合计", total)]:
+        print(f"{name:<28}{row['requests']:>8}{row['errors'] + row['shed']:>7}{row['throughput_rps']:>10.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['service_p99_ms']:>10.1f}")
+
+
+def print_curve(steps: List[Dict[str, Any]], knee: Optional[float]):
+    print(f"\n📈 饱和曲线")
+    print(f"{'到达率':>10}{'吞吐':>10}{'P50ms':>10}{'P99ms':>12}{'错误率':>9}")
+    for step in steps:
+        total = step["total"]
+        mark = "  ← 饱和" if knee is not None and step["offered_rps"] == knee else ""
+        print(f"{step['offered_rps']:>10.1f}{total['throughput_rps']:>10.1f}{total['p50_ms']:>10.1f}"
+              f"{total['p99_ms']:>12.1f}{total['error_rate'] * 100:>8.1f}%{mark}")
+
+
+# ----------------------------------------------------------------------
+# 本地服务
+# ----------------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(workdir: str, timeout: float = 30.0, project_dir: str = PROJECT_DIR,
+                 extra_env: Optional[Dict[str, str]] = None) -> Tuple[subprocess.Popen, str]:
+    """在临时端口启动 project_dir 下的 complete_dbgpt_app.py，等待端口可连接"""
+    port = free_port()
+    env = {
+        **os.environ,
+        "DBGPT_HOST": "127.0.0.1",
+        "DBGPT_PORT": str(port),
+        "WARMUP_ENABLED": "0",
+        "TRACE_EXPORTER": "none",
+        "AUDIT_LOG_DIR": os.path.join(workdir, "logs"),
+        "PYTHONPATH": project_dir,
+        **(extra_env or {})
+    }
+    log = open(os.path.join(workdir, "server.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.join(project_dir, "complete_dbgpt_app.py")],
+                               cwd=project_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务启动失败，见 {log.name}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"服务 {timeout:.0f}s 内未就绪，见 {log.name}")
+
+
+async def run_load(args, url: str) -> Dict[str, Any]:
+    target = urlparse(url)
+    pool = ConnectionPool(target.hostname, target.port or 80, args.connections)
+    runner = OpenLoopRunner(pool, timeout=args.timeout, max_inflight=args.max_inflight)
+
+    records = audit_records(args.audit_log_dir, args.audit_limit, args.since_days) if args.audit_log_dir else []
+    if args.audit_log_dir:
+        print(f"📥 审计日志 {len(records)} 条记录")
+
+    steps = []
+    try:
+        if args.replay:
+            items = audit_timeline(records, args.speedup)
+            if not items:
+                raise ValueError("审计日志中没有可回放的带时间戳问题")
+            steps.append(step_report(await runner.replay(items, args.duration)))
+            print_step(steps[-1])
+        else:
+            pools = audit_pools(records) if records else synthetic_pools()
+            workload = Workload(pools, parse_mix(args.mix), args.seed)
+            rates = [float(r) for r in args.rates.split(",") if r.strip()]
+            for i, rate in enumerate(rates):
+                step = await runner.run(workload, rate, args.duration or 10.0, args.warmup, args.arrival, args.seed + i)
+                steps.append(step_report(step))
+                print_step(steps[-1])
+    finally:
+        pool.close()
+
+    knee = find_knee(steps, args.slo_p99_ms, args.max_error_rate)
+    print_curve(steps, knee)
+    print(f"\n🔌 建立连接 {pool.opened} 条，完成请求 {pool.requests} 个")
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "target": url,
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "connections_opened": pool.opened,
+        "steps": steps,
+        "saturation_rps": knee
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 开环压测与工作负载回放")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="目标服务地址")
+    parser.add_argument("--spawn", action="store_true", help="在临时端口启动本地服务并压测（离线）")
+    parser.add_argument("--rates", default="10,20,50,100", help="逐级到达率（请求/秒），逗号分隔")
+    parser.add_argument("--duration", type=float, help="每级统计时长（秒，默认 10）；回放时截取前 N 秒")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每级开始时不计入统计的时长（秒）")
+    parser.add_argument("--arrival", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="请求类型权重")
+    parser.add_argument("--connections", type=int, default=64, help="最大长连接数")
+    parser.add_argument("--max-inflight", type=int, default=10000, help="客户端在途请求上限，超过则丢弃")
+    parser.add_argument("--timeout", type=float, default=30.0, help="单请求超时（秒）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--audit-log-dir", help="从审计日志目录读取问题与 SQL")
+    parser.add_argument("--audit-limit", type=int, help="最多读取的审计记录数")
+    parser.add_argument("--since-days", type=int, help="只读取最近 N 天的审计记录")
+    parser.add_argument("--replay", action="store_true", help="按审计时间戳的到达间隔回放（忽略 --rates）")
+    parser.add_argument("--speedup", type=float, default=1.0, help="回放加速倍数")
+    parser.add_argument("--slo-p99-ms", type=float, help="判定饱和的 p99 上限")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="判定饱和的错误率上限")
+    parser.add_argument("--output", default="load_test_report.json")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if args.spawn:
+        workdir = tempfile.mkdtemp(prefix="dbgpt_load_")
+        process, url = spawn_server(workdir)
+        print(f"🚀 本地服务已启动: {url}（日志 {workdir}/server.log）")
+    try:
+        report = asyncio.run(run_load(args, url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✅ 报告已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
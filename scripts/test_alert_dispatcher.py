@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+告警分发器测试脚本
+在本地启动模拟飞书 webhook，验证合并、去重、限流、重试和队列背压
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.alert_dispatcher import Alert, AlertDispatcher, TokenBucket
+
+
+class FakeWebhookServer:
+    """模拟飞书 webhook：记录收到的卡片，可令前 N 次请求失败"""
+
+    def __init__(self):
+        self.payloads = []
+        self.fail_next = 0
+        self.fail_status = 500
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if server.fail_next > 0:
+                    server.fail_next -= 1
+                    status, reply = server.fail_status, {"code": -1, "msg": "fail"}
+                else:
+                    server.payloads.append(json.loads(body))
+                    status, reply = 200, {"code": 0, "msg": "success"}
+                data = json.dumps(reply).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/hook"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def reset(self):
+        self.payloads.clear()
+        self.fail_next = 0
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class AlertDispatcherTester:
+    """告警分发器测试器"""
+
+    def __init__(self):
+        self.logger = self._setup_logging()
+        self.test_results = []
+        self.server = FakeWebhookServer()
+
+    def _setup_logging(self):
+        """设置日志"""
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+        return logging.getLogger(__name__)
+
+    def _dispatcher(self, **kwargs) -> AlertDispatcher:
+        options = {"max_per_hour": None, "max_per_day": None, "batch_window": 0.2,
+                   "backoff_base": 0.05}
+        options.update(kwargs)
+        return AlertDispatcher(self.server.url, **options)
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        self.logger.info("开始告警分发器测试")
+
+        test_cases = [
+            self.test_burst_coalesced,
+            self.test_retry_with_backoff,
+            self.test_rate_limit,
+            self.test_dedup_window,
+            self.test_bounded_queue,
+            self.test_stop_during_send,
+            self.test_config_and_log
+        ]
+
+        for test_case in test_cases:
+            self.server.reset()
+            try:
+                self.logger.info(f"运行测试: {test_case.__name__}")
+                result = asyncio.run(test_case())
+                self.test_results.append({
+                    "test": test_case.__name__,
+                    "status": "PASS" if result else "FAIL",
+                    "timestamp": datetime.now().isoformat()
+                })
+            except Exception as e:
+                self.logger.error(f"测试 {test_case.__name__} 出错: {e}")
+                self.test_results.append({
+                    "test": test_case.__name__,
+                    "status": "ERROR",
+                    "error": str(e),
+                    "timestamp": datetime.now().isoformat()
+                })
+
+        self.server.shutdown()
+        return self._summarize()
+
+    async def test_burst_coalesced(self) -> bool:
+        """突发告警合并为一张卡片，重复告警计数"""
+        dispatcher = self._dispatcher()
+        await dispatcher.start()
+        for i in range(300):
+            dispatcher.submit(Alert("anomaly", f"SKU {i % 3} 销量异常", f"第 {i} 次",
+                                    severity="critical" if i == 0 else "warning"))
+        await asyncio.sleep(0.5)
+        await dispatcher.stop()
+
+        cards = self.server.payloads
+        if len(cards) != 1:
+            self.logger.error(f"❌ 期望 1 张卡片，实际 {len(cards)}")
+            return False
+        card = cards[0]["card"]
+        content = card["elements"][0]["text"]["content"]
+        ok = card["header"]["template"] == "red" and "×100" in content
+        self.logger.info(f"{'✅' if ok else '❌'} 300 条告警合并为 1 张卡片: {card['header']['title']['content']}")
+        return ok
+
+    async def test_retry_with_backoff(self) -> bool:
+        """5xx 后退避重试成功"""
+        self.server.fail_next = 2
+        dispatcher = self._dispatcher()
+        await dispatcher.start()
+        dispatcher.submit(Alert("system", "服务异常", "重试测试"))
+        await asyncio.sleep(1.0)
+        await dispatcher.stop()
+
+        metrics = dispatcher.get_metrics()
+        ok = len(self.server.payloads) == 1 and metrics["retries"] == 2
+        self.logger.info(f"{'✅' if ok else '❌'} 重试 {metrics['retries']} 次后发送成功")
+        return ok
+
+    async def test_rate_limit(self) -> bool:
+        """令牌耗尽时不发送，等待期间到达的告警并入下一张卡片"""
+        dispatcher = self._dispatcher()
+        dispatcher._buckets = [TokenBucket(1, 1.0)]  # 每秒 1 张卡片
+        await dispatcher.start()
+
+        for wave in range(3):
+            for i in range(5):
+                dispatcher.submit(Alert("anomaly", f"第 {wave} 波告警 {i}", "限流测试"))
+            await asyncio.sleep(0.3)
+        elapsed_cards = len(self.server.payloads)
+        await asyncio.sleep(1.5)
+        await dispatcher.stop()
+
+        cards = len(self.server.payloads)
+        ok = elapsed_cards == 1 and cards == 2 and dispatcher.metrics["alerts_sent"] == 15
+        self.logger.info(f"{'✅' if ok else '❌'} 限流: 0.9 秒内发送 {elapsed_cards} 张，共 {cards} 张卡片")
+        return ok
+
+    async def test_dedup_window(self) -> bool:
+        """窗口期内已发送的告警被抑制"""
+        dispatcher = self._dispatcher(dedup_window=60)
+        await dispatcher.start()
+        dispatcher.submit(Alert("anomaly", "转化率异常", "第一次"))
+        await asyncio.sleep(0.4)
+        for _ in range(5):
+            dispatcher.submit(Alert("anomaly", "转化率异常", "重复"))
+        await asyncio.sleep(0.4)
+        await dispatcher.stop()
+
+        ok = len(self.server.payloads) == 1 and dispatcher.metrics["deduplicated"] == 5
+        self.logger.info(f"{'✅' if ok else '❌'} 去重: 抑制 {dispatcher.metrics['deduplicated']} 条重复告警")
+        return ok
+
+    async def test_bounded_queue(self) -> bool:
+        """队列满时丢弃并计数，提交不阻塞"""
+        dispatcher = self._dispatcher(max_queue=100)
+        start = time.perf_counter()
+        accepted = sum(dispatcher.submit(Alert("anomaly", f"告警 {i}", "背压测试")) for i in range(1000))
+        elapsed = time.perf_counter() - start
+        await dispatcher.start()
+        await dispatcher.stop()
+
+        ok = accepted == 100 and dispatcher.metrics["dropped"] == 900 and len(self.server.payloads) == 1
+        self.logger.info(f"{'✅' if ok else '❌'} 背压: 接收 {accepted}，丢弃 {dispatcher.metrics['dropped']}，"
+                         f"提交耗时 {elapsed * 1000:.1f}ms")
+        return ok
+
+    async def test_stop_during_send(self) -> bool:
+        """发送重试途中停止，整批告警在停止时补发而不是丢失"""
+        self.server.fail_next = 1
+        dispatcher = self._dispatcher(backoff_base=2.0)
+        await dispatcher.start()
+        dispatcher.submit(Alert("system", "服务异常", "停止测试"))
+        await asyncio.sleep(0.5)  # 首次发送已失败，正在退避等待
+        await dispatcher.stop(drain=True)
+
+        cards = self.server.payloads
+        ok = len(cards) == 1 and "停止测试" in json.dumps(cards[0], ensure_ascii=False) and dispatcher.queue_depth() == 0
+        self.logger.info(f"{'✅' if ok else '❌'} 停止时补发 {len(cards)} 张卡片")
+        return ok
+
+    async def test_config_and_log(self) -> bool:
+        """从配置读取限流和告警类型，批量写告警日志"""
+        config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   "config", "webhook_config.json")
+        log_path = f"/tmp/alert_dispatcher_test_{os.getpid()}.log"
+        dispatcher = AlertDispatcher.from_config(config_path, webhook_url=self.server.url,
+                                                 enabled=True, batch_window=0.2, log_path=log_path)
+        await dispatcher.start()
+        dispatcher.submit(Alert("threshold", "销量超过阈值", "日志测试"))
+        dispatcher.submit(Alert("unknown_type", "未知类型", "应被过滤"))
+        await asyncio.sleep(0.4)
+        await dispatcher.stop()
+
+        with open(log_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        os.remove(log_path)
+
+        ok = (len(dispatcher._buckets) == 2 and dispatcher.metrics["filtered"] == 1
+              and len(lines) == 1 and json.loads(lines[0])["type"] == "threshold")
+        self.logger.info(f"{'✅' if ok else '❌'} 配置: 令牌桶 {dispatcher.get_metrics()['tokens']}，日志 {len(lines)} 行")
+        return ok
+
+    def _summarize(self) -> bool:
+        passed = sum(1 for r in self.test_results if r["status"] == "PASS")
+        self.logger.info("=" * 50)
+        self.logger.info(f"测试结果: {passed}/{len(self.test_results)} 通过")
+        for result in self.test_results:
+            icon = {"PASS": "✅", "FAIL": "❌", "ERROR": "⚠️"}.get(result["status"], "❓")
+            self.logger.info(f"{icon} {result['test']}: {result['status']}")
+        return passed == len(self.test_results)
+
+
+def main():
+    """主函数"""
+    tester = AlertDispatcherTester()
+    success = tester.run_all_tests()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+流式异常检测引擎测试脚本
+用合成的平稳序列验证突增 / 下跌检测、业务规则告警、迟到数据的增量接入和状态快照恢复
+"""
+
+import os
+import sys
+import logging
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.anomaly_detection import AnomalyConfig, AnomalyDetector
+
+METRICS = ("daily_sales", "daily_revenue", "conversion_rate")
+START_DATE = "2025-01-01"
+
+
+def history_frame(skus, days: int, start: str = START_DATE, seed: int = 7) -> pd.DataFrame:
+    """平稳的历史数据：销量约 1000、销售额约 10 万、转化率约 5%"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=days, freq="D")
+    rows = [(sku, date) for sku in skus for date in dates]
+    n = len(rows)
+    return pd.DataFrame({
+        "sku": [sku for sku, _ in rows],
+        "date": [date for _, date in rows],
+        "daily_sales": 1000 + rng.normal(0, 20, n),
+        "daily_revenue": 100000 + rng.normal(0, 2000, n),
+        "conversion_rate": 5 + rng.normal(0, 0.1, n)
+    })
+
+
+def next_day(sku, day: str, **overrides) -> pd.DataFrame:
+    """单个 SKU 一天的数据，默认取历史水平"""
+    row = {"sku": sku, "date": pd.Timestamp(day), "daily_sales": 1000.0, "daily_revenue": 100000.0,
+           "conversion_rate": 5.0}
+    row.update(overrides)
+    return pd.DataFrame([row])
+
+
+class AnomalyDetectionTester:
+    """异常检测引擎测试器"""
+
+    def __init__(self):
+        self.logger = self._setup_logging()
+        self.test_results = []
+
+    def _setup_logging(self):
+        """设置日志"""
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+        return logging.getLogger(__name__)
+
+    def _detector(self, **kwargs) -> AnomalyDetector:
+        """只启用统计检测，规则阈值按需打开"""
+        options = {"sales_anomaly_threshold": None, "revenue_drop_threshold": None,
+                   "conversion_rate_threshold": None}
+        options.update(kwargs)
+        detector = AnomalyDetector(config=AnomalyConfig(**options), metrics=METRICS)
+        detector.ingest_frame(history_frame(["A", "B"], 28))
+        return detector
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        self.logger.info("开始异常检测引擎测试")
+
+        test_cases = [
+            self.test_spike,
+            self.test_dip,
+            self.test_rules,
+            self.test_late_rows,
+            self.test_save_load
+        ]
+
+        for test_case in test_cases:
+            try:
+                self.logger.info(f"运行测试: {test_case.__name__}")
+                result = test_case()
+                self.test_results.append({
+                    "test": test_case.__name__,
+                    "status": "PASS" if result else "FAIL",
+                    "timestamp": datetime.now().isoformat()
+                })
+            except Exception as e:
+                self.logger.error(f"测试 {test_case.__name__} 出错: {e}")
+                self.test_results.append({
+                    "test": test_case.__name__,
+                    "status": "ERROR",
+                    "error": str(e),
+                    "timestamp": datetime.now().isoformat()
+                })
+
+        return self._summarize()
+
+    def test_spike(self) -> bool:
+        """销量突增只对该 SKU、该指标报 spike"""
+        detector = self._detector()
+        anomalies = detector.ingest_frame(pd.concat([
+            next_day("A", "2025-01-29", daily_sales=1500.0),
+            next_day("B", "2025-01-29")
+        ]))
+        found = {(a.sku, a.metric, a.kind) for a in anomalies}
+        ok = found == {("A", "daily_sales", "spike")}
+        self.logger.info(f"{'✅' if ok else '❌'} 突增: {sorted(found)}")
+        return ok
+
+    def test_dip(self) -> bool:
+        """销售额下跌报 dip，严重程度按标准分分级"""
+        detector = self._detector()
+        anomalies = detector.ingest_frame(next_day("B", "2025-01-29", daily_revenue=40000.0))
+        ok = (len(anomalies) == 1 and anomalies[0].kind == "dip" and anomalies[0].metric == "daily_revenue"
+              and anomalies[0].severity == "critical")
+        self.logger.info(f"{'✅' if ok else '❌'} 下跌: {[a.to_dict() for a in anomalies]}")
+        return ok
+
+    def test_rules(self) -> bool:
+        """webhook_config.json 的规则：销量增量、销售额降幅、转化率上限"""
+        detector = self._detector(sales_anomaly_threshold=300, revenue_drop_threshold=0.3,
+                                  conversion_rate_threshold=20.0)
+        anomalies = detector.ingest_frame(pd.concat([
+            next_day("A", "2025-01-29", daily_sales=1400.0, daily_revenue=60000.0),
+            next_day("B", "2025-01-29", conversion_rate=25.0)
+        ]))
+        kinds = {(a.sku, a.kind) for a in anomalies}
+        expected = {("A", "sales_surge"), ("A", "revenue_drop"), ("B", "conversion_rate")}
+        ok = expected <= kinds
+        self.logger.info(f"{'✅' if ok else '❌'} 规则: {sorted(kinds)}")
+        return ok
+
+    def test_late_rows(self) -> bool:
+        """同一天分批落库的 SKU 和晚到的 SKU 都会被接入，已处理过的日期不会重复计入"""
+        import duckdb
+
+        detector = AnomalyDetector(config=AnomalyConfig(), metrics=METRICS)
+        conn = duckdb.connect()
+        conn.execute("CREATE TABLE douyin_sales_detail (date DATE, sku VARCHAR, daily_sales DOUBLE, "
+                     "daily_revenue DOUBLE, conversion_rate DOUBLE)")
+        insert = "INSERT INTO douyin_sales_detail VALUES (?, ?, 1000, 100000, 5)"
+
+        conn.execute(insert, ["2025-01-01", "A"])
+        detector.ingest_since(conn)
+        conn.execute(insert, ["2025-01-01", "B"])  # 同一天的后一批
+        detector.ingest_since(conn)
+        after_same_day = detector.stats["rows_ingested"]
+
+        conn.execute(insert, ["2025-01-02", "A"])
+        detector.ingest_since(conn)
+        conn.execute(insert, ["2025-01-02", "B"])  # B 晚于 A 到达
+        conn.execute(insert, ["2025-01-01", "C"])  # 新 SKU 的历史数据
+        detector.ingest_since(conn)
+        conn.execute(insert, ["2025-01-01", "A"])  # 早于 A 已处理日期的补录
+        detector.ingest_since(conn)
+        conn.close()
+
+        ok = (after_same_day == 2 and detector.stats["rows_ingested"] == 5
+              and int(detector.count[detector._index["B"]]) == 2 and len(detector._keys) == 3)
+        self.logger.info(f"{'✅' if ok else '❌'} 迟到数据: 同日两批接入 {after_same_day} 行，"
+                         f"共 {detector.stats['rows_ingested']} 行，水位线 {detector.watermark}")
+        return ok
+
+    def test_save_load(self) -> bool:
+        """快照恢复后的统计量和后续检测结果与原检测器一致"""
+        detector = self._detector()
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "anomaly_state.npz")
+            detector.save(path)
+            restored = AnomalyDetector.load(path, config=detector.config)
+
+        batch = next_day("A", "2025-01-29", daily_sales=1500.0)
+        expected = [a.to_dict() for a in detector.ingest_frame(batch)]
+        actual = [a.to_dict() for a in restored.ingest_frame(batch)]
+        ok = (expected == actual and len(actual) == 1 and restored.watermark == detector.watermark
+              and restored.baseline("B") == detector.baseline("B"))
+        self.logger.info(f"{'✅' if ok else '❌'} 快照: {len(restored._keys)} 个 SKU，水位线 {restored.watermark}")
+        return ok
+
+    def _summarize(self) -> bool:
+        passed = sum(1 for r in self.test_results if r["status"] == "PASS")
+        self.logger.info("=" * 50)
+        self.logger.info(f"测试结果: {passed}/{len(self.test_results)} 通过")
+        for result in self.test_results:
+            icon = {"PASS": "✅", "FAIL": "❌", "ERROR": "⚠️"}.get(result["status"], "❓")
+            self.logger.info(f"{icon} {result['test']}: {result['status']}")
+        return passed == len(self.test_results)
+
+
+def main():
+    """主函数"""
+    tester = AnomalyDetectionTester()
+    success = tester.run_all_tests()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -152,8 +152,8 @@ class DBGPTIntegrationTester:
             if not result.forecast_values or len(result.forecast_values) != 7:
                 return False
             
-            if not result.chart_base64:
-                self.logger.warning("图表生成失败，但趋势检测功能正常")
+            if not result.chart_id:
+                self.logger.warning("图表描述生成失败，但趋势检测功能正常")
             
             self.logger.info(f"趋势检测结果: {result.trend_direction}, 强度: {result.trend_strength:.2f}")
             return True
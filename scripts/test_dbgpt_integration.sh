@@ -64,7 +64,7 @@ echo ""
 
 # 3. 测试工作流 API
 log "测试 AWEL 工作流 API..."
-WORKFLOW_RESPONSE=$(curl -s -X POST http://localhost:5000/api/v1/workflow \
+WORKFLOW_RESPONSE=$(curl -s -X POST "http://localhost:5000/api/v1/workflow?wait=30" \
   -H "Content-Type: application/json" \
   -d '{
     "workflow_type": "data_insight",
@@ -143,7 +143,7 @@ export class DBGPTClient {
   }
   
   async executeWorkflow(type: string, inputData: any, parameters?: any) {
-    const response = await fetch(`${this.baseUrl}${AI_CONFIG.dbgpt.endpoints.workflow}`, {
+    const response = await fetch(`${this.baseUrl}${AI_CONFIG.dbgpt.endpoints.workflow}?wait=30`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
@@ -4,12 +4,13 @@
 用于演示 DB-GPT 功能，不依赖外部包
 """
 
-import json
 import os
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import logging
 
+from flows.json_response import encode_json, wants_pretty
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -162,12 +163,15 @@ class DBGPTHandler(BaseHTTPRequestHandler):
             self.wfile.write(b'Not Found')
     
     def send_json_response(self, data):
-        """发送 JSON 响应"""
+        """发送 JSON 响应（?pretty=1 时缩进，按 Accept-Encoding 压缩）"""
+        body, headers = encode_json(data, self.headers.get('Accept-Encoding'), wants_pretty(self.path))
         self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+        self.wfile.write(body)
     
     def log_message(self, format, *args):
         """自定义日志格式"""